@@ -0,0 +1,288 @@
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+
+# record header: magic, timestamp (seconds since the epoch), image size, name size
+_HEADER = struct.Struct('<4sdIH')
+_MAGIC = b'SIA1'
+
+INDEX_COLUMNS = [('time', '<f8'), ('offset', '<i8'), ('size', '<u4'), ('name', 'S32')]
+
+
+class PackArchive:
+    """
+    An append-only pack of jpeg images with a timestamp to offset index.
+
+    The images are stored as they are (no recompression) one after the other in ``<path>``, every one preceded by a
+    small header holding its timestamp, size and name, so the index can be rebuilt from the pack. The index
+    ``<path>.idx`` is an array of fixed-width (time, offset, size, name) records. Reads are served from a read-only
+    mmap of the pack, so they are random-access and don't copy the image.
+
+    Attributes
+    ----------
+    path : str
+        path to the pack file.
+    index_path : str
+        path to the index file.
+    """
+
+    def __init__(self, path):
+        """
+        Open (or create) an archive and make its index consistent with the pack.
+
+        Parameters
+        ----------
+        path : str
+            path to the pack file.
+        """
+        self.path = path
+        self.index_path = path + '.idx'
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._index = np.empty(0, dtype=np.dtype(INDEX_COLUMNS))
+        self._positions = {}  # encoded name -> position of its latest entry in the index
+        self.recover()
+
+    def recover(self):
+        """
+        Load the index and index the records written after it (e.g. before a power loss).
+        """
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        index = np.empty(0, dtype=np.dtype(INDEX_COLUMNS))
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            itemsize = np.dtype(INDEX_COLUMNS).itemsize
+            index = np.frombuffer(data[:len(data) - len(data) % itemsize], dtype=np.dtype(INDEX_COLUMNS))
+            # drop the entries of the images that didn't make it to the pack
+            index = index[index['offset'] + index['size'] <= size]
+
+        end = int(index['offset'][-1] + index['size'][-1]) if len(index) else 0
+        entries, end = self._scan(end, size)
+        if entries or os.path.exists(self.index_path) and os.path.getsize(self.index_path) != index.nbytes:
+            index = np.concatenate([index, np.array(entries, dtype=np.dtype(INDEX_COLUMNS))])
+            index.tofile(self.index_path)
+        if end < size:
+            # a partially written record
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+        self._index = index
+        self._positions = {name: i for i, name in enumerate(index['name'].tolist())}
+
+    def _scan(self, start, size):
+        """
+        Read the record headers from `start` to the end of the pack.
+        """
+        entries = []
+        end = start
+        if end + _HEADER.size > size:
+            return entries, end
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                while end + _HEADER.size <= size:
+                    magic, timestamp, image_size, name_size = _HEADER.unpack_from(mm, end)
+                    offset = end + _HEADER.size + name_size
+                    if magic != _MAGIC or offset + image_size > size:
+                        break
+                    entries.append((timestamp, offset, image_size, mm[end + _HEADER.size:offset]))
+                    end = offset + image_size
+        return entries, end
+
+    def append(self, name, timestamp, jpeg, sync=True):
+        """
+        Append an image to the archive.
+
+        Parameters
+        ----------
+        name : str
+            the image name (e.g. its timestamp string).
+        timestamp : float
+            the image time in seconds since the epoch.
+        jpeg : bytes-like
+            the encoded image.
+        sync : bool, default True
+            flush the pack to the disk before the index is updated.
+
+        Returns
+        -------
+        int
+            the offset of the image in the pack.
+        """
+        encoded_name = name.encode('utf-8')
+        if len(encoded_name) > np.dtype(INDEX_COLUMNS)['name'].itemsize:
+            raise ValueError(f'The image name is too long: {name}!')
+        jpeg = memoryview(jpeg).cast('B')
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                start = f.tell()
+                f.write(_HEADER.pack(_MAGIC, timestamp, len(jpeg), len(encoded_name)))
+                f.write(encoded_name)
+                f.write(jpeg)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            offset = start + _HEADER.size + len(encoded_name)
+            entry = np.array([(timestamp, offset, len(jpeg), encoded_name)], dtype=np.dtype(INDEX_COLUMNS))
+            with open(self.index_path, 'ab') as f:
+                entry.tofile(f)
+            self._positions[encoded_name] = len(self._index)
+            self._index = np.concatenate([self._index, entry])
+        return offset
+
+    def sync(self):
+        """
+        Flush the pack and the index to the disk.
+        """
+        with self._lock:
+            for path in (self.path, self.index_path):
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        os.fsync(f.fileno())
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, name):
+        return name.encode('utf-8') in self._positions
+
+    def names(self):
+        """
+        Get the names of the archived images in the order they were added.
+
+        Returns
+        -------
+        list of str
+            the names.
+        """
+        return [name.decode('utf-8') for name in self._index['name']]
+
+    @property
+    def index(self):
+        """
+        numpy.ndarray: the (time, offset, size, name) records of the archived images.
+        """
+        return self._index
+
+    def _view(self, offset, size):
+        with self._lock:
+            if self._mmap is None or len(self._mmap) < offset + size:
+                self._close_mmap()
+                with open(self.path, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._mmap)[offset:offset + size]
+
+    def locate(self, name):
+        """
+        Find an image in the pack.
+
+        Parameters
+        ----------
+        name : str
+            the image name.
+
+        Returns
+        -------
+        tuple of (int, int)
+            the offset and the size of the image.
+
+        Raises
+        ------
+        KeyError
+            if there is no such image.
+        """
+        position = self._positions.get(name.encode('utf-8'))
+        if position is None:
+            raise KeyError(name)
+        entry = self._index[position]
+        return int(entry['offset']), int(entry['size'])
+
+    def read(self, name):
+        """
+        Read an image by name.
+
+        Parameters
+        ----------
+        name : str
+            the image name.
+
+        Returns
+        -------
+        memoryview
+            the jpeg bytes (a view of the mmap).
+
+        Raises
+        ------
+        KeyError
+            if there is no such image.
+        """
+        return self._view(*self.locate(name))
+
+    def read_at(self, timestamp):
+        """
+        Read the image taken at a timestamp.
+
+        Parameters
+        ----------
+        timestamp : float
+            the image time in seconds since the epoch.
+
+        Returns
+        -------
+        memoryview
+            the jpeg bytes (a view of the mmap).
+
+        Raises
+        ------
+        KeyError
+            if there is no image at that time.
+        """
+        matches = np.flatnonzero(self._index['time'] == timestamp)
+        if not len(matches):
+            raise KeyError(timestamp)
+        entry = self._index[matches[-1]]
+        return self._view(int(entry['offset']), int(entry['size']))
+
+    def range(self, start, end):
+        """
+        Get the images in a time range.
+
+        Parameters
+        ----------
+        start : float
+            start of the range (inclusive) in seconds since the epoch.
+        end : float
+            end of the range (exclusive) in seconds since the epoch.
+
+        Yields
+        ------
+        tuple of (str, memoryview)
+            the name and the jpeg bytes, sorted by time.
+        """
+        selected = np.flatnonzero((self._index['time'] >= start) & (self._index['time'] < end))
+        for i in selected[np.argsort(self._index['time'][selected], kind='stable')]:
+            entry = self._index[i]
+            yield entry['name'].decode('utf-8'), self._view(int(entry['offset']), int(entry['size']))
+
+    def _close_mmap(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # a view is still in use, the mmap is closed when it's collected
+            self._mmap = None
+
+    def close(self):
+        """
+        Close the mmap.
+        """
+        with self._lock:
+            self._close_mmap()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,136 @@
+"""
+Registries of the hardware backends (cameras, camera streams, sensors and modems).
+
+The backends are registered by their import path, so a module and the hardware libraries it needs (e.g. picamera,
+RPi.GPIO, pyserial or minimalmodbus) are imported only when the configured backend is loaded. A plugin can add its
+own backend with `Registry.register`.
+"""
+import importlib
+import threading
+
+
+class Registry:
+    """
+    Named backends that are imported when they are first loaded.
+
+    Attributes
+    ----------
+    kind : str
+        what the backends are (e.g. 'camera'), used in the error messages.
+    """
+
+    def __init__(self, kind, backends=None):
+        """
+        Construct a registry.
+
+        Parameters
+        ----------
+        kind : str
+            what the backends are.
+        backends : dict of {str : str or object} or None, default None
+            the backends by name, see `register`.
+        """
+        self.kind = kind
+        self._targets = {}
+        self._loaded = {}
+        self._lock = threading.Lock()
+        for name, target in (backends or {}).items():
+            self.register(name, target)
+
+    def register(self, name, target):
+        """
+        Register a backend, it replaces the backend of the same name.
+
+        Parameters
+        ----------
+        name : str
+            the backend name.
+        target : str or object
+            the backend itself, or its import path as 'package.module:attribute' (imported by `load`).
+        """
+        with self._lock:
+            self._targets[name] = target
+            self._loaded.pop(name, None)
+            if not isinstance(target, str):
+                self._loaded[name] = target
+
+    def load(self, name):
+        """
+        Get a backend, its module is imported on the first call.
+
+        Parameters
+        ----------
+        name : str
+            the backend name.
+
+        Returns
+        -------
+        object
+            the backend (e.g. a camera class).
+
+        Raises
+        ------
+        ValueError
+            if there is no such backend.
+        ImportError
+            if the backend or a library it needs is not installed.
+        """
+        with self._lock:
+            if name in self._loaded:
+                return self._loaded[name]
+            try:
+                target = self._targets[name]
+            except KeyError:
+                raise ValueError(f'Unknown {self.kind}: {name}!') from None
+            module, _, attribute = target.partition(':')
+            backend = getattr(importlib.import_module(module), attribute)
+            self._loaded[name] = backend
+            return backend
+
+    def is_loaded(self, name):
+        """
+        Check whether a backend has been loaded.
+
+        Parameters
+        ----------
+        name : str
+            the backend name.
+
+        Returns
+        -------
+        bool
+        """
+        with self._lock:
+            return name in self._loaded
+
+    def names(self):
+        """
+        Get the names of the registered backends.
+
+        Returns
+        -------
+        list of str
+        """
+        with self._lock:
+            return list(self._targets)
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._targets
+
+
+CAMERAS = Registry('camera', {
+    'rpi': 'SkyImageAgg.Collectors.RpiCam:RpiCam',
+    'geovision': 'SkyImageAgg.Collectors.GeoVisionCam:GeoVisionCam'
+})
+STREAMS = Registry('camera stream', {
+    'mjpeg': 'SkyImageAgg.Collectors.StreamGrabber:MjpegGrabber',
+    'rtsp': 'SkyImageAgg.Collectors.StreamGrabber:RtspGrabber'
+})
+SENSORS = Registry('sensor', {
+    'irradiance': 'SkyImageAgg.Collectors.IrradianceSensor:IrrSensor'
+})
+MODEMS = Registry('modem', {
+    'sms': 'SkyImageAgg.GSM:Messenger',
+    'gprs': 'SkyImageAgg.GSM:GPRS'
+})
@@ -1,3 +1,4 @@
+import time
 from abc import ABC, abstractmethod
 
 
@@ -27,6 +28,44 @@ class Cam(ABC):
         """
         pass
 
+    def cap_jpeg(self):
+        """
+        Capture a picture without decoding it.
+
+        Returns
+        -------
+        bytes
+            the jpeg image as delivered by the camera.
+        """
+        raise NotImplementedError('This camera doesn\'t deliver jpeg images!')
+
+    @property
+    def supports_bracketing(self):
+        """
+        bool: whether the camera implements `cap_bracket`.
+        """
+        return type(self).cap_bracket is not Cam.cap_bracket
+
+    def cap_bracket(self, exposures, budget=None, clock=time.monotonic):
+        """
+        Capture pictures at several exposures in quick succession.
+
+        Parameters
+        ----------
+        exposures : list of float
+            exposure offsets in EV (stops) from the automatic exposure, the first one is the reference.
+        budget : float or None, default None
+            the time budget in seconds, the remaining exposures are skipped once it's spent.
+        clock : callable, default time.monotonic
+            returns the current time in seconds, for the budget.
+
+        Returns
+        -------
+        list of numpy.array
+            the images, at least the reference one.
+        """
+        raise NotImplementedError('This camera doesn\'t support exposure bracketing!')
+
     @abstractmethod
     def cap_video(self, output):
         """
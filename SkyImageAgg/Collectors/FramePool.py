@@ -0,0 +1,74 @@
+import threading
+import weakref
+
+import numpy as np
+
+
+class FramePool:
+    """
+    Preallocated frame buffers that are reused once the frames captured into them are garbage.
+
+    `acquire` returns a frame backed by a free buffer. The buffer goes back to the pool when the frame and all the
+    views on it (e.g. a cropped frame in the pipeline) are collected, so a frame is never overwritten while it's still
+    in use. If every buffer is in use, a new one is allocated and kept in the pool.
+
+    Attributes
+    ----------
+    shape : tuple of int
+        the shape of the frames.
+    dtype : numpy.dtype
+        the type of the frames.
+    allocated : int
+        number of allocated buffers.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, size=2):
+        """
+        Construct a pool.
+
+        Parameters
+        ----------
+        shape : tuple of int
+            the shape of the frames.
+        dtype : numpy.dtype, default numpy.uint8
+            the type of the frames.
+        size : int, default 2
+            number of buffers allocated in advance.
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._free = [np.empty(self.shape, dtype=self.dtype) for _ in range(size)]
+        self.allocated = size
+
+    def acquire(self):
+        """
+        Get a frame backed by a free buffer, its content is undefined.
+
+        Returns
+        -------
+        numpy.array
+            the frame.
+        """
+        with self._lock:
+            if self._free:
+                buffer = self._free.pop()
+            else:
+                buffer = np.empty(self.shape, dtype=self.dtype)
+                self.allocated += 1
+        # the frame and its views reference `lease`, so it's collected when they are all gone
+        lease = np.frombuffer(memoryview(buffer).cast('B'), dtype=self.dtype)
+        weakref.finalize(lease, self._release, buffer)
+        return lease.reshape(self.shape)
+
+    def _release(self, buffer):
+        with self._lock:
+            self._free.append(buffer)
+
+    @property
+    def free(self):
+        """
+        int: number of buffers that are not in use.
+        """
+        with self._lock:
+            return len(self._free)
@@ -1,19 +1,33 @@
 import re
 import hashlib
 
-import requests
 import cv2
 import numpy as np
 from bs4 import BeautifulSoup
 
 from SkyImageAgg.Collectors.Camera import Cam
+from SkyImageAgg.SessionPool import get_default_pool
 
 
 class GeoVisionCam(Cam):
     """
     GeoVision IP camera class.
+
+    With a stream grabber, the pictures are taken from the latest frame of the stream the camera keeps sending,
+    instead of requesting a still picture for every capture. A still picture is requested if the stream has no
+    frame newer than `max_age`.
+
+    Attributes
+    ----------
+    grabber : StreamGrabber or None
+        the grabber of the camera stream.
+    max_age : float or None
+        the maximum age of a stream frame in seconds.
+    stream_misses : int
+        number of captures that fell back to a still picture request (e.g. a jpeg capture from a stream without
+        jpegs).
     """
-    def __init__(self, cam_address):
+    def __init__(self, cam_address, session_pool=None, grabber=None, max_age=None):
         """
         Construct a cam object.
 
@@ -21,9 +35,21 @@ class GeoVisionCam(Cam):
         ----------
         cam_address : str
             url to the IP camera login page.
+        session_pool : SessionPool or None, default None
+            the pool of keep-alive connections, if None the process-wide pool is used.
+        grabber : StreamGrabber or None, default None
+            a grabber of the camera stream, it's started here.
+        max_age : float or None, default None
+            the maximum age of a stream frame in seconds, any frame is used if None.
         """
         super().__init__()
         self.cam_address = cam_address
+        self.session = session_pool or get_default_pool()
+        self.grabber = grabber
+        self.max_age = max_age
+        self.stream_misses = 0
+        if self.grabber:
+            self.grabber.start()
         self.user_token = None
         self.pass_token = None
         self.desc_token = None
@@ -34,7 +60,7 @@ class GeoVisionCam(Cam):
 
     def _get_salt_values(self):
         # get html and JS code as text
-        page = requests.get('{}/ssi.cgi/Login.htm'.format(self.cam_address))
+        page = self.session.get('{}/ssi.cgi/Login.htm'.format(self.cam_address))
         html_content = BeautifulSoup(page.content, "html.parser").text
         # parse the salt values from the HTML/JS code of login page(cc1 and cc2)
         salt = re.search(r'cc1=\"(.{4})\".*cc2=\"(.{4})\"', html_content)
@@ -72,12 +98,51 @@ class GeoVisionCam(Cam):
         headers = {
             'User-Agent': 'Mozilla'
         }
-        c = requests.post('{}/LoginPC.cgi'.format(self.cam_address), data=data, headers=headers)
+        c = self.session.post('{}/LoginPC.cgi'.format(self.cam_address), data=data, headers=headers)
 
         self.user_token, self.pass_token, self.desc_token = re.search(
             r'gUserName\s=\s\"(.*)\";\n.*\s\"(.*)\";\n.*\"(.*)\"',
             c.text).groups()
 
+    def _request_picture(self, stream=False):
+        if not (self.user_token and self.pass_token and self.desc_token):
+            raise Exception('Authentication failed! Wrong username or password!')
+        data = {
+            'username': self.user_token,
+            'password': self.pass_token,
+            'data_type': 0,
+            'attachment': 1,
+            'channel': 1,
+            'secret': 1,
+            'key': self.desc_token
+        }
+        return self.session.post('{}/PictureCatch.cgi'.format(self.cam_address), data=data, stream=stream)
+
+    def _stream_frame(self):
+        if self.grabber:
+            try:
+                return self.grabber.latest(self.max_age)
+            except LookupError:
+                self.stream_misses += 1
+        return None
+
+    def cap_jpeg(self):
+        """
+        Capture a picture without decoding it.
+
+        Returns
+        -------
+        bytes
+            the jpeg image.
+        """
+        frame = self._stream_frame()
+        if frame is not None:
+            if frame.jpeg is not None:
+                return frame.jpeg
+            # e.g. an RTSP stream, its frames are decoded
+            self.stream_misses += 1
+        return self._request_picture().content
+
     def cap_pic(self, output='array'):
         """
         Capture a picture.
@@ -91,26 +156,28 @@ class GeoVisionCam(Cam):
         numpy.array
             image array.
         """
-        if self.user_token and self.pass_token and self.desc_token:
-            data = {
-                'username': self.user_token,
-                'password': self.pass_token,
-                'data_type': 0,
-                'attachment': 1,
-                'channel': 1,
-                'secret': 1,
-                'key': self.desc_token
-            }
-            r = requests.post('{}/PictureCatch.cgi'.format(self.cam_address), data=data, stream=True)
-
-            if output.lower() == 'array':
-                return cv2.imdecode(np.frombuffer(r.content, np.uint8), -1)
-            # write the image in the disk
-            with open(output, 'wb') as f:
-                for chunk in r.iter_content():
-                    f.write(chunk)
-        else:
-            raise Exception('Authentication failed! Wrong username or password!')
+        if output.lower() == 'array':
+            frame = self._stream_frame()
+            if frame is not None and frame.image is not None:
+                # the frame is shared with the other readers and may be modified in place (e.g. masked)
+                return frame.image.copy()
+            if frame is not None:
+                jpeg = frame.jpeg
+            else:
+                jpeg = self._request_picture().content
+            return cv2.imdecode(np.frombuffer(jpeg, np.uint8), -1)
+        # write the image in the disk
+        r = self._request_picture(stream=True)
+        with open(output, 'wb') as f:
+            for chunk in r.iter_content():
+                f.write(chunk)
+
+    def close(self):
+        """
+        Stop the stream grabber.
+        """
+        if self.grabber:
+            self.grabber.stop()
 
     def cap_video(self, output):
         """
@@ -3,12 +3,29 @@ import time
 
 import minimalmodbus
 
+from SkyImageAgg.Metrics import metrics
+
+# input registers of the sensor (values in tenths)
+IRRADIANCE_REGISTER = 0
+CELL_TEMP_REGISTER = 7
+EXT_TEMP_REGISTER = 8
+
+
+def to_signed(value):
+    """
+    Interpret a 16-bit register value as a two's complement integer.
+    """
+    return value - 0x10000 if value & 0x8000 else value
+
 
 class IrrSensor(minimalmodbus.Instrument):
     """
     Class for communicating with the irradiance sensor through Modbus protocol.
+
+    In the bulk mode, the whole register block is read in one transaction and the serial port stays open between
+    the samples.
     """
-    def __init__(self, port, address, baudrate, bytesize, parity, stopbits):
+    def __init__(self, port, address, baudrate, bytesize, parity, stopbits, bulk=True):
         """
         Construct a sensor object.
 
@@ -25,8 +42,12 @@ class IrrSensor(minimalmodbus.Instrument):
             modbus pairity
         stopbits : int
             modbus stopbits
+        bulk : bool, default True
+            read all the registers in one transaction and keep the port open.
         """
         super().__init__(port=port, slaveaddress=address)
+        self.bulk = bulk
+        self.close_port_after_each_call = False
         self.serial.baudrate = baudrate
         self.serial.bytesize = bytesize
         self.serial.parity = parity
@@ -42,10 +63,57 @@ class IrrSensor(minimalmodbus.Instrument):
         if not self.serial.isOpen():
             self.serial.open()
 
+    @staticmethod
+    def decode(registers):
+        """
+        Decode the channels from the register block.
+
+        Parameters
+        ----------
+        registers : list of int
+            the registers starting at address 0.
+
+        Returns
+        -------
+        tuple of float
+            irradiance (W/m^2), external temperature and cell temperature (°C).
+        """
+        return (
+            registers[IRRADIANCE_REGISTER] / 10,
+            to_signed(registers[EXT_TEMP_REGISTER]) / 10,
+            to_signed(registers[CELL_TEMP_REGISTER]) / 10
+        )
+
+    def read_block(self):
+        """
+        Read the register block holding all the channels in one transaction.
+
+        Returns
+        -------
+        list of int
+            the raw registers.
+        """
+        self.open_serial()
+        try:
+            return self.read_registers(IRRADIANCE_REGISTER, EXT_TEMP_REGISTER + 1, functioncode=4)
+        except Exception:
+            # start the next sample with a fresh connection
+            self.serial.close()
+            raise
+
+    @metrics.timed('sensor_read')
     def get_data(self):
         """
         Get required data from sensor,
+
+        Returns
+        -------
+        tuple of float
+            irradiance (W/m^2), external temperature and cell temperature (°C).
         """
+        if self.bulk:
+            return self.decode(self.read_block())
+
         self.open_serial()
 
         irr = self.read_register(0, 1, 4, False)
@@ -55,6 +123,12 @@ class IrrSensor(minimalmodbus.Instrument):
         self.serial.close()
         return irr, ext_temp, cell_temp
 
+    def close(self):
+        """
+        Close the serial port.
+        """
+        self.serial.close()
+
     @staticmethod
     def restart_USB2Serial():
         """
@@ -1,32 +1,101 @@
+import threading
 import time
 from io import BytesIO
 
 import cv2
 import numpy as np
-import picamera
-from picamera import PiCamera
 
 from SkyImageAgg.Collectors.Camera import Cam
+from SkyImageAgg.Collectors.FramePool import FramePool
+
+CAPTURE_FORMATS = ('jpeg', 'bgr', 'yuv')
+
+
+def raw_resolution(resolution):
+    """
+    Get the resolution of the raw (unencoded) captures, the camera pads the width to 32 and the height to 16 pixels.
+
+    Parameters
+    ----------
+    resolution : tuple of (int, int)
+        width and height of the picture.
+
+    Returns
+    -------
+    tuple of (int, int)
+        the padded width and height.
+    """
+    width, height = resolution
+    return (width + 31) // 32 * 32, (height + 15) // 16 * 16
 
 
 class RpiCam(Cam):
     """
     Class for constructing a camera object for Raspberry pi camera.
 
+    In the 'bgr' and 'yuv' capture formats `cap_pic` has the camera write the raw frames directly into reusable
+    preallocated buffers (like `picamera.array` does), so there is no jpeg encoding on the GPU and no decoding and
+    allocation on the CPU for frames that are re-encoded anyway.
+
     Attributes
     ----------
     cam : PiCamera
         RPi camera object.
+    resolution : tuple of (int, int)
+        width and height of the pictures.
+    capture_format : str
+        'jpeg' (the pictures are decoded), 'bgr' or 'yuv' (raw frames).
+    use_video_port : bool
+        whether the pictures are captured from the video port (no mode switch between the captures, so the latency is
+        much lower, but the pictures are noisier).
+    pool : FramePool or None
+        the buffers of the raw frames.
     """
-    def __init__(self):
+    def __init__(self, resolution=(2592, 1944), capture_format='jpeg', use_video_port=False, buffers=2, camera=None):
+        """
+        Construct a camera object.
+
+        Parameters
+        ----------
+        resolution : tuple of (int, int), default (2592, 1944)
+            width and height of the pictures.
+        capture_format : str, default 'jpeg'
+            'jpeg', 'bgr' or 'yuv'.
+        use_video_port : bool, default False
+            capture the pictures from the video port.
+        buffers : int, default 2
+            number of raw frame buffers allocated in advance, it should cover the frames in use at the same time.
+        camera : PiCamera or None, default None
+            an opened camera (or a compatible object), if None the RPi camera is opened.
+        """
         super().__init__()
-        try:
-            self.cam = PiCamera()
-        except picamera.exc.PiCameraMMALError:
-            raise ConnectionError('It seems that the RPi camera is being used by another application!')
-        self.cam.resolution = (2592, 1944)
-        self.cam.start_preview()
-        time.sleep(2)
+        if capture_format not in CAPTURE_FORMATS:
+            raise ValueError(f'Unknown capture format: {capture_format}!')
+
+        if camera is None:
+            import picamera
+
+            try:
+                camera = picamera.PiCamera()
+            except picamera.exc.PiCameraMMALError:
+                raise ConnectionError('It seems that the RPi camera is being used by another application!')
+            camera.resolution = tuple(resolution)
+            camera.start_preview()
+            # let the camera adjust the gains
+            time.sleep(2)
+        self.cam = camera
+        self.resolution = tuple(resolution)
+        self.capture_format = capture_format
+        self.use_video_port = use_video_port
+        self._lock = threading.Lock()
+
+        width, height = raw_resolution(self.resolution)
+        if capture_format == 'jpeg':
+            self.pool = None
+        else:
+            self.pool = FramePool((height, width, 3), size=buffers)
+        # the planar YUV420 frame is converted into the pool buffers
+        self._yuv = np.empty((height * 3 // 2, width), dtype=np.uint8) if capture_format == 'yuv' else None
 
     def login(self, address, username, pwd):
         """
@@ -34,6 +103,93 @@ class RpiCam(Cam):
         """
         raise NotImplementedError('This method is not implemented yet!')
 
+    def cap_jpeg(self):
+        """
+        Capture a picture without decoding it.
+
+        Returns
+        -------
+        bytes
+            the jpeg image.
+        """
+        output = BytesIO()
+        with self._lock:
+            self.cam.capture(output, format='jpeg', use_video_port=self.use_video_port)
+        return output.getvalue()
+
+    def cap_raw(self):
+        """
+        Capture a raw picture into a pooled buffer.
+
+        The frame is a view on the buffer, it can be modified in place and its buffer is reused when it's collected.
+
+        Returns
+        -------
+        numpy.array
+            the BGR image.
+        """
+        with self._lock:
+            return self._capture_raw()
+
+    def _capture_raw(self):
+        frame = self.pool.acquire()
+        if self.capture_format == 'bgr':
+            self.cam.capture(frame, format='bgr', use_video_port=self.use_video_port)
+        else:
+            self.cam.capture(self._yuv, format='yuv', use_video_port=self.use_video_port)
+            cv2.cvtColor(self._yuv, cv2.COLOR_YUV2BGR_I420, dst=frame)
+        width, height = self.resolution
+        return frame[:height, :width]
+
+    def _capture_image(self):
+        if self.pool is not None:
+            return self._capture_raw()
+        output = BytesIO()
+        self.cam.capture(output, format='jpeg', use_video_port=self.use_video_port)
+        return cv2.imdecode(np.frombuffer(output.getvalue(), np.uint8), -1)
+
+    def cap_bracket(self, exposures, budget=None, clock=time.monotonic):
+        """
+        Capture pictures at several exposures in quick succession.
+
+        The gains and the white balance are frozen at their automatic values and only the shutter speed is changed,
+        so the frames differ only in their exposure. The raw frames are captured into the pooled buffers.
+
+        Parameters
+        ----------
+        exposures : list of float
+            exposure offsets in EV (stops) from the automatic exposure, the first one is the reference.
+        budget : float or None, default None
+            the time budget in seconds, an exposure is skipped if it wouldn't be captured within it.
+        clock : callable, default time.monotonic
+            returns the current time in seconds, for the budget.
+
+        Returns
+        -------
+        list of numpy.array
+            the images, at least the reference one.
+        """
+        start = clock()
+        frames = []
+        with self._lock:
+            base = self.cam.exposure_speed
+            exposure_mode, awb_mode, awb_gains = self.cam.exposure_mode, self.cam.awb_mode, self.cam.awb_gains
+            self.cam.awb_mode = 'off'
+            self.cam.awb_gains = awb_gains
+            self.cam.exposure_mode = 'off'
+            try:
+                for ev in exposures:
+                    elapsed = clock() - start
+                    if frames and budget is not None and elapsed + elapsed / len(frames) > budget:
+                        break
+                    self.cam.shutter_speed = max(int(base * 2 ** ev), 1)
+                    frames.append(self._capture_image())
+            finally:
+                self.cam.shutter_speed = 0
+                self.cam.exposure_mode = exposure_mode
+                self.cam.awb_mode = awb_mode
+        return frames
+
     def cap_pic(self, output='array'):
         """
         Capture a picture.
@@ -49,13 +205,12 @@ class RpiCam(Cam):
             image array.
         """
         if output == 'array':
-            output = BytesIO()
-            self.cam.capture(output, format='jpeg')
-            # "Rewind" the stream to the beginning so we can read its content
-            output.seek(0)
-            return cv2.imdecode(np.frombuffer(output.read(), np.uint8), -1)
+            if self.pool is not None:
+                return self.cap_raw()
+            return cv2.imdecode(np.frombuffer(self.cap_jpeg(), np.uint8), -1)
         else:
-            self.cam.capture(output)
+            with self._lock:
+                self.cam.capture(output)
 
     def cap_video(self, output):
         """
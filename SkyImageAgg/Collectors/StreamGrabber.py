@@ -0,0 +1,368 @@
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+import requests
+
+StreamFrame = namedtuple('StreamFrame', ['seq', 'received_at', 'jpeg', 'image'])
+StreamFrame.__doc__ = '''
+The latest frame of a stream.
+
+Attributes
+----------
+seq : int
+    sequence number of the frame since the grabber was constructed.
+received_at : float
+    `time.monotonic()` when the frame was received.
+jpeg : bytes or None
+    the jpeg frame (MJPEG streams only).
+image : numpy.array or None
+    the decoded frame, None if the grabber doesn't decode the frames.
+'''
+
+
+def parse_boundary(content_type):
+    """
+    Get the part boundary of a multipart content type.
+
+    Parameters
+    ----------
+    content_type : str
+        e.g. 'multipart/x-mixed-replace; boundary=frame'.
+
+    Returns
+    -------
+    bytes
+        the boundary without the leading dashes.
+    """
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.strip().partition('=')
+        if name.lower() == 'boundary':
+            return value.strip().strip('"').lstrip('-').encode('latin-1')
+    raise ValueError(f'No boundary in {content_type}!')
+
+
+def read_mjpeg(read, boundary):
+    """
+    Read the jpeg parts of a multipart (MJPEG) stream.
+
+    The parts are read by their Content-Length if the camera sends it, otherwise up to the next boundary.
+
+    Parameters
+    ----------
+    read : callable
+        returns the next available bytes of the stream, empty bytes at its end (e.g. `read1` of a response).
+    boundary : bytes
+        the part boundary without the leading dashes.
+
+    Yields
+    ------
+    bytes
+        the jpeg frames.
+    """
+    buffer = bytearray()
+
+    def fill():
+        data = read()
+        buffer.extend(data)
+        return bool(data)
+
+    while True:
+        start = buffer.find(boundary)
+        header_end = buffer.find(b'\r\n\r\n', start) if start >= 0 else -1
+        if header_end < 0:
+            if not fill():
+                return
+            continue
+
+        headers = {}
+        for line in bytes(buffer[start + len(boundary):header_end]).split(b'\r\n'):
+            name, sep, value = line.partition(b':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        body_start = header_end + 4
+
+        length = headers.get(b'content-length')
+        if length:
+            end = body_start + int(length)
+            while len(buffer) < end:
+                if not fill():
+                    return
+        else:
+            scanned = body_start
+            while True:
+                end = buffer.find(boundary, scanned)
+                if end >= 0:
+                    break
+                scanned = max(body_start, len(buffer) - len(boundary))
+                if not fill():
+                    return
+            # the dashes and the CRLF before the boundary belong to the delimiter
+            end = end - 2 if buffer[end - 2:end] == b'--' else end
+            end = end - 2 if buffer[end - 2:end] == b'\r\n' else end
+
+        yield bytes(buffer[body_start:end])
+        del buffer[:end]
+
+
+class StreamGrabber:
+    """
+    Hold a camera stream open in a daemon thread and keep its latest frame in a single slot.
+
+    A capture is then a read of the slot instead of a request to the camera. If the stream breaks, it's reopened
+    after `reconnect_delay` seconds.
+
+    Attributes
+    ----------
+    url : str
+        the stream url.
+    decode : bool
+        whether the frames are decoded in the grabber thread.
+    reconnect_delay : float
+        seconds to wait before the stream is reopened.
+    frames : int
+        number of received frames.
+    errors : int
+        number of stream failures.
+    last_error : Exception or None
+        the last stream failure.
+    """
+
+    def __init__(self, url, decode=True, reconnect_delay=5.0):
+        """
+        Construct a grabber, it's started by `start`.
+
+        Parameters
+        ----------
+        url : str
+            the stream url.
+        decode : bool, default True
+            decode the frames in the grabber thread, so the readers get the pixels without delay.
+        reconnect_delay : float, default 5.0
+            seconds to wait before the stream is reopened.
+        """
+        self.url = url
+        self.decode = decode
+        self.reconnect_delay = reconnect_delay
+        self.frames = 0
+        self.errors = 0
+        self.last_error = None
+        self._slot = None
+        self._new_frame = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _open(self):
+        """
+        Open the stream and yield its frames as (jpeg, image) tuples.
+        """
+        raise NotImplementedError
+
+    def _close(self):
+        """
+        Close the stream.
+        """
+
+    def _interrupt(self):
+        """
+        Interrupt a blocking read of the stream, it's called by `stop` from another thread.
+        """
+
+    def put(self, jpeg=None, image=None):
+        """
+        Replace the latest frame.
+
+        Parameters
+        ----------
+        jpeg : bytes or None, default None
+            the jpeg frame.
+        image : numpy.array or None, default None
+            the decoded frame.
+        """
+        with self._new_frame:
+            self.frames += 1
+            self._slot = StreamFrame(self.frames, time.monotonic(), jpeg, image)
+            self._new_frame.notify_all()
+
+    def run(self):
+        """
+        Read the stream until `stop` is called.
+        """
+        while not self._stop.is_set():
+            try:
+                for jpeg, image in self._open():
+                    if self._stop.is_set():
+                        break
+                    self.put(jpeg, image)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.errors += 1
+                self.last_error = e
+            finally:
+                self._close()
+            self._stop.wait(self.reconnect_delay)
+
+    def latest(self, max_age=None):
+        """
+        Get the latest frame.
+
+        Parameters
+        ----------
+        max_age : float or None, default None
+            the maximum age of the frame in seconds.
+
+        Returns
+        -------
+        StreamFrame
+            the frame.
+
+        Raises
+        ------
+        LookupError
+            if there is no frame yet or it's older than `max_age` (e.g. the stream stalled).
+        """
+        frame = self._slot
+        if frame is None:
+            raise LookupError(f'No frame from {self.url} yet!')
+        if max_age is not None and time.monotonic() - frame.received_at > max_age:
+            raise LookupError(f'The last frame from {self.url} is {time.monotonic() - frame.received_at:.1f}s old!')
+        return frame
+
+    def wait(self, after=0, timeout=None):
+        """
+        Wait for a frame newer than a sequence number.
+
+        Parameters
+        ----------
+        after : int, default 0
+            the sequence number of the last seen frame.
+        timeout : float or None, default None
+            the maximum time to wait in seconds.
+
+        Returns
+        -------
+        StreamFrame or None
+            the frame, None on timeout.
+        """
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self._slot is not None and self._slot.seq > after, timeout)
+            frame = self._slot
+        return frame if frame is not None and frame.seq > after else None
+
+    def start(self):
+        """
+        Start grabbing in a daemon thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=f'{type(self).__name__}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """
+        Close the stream and stop the grabber thread.
+
+        Parameters
+        ----------
+        timeout : float, default 10.0
+            the maximum time to wait for the thread in seconds, a daemon thread stuck in a read is left behind.
+        """
+        self._stop.set()
+        self._interrupt()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+class MjpegGrabber(StreamGrabber):
+    """
+    Grab the frames of an MJPEG (multipart/x-mixed-replace) stream over HTTP.
+
+    The jpeg of every frame is kept, so it can be stored or uploaded without re-encoding.
+    """
+
+    def __init__(self, url, decode=True, reconnect_delay=5.0, session=None, timeout=10.0):
+        """
+        Construct a grabber.
+
+        Parameters
+        ----------
+        url : str
+            the stream url, with the credentials if the camera needs them.
+        decode : bool, default True
+            decode the frames in the grabber thread.
+        reconnect_delay : float, default 5.0
+            seconds to wait before the stream is reopened.
+        session : requests.Session or None, default None
+            the session, a dedicated one if None (the stream holds its connection).
+        timeout : float, default 10.0
+            seconds the stream may stall before it's reopened.
+        """
+        super().__init__(url, decode, reconnect_delay)
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self._response = None
+
+    def _open(self):
+        response = self.session.get(self.url, stream=True, timeout=self.timeout)
+        self._response = response
+        response.raise_for_status()
+        boundary = parse_boundary(response.headers.get('Content-Type', ''))
+        raw = response.raw
+        # read1 returns the data as soon as it arrives, so a frame isn't held back until the next one
+        read = (lambda: raw.read1(65536)) if hasattr(raw, 'read1') else (lambda: raw.read(4096))
+        for jpeg in read_mjpeg(read, boundary):
+            image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) if self.decode else None
+            if self.decode and image is None:
+                continue  # a corrupted frame
+            yield jpeg, image
+        raise ConnectionError(f'The stream {self.url} ended!')
+
+    def _close(self):
+        response, self._response = self._response, None
+        if response is not None:
+            response.close()
+
+    def _interrupt(self):
+        self._close()
+
+
+class RtspGrabber(StreamGrabber):
+    """
+    Grab the decoded frames of an RTSP (or any other stream OpenCV can open) with `cv2.VideoCapture`.
+    """
+
+    def __init__(self, url, reconnect_delay=5.0):
+        """
+        Construct a grabber.
+
+        Parameters
+        ----------
+        url : str
+            the stream url, with the credentials if the camera needs them.
+        reconnect_delay : float, default 5.0
+            seconds to wait before the stream is reopened.
+        """
+        super().__init__(url, True, reconnect_delay)
+        self._capture = None
+
+    def _open(self):
+        capture = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        self._capture = capture
+        if not capture.isOpened():
+            raise ConnectionError(f'Couldn\'t open the stream {self.url}!')
+        while True:
+            ok, image = capture.read()
+            if not ok:
+                raise ConnectionError(f'The stream {self.url} ended!')
+            yield None, image
+
+    def _close(self):
+        capture, self._capture = self._capture, None
+        if capture is not None:
+            capture.release()
+
+
+GRABBERS = {'mjpeg': MjpegGrabber, 'rtsp': RtspGrabber}
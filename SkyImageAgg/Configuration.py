@@ -1,10 +1,60 @@
 import configparser
+from collections import namedtuple
 from os.path import dirname
 from os.path import join
 
 conf = configparser.ConfigParser()
 conf.read(join(dirname(dirname(__file__)), 'config.ini'))
 
+CameraConfig = namedtuple(
+    'CameraConfig',
+    ['name', 'address', 'username', 'pwd', 'client_id', 'key', 'mask_path', 'stream', 'stream_url']
+)
+CameraConfig.__doc__ = '''
+The settings of one camera of a multi-camera site, read from a ``[Camera.<name>]`` section.
+'''
+
+
+def read_camera_sections(config, sections):
+    """
+    Read the camera sections of a multi-camera site.
+
+    The keys missing in a section are taken from the [Camera], [Auth] ('client_id' and 'sha256_key') and [Image]
+    ('mask_image') sections.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        the parsed configuration.
+    sections : list of str
+        the section names, e.g. ['Camera.east', 'Camera.west'], the camera name is the part after the dot.
+
+    Returns
+    -------
+    list of CameraConfig
+        the camera settings.
+    """
+    cameras = []
+    for section in sections:
+        if not config.has_section(section):
+            raise ValueError(f'No [{section}] section in the configuration!')
+
+        def get(key, default_section='Camera'):
+            return config.get(section, key, fallback=config.get(default_section, key))
+
+        cameras.append(CameraConfig(
+            name=section.split('.', 1)[-1],
+            address=get('cam_address'),
+            username=get('cam_username'),
+            pwd=get('cam_password'),
+            client_id=get('client_id', 'Auth'),
+            key=get('sha256_key', 'Auth'),
+            mask_path=get('mask_image', 'Image'),
+            stream=get('stream'),
+            stream_url=get('stream_url')
+        ))
+    return cameras
+
 
 class Config:
     """
@@ -15,10 +65,46 @@ class Config:
     key = conf.get('Auth', 'sha256_key')
     server = conf.get('Auth', 'upload_server')
 
+    # bracketing settings
+    bracketing_enabled = conf.getboolean('Bracketing', 'enabled')
+    bracketing_exposures = [float(i.strip()) for i in conf.get('Bracketing', 'exposures').split(',')]
+    bracketing_capture_budget = conf.getfloat('Bracketing', 'capture_budget')
+    bracketing_fusion_budget = conf.getfloat('Bracketing', 'fusion_budget')
+
+    # pipeline settings
+    pipeline_enabled = conf.getboolean('Pipeline', 'enabled')
+    pipeline_queue_size = conf.getint('Pipeline', 'queue_size')
+    pipeline_encoders = conf.getint('Pipeline', 'encoder_workers')
+    pipeline_uploaders = conf.getint('Pipeline', 'uploader_workers')
+    pipeline_drop_policy = conf.get('Pipeline', 'drop_policy')
+
+    # upload spool settings
+    spool_disk_budget = conf.getint('Spool', 'disk_budget')
+    spool_ram_budget = conf.getint('Spool', 'ram_budget')
+    spool_drain_policy = conf.get('Spool', 'drain_policy')
+
+    # backlog settings
+    backlog_max_workers = conf.getint('Backlog', 'max_workers')
+    backlog_max_error_rate = conf.getfloat('Backlog', 'max_error_rate')
+
+    # network settings
+    pool_connections = conf.getint('Network', 'pool_connections')
+    pool_maxsize = conf.getint('Network', 'pool_maxsize')
+    max_per_host = conf.getint('Network', 'max_per_host')
+    keep_alive = conf.getboolean('Network', 'keep_alive')
+
     # camera settings
     cam_address = conf.get('Camera', 'cam_address')
     cam_username = conf.get('Camera', 'cam_username')
     cam_pwd = conf.get('Camera', 'cam_password')
+    rpi_capture_format = conf.get('Camera', 'rpi_capture_format')
+    rpi_video_port = conf.getboolean('Camera', 'rpi_video_port')
+    cam_stream = conf.get('Camera', 'stream')
+    cam_stream_url = conf.get('Camera', 'stream_url')
+    cam_stream_max_age = conf.getfloat('Camera', 'stream_max_age')
+
+    # multi-camera settings
+    cameras = read_camera_sections(conf, [i.strip() for i in conf.get('Cameras', 'sections').split(',') if i.strip()])
 
     # Logging settings
     log_path = conf.get('Logging', 'log_path')
@@ -40,9 +126,16 @@ class Config:
     ntp_server = conf.get('Time', 'ntp_server')
     cap_interval = conf.getint('Time', 'cap_interval')
     daytime_offset = conf.getint('Time', 'daytime_offset')
+    min_sun_elevation = conf.getfloat('Time', 'min_sun_elevation')
 
     # Image settings
     jpeg_quality = conf.getint('Image', 'jpeg_quality')
+    jpeg_encoder = conf.get('Image', 'jpeg_encoder')
+    jpeg_subsampling = conf.get('Image', 'jpeg_subsampling')
+    jpeg_subsampling = None if jpeg_subsampling == 'default' else jpeg_subsampling
+    jpeg_progressive = conf.getboolean('Image', 'jpeg_progressive')
+    jpeg_passthrough = conf.getboolean('Image', 'jpeg_passthrough')
+    lossless_crop = conf.get('Image', 'lossless_crop')
     image_size = [int(i.strip()) for i in conf.get('Image', 'image_size').split(',')]
     masking_enabled = conf.getboolean('Image', 'masking')
     mask_path = conf.get('Image', 'mask_image')
@@ -56,6 +149,30 @@ class Config:
     influxdb_pwd = conf.get('Dashboard', 'password')
     influxdb_database = conf.get('Dashboard', 'database')
     influxdb_measurement = conf.get('Dashboard', 'measurement')
+    influxdb_batch_size = conf.getint('Dashboard', 'batch_size')
+    influxdb_flush_interval = conf.getfloat('Dashboard', 'flush_interval')
+    influxdb_buffer_size = conf.getint('Dashboard', 'buffer_size')
+
+    # feature settings
+    features_enabled = conf.getboolean('Features', 'enabled')
+    features_ratio_threshold = conf.getfloat('Features', 'ratio_threshold')
+    features_server = conf.get('Features', 'upload_server')
+    features_server = None if features_server in ('', 'None') else features_server
+    features_image_interval = conf.getint('Features', 'image_interval')
+
+    # adaptive capture settings
+    adaptive_enabled = conf.getboolean('Adaptive', 'enabled')
+    adaptive_max_interval = conf.getint('Adaptive', 'max_interval')
+    adaptive_change_threshold = conf.getfloat('Adaptive', 'change_threshold')
+    adaptive_ramp_threshold = conf.getfloat('Adaptive', 'ramp_threshold')
+    adaptive_duplicate_threshold = conf.getfloat('Adaptive', 'duplicate_threshold')
+
+    # metrics settings
+    metrics_enabled = conf.getboolean('Metrics', 'enabled')
+    metrics_host = conf.get('Metrics', 'host')
+    metrics_port = conf.getint('Metrics', 'port')
+    metrics_push_interval = conf.getint('Metrics', 'push_interval')
+    metrics_measurement = conf.get('Metrics', 'measurement')
 
     # Irradiance sensor settings
     irr_sensor_enabled = conf.getboolean('Irradiance_sensor', 'enabled')
@@ -67,6 +184,9 @@ class Config:
     irr_sensor_bytesize = conf.getint('Irradiance_sensor', 'bytesize')
     irr_sensor_parity = conf.get('Irradiance_sensor', 'parity')
     irr_sensor_stopbits = conf.getint('Irradiance_sensor', 'stopbits')
+    irr_sensor_bulk_read = conf.getboolean('Irradiance_sensor', 'bulk_read')
+    irr_sampling_rate = conf.getfloat('Irradiance_sensor', 'sampling_rate')
+    irr_flush_interval = conf.getfloat('Irradiance_sensor', 'flush_interval')
 
     # GSM settings
     gsm_enabled = conf.getboolean('GSM', 'enabled')
@@ -1,25 +1,28 @@
 import base64
 import datetime as dt
-import glob
 import hashlib
 import hmac
 import json
 import os
-import pickle
 import shutil
-import zipfile
+import threading
 from datetime import datetime
 
 import numpy as np
 import requests
-from astral import Astral
-from astral import Location
 from timeout_decorator import timeout
 
+from SkyImageAgg.Archive import PackArchive
+from SkyImageAgg.Backends import CAMERAS
 from SkyImageAgg.Preprocessor import SkyImage
-from SkyImageAgg.Collectors.GeoVisionCam import GeoVisionCam as IPCamera
-from SkyImageAgg.Collectors.RpiCam import RpiCam
+from SkyImageAgg.Manifest import Manifest
+from SkyImageAgg.Metrics import metrics
+from SkyImageAgg.MultiCamera import split_name
+from SkyImageAgg import Solar
 from SkyImageAgg import Utils
+from SkyImageAgg.SessionPool import get_default_pool
+from SkyImageAgg.Uploader import BodyReader
+from SkyImageAgg.Uploader import UploadBodyBuilder
 
 
 def encrypt_data(key, message):
@@ -41,7 +44,7 @@ def encrypt_data(key, message):
     return hmac.new(key, bytes(message, 'ascii'), digestmod=hashlib.sha256).hexdigest()
 
 
-def send_post_request(url, data):
+def send_post_request(url, data, session=None, timeout=None):
     """
     Send a post request to a given server/url.
 
@@ -51,6 +54,10 @@ def send_post_request(url, data):
         server's url.
     data : str
         data to be sent.
+    session : SessionPool or None, default None
+        the session pool to send the request through, if None a new connection is opened.
+    timeout : float or None, default None
+        the number of seconds the connection may stall before the request is aborted.
 
     Returns
     -------
@@ -60,7 +67,33 @@ def send_post_request(url, data):
     post_data = {
         'data': data
     }
-    return requests.post(url, data=post_data)
+    return (session or requests).post(url, data=post_data, timeout=timeout)
+
+
+def send_form_body(url, body, session=None, timeout=None):
+    """
+    Send an already form-encoded body in a post request to a given server/url.
+
+    Parameters
+    ----------
+    url : str
+        server's url.
+    body : memoryview or bytes
+        form-encoded body, e.g. built by `UploadBodyBuilder`.
+    session : SessionPool or None, default None
+        the session pool to send the request through, if None a new connection is opened.
+    timeout : float or None, default None
+        the number of seconds the connection may stall before the request is aborted.
+
+    Returns
+    -------
+    requests.Response
+        http response.
+    """
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded'
+    }
+    return (session or requests).post(url, data=BodyReader(memoryview(body)), headers=headers, timeout=timeout)
 
 
 class TwilightCalc:
@@ -77,8 +110,10 @@ class TwilightCalc:
         location altitude.
     ntp_server : str
         the ntp server that you want to sync time with.
-    twilight_coll : str or dict of {int : (datetime.time, datetime.time)}
-        collection of times, if file is selected it's the path to the file, else it's a dictionary.
+    file : str or None
+        path to the binary twilight table, if None the table is kept only in memory.
+    table : TwilightTable or None
+        the annual twilight table, it's loaded (or computed) on the first lookup.
     """
 
     def __init__(
@@ -106,13 +141,14 @@ class TwilightCalc:
         in_memory : bool, default True
             if you want to keep the calculated times in memory instead of writing them on disk.
         file : str, default None
-            path to the pickle file that you to save the times in.
+            path to the binary file that you want to save the times in.
         """
         self.latitude = latitude
         self.longitude = longitude
         self.altitude = altitude
         self.ntp_server = ntp_server
-        self.twilight_coll = file
+        self.file = file
+        self.table = None
         self.sync_time()
 
         if in_memory and file:
@@ -120,7 +156,7 @@ class TwilightCalc:
 
         if in_memory:
             # collect the times and store it as an attribute
-            self.twilight_coll = self.collect_annual_twilight_times()
+            self.collect_annual_twilight_times()
 
     def find_sunrise_and_sunset_time(self, date=None):
         """
@@ -139,49 +175,40 @@ class TwilightCalc:
         if not date:
             date = dt.datetime.now(dt.timezone.utc).date()
 
-        astral = Astral()
-        astral.solar_depression = 'civil'
-        location = Location((
-            'custom',
-            'region',
+        sunrise, sunset = Solar.sunrise_and_sunset(
+            np.array([np.datetime64(date, 'D')]),
             self.latitude,
             self.longitude,
-            'UTC',
             self.altitude
-        ))
-        sun = location.sun(date=date)
-
-        return sun['sunrise'].time(), sun['sunset'].time()
+        )
+        return Solar.TwilightTable.seconds_to_time(sunrise[0]), Solar.TwilightTable.seconds_to_time(sunset[0])
 
     def collect_annual_twilight_times(self):
         """
         Collect the annual sunrise/sunset times with respect to the location of the camera.
 
+        All the days are calculated at once and if `file` is set, the table is written there.
+
         Returns
         -------
-        dict of {int : (datetime.time, datetime.time)}
-            a dictionary with day order as its keys and tuple of twilight times as its values.
+        TwilightTable
+            table of twilight times indexed by the day order.
         """
-        coll = {  # storing location coordinates as -1 as its key in the collection
-            -1: (self.latitude,
-                 self.longitude)
-        }
-
-        dates = np.arange(
-            # 2020 is chosen as it's a leap year with 366 days
-            dt.datetime(2020, 1, 1),
-            dt.datetime(2021, 1, 1),
-            dt.timedelta(days=1)
-        ).astype(dt.datetime).tolist()
+        self.table = Solar.TwilightTable.compute(self.latitude, self.longitude, self.altitude)
 
-        for date in dates:
-            coll[date.timetuple().tm_yday] = self.find_sunrise_and_sunset_time(date=date)
+        if self.file:
+            self.table.save(self.file)
 
-        if isinstance(self.twilight_coll, str):
-            with open(self.twilight_coll, 'wb') as f:
-                pickle.dump(coll, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return self.table
 
-        return coll
+    def _load_table(self):
+        try:
+            table = Solar.TwilightTable.load(self.file)
+        except (OSError, ValueError):
+            return None
+        if not table.is_located_at(self.latitude, self.longitude, self.altitude):
+            return None
+        return table
 
     def get_twilight_times_by_day(self, day_of_year):
         """
@@ -197,17 +224,12 @@ class TwilightCalc:
         tuple of (datetime.time, datetime.time)
             sunrise and sunset times
         """
-        if isinstance(self.twilight_coll, str):
-            if not os.path.exists(self.twilight_coll):
+        if self.table is None:
+            self.table = self._load_table() if self.file else None
+            if self.table is None:
                 self.collect_annual_twilight_times()
 
-            with open(self.twilight_coll, 'rb') as handle:
-                coll = pickle.load(handle)
-
-            return coll[day_of_year]
-        else:
-
-            return self.twilight_coll[day_of_year]
+        return self.table[day_of_year]
 
     def has_location_changed(self):
         """
@@ -218,11 +240,9 @@ class TwilightCalc:
         bool
             True if the location has changed, false otherwise.
         """
-        try:
-            if self.get_twilight_times_by_day(-1) == (self.latitude, self.longitude):
-                return False
-        except Exception:
-            return True
+        if self.file:
+            return self._load_table() is None
+        return self.table is None or not self.table.is_located_at(self.latitude, self.longitude, self.altitude)
 
     def sync_time(self):
         """
@@ -253,6 +273,8 @@ class Controller(SkyImage):
         the SHA-256 key provided by the vendor.
     storage_path : str
         the path to the storage directory.
+    manifest : Manifest
+        the index of the images in `storage_path`.
     time_format : str
         the time format.
     cam_username : str
@@ -261,6 +283,8 @@ class Controller(SkyImage):
         password for the IP camera.
     cam_address : str or None, default 'rpi'
         url to the IP camera login page, if default, RPi camera used if attached.
+    session_pool : SessionPool
+        the pool of keep-alive connections used for uploads and the IP camera.
     """
 
     def __init__(
@@ -272,7 +296,9 @@ class Controller(SkyImage):
             time_format,
             cam_username,
             cam_pwd,
-            cam_address='rpi'
+            cam_address='rpi',
+            session_pool=None,
+            camera=None
     ):
         """
         Construct a controller object.
@@ -295,13 +321,21 @@ class Controller(SkyImage):
             password for the IP camera.
         cam_address : str or None, default 'rpi'
             url to the IP camera login page, if default, RPi camera used if attached.
+        session_pool : SessionPool or None, default None
+            the pool of keep-alive connections, if None the process-wide pool is used.
+        camera : Cam or None, default None
+            an already constructed camera, it overrides `cam_address`.
         """
-        if cam_address == 'rpi':
-            cam_obj = RpiCam()
+        self.session_pool = session_pool or get_default_pool()
+
+        if camera is not None:
+            cam_obj = camera
+        elif cam_address == 'rpi':
+            cam_obj = CAMERAS.load('rpi')()
         elif not cam_address:
             cam_obj = None
         else:
-            cam_obj = IPCamera(cam_address)
+            cam_obj = CAMERAS.load('geovision')(cam_address, session_pool=self.session_pool)
             cam_obj.login(cam_username, cam_pwd)
 
         super().__init__(camera=cam_obj)
@@ -311,10 +345,60 @@ class Controller(SkyImage):
         self.server = server
         self.time_format = time_format
         self.storage_path = storage_path
+        # every thread gets its own body builder to reuse its buffer
+        self._local = threading.local()
 
         # create the main storage if doesn't exist
         if not os.path.exists(self.storage_path):
             os.mkdir(self.storage_path)
+        # index of the images in the main storage
+        self.manifest = Manifest(self.storage_path)
+
+    def to_iso_format(self, time_stamp):
+        """
+        Convert the timestamp of an image to the server time format (iso).
+
+        Parameters
+        ----------
+        time_stamp : str or datetime.datetime
+            the timestamp of the image as string (in `time_format`, or the image name of a multi-camera site) or
+            datetime object.
+
+        Returns
+        -------
+        str
+            the timestamp in iso format.
+        """
+        if isinstance(time_stamp, datetime):
+            return time_stamp.isoformat()
+        return datetime.strptime(split_name(time_stamp)[0], self.time_format).isoformat()
+
+    @property
+    def body_builder(self):
+        """
+        UploadBodyBuilder: the upload body builder of the calling thread.
+        """
+        try:
+            return self._local.builder
+        except AttributeError:
+            self._local.builder = UploadBodyBuilder(self.key, self.client_id)
+            return self._local.builder
+
+    def builder_for(self, time_stamp):
+        """
+        Get the upload body builder of an image, it's overridden by the sites with several cameras.
+
+        Parameters
+        ----------
+        time_stamp : str or datetime.datetime
+            the timestamp (name) of the image.
+
+        Returns
+        -------
+        UploadBodyBuilder
+            the body builder of the calling thread.
+        """
+        return self.body_builder
 
     def prepare_as_post_req(self, time_stamp=datetime.utcnow()):
         """
@@ -330,11 +414,7 @@ class Controller(SkyImage):
         str
             JSON data.
         """
-        # converting the time to the server time format (iso)
-        if isinstance(time_stamp, datetime):
-            time_stamp = time_stamp.isoformat()
-        else:
-            time_stamp = datetime.strptime(time_stamp, self.time_format).isoformat()
+        time_stamp = self.to_iso_format(time_stamp)
 
         encoded_image = self.encode_to_jpeg()
 
@@ -347,7 +427,8 @@ class Controller(SkyImage):
         }
         return json.dumps(data)
 
-    def upload(self, time_stamp=datetime.utcnow()):
+    @metrics.timed('upload')
+    def upload(self, time_stamp=datetime.utcnow(), jpeg=None, timeout=None):
         """
         Upload the image to the server.
 
@@ -355,11 +436,64 @@ class Controller(SkyImage):
         ----------
         time_stamp : datetime.datetime, default datetime.utcnow()
             the timestamp of the image.
+        jpeg : bytes-like or None, default None
+            the already jpeg encoded image, if None the containing image is encoded.
+        timeout : float or None, default None
+            the number of seconds the connection may stall before the upload is aborted.
+        """
+        if jpeg is None:
+            jpeg = self.encode_to_jpeg()
+        self.upload_jpeg(jpeg, time_stamp=time_stamp, timeout=timeout)
+
+    def upload_jpeg(self, jpeg, time_stamp, timeout=None):
+        """
+        Upload an already jpeg encoded image to the server.
+
+        Parameters
+        ----------
+        jpeg : bytes-like
+            the jpeg encoded image.
+        time_stamp : str or datetime.datetime
+            the timestamp of the image.
+        timeout : float or None, default None
+            the number of seconds the connection may stall before the upload is aborted.
+        """
+        with metrics.span('serialize'):
+            body, signature = self.builder_for(time_stamp).build(jpeg, self.to_iso_format(time_stamp))
+        try:
+            with metrics.span('send'):
+                response = send_form_body(f'{self.server}{signature}', body, session=self.session_pool,
+                                          timeout=timeout)
+            json.loads(response.text)
+        except Exception as e:
+            raise ConnectionError(e)
+
+    @metrics.timed('upload_features')
+    def upload_features(self, features, time_stamp, server, timeout=None):
+        """
+        Upload the features of an image as a small JSON record, signed like the images.
+
+        Parameters
+        ----------
+        features : dict
+            the features (e.g. returned by `FeatureExtractor.extract`) and the sensor data.
+        time_stamp : str or datetime.datetime
+            the timestamp of the image.
+        server : str
+            url of the server receiving the features, the signature is appended to it.
+        timeout : float or None, default None
+            the number of seconds the connection may stall before the upload is aborted.
         """
-        json_data = self.prepare_as_post_req(time_stamp)
-        signature = encrypt_data(self.key, json_data)
+        builder = self.builder_for(time_stamp)
+        data = json.dumps({
+            'status': 'ok',
+            'id': builder.client_id,
+            'time': self.to_iso_format(time_stamp),
+            'features': features
+        }, allow_nan=False)
         try:
-            response = send_post_request(f'{self.server}{signature}', json_data)
+            response = send_post_request(f'{server}{encrypt_data(builder.key, data)}', data,
+                                         session=self.session_pool, timeout=timeout)
             json.loads(response.text)
         except Exception as e:
             raise ConnectionError(e)
@@ -376,20 +510,24 @@ class Controller(SkyImage):
         """
         self.upload(self.make_thumbnail(), time_stamp=time_stamp)
 
-    @timeout(15, timeout_exception=TimeoutError, use_signals=False)
-    def upload_with_timeout(self, time_stamp=datetime.utcnow()):
+    def upload_with_timeout(self, time_stamp=datetime.utcnow(), jpeg=None):
         """
         Upload the image to the server with a given timeout limit.
 
+        The timeout is applied on the connection, so the upload runs in this process and keeps using the pooled
+        keep-alive connections.
+
         Parameters
         ----------
         time_stamp : datetime.datetime, default datetime.utcnow()
             the timestamp of the image.
+        jpeg : bytes-like or None, default None
+            the already jpeg encoded image, if None the containing image is encoded.
         """
-        self.upload(time_stamp=time_stamp)
+        self.upload(time_stamp=time_stamp, jpeg=jpeg, timeout=15)
 
-    @Utils.retry_on_failure(attempts=2)
-    def retry_uploading_image(self, time_stamp=datetime.utcnow()):
+    @Utils.retry_on_exception(attempts=2)
+    def retry_uploading_image(self, time_stamp=datetime.utcnow(), jpeg=None):
         """
         Retry to upload a given image for a given number of attempts passed through the decorator.
 
@@ -397,8 +535,10 @@ class Controller(SkyImage):
         ----------
         time_stamp : datetime.datetime, default datetime.utcnow()
             the timestamp of the image.
+        jpeg : bytes-like or None, default None
+            the already jpeg encoded image, if None the containing image is encoded.
         """
-        self.upload_with_timeout(time_stamp=time_stamp)
+        self.upload_with_timeout(time_stamp=time_stamp, jpeg=jpeg)
 
     def get_available_free_space(self):
         """
@@ -412,13 +552,88 @@ class Controller(SkyImage):
         free_space = shutil.disk_usage(self.storage_path)[2]
         return round(free_space / 2 ** 30, 1)
 
-    def compress_storage(self):
+    def to_epoch(self, time_stamp):
+        """
+        Convert an image timestamp to seconds since the epoch.
+
+        Parameters
+        ----------
+        time_stamp : str
+            the timestamp of the image in `time_format` (UTC), or the image name of a multi-camera site.
+
+        Returns
+        -------
+        float
+            seconds since the epoch.
+        """
+        time_stamp = split_name(time_stamp)[0]
+        return datetime.strptime(time_stamp, self.time_format).replace(tzinfo=dt.timezone.utc).timestamp()
+
+    def get_archive(self, day):
+        """
+        Open the archive of a day in `storage_path`.
+
+        Parameters
+        ----------
+        day : str
+            the day as 'YYYYMMDD'.
+
+        Returns
+        -------
+        PackArchive
+            the daily archive (``YYYYMMDD.pack``).
         """
-        Compress all the jpeg images in `storage_path` and saves them in the same directory.
+        return PackArchive(os.path.join(self.storage_path, '{}.pack'.format(day)))
+
+    def compress_storage(self, on_archived=None):
         """
-        curr_time = dt.datetime.utcnow().strftime(self.time_format)
-        zip_archive = '{}.zip'.format(curr_time)
+        Move the jpeg images in `storage_path` into the daily archives in the same directory.
+
+        The images are appended to the pack of their day as they are (no recompression) and removed once the pack is
+        on the disk.
 
-        with zipfile.ZipFile(os.path.join(self.storage_path, zip_archive), 'w') as zf:
-            for file in glob.iglob(os.path.join(self.storage_path, '*.jpg')):
-                zf.write(filename=file)
+        Parameters
+        ----------
+        on_archived : callable or None, default None
+            called with the name, the day and the offset of every archived image.
+
+        Returns
+        -------
+        int
+            the number of archived images.
+        """
+        images = {}
+        for name in self.manifest.names():
+            try:
+                timestamp = self.to_epoch(name)
+            except ValueError:
+                continue  # not named after its timestamp
+            day = datetime.utcfromtimestamp(timestamp).strftime('%Y%m%d')
+            images.setdefault(day, []).append((self.manifest.path_of(name), name, timestamp))
+
+        archived = 0
+        for day, files in images.items():
+            with self.get_archive(day) as archive:
+                offsets = []
+                for file, name, timestamp in files:
+                    if name in archive:
+                        # archived before an interruption, but not removed
+                        offsets.append(archive.locate(name)[0])
+                        continue
+                    try:
+                        with open(file, 'rb') as f:
+                            offsets.append(archive.append(name, timestamp, f.read(), sync=False))
+                    except FileNotFoundError:
+                        offsets.append(None)
+                # remove the originals once the whole day is on the disk
+                archive.sync()
+
+            for (file, name, _), offset in zip(files, offsets):
+                self.manifest.remove(name)
+                if offset is None:
+                    continue
+                os.remove(file)
+                archived += 1
+                if on_archived:
+                    on_archived(name, day, offset)
+        return archived
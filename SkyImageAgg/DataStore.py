@@ -0,0 +1,350 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# upload status of the captures, the decimated images were not uploaded on purpose (only their features were)
+QUEUED, UPLOADED, STORED, DROPPED, DECIMATED = range(5)
+STATUS_NAMES = {QUEUED: 'queued', UPLOADED: 'uploaded', STORED: 'stored', DROPPED: 'dropped', DECIMATED: 'decimated'}
+
+CAPTURE_COLUMNS = [
+    ('time', '<f8'),  # image timestamp (seconds since the epoch)
+    ('irradiance', '<f4'),  # mean irradiance of the capture interval (W/m^2)
+    ('ext_temp', '<f4'),  # mean external temperature (°C)
+    ('cell_temp', '<f4'),  # mean cell temperature (°C)
+    ('capture_latency', '<f4'),  # seconds from the capture to the upload/storage
+    ('size', '<u4'),  # jpeg size in bytes
+    ('offset', '<i8'),  # offset of the image in the daily archive, -1 if it isn't archived
+    ('status', 'u1')  # upload status
+]
+
+
+def day_of(epoch_seconds):
+    """
+    Get the UTC day of a timestamp as 'YYYYMMDD'.
+    """
+    return time.strftime('%Y%m%d', time.gmtime(epoch_seconds))
+
+
+class ColumnTable:
+    """
+    An append-only table stored as one raw little-endian file per column.
+
+    Every column lives in ``<directory>/<name>.<type>`` (e.g. ``irradiance.f4``), so appending a block of rows is one
+    sequential write per column and reading a single column doesn't touch the others. If the writes were
+    interrupted, the table is as long as its shortest column and the next append cuts the other columns to that
+    length, so the rows stay aligned.
+
+    Attributes
+    ----------
+    directory : str
+        the directory of the table.
+    dtype : numpy.dtype
+        the structured type of a row.
+    """
+
+    def __init__(self, directory, columns):
+        """
+        Construct a table, the directory is created by the first append.
+
+        Parameters
+        ----------
+        directory : str
+            the directory of the table.
+        columns : list of tuple
+            names and types of the columns, e.g. ``[('time', '<f8'), ('irradiance', '<f4')]``.
+        """
+        self.directory = directory
+        self.dtype = np.dtype(columns)
+
+    def column_path(self, name):
+        """
+        Get the path of a column file.
+
+        Parameters
+        ----------
+        name : str
+            the column name.
+
+        Returns
+        -------
+        str
+            the path.
+        """
+        return os.path.join(self.directory, '{}.{}'.format(name, self.dtype[name].str[1:]))
+
+    def update(self, name, row, value):
+        """
+        Overwrite a value of a fixed-width column in place.
+
+        Parameters
+        ----------
+        name : str
+            the column name.
+        row : int
+            the row index.
+        value : scalar
+            the new value.
+        """
+        dtype = self.dtype[name]
+        with open(self.column_path(name), 'r+b') as f:
+            f.seek(int(row) * dtype.itemsize)
+            f.write(np.array(value, dtype=dtype).tobytes())
+
+    def append(self, rows):
+        """
+        Append rows to the table.
+
+        Parameters
+        ----------
+        rows : numpy.ndarray or dict of {str : array_like}
+            a structured array or the column arrays, all of the same length.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        length = len(self)
+        for name in self.dtype.names:
+            column = np.ascontiguousarray(rows[name], dtype=self.dtype[name])
+            with open(self.column_path(name), 'ab') as f:
+                # drop what's left of a torn append
+                if f.tell() != length * self.dtype[name].itemsize:
+                    f.truncate(length * self.dtype[name].itemsize)
+                column.tofile(f)
+
+    def __len__(self):
+        lengths = []
+        for name in self.dtype.names:
+            try:
+                lengths.append(os.path.getsize(self.column_path(name)) // self.dtype[name].itemsize)
+            except FileNotFoundError:
+                return 0
+        return min(lengths)
+
+    def read(self, columns=None, start=0, stop=None):
+        """
+        Read rows of the table.
+
+        Parameters
+        ----------
+        columns : list of str or None, default None
+            the columns to read, all of them if None.
+        start : int, default 0
+            the first row.
+        stop : int or None, default None
+            the row after the last one, the end of the table if None.
+
+        Returns
+        -------
+        dict of {str : numpy.ndarray}
+            the column arrays.
+        """
+        length = len(self)
+        start, stop, _ = slice(start, stop).indices(length)
+        count = max(stop - start, 0)
+        result = {}
+        for name in columns or self.dtype.names:
+            dtype = self.dtype[name]
+            if count:
+                result[name] = np.fromfile(self.column_path(name), dtype=dtype, count=count,
+                                           offset=start * dtype.itemsize)
+            else:
+                result[name] = np.empty(0, dtype=dtype)
+        return result
+
+
+class DataStore:
+    """
+    Daily append-only column tables (``<name>-YYYYMMDD``) with time range queries.
+
+    Every row has a 'time' column in seconds since the epoch, which decides its daily table, so a range query only
+    reads the time columns of the days it covers. Rows added by `record` are buffered in memory until `flush`.
+
+    Attributes
+    ----------
+    directory : str
+        the directory of the daily tables.
+    name : str
+        the prefix of the table names.
+    dtype : numpy.dtype
+        the structured type of a row.
+    """
+
+    def __init__(self, directory, name, columns):
+        """
+        Construct a store.
+
+        Parameters
+        ----------
+        directory : str
+            the directory of the daily tables.
+        name : str
+            the prefix of the table names.
+        columns : list of tuple
+            names and types of the columns, including ``('time', '<f8')``.
+        """
+        self.directory = directory
+        self.name = name
+        self.dtype = np.dtype(columns)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def table(self, day):
+        """
+        Get the table of a day.
+
+        Parameters
+        ----------
+        day : str
+            the day as 'YYYYMMDD'.
+
+        Returns
+        -------
+        ColumnTable
+            the table.
+        """
+        return ColumnTable(os.path.join(self.directory, '{}-{}'.format(self.name, day)), self.dtype)
+
+    def days(self):
+        """
+        Get the days that have a table.
+
+        Returns
+        -------
+        list of str
+            the sorted days as 'YYYYMMDD'.
+        """
+        prefix = self.name + '-'
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name[len(prefix):] for name in names
+            if name.startswith(prefix) and name[len(prefix):].isdigit() and len(name) == len(prefix) + 8
+        )
+
+    def append(self, rows):
+        """
+        Write rows into their daily tables.
+
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            a structured array of `dtype`.
+        """
+        rows = np.asarray(rows, dtype=self.dtype)
+        if not len(rows):
+            return
+        days = rows['time'] // 86400
+        for block in np.split(rows, np.flatnonzero(np.diff(days)) + 1):
+            self.table(day_of(block['time'][0])).append(block)
+
+    def record(self, **values):
+        """
+        Buffer a row, the missing columns are zero.
+
+        Parameters
+        ----------
+        values
+            the column values, 'time' is required.
+        """
+        row = np.zeros((), dtype=self.dtype)
+        for name, value in values.items():
+            row[name] = value
+        with self._lock:
+            self._pending.append(row)
+
+    def flush(self):
+        """
+        Write the buffered rows.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        try:
+            self.append(np.array(pending, dtype=self.dtype))
+        except Exception:
+            with self._lock:
+                self._pending[:0] = pending
+            raise
+
+    def query(self, start, end, columns=None):
+        """
+        Get the rows in a time range, including the buffered ones.
+
+        Parameters
+        ----------
+        start : float
+            start of the range (inclusive) in seconds since the epoch.
+        end : float
+            end of the range (exclusive) in seconds since the epoch.
+        columns : list of str or None, default None
+            the columns to read, all of them if None.
+
+        Returns
+        -------
+        dict of {str : numpy.ndarray}
+            the column arrays sorted by time.
+        """
+        columns = list(columns or self.dtype.names)
+        first, last = day_of(start), day_of(max(end - 1e-6, start))
+        parts = {name: [] for name in columns}
+        times = []
+        for day in self.days():
+            if not first <= day <= last:
+                continue
+            table = self.table(day)
+            time_column = table.read(['time'])['time']
+            rows = np.flatnonzero((time_column >= start) & (time_column < end))
+            if not len(rows):
+                continue
+            data = table.read(columns, rows[0], rows[-1] + 1)
+            selected = rows - rows[0]
+            times.append(time_column[rows])
+            for name in columns:
+                parts[name].append(data[name][selected])
+
+        with self._lock:
+            pending = np.array(self._pending, dtype=self.dtype)
+        if len(pending):
+            pending = pending[(pending['time'] >= start) & (pending['time'] < end)]
+            times.append(pending['time'])
+            for name in columns:
+                parts[name].append(pending[name])
+
+        if not times:
+            return {name: np.empty(0, dtype=self.dtype[name]) for name in columns}
+        order = np.argsort(np.concatenate(times), kind='stable')
+        return {name: np.concatenate(parts[name])[order] for name in columns}
+
+    def update(self, timestamp, **values):
+        """
+        Overwrite the columns of the rows of a timestamp in place, e.g. the upload status.
+
+        Parameters
+        ----------
+        timestamp : float
+            the row time in seconds since the epoch.
+        values
+            the new column values.
+
+        Returns
+        -------
+        int
+            the number of updated rows.
+        """
+        updated = 0
+        with self._lock:
+            for row in self._pending:
+                if row['time'] == timestamp:
+                    for name, value in values.items():
+                        row[name] = value
+                    updated += 1
+        if updated:
+            return updated
+
+        table = self.table(day_of(timestamp))
+        for row in np.flatnonzero(table.read(['time'])['time'] == timestamp):
+            for name, value in values.items():
+                table.update(name, row, value)
+            updated += 1
+        return updated
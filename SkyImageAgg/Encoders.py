@@ -0,0 +1,286 @@
+"""
+Pluggable jpeg encoders.
+
+OpenCV is always available; Pillow (or its drop-in replacement Pillow-SIMD) and TurboJPEG (PyTurboJPEG) are used if
+they are installed. `select_encoder` measures the available backends on a frame of the configured size and picks the
+fastest one.
+"""
+import io
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# chroma subsampling options, None keeps the default of the backend (4:2:0 for all of them)
+SUBSAMPLING = (None, '444', '422', '420')
+
+
+class JpegEncoder:
+    """
+    Base class of the jpeg encoders.
+
+    Attributes
+    ----------
+    name : str
+        the backend name.
+    """
+    name = None
+
+    @classmethod
+    def available(cls):
+        """
+        Check if the backend can be used.
+
+        Returns
+        -------
+        bool
+            True if the backend library is installed.
+        """
+        return True
+
+    def encode(self, image, quality, subsampling=None, progressive=False):
+        """
+        Encode an image.
+
+        Parameters
+        ----------
+        image : numpy.array
+            a BGR or grayscale uint8 image.
+        quality : int
+            the jpeg quality (1-100).
+        subsampling : str or None, default None
+            '444', '422' or '420', the backend default if None.
+        progressive : bool, default False
+            make a progressive jpeg.
+
+        Returns
+        -------
+        bytes-like
+            the jpeg encoded image.
+        """
+        if quality is None:
+            raise TypeError('It seems jpeg_quality attr is set to None!')
+        return self._encode(image, quality, subsampling, progressive)
+
+    def _encode(self, image, quality, subsampling, progressive):
+        # the backend specific part of `encode`, the quality is checked already
+        raise NotImplementedError
+
+
+class OpenCVEncoder(JpegEncoder):
+    name = 'opencv'
+
+    _SUBSAMPLING = {
+        '444': getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_444', None),
+        '422': getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_422', None),
+        '420': getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_420', None)
+    }
+
+    def _encode(self, image, quality, subsampling, progressive):
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        if progressive:
+            params += [int(cv2.IMWRITE_JPEG_PROGRESSIVE), 1]
+        if subsampling and image.ndim == 3:
+            if self._SUBSAMPLING.get(subsampling) is None:
+                raise ValueError(f'Chroma subsampling {subsampling} is not supported by this OpenCV version!')
+            params += [int(cv2.IMWRITE_JPEG_SAMPLING_FACTOR), self._SUBSAMPLING[subsampling]]
+        ok, jpeg = cv2.imencode('.jpg', image, params)
+        if not ok:
+            raise ValueError('The image could not be encoded!')
+        return jpeg
+
+
+class PillowEncoder(JpegEncoder):
+    name = 'pillow'
+
+    _SUBSAMPLING = {None: -1, '444': 0, '422': 1, '420': 2}
+
+    @classmethod
+    def available(cls):
+        try:
+            import PIL.Image  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _encode(self, image, quality, subsampling, progressive):
+        from PIL import Image
+
+        image = np.ascontiguousarray(image)
+        size = (image.shape[1], image.shape[0])
+        if image.ndim == 2:
+            pil_image = Image.frombuffer('L', size, image, 'raw', 'L', 0, 1)
+        else:
+            # the raw decoder swaps the channels, no intermediate RGB copy is made
+            pil_image = Image.frombuffer('RGB', size, image, 'raw', 'BGR', 0, 1)
+        output = io.BytesIO()
+        pil_image.save(
+            output,
+            format='JPEG',
+            quality=quality,
+            subsampling=self._SUBSAMPLING[subsampling],
+            progressive=progressive
+        )
+        return output.getbuffer()
+
+
+class TurboJpegEncoder(JpegEncoder):
+    name = 'turbojpeg'
+
+    def __init__(self):
+        from turbojpeg import TurboJPEG
+        self._turbojpeg = TurboJPEG()
+
+    @classmethod
+    def available(cls):
+        try:
+            from turbojpeg import TurboJPEG
+            TurboJPEG()  # loads the libjpeg-turbo shared library
+        except Exception:
+            return False
+        return True
+
+    def _encode(self, image, quality, subsampling, progressive):
+        import turbojpeg
+
+        kwargs = {'quality': quality}
+        if image.ndim == 2:
+            kwargs['pixel_format'] = turbojpeg.TJPF_GRAY
+            kwargs['jpeg_subsample'] = turbojpeg.TJSAMP_GRAY
+        else:
+            kwargs['pixel_format'] = turbojpeg.TJPF_BGR
+            kwargs['jpeg_subsample'] = {
+                None: turbojpeg.TJSAMP_420,
+                '444': turbojpeg.TJSAMP_444,
+                '422': turbojpeg.TJSAMP_422,
+                '420': turbojpeg.TJSAMP_420
+            }[subsampling]
+        if progressive:
+            kwargs['flags'] = turbojpeg.TJFLAG_PROGRESSIVE
+        return self._turbojpeg.encode(np.ascontiguousarray(image), **kwargs)
+
+
+ENCODERS = {encoder.name: encoder for encoder in (OpenCVEncoder, PillowEncoder, TurboJpegEncoder)}
+
+
+def available_encoders():
+    """
+    Get the names of the backends that can be used.
+
+    Returns
+    -------
+    list of str
+        the backend names.
+    """
+    return [name for name, encoder in ENCODERS.items() if encoder.available()]
+
+
+def benchmark(image, quality, subsampling=None, progressive=False, repeat=3, names=None):
+    """
+    Measure the encoding time and the output size of the backends.
+
+    Parameters
+    ----------
+    image : numpy.array
+        the image to encode.
+    quality : int
+        the jpeg quality.
+    subsampling : str or None, default None
+        the chroma subsampling.
+    progressive : bool, default False
+        make progressive jpegs.
+    repeat : int, default 3
+        the best time of `repeat` runs is reported.
+    names : list of str or None, default None
+        the backends to measure, all the available ones if None.
+
+    Returns
+    -------
+    list of dict
+        'name', 'seconds' and 'size' per backend, sorted by time. Backends that failed have 'error' instead.
+    """
+    results = []
+    for name in names or available_encoders():
+        try:
+            encoder = ENCODERS[name]()
+            encoder.encode(image, quality, subsampling, progressive)  # warm up
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                jpeg = encoder.encode(image, quality, subsampling, progressive)
+                best = min(best, time.perf_counter() - start)
+            results.append({'name': name, 'seconds': best, 'size': len(memoryview(jpeg).cast('B'))})
+        except Exception as e:
+            results.append({'name': name, 'seconds': float('inf'), 'size': 0, 'error': str(e)})
+    return sorted(results, key=lambda result: result['seconds'])
+
+
+def select_encoder(name='auto', shape=(1000, 1000), quality=70, subsampling=None, progressive=False):
+    """
+    Make an encoder by name or pick the fastest available one.
+
+    Parameters
+    ----------
+    name : str, default 'auto'
+        'auto', 'opencv', 'pillow' or 'turbojpeg'.
+    shape : tuple of int, default (1000, 1000)
+        (height, width) of the test frame for 'auto'.
+    quality : int, default 70
+        the jpeg quality for 'auto'.
+    subsampling : str or None, default None
+        the chroma subsampling for 'auto'.
+    progressive : bool, default False
+        progressive setting for 'auto'.
+
+    Returns
+    -------
+    JpegEncoder
+        the encoder.
+    """
+    if name != 'auto':
+        if name not in ENCODERS:
+            raise ValueError(f'Unknown jpeg encoder: {name}!')
+        if not ENCODERS[name].available():
+            raise ImportError(f'The {name} jpeg encoder is not installed!')
+        return ENCODERS[name]()
+
+    candidates = available_encoders()
+    if len(candidates) == 1:
+        return ENCODERS[candidates[0]]()
+    # a noisy gradient, about as hard to compress as a sky frame
+    rng = np.random.default_rng(0)
+    image = (np.linspace(96, 224, shape[1])[:, np.newaxis] + rng.integers(0, 16, (*shape, 3))).astype(np.uint8)
+    fastest = benchmark(image, quality, subsampling, progressive, repeat=2, names=candidates)[0]
+    return ENCODERS[fastest['name'] if 'error' not in fastest else 'opencv']()
+
+
+_default_encoder = OpenCVEncoder()
+_default_lock = threading.Lock()
+
+
+def get_default_encoder():
+    """
+    Get the encoder used by `Preprocessor.encode_jpeg`.
+
+    Returns
+    -------
+    JpegEncoder
+        the default encoder (OpenCV unless another one was set).
+    """
+    return _default_encoder
+
+
+def set_default_encoder(encoder):
+    """
+    Set the encoder used by `Preprocessor.encode_jpeg`.
+
+    Parameters
+    ----------
+    encoder : JpegEncoder
+        the new default encoder.
+    """
+    global _default_encoder
+    with _default_lock:
+        _default_encoder = encoder
+
@@ -3,9 +3,6 @@ import os
 import time
 from logging import NullHandler
 
-import RPi.GPIO as GPIO
-import serial
-
 from SkyImageAgg import Utils
 from SkyImageAgg.Utils import has_internet
 
@@ -51,6 +48,8 @@ class Modem:
         """
         Set the GPIO pin.
         """
+        import RPi.GPIO as GPIO  # only available on the Raspberry Pi
+
         GPIO.setwarnings(False)
         GPIO.setmode(GPIO.BOARD)
         GPIO.setup(self.pin, GPIO.OUT)
@@ -77,6 +76,8 @@ class Modem:
         if self.is_power_on():
             self._logger.debug("Switching modem off...")
             self.set_pin()
+            import RPi.GPIO as GPIO
+
             GPIO.cleanup()
             # give modem some time to log out
             time.sleep(5)
@@ -89,6 +90,8 @@ class Modem:
         """
         if not self.serial_com:
             try:
+                import serial
+
                 self._logger.info('Enabling serial port {} with baudrate {}'.format(self.port, 115200))
                 self.serial_com = serial.Serial(self.port, baudrate=115200, timeout=1)
             except Exception as e:
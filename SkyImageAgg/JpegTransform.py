@@ -0,0 +1,225 @@
+"""
+Lossless transforms of jpeg images in the DCT domain.
+
+A jpeg can be cropped without decoding it when the top left corner of the crop window lies on an MCU (minimum coded
+unit) boundary. The crop is done by libjpeg-turbo, either through PyTurboJPEG or the `jpegtran` tool, whichever is
+installed.
+"""
+import shutil
+import subprocess
+from collections import namedtuple
+
+JpegInfo = namedtuple('JpegInfo', ['width', 'height', 'components', 'mcu_width', 'mcu_height', 'progressive'])
+JpegInfo.__doc__ = '''
+The frame header of a jpeg.
+
+Attributes
+----------
+width : int
+    the image width in pixels.
+height : int
+    the image height in pixels.
+components : int
+    the number of color components (1 for grayscale, 3 for color).
+mcu_width : int
+    the MCU width in pixels (8 times the largest horizontal sampling factor).
+mcu_height : int
+    the MCU height in pixels (8 times the largest vertical sampling factor).
+progressive : bool
+    whether the jpeg is progressive.
+'''
+
+# start of frame markers, except the differential, lossless and arithmetic coded ones
+_SOF_MARKERS = {0xC0: False, 0xC1: False, 0xC2: True}
+# markers without a length field
+_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7}
+
+
+def read_jpeg_info(jpeg):
+    """
+    Read the frame header of a jpeg without decoding it.
+
+    Parameters
+    ----------
+    jpeg : bytes-like
+        the jpeg image.
+
+    Returns
+    -------
+    JpegInfo or None
+        the frame header, None if it's not a (supported) jpeg.
+    """
+    data = memoryview(jpeg).cast('B')
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in _STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker == 0xDA:  # start of scan, there was no frame header
+            return None
+        length = data[i + 2] << 8 | data[i + 3]
+        if marker in _SOF_MARKERS:
+            if i + 2 + length > len(data) or length < 8:
+                return None
+            height = data[i + 5] << 8 | data[i + 6]
+            width = data[i + 7] << 8 | data[i + 8]
+            components = data[i + 9]
+            if length < 8 + 3 * components:
+                return None
+            factors = [data[i + 11 + 3 * c] for c in range(components)]
+            return JpegInfo(
+                width=width,
+                height=height,
+                components=components,
+                mcu_width=8 * max(f >> 4 for f in factors) if components > 1 else 8,
+                mcu_height=8 * max(f & 0x0F for f in factors) if components > 1 else 8,
+                progressive=_SOF_MARKERS[marker]
+            )
+        if marker & 0xF0 == 0xC0 and marker not in (0xC4, 0xC8, 0xCC):
+            return None  # lossless, hierarchical or arithmetic coded
+        i += 2 + length
+    return None
+
+
+def align_crop(crop_size, info):
+    """
+    Move the crop window up and left to the nearest MCU boundary, so it can be cropped losslessly.
+
+    The size of the window is kept, so it's shifted by less than one MCU (8 or 16 pixels).
+
+    Parameters
+    ----------
+    crop_size : tuple of (int, int, int, int)
+        corners of the crop frame (top, bottom, left, right).
+    info : JpegInfo
+        the frame header of the jpeg.
+
+    Returns
+    -------
+    tuple of (int, int, int, int)
+        corners of the aligned crop frame.
+    """
+    top, bottom, left, right = crop_size
+    aligned_top = top - top % info.mcu_height
+    aligned_left = left - left % info.mcu_width
+    return aligned_top, aligned_top + bottom - top, aligned_left, aligned_left + right - left
+
+
+class LosslessCropper:
+    """
+    Base class of the lossless crop backends.
+
+    Attributes
+    ----------
+    name : str
+        the backend name.
+    """
+    name = None
+
+    @classmethod
+    def available(cls):
+        """
+        Check if the backend can be used.
+
+        Returns
+        -------
+        bool
+            True if the backend is installed.
+        """
+        return False
+
+    def crop(self, jpeg, crop_size):
+        """
+        Crop a jpeg in the DCT domain.
+
+        Parameters
+        ----------
+        jpeg : bytes-like
+            the jpeg image.
+        crop_size : tuple of (int, int, int, int)
+            corners of the crop frame, the top left corner must lie on an MCU boundary.
+
+        Returns
+        -------
+        bytes
+            the cropped jpeg.
+        """
+        raise NotImplementedError
+
+
+class TurboJpegCropper(LosslessCropper):
+    name = 'turbojpeg'
+
+    def __init__(self):
+        from turbojpeg import TurboJPEG
+        self._turbojpeg = TurboJPEG()
+
+    @classmethod
+    def available(cls):
+        try:
+            from turbojpeg import TurboJPEG
+            return hasattr(TurboJPEG(), 'crop')
+        except Exception:
+            return False
+
+    def crop(self, jpeg, crop_size):
+        top, bottom, left, right = crop_size
+        return self._turbojpeg.crop(bytes(memoryview(jpeg).cast('B')), left, top, right - left, bottom - top)
+
+
+class JpegtranCropper(LosslessCropper):
+    name = 'jpegtran'
+
+    def __init__(self, executable=None):
+        self.executable = executable or shutil.which('jpegtran')
+
+    @classmethod
+    def available(cls):
+        return shutil.which('jpegtran') is not None
+
+    def crop(self, jpeg, crop_size):
+        top, bottom, left, right = crop_size
+        result = subprocess.run(
+            [self.executable, '-copy', 'all', '-crop', f'{right - left}x{bottom - top}+{left}+{top}'],
+            input=memoryview(jpeg).cast('B'),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        )
+        return result.stdout
+
+
+CROPPERS = {cropper.name: cropper for cropper in (TurboJpegCropper, JpegtranCropper)}
+
+
+def get_cropper(name='auto'):
+    """
+    Make a lossless crop backend.
+
+    Parameters
+    ----------
+    name : str, default 'auto'
+        'auto' (the first installed one), 'turbojpeg' or 'jpegtran'.
+
+    Returns
+    -------
+    LosslessCropper or None
+        the backend, None if it's not installed.
+    """
+    if name == 'auto':
+        for cropper in CROPPERS.values():
+            if cropper.available():
+                return cropper()
+        return None
+    if name not in CROPPERS:
+        raise ValueError(f'Unknown lossless crop backend: {name}!')
+    return CROPPERS[name]() if CROPPERS[name].available() else None
@@ -1,18 +1,322 @@
 import logging
+import os
+import threading
 import time
+from collections import deque
 from datetime import datetime
 from logging import Formatter
 from logging import StreamHandler
 from logging.handlers import TimedRotatingFileHandler
 
-from i2c_lcd import lcd
-from influxdb import InfluxDBClient
-
 _log_format = Formatter('[%(asctime)s] %(levelname)s %(threadName)s %(name)s %(message)s')
 
+# line protocol special characters
+_MEASUREMENT_ESCAPES = str.maketrans({',': r'\,', ' ': r'\ ', '\n': r'\n'})
+_KEY_ESCAPES = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ ', '\n': r'\n'})
+_STRING_ESCAPES = str.maketrans({'"': r'\"', '\\': '\\\\', '\n': r'\n'})
+
+
+def escape_measurement(name):
+    return str(name).translate(_MEASUREMENT_ESCAPES)
+
+
+def escape_key(key):
+    """
+    Escape a tag key, a tag value or a field key for the line protocol.
+    """
+    return str(key).translate(_KEY_ESCAPES)
+
+
+def format_field(value):
+    """
+    Format a field value for the line protocol.
+
+    Booleans are written as booleans, numbers as floats (no `i` suffix, to keep the field types of the existing
+    series) and anything else as an escaped, quoted string.
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(float(value))
+    return '"{}"'.format(str(value).translate(_STRING_ESCAPES))
+
+
+def make_line(measurement, tags, fields, time_ns=None):
+    """
+    Make a line protocol point.
+
+    Parameters
+    ----------
+    measurement : str
+        the measurement name.
+    tags : str
+        the escaped tag set starting with a comma (see `InfluxdbLogHandler.add_tags`) or ''.
+    fields : dict
+        field keys and values.
+    time_ns : int or None, default None
+        the timestamp in nanoseconds, the server time is used if None.
+
+    Returns
+    -------
+    str
+        the line.
+    """
+    line = '{}{} {}'.format(
+        escape_measurement(measurement),
+        tags,
+        ','.join('{}={}'.format(escape_key(k), format_field(v)) for k, v in fields.items())
+    )
+    if time_ns is not None:
+        line = '{} {}'.format(line, time_ns)
+    return line
+
+
+class BufferedLineWriter:
+    """
+    Write line protocol points to InfluxDB in batches from a background thread.
+
+    `put` only appends to a bounded ring buffer, so it never waits for the network. The flusher thread sends a batch
+    when `batch_size` points are buffered or every `flush_interval` seconds. Batches that can't be written are
+    appended to an overflow file, which is replayed once the server is reachable again, or kept in the buffer if
+    there is no overflow file.
+
+    Attributes
+    ----------
+    client : InfluxDBClient
+        the client.
+    database : str
+        the database name, created on the first connection if it doesn't exist.
+    overflow_file : str or None
+        the file holding the points that couldn't be written.
+    written : int
+        number of points written.
+    dropped : int
+        number of points lost because the buffer or the overflow file was full.
+    spilled : int
+        number of points written to the overflow file.
+    """
+
+    def __init__(
+            self,
+            client,
+            database,
+            batch_size=500,
+            flush_interval=10.0,
+            capacity=10000,
+            overflow_dir=None,
+            max_overflow_bytes=2 ** 24,
+            retry_interval=30.0
+    ):
+        """
+        Construct a writer and start its flusher thread.
+
+        Parameters
+        ----------
+        client : InfluxDBClient
+            the client.
+        database : str
+            the database name.
+        batch_size : int, default 500
+            maximum number of points per write.
+        flush_interval : float, default 10.0
+            maximum time in seconds a point waits in the buffer.
+        capacity : int, default 10000
+            size of the ring buffer, the oldest points are dropped when it's full.
+        overflow_dir : str or None, default None
+            where to keep the points that couldn't be written, they are dropped if None.
+        max_overflow_bytes : int, default 16 MiB
+            maximum size of the overflow file.
+        retry_interval : float, default 30.0
+            seconds to wait after a failed write.
+        """
+        self.client = client
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_overflow_bytes = max_overflow_bytes
+        self.retry_interval = retry_interval
+        self.overflow_file = os.path.join(overflow_dir, '{}.lp'.format(database)) if overflow_dir else None
+        if overflow_dir:
+            os.makedirs(overflow_dir, exist_ok=True)
+
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._buffer = deque()
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flushed = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._closed = False
+        self._db_ready = False
+        self._retry_at = 0
+        self._thread = threading.Thread(target=self._run, name='InfluxFlusher', daemon=True)
+        self._thread.start()
+
+    def put(self, line):
+        """
+        Buffer a point, it never blocks on the network.
+
+        Parameters
+        ----------
+        line : str
+            the line protocol point.
+        """
+        with self._lock:
+            if len(self._buffer) >= self._capacity:
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def _take(self):
+        with self._lock:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            self._in_flight = len(batch)
+            return batch
+
+    def _done(self):
+        with self._lock:
+            self._in_flight = 0
+            self._flushed.notify_all()
+
+    def _write(self, lines):
+        if not self._db_ready:
+            if self.database not in [db['name'] for db in self.client.get_list_database()]:
+                self.client.create_database(self.database)
+            self._db_ready = True
+        self.client.write(data=lines, params={'db': self.database}, protocol='line')
+
+    def _spill(self, lines):
+        """
+        Keep the points that couldn't be written, returns False if they were put back in the buffer.
+        """
+        if not self.overflow_file:
+            if self._closed:
+                self.dropped += len(lines)
+                return True
+            with self._lock:
+                free = self._capacity - len(self._buffer)
+                self.dropped += max(len(lines) - free, 0)
+                self._buffer.extendleft(reversed(lines[max(len(lines) - free, 0):]))
+            return False
+
+        data = ''.join(line + '\n' for line in lines).encode('utf-8')
+        try:
+            size = os.path.getsize(self.overflow_file)
+        except FileNotFoundError:
+            size = 0
+        if size + len(data) > self.max_overflow_bytes:
+            self.dropped += len(lines)
+        else:
+            with open(self.overflow_file, 'ab') as f:
+                f.write(data)
+            self.spilled += len(lines)
+        return True
+
+    def _replay(self):
+        """
+        Write the points of the overflow file, keep the rest in it if the server fails again.
+        """
+        if not self.overflow_file or not os.path.exists(self.overflow_file):
+            return True
+        with open(self.overflow_file, 'rb') as f:
+            lines = f.read().decode('utf-8').splitlines()
+        for i in range(0, len(lines), self.batch_size):
+            try:
+                self._write(lines[i:i + self.batch_size])
+            except Exception:
+                tmp = self.overflow_file + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(''.join(line + '\n' for line in lines[i:]).encode('utf-8'))
+                os.replace(tmp, self.overflow_file)
+                return False
+            self.written += len(lines[i:i + self.batch_size])
+        os.remove(self.overflow_file)
+        return True
+
+    def _flush_batch(self, batch):
+        if time.monotonic() < self._retry_at:
+            return self._spill(batch)
+        try:
+            self._write(batch)
+            self.written += len(batch)
+        except Exception:
+            self._retry_at = time.monotonic() + self.retry_interval
+            return self._spill(batch)
+        if not self._replay():
+            self._retry_at = time.monotonic() + self.retry_interval
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            while True:
+                batch = self._take()
+                if not batch:
+                    self._done()
+                    break
+                try:
+                    handled = self._flush_batch(batch)
+                except Exception:
+                    self.dropped += len(batch)
+                    handled = True
+                self._done()
+                if not handled or (len(self) < self.batch_size and not self._closed):
+                    break
+            if self._closed:
+                return
+
+    def flush(self, timeout=None):
+        """
+        Write the buffered points now and wait until the buffer is empty.
+
+        Parameters
+        ----------
+        timeout : float or None, default None
+            maximum time to wait in seconds.
+
+        Returns
+        -------
+        bool
+            True if the buffer was flushed in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._buffer or self._in_flight:
+                self._wakeup.set()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._flushed.wait(remaining if remaining is None else min(remaining, 0.1))
+        return True
+
+    def close(self, timeout=10):
+        """
+        Flush the buffered points and stop the flusher thread.
+
+        Parameters
+        ----------
+        timeout : float, default 10
+            maximum time to wait in seconds.
+        """
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+
 class DisplayLogHandler(logging.Handler):
     def __init__(self, header=''):
         super().__init__()
+        from i2c_lcd import lcd  # only available on the Raspberry Pi with the display
         self.lcd = lcd()
         self.header = header
 
@@ -27,67 +331,102 @@ class DisplayLogHandler(logging.Handler):
 
 
 class InfluxdbLogHandler(logging.Handler):
-    def __init__(self, host, username, pwd, database, measurement, port=8086):
+    """
+    Send the log records to an InfluxDB server without blocking the logging call.
+
+    The records are turned into line protocol points and buffered by a `BufferedLineWriter`.
+    """
+
+    def __init__(
+            self,
+            host,
+            username,
+            pwd,
+            database,
+            measurement,
+            port=8086,
+            batch_size=500,
+            flush_interval=10.0,
+            buffer_size=10000,
+            overflow_dir=None
+    ):
         super().__init__()
-        # connect to influxdb server
+        from influxdb import InfluxDBClient  # only needed if the dashboard is enabled
+
         self.client = InfluxDBClient(host=host, port=port, username=username, password=pwd)
         self.db = database
-        db_list = [i['name'] for i in self.client.get_list_database()]
-        # check if the database already exists
-        if not self.db in db_list:
-            # if not, make a new database
-            self.client.create_database(self.db)
-
         self.measurment = measurement
         self.tags = ''
+        self.writer = BufferedLineWriter(
+            self.client,
+            database,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            capacity=buffer_size,
+            overflow_dir=os.path.join(overflow_dir, measurement) if overflow_dir else None
+        )
 
     def add_tags(self, **kwargs):
         tag_set = [
-            ',{tag_key}={tag_value}'.format(tag_key=k, tag_value=v)
-            for k, v in kwargs.items()
+            ',{tag_key}={tag_value}'.format(tag_key=escape_key(k), tag_value=escape_key(v))
+            for k, v in sorted(kwargs.items())  # sorted tags are faster to parse for the server
         ]
         self.tags = ''.join(tag_set)
 
-    def emit(self, record):
-        line = '{measurement}{tags} ' \
-               'name="{name}",' \
-               'levelname="{levelname}",' \
-               'asctime="{asctime}",' \
-               'threadName="{threadName}",' \
-               'message="{message}"'.format(
-            measurement=self.measurment,
-            tags=self.tags,
-            name=record.name,
-            levelname=record.levelname,
-            asctime=record.asctime,
-            threadName=record.threadName,
-            message=record.message
+    def asctime(self, record):
+        formatter = self.formatter or _log_format
+        return formatter.formatTime(record, formatter.datefmt)
+
+    def make_line(self, record):
+        return make_line(
+            self.measurment,
+            self.tags,
+            {
+                'name': record.name,
+                'levelname': record.levelname,
+                'asctime': self.asctime(record),
+                'threadName': record.threadName,
+                'message': record.getMessage()
+            },
+            time_ns=int(record.created * 1e9)  # the points are written later in batches
         )
-        self.client.write(data=[line], params={'db': self.db}, protocol='line')
 
+    def emit(self, record):
+        try:
+            self.writer.put(self.make_line(record))
+        except Exception:
+            self.handleError(record)
 
-class SensorLogHandler(InfluxdbLogHandler):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    def flush(self):
+        self.writer.flush(timeout=10)
 
-    def emit(self, record):
-        line = '{measurement}{tags} ' \
-               'asctime="{asctime}",' \
-               'name="{name}",' \
-               'timestamp="{timestamp}",' \
-               'irradiance={irradiance},' \
-               'ext_temperature={ext_temperature},' \
-               'cell_temperature={cell_temperature}'.format(
-            measurement=self.measurment,
-            tags=self.tags,
-            asctime=record.asctime,
-            name=record.name,
-            timestamp=record.msg['timestamp'],
-            irradiance=record.msg['irradiance'],        # irradiance - float (W/m^2)
-            ext_temperature=record.msg['ext_temp'],     # external - float temperature (°C)
-            cell_temperature=record.msg['cell_temp']    # cell temperature - float (°C)
+    def close(self):
+        self.writer.close()
+        super().close()
+
+
+class SensorLogHandler(InfluxdbLogHandler):
+    def make_line(self, record):
+        return make_line(
+            self.measurment,
+            self.tags,
+            {
+                'asctime': self.asctime(record),
+                'name': record.name,
+                'timestamp': record.msg['timestamp'],
+                'irradiance': record.msg['irradiance'],  # irradiance - float (W/m^2)
+                'ext_temperature': record.msg['ext_temp'],  # external - float temperature (°C)
+                'cell_temperature': record.msg['cell_temp']  # cell temperature - float (°C)
+            },
+            time_ns=int(record.created * 1e9)
         )
-        self.client.write(data=[line], params={'db': self.db}, protocol='line')
+
+
+class MetricsLogHandler(InfluxdbLogHandler):
+    def make_line(self, record):
+        # the message is the dict of fields of `MetricsRegistry.fields`
+        return make_line(self.measurment, self.tags, record.msg, time_ns=int(record.created * 1e9))
+
 
 class Logger(logging.Logger):
     def __init__(self, name, level='DEBUG', format=_log_format):
@@ -101,8 +440,19 @@ class Logger(logging.Logger):
             handler.setFormatter(self.format)
         self.addHandler(handler)
 
-    def add_influx_handler(self, host, username, pwd, database, measurement, port=8086, tags=None, format=None):
-        handler = InfluxdbLogHandler(host, username, pwd, database, measurement, port=port)
+    def add_influx_handler(
+            self,
+            host,
+            username,
+            pwd,
+            database,
+            measurement,
+            port=8086,
+            tags=None,
+            format=None,
+            **buffer_kwargs
+    ):
+        handler = InfluxdbLogHandler(host, username, pwd, database, measurement, port=port, **buffer_kwargs)
         if tags:
             handler.add_tags(**tags)
         self.add_handler(handler, format=format)
@@ -131,10 +481,28 @@ class Logger(logging.Logger):
             database,
             measurement,
             format=Formatter('[%(asctime)s] %(name)s %(message)s'),
-            tags=None
+            tags=None,
+            **buffer_kwargs
     ):
-        handler = SensorLogHandler(host, username, pwd, database, measurement, port=port)
+        handler = SensorLogHandler(host, username, pwd, database, measurement, port=port, **buffer_kwargs)
         handler.setLevel(20)  # INFO level
         if tags:
             handler.add_tags(**tags)
         self.add_handler(handler, format=format)
+
+    def add_metrics_handler(
+            self,
+            host,
+            port,
+            username,
+            pwd,
+            database,
+            measurement,
+            tags=None,
+            **buffer_kwargs
+    ):
+        handler = MetricsLogHandler(host, username, pwd, database, measurement, port=port, **buffer_kwargs)
+        handler.setLevel(20)  # INFO level
+        if tags:
+            handler.add_tags(**tags)
+        self.add_handler(handler)
@@ -0,0 +1,180 @@
+import glob
+import os
+import threading
+from collections import OrderedDict
+
+_LOG = 'manifest.log'
+
+
+class Manifest:
+    """
+    A persistent index of the jpeg files in a directory.
+
+    Every added or removed file is appended to a log (``add <size> <name>`` / ``del <name>``) in the directory, so
+    listing the files costs O(files in the index) and never walks the directory. The directory is scanned only once,
+    when there is no log yet (e.g. the first run after an upgrade).
+
+    Attributes
+    ----------
+    directory : str
+        the indexed directory.
+    log_path : str
+        path to the log.
+    """
+
+    def __init__(self, directory, compact_threshold=1000):
+        """
+        Construct a manifest and load it from its log.
+
+        Parameters
+        ----------
+        directory : str
+            the indexed directory.
+        compact_threshold : int, default 1000
+            the log is rewritten when it holds this many more lines than the index has files.
+        """
+        self.directory = directory
+        self.log_path = os.path.join(directory, _LOG)
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._files = OrderedDict()
+        self._lines = 0
+        self._log = None
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        self.recover()
+
+    def path_of(self, name):
+        """
+        Get the path of a file in the directory.
+
+        Parameters
+        ----------
+        name : str
+            the name of the image (its timestamp).
+
+        Returns
+        -------
+        str
+            path to the jpeg file.
+        """
+        return os.path.join(self.directory, f'{name}.jpg')
+
+    def recover(self):
+        """
+        Load the index from the log and compact it, the directory is scanned if there is no log.
+        """
+        with self._lock:
+            if self._log:
+                self._log.close()
+
+            files = OrderedDict()
+            if os.path.exists(self.log_path):
+                with open(self.log_path) as f:
+                    for line in f:
+                        fields = line.rstrip('\n').split(' ', 2)
+                        try:
+                            if fields[0] == 'add':
+                                files[fields[2]] = int(fields[1])
+                            elif fields[0] == 'del':
+                                files.pop(fields[1], None)
+                        except (IndexError, ValueError):
+                            continue  # torn write of the last line
+            else:
+                for path in sorted(glob.iglob(os.path.join(self.directory, '*.jpg'))):
+                    files[os.path.basename(path)[:-len('.jpg')]] = os.path.getsize(path)
+
+            self._files = files
+            self._compact()
+
+    def _compact(self):
+        tmp_path = f'{self.log_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            for name, size in self._files.items():
+                f.write(f'add {size} {name}\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_path)
+        self._log = open(self.log_path, 'a')
+        self._lines = len(self._files)
+
+    def _append(self, line, sync):
+        self._log.write(line + '\n')
+        self._log.flush()
+        if sync:
+            os.fsync(self._log.fileno())
+        self._lines += 1
+        if self._lines - len(self._files) > self.compact_threshold:
+            self._log.close()
+            self._compact()
+
+    def add(self, name, size=None):
+        """
+        Add a file, which is already in the directory, to the index.
+
+        Parameters
+        ----------
+        name : str
+            the name of the image (its timestamp).
+        size : int or None, default None
+            the file size, it's read from the disk if None.
+        """
+        if size is None:
+            size = os.path.getsize(self.path_of(name))
+        with self._lock:
+            self._files.pop(name, None)
+            self._files[name] = size
+            self._append(f'add {size} {name}', sync=True)
+
+    def remove(self, name):
+        """
+        Remove a file from the index (not from the disk).
+
+        Parameters
+        ----------
+        name : str
+            the name of the image (its timestamp).
+        """
+        with self._lock:
+            if self._files.pop(name, None) is not None:
+                # a lost removal only makes the file show up again, so it's not synced
+                self._append(f'del {name}', sync=False)
+
+    def names(self):
+        """
+        Get the indexed files in the order they were added.
+
+        Returns
+        -------
+        list of str
+            the names of the images.
+        """
+        with self._lock:
+            return list(self._files)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._files)
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._files
+
+    @property
+    def total_size(self):
+        """
+        int: number of bytes occupied by the indexed files.
+        """
+        with self._lock:
+            return sum(self._files.values())
+
+    def close(self):
+        """
+        Close the log.
+        """
+        with self._lock:
+            if self._log:
+                self._log.close()
+                self._log = None
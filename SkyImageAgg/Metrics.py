@@ -0,0 +1,447 @@
+import bisect
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+# default latency buckets (upper bounds in seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    A thread-safe histogram with fixed buckets.
+
+    Attributes
+    ----------
+    buckets : tuple of float
+        upper bounds of the buckets, the last (implicit) bucket is +Inf.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Construct a histogram.
+
+        Parameters
+        ----------
+        buckets : tuple of float, default LATENCY_BUCKETS
+            sorted upper bounds of the buckets.
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        """
+        Add a value to the histogram.
+
+        Parameters
+        ----------
+        value : float
+            the observed value.
+        """
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """
+        Get the current state of the histogram.
+
+        Returns
+        -------
+        dict
+            'count', 'sum' and 'buckets' (list of (upper bound, cumulative count), the last bound is inf).
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative = []
+        running = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return {'count': count, 'sum': total, 'buckets': cumulative}
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        Parameters
+        ----------
+        q : float
+            the quantile between 0 and 1.
+
+        Returns
+        -------
+        float or None
+            the estimated quantile, None if the histogram is empty.
+        """
+        snapshot = self.snapshot()
+        if not snapshot['count']:
+            return None
+        rank = q * snapshot['count']
+        for bound, cumulative in snapshot['buckets']:
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+
+class Counter:
+    """
+    A thread-safe monotonic counter.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, n=1):
+        """
+        Increment the counter.
+
+        Parameters
+        ----------
+        n : int, default 1
+            the increment.
+        """
+        with self._lock:
+            self._value += n
+
+    @property
+    def value(self):
+        """
+        int: the current count.
+        """
+        with self._lock:
+            return self._value
+
+
+class _NullSpan:
+    # returned by `MetricsRegistry.span` when the metrics are disabled, so a disabled span costs one attribute check
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    Time a block of code on the monotonic clock, the duration is added to the span histogram on exit.
+
+    A block left by an exception is counted in the span errors, its duration is still observed.
+    """
+
+    __slots__ = ('_registry', '_name', '_start')
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._registry.histogram(self._name).observe(time.monotonic() - self._start)
+        if exc_type is not None:
+            self._registry.counter(f'{self._name}_errors').inc()
+        return False
+
+
+class MetricsRegistry:
+    """
+    Named span histograms and counters of the application, exported in the Prometheus text format.
+
+    The metrics are disabled until `enabled` is set, then `span` and `timed` return/call straight through and
+    `inc` does nothing.
+
+    Attributes
+    ----------
+    prefix : str
+        prefix of the exported metric names.
+    enabled : bool
+        whether the metrics are recorded.
+    buckets : tuple of float
+        upper bounds of the buckets of the span histograms.
+    """
+
+    def __init__(self, prefix='skyimager', enabled=False, buckets=LATENCY_BUCKETS):
+        """
+        Construct a registry.
+
+        Parameters
+        ----------
+        prefix : str, default 'skyimager'
+            prefix of the exported metric names.
+        enabled : bool, default False
+            whether the metrics are recorded.
+        buckets : tuple of float, default LATENCY_BUCKETS
+            upper bounds of the buckets of the span histograms.
+        """
+        self.prefix = prefix
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        """
+        Get a span histogram, it's created on the first call.
+
+        Parameters
+        ----------
+        name : str
+            the span name.
+
+        Returns
+        -------
+        Histogram
+            durations of the span in seconds.
+        """
+        try:
+            return self._histograms[name]
+        except KeyError:
+            with self._lock:
+                return self._histograms.setdefault(name, Histogram(self.buckets))
+
+    def add_histogram(self, name, histogram):
+        """
+        Export a histogram recorded elsewhere (e.g. the stage latencies of a `Pipeline`) as a span.
+
+        Parameters
+        ----------
+        name : str
+            the span name.
+        histogram : Histogram
+            the durations in seconds.
+        """
+        with self._lock:
+            self._histograms[name] = histogram
+
+    def counter(self, name):
+        """
+        Get a counter, it's created on the first call.
+
+        Parameters
+        ----------
+        name : str
+            the counter name.
+
+        Returns
+        -------
+        Counter
+            the counter.
+        """
+        try:
+            return self._counters[name]
+        except KeyError:
+            with self._lock:
+                return self._counters.setdefault(name, Counter())
+
+    def inc(self, name, n=1):
+        """
+        Increment a counter if the metrics are enabled.
+
+        Parameters
+        ----------
+        name : str
+            the counter name.
+        n : int, default 1
+            the increment.
+        """
+        if self.enabled:
+            self.counter(name).inc(n)
+
+    def span(self, name):
+        """
+        Time a block of code, e.g. `with metrics.span('capture'): ...`.
+
+        Parameters
+        ----------
+        name : str
+            the span name.
+
+        Returns
+        -------
+        Span or context manager
+            the span, a no-op if the metrics are disabled.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name)
+
+    def timed(self, name):
+        """
+        Decorate a function to time its calls as a span.
+
+        Parameters
+        ----------
+        name : str
+            the span name.
+
+        Returns
+        -------
+        callable
+            the decorator.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Span(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def collect(self):
+        """
+        Get the current state of the metrics.
+
+        Returns
+        -------
+        tuple of (dict of {str : dict}, dict of {str : int})
+            the `Histogram.snapshot` of every span and the value of every counter, sorted by name.
+        """
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        return {name: hist.snapshot() for name, hist in histograms}, {name: c.value for name, c in counters}
+
+    def fields(self):
+        """
+        Get the metrics as flat fields, e.g. for an InfluxDB point.
+
+        Returns
+        -------
+        dict of {str : int or float}
+            '<span>_count', '<span>_sum' and '<span>_p95' (upper bound of the bucket) of every span and the
+            counters.
+        """
+        histograms, counters = self.collect()
+        fields = {}
+        for name, snapshot in histograms.items():
+            fields[f'{name}_count'] = snapshot['count']
+            fields[f'{name}_sum'] = snapshot['sum']
+            rank = 0.95 * snapshot['count']
+            p95 = next((bound for bound, cumulative in snapshot['buckets'] if cumulative >= rank), None)
+            if snapshot['count'] and p95 != float('inf'):
+                fields[f'{name}_p95'] = p95
+        fields.update(counters)
+        return fields
+
+    def render(self):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        The spans are the `<prefix>_span_seconds` histogram labelled by span and the counters are
+        `<prefix>_<name>_total`.
+
+        Returns
+        -------
+        str
+            the exposition.
+        """
+        histograms, counters = self.collect()
+        lines = []
+        if histograms:
+            family = f'{self.prefix}_span_seconds'
+            lines.append(f'# HELP {family} Duration of the instrumented spans.')
+            lines.append(f'# TYPE {family} histogram')
+            for name, snapshot in histograms.items():
+                for bound, cumulative in snapshot['buckets']:
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{family}_bucket{{span="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{family}_sum{{span="{name}"}} {snapshot["sum"]!r}')
+                lines.append(f'{family}_count{{span="{name}"}} {snapshot["count"]}')
+        for name, value in counters.items():
+            lines.append(f'# TYPE {self.prefix}_{name}_total counter')
+            lines.append(f'{self.prefix}_{name}_total {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# the metrics of the application, enabled by `SkyScanner` if `Config.metrics_enabled` is set
+metrics = MetricsRegistry()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scraped every few seconds, not worth logging
+
+
+class MetricsServer:
+    """
+    Serve a registry at http://host:port/metrics for Prometheus (or curl) in a background thread.
+
+    Attributes
+    ----------
+    registry : MetricsRegistry
+        the exported metrics.
+    """
+
+    def __init__(self, registry=metrics, host='127.0.0.1', port=9100):
+        """
+        Construct the server, it binds the port.
+
+        Parameters
+        ----------
+        registry : MetricsRegistry, default metrics
+            the exported metrics.
+        host : str, default '127.0.0.1'
+            the address to listen on, the local host only by default.
+        port : int, default 9100
+            the port, 0 picks a free one.
+        """
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self._thread = None
+
+    @property
+    def port(self):
+        """
+        int: the bound port.
+        """
+        return self._server.server_address[1]
+
+    def start(self):
+        """
+        Start serving in a daemon thread.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop serving and close the socket.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
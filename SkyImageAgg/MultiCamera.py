@@ -0,0 +1,456 @@
+import logging
+import threading
+import time
+
+from SkyImageAgg.DataStore import STATUS_NAMES
+from SkyImageAgg.Metrics import Histogram
+from SkyImageAgg.Preprocessor import FramePreprocessor
+from SkyImageAgg.Preprocessor import get_binary_image
+from SkyImageAgg.Uploader import UploadBodyBuilder
+
+# separates the timestamp and the camera in the image names of a multi-camera site
+NAME_SEPARATOR = '@'
+
+
+def join_name(timestamp, camera):
+    """
+    Get the image name of a camera's capture, e.g. '2019-06-01_12-00-00@east'.
+
+    Parameters
+    ----------
+    timestamp : str
+        the image timestamp.
+    camera : str or None
+        the camera name, None for the single camera of a site.
+
+    Returns
+    -------
+    str
+        the image name.
+    """
+    return timestamp if camera is None else f'{timestamp}{NAME_SEPARATOR}{camera}'
+
+
+def split_name(name):
+    """
+    Split an image name into its timestamp and camera.
+
+    Parameters
+    ----------
+    name : str
+        the image name.
+
+    Returns
+    -------
+    tuple of (str, str or None)
+        the timestamp and the camera name, None if the name is just the timestamp.
+    """
+    timestamp, sep, camera = name.partition(NAME_SEPARATOR)
+    return timestamp, camera if sep else None
+
+
+def check_camera_name(name):
+    """
+    Check a camera name can be a part of the image names and file paths.
+
+    Parameters
+    ----------
+    name : str
+        the camera name.
+
+    Raises
+    ------
+    ValueError
+        if the name is empty or contains the separator, a path separator or whitespace.
+    """
+    if not name or NAME_SEPARATOR in name or '/' in name or '\\' in name or any(c.isspace() for c in name):
+        raise ValueError(f'Invalid camera name: {name!r}!')
+
+
+class MaskCache:
+    """
+    Share one `FramePreprocessor` between the cameras with the same mask.
+
+    A mask file is loaded once and the preprocessor fits it to the crop window once per frame resolution, so
+    cameras of the same model and mask share a single fitted mask.
+
+    Attributes
+    ----------
+    output_resolution : tuple of (int, int) or None
+        the number of pixels in x and y of the output images, if None the frames are not cropped.
+    passthrough : bool
+        whether jpeg frames are kept encoded when the preprocessing doesn't need their pixels.
+    cropper : LosslessCropper or None
+        the backend for cropping jpeg frames losslessly.
+    """
+
+    def __init__(self, output_resolution=None, passthrough=False, cropper=None):
+        """
+        Construct a mask cache.
+
+        Parameters
+        ----------
+        output_resolution : tuple of (int, int) or None, default None
+            the number of pixels in x and y of the output images.
+        passthrough : bool, default False
+            whether jpeg frames are kept encoded when the preprocessing doesn't need their pixels.
+        cropper : LosslessCropper or None, default None
+            the backend for cropping jpeg frames losslessly.
+        """
+        self.output_resolution = output_resolution
+        self.passthrough = passthrough
+        self.cropper = cropper
+        self._preprocessors = {}
+        self._lock = threading.Lock()
+
+    def get(self, mask_path=None):
+        """
+        Get the preprocessor of a mask.
+
+        Parameters
+        ----------
+        mask_path : str or None, default None
+            path to the mask, the frames are not masked if None.
+
+        Returns
+        -------
+        FramePreprocessor
+            the shared preprocessor.
+        """
+        with self._lock:
+            if mask_path not in self._preprocessors:
+                self._preprocessors[mask_path] = FramePreprocessor(
+                    mask=get_binary_image(mask_path) if mask_path else None,
+                    output_resolution=self.output_resolution,
+                    passthrough=self.passthrough,
+                    cropper=self.cropper
+                )
+            return self._preprocessors[mask_path]
+
+    def __len__(self):
+        return len(self._preprocessors)
+
+
+class CameraUnit:
+    """
+    One camera of a multi-camera site: the camera, its preprocessor, its upload identity and its metrics.
+
+    Attributes
+    ----------
+    name : str
+        the camera name, it's appended to the image names (see `join_name`).
+    camera : Cam
+        the camera object.
+    preprocessor : FramePreprocessor
+        crops and masks the frames of the camera.
+    client_id : int or str
+        the camera ID assigned by the vendor.
+    key : bytes
+        the SHA-256 key provided by the vendor.
+    captures : DataStore or None
+        daily tables of the capture metadata of the camera.
+    features : DataStore or None
+        daily tables of the image features of the camera.
+    capture_latency : Histogram
+        duration of the captures in seconds.
+    output_latency : Histogram
+        time from the start of the capture to the upload/storage in seconds.
+    captured : int
+        number of captured frames.
+    failed : int
+        number of failed captures.
+    skipped : int
+        number of capture instants skipped because the previous capture was still running.
+    """
+
+    def __init__(self, name, camera, preprocessor, client_id, key, captures=None, features=None):
+        """
+        Construct a camera unit.
+
+        Parameters
+        ----------
+        name : str
+            the camera name.
+        camera : Cam
+            the camera object.
+        preprocessor : FramePreprocessor
+            crops and masks the frames of the camera (e.g. shared through `MaskCache`).
+        client_id : int or str
+            the camera ID assigned by the vendor.
+        key : str
+            the SHA-256 key provided by the vendor.
+        captures : DataStore or None, default None
+            daily tables of the capture metadata of the camera.
+        features : DataStore or None, default None
+            daily tables of the image features of the camera.
+        """
+        check_camera_name(name)
+        self.name = name
+        self.camera = camera
+        self.preprocessor = preprocessor
+        self.client_id = client_id
+        self.key = bytes(key, 'ascii')
+        self.captures = captures
+        self.features = features
+        self.capture_latency = Histogram()
+        self.output_latency = Histogram()
+        self.captured = 0
+        self.failed = 0
+        self.skipped = 0
+        self._statuses = dict.fromkeys(STATUS_NAMES, 0)
+        self._lock = threading.Lock()
+        # every thread gets its own body builder to reuse its buffer
+        self._local = threading.local()
+
+    @property
+    def body_builder(self):
+        """
+        UploadBodyBuilder: the upload body builder of the calling thread.
+        """
+        try:
+            return self._local.builder
+        except AttributeError:
+            self._local.builder = UploadBodyBuilder(self.key, self.client_id)
+            return self._local.builder
+
+    def capture(self):
+        """
+        Capture a frame, kept encoded if the preprocessor can pass the camera jpegs through.
+
+        Returns
+        -------
+        numpy.array or bytes
+            the image or the jpeg.
+        """
+        if self.preprocessor.passthrough:
+            return self.camera.cap_jpeg()
+        return self.camera.cap_pic()
+
+    def count_capture(self, latency, failed=False):
+        """
+        Count a capture.
+
+        Parameters
+        ----------
+        latency : float
+            duration of the capture in seconds.
+        failed : bool, default False
+            whether the capture failed.
+        """
+        self.capture_latency.observe(latency)
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.captured += 1
+
+    def count_skip(self):
+        """
+        Count a capture instant skipped by the camera.
+        """
+        with self._lock:
+            self.skipped += 1
+
+    def count_output(self, status, latency):
+        """
+        Count an uploaded, queued, stored, dropped or decimated frame.
+
+        Parameters
+        ----------
+        status : int
+            the upload status (see `DataStore`).
+        latency : float
+            seconds from the capture to the upload/storage.
+        """
+        self.output_latency.observe(latency)
+        with self._lock:
+            self._statuses[status] += 1
+
+    def stats(self):
+        """
+        Get the metrics of the camera.
+
+        Returns
+        -------
+        dict
+            the capture counters, the number of frames per upload status ('uploaded', 'queued', 'stored', 'dropped'
+            and 'decimated') and the snapshots of the 'capture_latency' and 'output_latency' histograms.
+        """
+        with self._lock:
+            stats = {'captured': self.captured, 'failed': self.failed, 'skipped': self.skipped}
+            stats.update({STATUS_NAMES[status]: count for status, count in self._statuses.items()})
+        stats['capture_latency'] = self.capture_latency.snapshot()
+        stats['output_latency'] = self.output_latency.snapshot()
+        return stats
+
+
+class SyncCapture:
+    """
+    Trigger the captures of several cameras at the same instant.
+
+    Every camera has a capture thread waiting for the trigger, so the captures of a tick start together instead of
+    one after another. A camera that is still busy with the previous capture skips the tick, so a slow or
+    unreachable camera doesn't delay the others. The first failure of a camera is logged with its traceback, then
+    every `log_every`-th failure in a row, until the camera captures again.
+
+    Attributes
+    ----------
+    units : list of CameraUnit
+        the cameras.
+    feed : callable
+        called with a unit and the timestamp to capture the frame (e.g. `Pipeline.capture` of the unit source).
+    skew : Histogram
+        the spread of the capture start times of a tick in seconds.
+    logger : logging.Logger
+        logs the failed captures.
+    log_every : int
+        the number of failures in a row between two log records of a camera.
+    """
+
+    def __init__(self, units, feed, logger=None, log_every=60):
+        """
+        Construct a synchronized capture.
+
+        Parameters
+        ----------
+        units : list of CameraUnit
+            the cameras.
+        feed : callable
+            called with a unit and the timestamp in the capture thread of the unit.
+        logger : logging.Logger or None, default None
+            logs the failed captures, the module logger if None.
+        log_every : int, default 60
+            the number of failures in a row between two log records of a camera.
+        """
+        self.units = list(units)
+        self.feed = feed
+        self.logger = logger or logging.getLogger(__name__)
+        self.log_every = log_every
+        self.skew = Histogram()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._triggers = {unit.name: threading.Event() for unit in self.units}
+        self._pending = {}
+        self._busy = set()
+        self._stop = False
+        self._threads = []
+
+    def _work(self, unit):
+        trigger = self._triggers[unit.name]
+        failures = 0  # in a row
+        while True:
+            trigger.wait()
+            trigger.clear()
+            start = time.monotonic()
+            with self._lock:
+                if self._stop:
+                    return
+                timestamp, tick = self._pending.pop(unit.name)
+                tick['starts'].append(start)
+                if len(tick['starts']) == tick['count']:
+                    self.skew.observe(max(tick['starts']) - min(tick['starts']))
+
+            failed = False
+            try:
+                self.feed(unit, timestamp)
+            except Exception as e:
+                failed = True
+                failures += 1
+                if failures == 1:
+                    self.logger.exception(f'The capture of the {unit.name} camera failed!')
+                elif failures % self.log_every == 0:
+                    self.logger.error(f'The capture of the {unit.name} camera failed {failures} times in a row: {e!r}')
+            else:
+                if failures:
+                    self.logger.info(f'The {unit.name} camera captures again after {failures} failures.')
+                failures = 0
+            unit.count_capture(time.monotonic() - start, failed)
+
+            with self._idle:
+                self._busy.discard(unit.name)
+                self._idle.notify_all()
+
+    def trigger(self, timestamp):
+        """
+        Start the captures of the idle cameras, it doesn't wait for them.
+
+        Parameters
+        ----------
+        timestamp : str
+            the timestamp of the frames.
+
+        Returns
+        -------
+        list of str
+            the names of the triggered cameras.
+        """
+        with self._lock:
+            idle = [unit for unit in self.units if unit.name not in self._busy]
+            for unit in self.units:
+                if unit.name in self._busy:
+                    unit.count_skip()
+            tick = {'count': len(idle), 'starts': []}
+            for unit in idle:
+                self._busy.add(unit.name)
+                self._pending[unit.name] = timestamp, tick
+        for unit in idle:
+            self._triggers[unit.name].set()
+        return [unit.name for unit in idle]
+
+    def wait(self, timeout=None):
+        """
+        Wait until all the cameras are idle.
+
+        Parameters
+        ----------
+        timeout : float or None, default None
+            the maximum time to wait in seconds.
+
+        Returns
+        -------
+        bool
+            False on timeout.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._busy, timeout)
+
+    def start(self):
+        """
+        Start the capture threads.
+        """
+        self._stop = False
+        self._threads = [
+            threading.Thread(target=self._work, args=(unit,), name=f'capture-{unit.name}', daemon=True)
+            for unit in self.units
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the capture threads once their captures are done.
+
+        Parameters
+        ----------
+        timeout : float or None, default None
+            the maximum time to wait for the running captures in seconds.
+        """
+        self.wait(timeout)
+        with self._lock:
+            self._stop = True
+        for trigger in self._triggers.values():
+            trigger.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self):
+        """
+        Get the metrics of the cameras.
+
+        Returns
+        -------
+        dict of {str : dict}
+            `CameraUnit.stats` per camera name.
+        """
+        return {unit.name: unit.stats() for unit in self.units}
@@ -0,0 +1,359 @@
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from SkyImageAgg.Metrics import Histogram
+
+Frame = namedtuple('Frame', ['timestamp', 'captured_at', 'image', 'jpeg', 'source', 'analysis'], defaults=(None, None))
+Frame.__doc__ = '''
+An immutable frame passed between the pipeline stages.
+
+Attributes
+----------
+timestamp : str
+    the timestamp of the frame (used as its name).
+captured_at : float
+    `time.monotonic()` when the capture started.
+image : numpy.array or None
+    the pixels, read-only after preprocessing and dropped after encoding (before preprocessing, it's a list of
+    frames if the capture returns a bracket).
+jpeg : bytes or None
+    the jpeg encoded image, or the captured jpeg before the preprocessing if the frames are kept encoded.
+source : str or None
+    the name of the source (camera) that captured the frame, None for the default source.
+analysis : object
+    the result of the analysis of the preprocessed frame (e.g. its features), if the pipeline analyzes the frames.
+'''
+
+Source = namedtuple('Source', ['capture', 'preprocess', 'preprocess_jpeg'])
+
+DROP_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+
+class Stage:
+    """
+    A pipeline stage: a pool of workers taking frames from a bounded queue.
+
+    Attributes
+    ----------
+    name : str
+        the stage name.
+    func : callable
+        called with a frame, returns the frame for the next stage or None.
+    workers : int
+        number of worker threads.
+    queue : queue.Queue
+        the bounded input queue.
+    drop_policy : str
+        what to do with a frame when the queue is full: 'block' the producer (backpressure),
+        'drop_oldest' queued frame or 'drop_newest' (the incoming one).
+    latency : Histogram
+        time spent in `func` in seconds.
+    dropped : int
+        number of dropped frames.
+    logger : logging.Logger
+        logs the errors of `func` and `on_drop`, they don't stop the workers.
+    """
+
+    def __init__(self, name, func, workers=1, maxsize=2, drop_policy='drop_oldest', on_drop=None, logger=None):
+        """
+        Construct a stage.
+
+        Parameters
+        ----------
+        name : str
+            the stage name.
+        func : callable
+            called with a frame, returns the frame for the next stage or None.
+        workers : int, default 1
+            number of worker threads.
+        maxsize : int, default 2
+            capacity of the input queue.
+        drop_policy : str, default 'drop_oldest'
+            one of 'block', 'drop_oldest' and 'drop_newest'.
+        on_drop : callable or None, default None
+            called with the stage name and every dropped frame.
+        logger : logging.Logger or None, default None
+            logs the errors of `func` and `on_drop`, the module logger if None.
+        """
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f'Unknown drop policy: {drop_policy}!')
+
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.drop_policy = drop_policy
+        self.on_drop = on_drop
+        self.next = None
+        self.latency = Histogram()
+        self.dropped = 0
+        self.logger = logger or logging.getLogger(__name__)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _drop(self, frame):
+        with self._lock:
+            self.dropped += 1
+        if self.on_drop:
+            try:
+                self.on_drop(self.name, frame)
+            except Exception:
+                self.logger.exception(f'The {self.name} stage could not hand over the dropped frame {frame.timestamp}!')
+
+    def put(self, frame):
+        """
+        Queue a frame according to the drop policy.
+
+        Parameters
+        ----------
+        frame : Frame
+            the frame.
+        """
+        if self.drop_policy == 'block':
+            self.queue.put(frame)
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except queue.Full:
+                if self.drop_policy == 'drop_newest':
+                    self._drop(frame)
+                    return
+            try:
+                oldest = self.queue.get_nowait()
+            except queue.Empty:
+                continue
+            if oldest is not None:
+                self._drop(oldest)
+            else:  # keep the stop signal
+                self.queue.put(oldest)
+                self._drop(frame)
+                return
+
+    def _work(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                return
+
+            start = time.monotonic()
+            try:
+                result = self.func(frame)
+            except Exception:
+                self.logger.exception(f'The {self.name} stage failed on the frame {frame.timestamp}!')
+                result = None
+                self._drop(frame)
+            self.latency.observe(time.monotonic() - start)
+
+            if result is not None and self.next:
+                self.next.put(result)
+
+    def start(self):
+        """
+        Start the worker threads.
+        """
+        self._threads = [
+            threading.Thread(target=self._work, name=f'{self.name}-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Let the workers finish the queued frames and stop them.
+        """
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+class Pipeline:
+    """
+    Capture, preprocess, encode and upload frames in separate stages connected by bounded queues.
+
+    A slow upload only fills the queues, it doesn't delay the next capture. Every frame is an immutable `Frame`,
+    so the stages never share mutable state. Several cameras can feed the same stages as named sources (see
+    `add_source`), they share the encoder and output workers then.
+
+    Attributes
+    ----------
+    capture_latency : Histogram
+        duration of the captures in seconds.
+    total_latency : Histogram
+        time from the start of the capture to the end of the output stage in seconds.
+    stages : list of Stage
+        the preprocess, encode and output stages.
+    sources : dict of {str or None : Source}
+        the capture and preprocess functions of the sources, the default one is None.
+    """
+
+    def __init__(
+            self,
+            capture,
+            preprocess,
+            encode,
+            output,
+            encoders=2,
+            outputs=2,
+            queue_size=4,
+            drop_policy='drop_oldest',
+            on_drop=None,
+            preprocess_jpeg=None,
+            preprocessors=1,
+            analyze=None,
+            logger=None
+    ):
+        """
+        Construct a pipeline.
+
+        Parameters
+        ----------
+        capture : callable or None
+            returns a new image array, or the jpeg bytes if `preprocess_jpeg` is given. If None, there is no default
+            source and the frames are captured only from the sources added by `add_source`.
+        preprocess : callable or None
+            called with an image array, returns the preprocessed image.
+        encode : callable
+            called with an image array, returns the jpeg bytes.
+        output : callable
+            called with every encoded frame (e.g. uploads it), it should handle its own failures.
+        encoders : int, default 2
+            number of encoder threads.
+        outputs : int, default 2
+            number of output (uploader) threads.
+        queue_size : int, default 4
+            capacity of every stage queue.
+        drop_policy : str, default 'drop_oldest'
+            one of 'block', 'drop_oldest' and 'drop_newest', see `Stage`.
+        on_drop : callable or None, default None
+            called with the stage name and every dropped frame.
+        preprocess_jpeg : callable or None, default None
+            called with the captured jpeg bytes, returns the preprocessed jpeg and None if the frame can stay
+            encoded (it skips the encode stage) or None and the decoded and preprocessed image, see
+            `FramePreprocessor.process_jpeg`.
+        preprocessors : int, default 1
+            number of preprocessing threads.
+        analyze : callable or None, default None
+            called in the preprocess stage with the preprocessed image (or jpeg if the frame is kept encoded) and
+            the frame, returns the analysis of the frame (e.g. its features).
+        logger : logging.Logger or None, default None
+            logs the errors of the stages, see `Stage`.
+        """
+        self.sources = {}
+        if capture is not None:
+            self.add_source(None, capture, preprocess, preprocess_jpeg)
+        self.capture_latency = Histogram()
+        self.total_latency = Histogram()
+
+        def preprocess_frame(frame):
+            source = self.sources[frame.source]
+            if frame.image is None:
+                jpeg, image = source.preprocess_jpeg(frame.jpeg)
+                if jpeg is not None:
+                    jpeg = bytes(memoryview(jpeg).cast('B'))
+                    analysis = analyze(jpeg, frame) if analyze else None
+                    return frame._replace(jpeg=jpeg, analysis=analysis)
+            else:
+                image = source.preprocess(frame.image)
+            image.flags.writeable = False
+            analysis = analyze(image, frame) if analyze else None
+            return frame._replace(image=image, jpeg=None, analysis=analysis)
+
+        def encode_frame(frame):
+            if frame.image is None:  # kept encoded
+                return frame
+            return frame._replace(image=None, jpeg=bytes(memoryview(encode(frame.image)).cast('B')))
+
+        def output_frame(frame):
+            output(frame)
+            self.total_latency.observe(time.monotonic() - frame.captured_at)
+
+        self.stages = [
+            Stage('preprocess', preprocess_frame, preprocessors, queue_size, drop_policy, on_drop, logger),
+            Stage('encode', encode_frame, encoders, queue_size, drop_policy, on_drop, logger),
+            Stage('output', output_frame, outputs, queue_size, drop_policy, on_drop, logger)
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next = next_stage
+
+    def add_source(self, name, capture, preprocess, preprocess_jpeg=None):
+        """
+        Add a source of frames (e.g. one camera of several).
+
+        Parameters
+        ----------
+        name : str or None
+            the source name, it's the `source` of its frames.
+        capture : callable
+            returns a new image array, or the jpeg bytes if `preprocess_jpeg` is given.
+        preprocess : callable
+            called with an image array, returns the preprocessed image.
+        preprocess_jpeg : callable or None, default None
+            called with the captured jpeg bytes, see `Pipeline`.
+        """
+        self.sources[name] = Source(capture, preprocess, preprocess_jpeg)
+
+    def capture(self, timestamp, source=None):
+        """
+        Capture a frame and feed it to the pipeline, it's called by the capture thread.
+
+        Parameters
+        ----------
+        timestamp : str
+            the timestamp of the frame.
+        source : str or None, default None
+            the name of the source to capture from.
+
+        Returns
+        -------
+        Frame
+            the captured frame.
+        """
+        capture, _, preprocess_jpeg = self.sources[source]
+        start = time.monotonic()
+        captured = capture()
+        self.capture_latency.observe(time.monotonic() - start)
+        if preprocess_jpeg:
+            frame = Frame(timestamp=timestamp, captured_at=start, image=None, jpeg=captured, source=source)
+        else:
+            frame = Frame(timestamp=timestamp, captured_at=start, image=captured, jpeg=None, source=source)
+        self.stages[0].put(frame)
+        return frame
+
+    def start(self):
+        """
+        Start the stage workers.
+        """
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        """
+        Drain the queued frames and stop the stage workers.
+        """
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self):
+        """
+        Get the latency histograms and the drop counters of the stages.
+
+        Returns
+        -------
+        dict of {str : dict}
+            snapshot of the latency histogram and number of dropped frames per stage,
+            plus the 'capture' and 'total' latencies.
+        """
+        stats = {'capture': {'latency': self.capture_latency.snapshot(), 'dropped': 0}}
+        for stage in self.stages:
+            stats[stage.name] = {'latency': stage.latency.snapshot(), 'dropped': stage.dropped}
+        stats['total'] = {'latency': self.total_latency.snapshot(), 'dropped': 0}
+        return stats
@@ -2,8 +2,14 @@ import cv2
 import numpy as np
 import os
 import datetime as dt
+import threading
+import time
 
 from SkyImageAgg.Collectors.Camera import Cam
+from SkyImageAgg.Encoders import get_default_encoder
+from SkyImageAgg.JpegTransform import align_crop
+from SkyImageAgg.JpegTransform import read_jpeg_info
+from SkyImageAgg.Metrics import metrics
 
 
 def load_image(image, grayscale_mode=True):
@@ -39,11 +45,680 @@ def get_binary_image(image):
     Returns
     -------
     numpy.array
-        the numpy array of the specified image.
+        the uint8 array of the specified image with 1 where the image is white and 0 elsewhere.
     """
     if not os.path.isfile(image):
         raise FileNotFoundError(f'{image} doesn\'t exist!')
-    return np.where(cv2.imread(image) == 255, 1, 0)
+    return (cv2.imread(image, cv2.IMREAD_GRAYSCALE) == 255).astype(np.uint8)
+
+
+def crop_image(image, crop_size):
+    """
+    Crop an image without copying it.
+
+    Parameters
+    ----------
+    image : numpy.array
+        the image array.
+    crop_size : tuple of (int, int, int, int)
+        corners of the crop frame.
+
+    Returns
+    -------
+    numpy.array
+        a view on the cropped region of the image.
+    """
+    return image[crop_size[0]:crop_size[1], crop_size[2]:crop_size[3]]
+
+
+def mask_image(image, mask):
+    """
+    Apply a binary mask on an image in place.
+
+    The multiplication is done in the dtype of the image (uint8), so no temporary arrays are allocated.
+
+    Parameters
+    ----------
+    image : numpy.array
+        the image array, it can be a view on a larger frame.
+    mask : numpy.array
+        uint8 array of 0 and 1 with the same height and width as the image.
+
+    Returns
+    -------
+    numpy.array
+        the masked image (the same object as `image`).
+    """
+    if image.ndim == 3 and mask.ndim == 2:
+        mask = mask[..., np.newaxis]
+    return np.multiply(image, mask, out=image, casting='unsafe')
+
+
+def fit_mask(mask, frame_shape, crop_size):
+    """
+    Fit the mask to the cropped frames.
+
+    If the mask has the size of the raw frame, only the crop window of it is kept so it can be applied on
+    the cropped images directly.
+
+    Parameters
+    ----------
+    mask : numpy.array
+        binary mask array.
+    frame_shape : tuple
+        shape of the raw frames.
+    crop_size : tuple of (int, int, int, int) or None
+        corners of the crop frame.
+
+    Returns
+    -------
+    numpy.array
+        contiguous mask array that matches the cropped frames.
+    """
+    if crop_size and mask.shape[:2] == tuple(frame_shape[:2]):
+        mask = crop_image(mask, crop_size)
+    return np.ascontiguousarray(mask, dtype=np.uint8)
+
+
+def calc_crop_size(frame_shape, output_resolution):
+    """
+    Calculate the crop frame corners based on the frame shape and the desired output resolution.
+
+    Parameters
+    ----------
+    frame_shape : tuple
+        shape of the raw frames.
+    output_resolution : tuple of (int, int)
+        the number of pixels in x and y of the output image.
+
+    Returns
+    -------
+    tuple of (int, int, int, int)
+        Return corners of the crop frame.
+    """
+    w_delta = int((frame_shape[1] - output_resolution[1]) / 2)
+    h_delta = int((frame_shape[0] - output_resolution[0]) / 2)
+
+    if h_delta < 0 or w_delta < 0:
+        raise ValueError('Crop dimensions cannot be larger that the input image!')
+
+    return h_delta, h_delta + output_resolution[0], w_delta, w_delta + output_resolution[1]
+
+
+def decode_jpeg(jpeg):
+    """
+    Decode a jpeg image.
+
+    Parameters
+    ----------
+    jpeg : bytes-like
+        the jpeg image.
+
+    Returns
+    -------
+    numpy.array
+        the image array.
+    """
+    image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError('The jpeg could not be decoded!')
+    return image
+
+
+def encode_jpeg(image, quality, subsampling=None, progressive=False, encoder=None):
+    """
+    Encode an image in jpeg format.
+
+    Parameters
+    ----------
+    image : numpy.array
+        the image array.
+    quality : int
+        the jpeg compression quality.
+    subsampling : str or None, default None
+        the chroma subsampling ('444', '422' or '420'), the encoder default if None.
+    progressive : bool, default False
+        make a progressive jpeg.
+    encoder : JpegEncoder or None, default None
+        the encoder, `Encoders.get_default_encoder()` if None.
+
+    Returns
+    -------
+    bytes-like
+        the jpeg compressed image (e.g. a uint8 array or a memoryview, depending on the encoder).
+    """
+    return (encoder or get_default_encoder()).encode(image, quality, subsampling, progressive)
+
+
+def exposure_weights(image, sigma=0.2, scale=8):
+    """
+    Calculate the well-exposedness weights of an image at a reduced resolution.
+
+    Pixels close to mid-gray get high weights, saturated or dark ones low weights (as in Mertens' exposure fusion).
+
+    Parameters
+    ----------
+    image : numpy.array
+        the uint8 image.
+    sigma : float, default 0.2
+        width of the gaussian around mid-gray (on a 0-1 scale).
+    scale : int, default 8
+        the weights are calculated on the image downscaled by this factor.
+
+    Returns
+    -------
+    numpy.array
+        float32 weights of the downscaled image.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    size = (max(gray.shape[1] // scale, 1), max(gray.shape[0] // scale, 1))
+    small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    small *= 1 / 255
+    small -= 0.5
+    np.square(small, out=small)
+    small *= -1 / (2 * sigma ** 2)
+    return np.exp(small, out=small)
+
+
+def fuse_exposures(frames, sigma=0.2, scale=8):
+    """
+    Merge differently exposed frames of the same scene into one well exposed image.
+
+    The weights are calculated at a reduced resolution, smoothed and upscaled, which blends the frames without
+    seams at a fraction of the cost of the pyramid blending. The fused image is accumulated frame by frame, so
+    only one float32 image is allocated.
+
+    Parameters
+    ----------
+    frames : list of numpy.array
+        uint8 frames of the same shape.
+    sigma : float, default 0.2
+        width of the well-exposedness gaussian, see `exposure_weights`.
+    scale : int, default 8
+        downscale factor of the weight maps.
+
+    Returns
+    -------
+    numpy.array
+        the fused uint8 image.
+    """
+    if len(frames) == 1:
+        return frames[0]
+
+    height, width = frames[0].shape[:2]
+    weights = [exposure_weights(frame, sigma, scale) for frame in frames]
+    total = np.add.reduce(weights) + 1e-6
+    fused = np.zeros(frames[0].shape, dtype=np.float32)
+    product = np.empty(frames[0].shape, dtype=np.float32)
+    for frame, weight in zip(frames, weights):
+        weight /= total
+        weight = cv2.GaussianBlur(weight, (0, 0), 2)
+        weight = cv2.resize(weight, (width, height), interpolation=cv2.INTER_LINEAR)
+        if frame.ndim == 3:
+            weight = weight[..., np.newaxis]
+        np.multiply(frame, weight, out=product)
+        fused += product
+    fused += 0.5
+    return np.clip(fused, 0, 255, out=fused).astype(np.uint8)
+
+
+class ExposureFusion:
+    """
+    Fuse bracketed frames within a time budget.
+
+    The cost of the fusion per frame and megapixel is tracked, so a bracket is fused only from as many frames as fit
+    in the budget: the first frame (the reference exposure) and the following ones in their order. If not even two
+    frames fit, the reference frame is used as it is.
+
+    Attributes
+    ----------
+    budget : float or None
+        the time budget of a fusion in seconds, unlimited if None.
+    sigma : float
+        width of the well-exposedness gaussian.
+    scale : int
+        downscale factor of the weight maps.
+    fused : int
+        number of fused brackets.
+    reduced : int
+        number of brackets fused from fewer frames because of the budget.
+    skipped : int
+        number of brackets replaced by their reference frame because of the budget.
+    """
+
+    def __init__(self, budget=None, sigma=0.2, scale=8):
+        """
+        Construct an exposure fusion stage.
+
+        Parameters
+        ----------
+        budget : float or None, default None
+            the time budget of a fusion in seconds.
+        sigma : float, default 0.2
+            width of the well-exposedness gaussian.
+        scale : int, default 8
+            downscale factor of the weight maps.
+        """
+        self.budget = budget
+        self.sigma = sigma
+        self.scale = scale
+        self.fused = 0
+        self.reduced = 0
+        self.skipped = 0
+        self._cost = None  # seconds per frame and megapixel
+
+    def max_frames(self, shape):
+        """
+        Estimate how many frames of a shape can be fused within the budget.
+
+        Parameters
+        ----------
+        shape : tuple of int
+            the frame shape.
+
+        Returns
+        -------
+        int or None
+            the number of frames, None if it's not limited (yet).
+        """
+        if self.budget is None or self._cost is None:
+            return None
+        return int(self.budget / (self._cost * shape[0] * shape[1] / 1e6))
+
+    def fuse(self, frames):
+        """
+        Fuse a bracket.
+
+        Parameters
+        ----------
+        frames : list of numpy.array
+            the frames, the first one is the reference exposure.
+
+        Returns
+        -------
+        numpy.array
+            the fused image.
+        """
+        limit = self.max_frames(frames[0].shape)
+        if limit is not None and limit < len(frames):
+            if limit < 2:
+                self.skipped += 1
+                # let the estimate decay, so the fusion is retried if it was a temporary slowdown
+                self._cost *= 0.9
+                return frames[0]
+            frames = frames[:limit]
+            self.reduced += 1
+
+        start = time.monotonic()
+        fused = fuse_exposures(frames, self.sigma, self.scale)
+        if len(frames) > 1:
+            cost = (time.monotonic() - start) / (len(frames) * frames[0].shape[0] * frames[0].shape[1] / 1e6)
+            # exponential moving average, so a single slow fusion doesn't disable the fusion for good
+            self._cost = cost if self._cost is None else 0.8 * self._cost + 0.2 * cost
+            self.fused += 1
+        return fused
+
+
+# number of azimuth sectors of the sector-wise cloud cover
+SECTORS = 8
+
+# the columns of the daily feature tables, the cloud cover of sector i is 'sector_<i>'
+FEATURE_COLUMNS = [
+    ('time', '<f8'),  # image timestamp (seconds since the epoch)
+    ('cloud_fraction', '<f4'),  # share of the cloudy pixels among the classified (unsaturated) sky pixels
+    ('saturation', '<f4'),  # share of the saturated sky pixels
+    ('sun_saturation', '<f4'),  # share of the saturated pixels in the sun disk, NaN if the sun isn't visible
+    ('sun_x', '<f4'),  # sun center in the image (pixels), NaN if the sun isn't visible
+    ('sun_y', '<f4')
+] + [(f'sector_{i}', '<f4') for i in range(SECTORS)]
+
+
+class FeatureExtractor:
+    """
+    Compute the cloud cover and sun features of preprocessed sky images.
+
+    The features are computed on every `step`-th pixel in x and y, so a 1926x1926 image takes a few milliseconds.
+    The pixels zeroed by the mask are left out and the saturated pixels (the sun and its glare) are not classified.
+    A pixel is cloudy if its red/blue ratio is above `ratio_threshold`, the clear sky scatters much more blue than
+    red light while the clouds scatter both alike.
+
+    The sun is the largest saturated region. The share of the saturated pixels in the disk around its center is
+    close to 1 for a clear sun and drops as clouds occlude it. The sectors split the sky by azimuth around the image
+    center, sector 0 starts at the top of the image and they go clockwise.
+
+    Attributes
+    ----------
+    ratio_threshold : float
+        the red/blue ratio above which a pixel is cloudy.
+    sun_radius : float
+        radius of the sun disk as a fraction of the image size.
+    step : int
+        the subsampling step.
+    """
+
+    def __init__(self, ratio_threshold=0.6, sun_radius=0.01, step=4):
+        """
+        Construct a feature extractor.
+
+        Parameters
+        ----------
+        ratio_threshold : float, default 0.6
+            the red/blue ratio above which a pixel is cloudy.
+        sun_radius : float, default 0.01
+            radius of the sun disk as a fraction of the image size.
+        step : int, default 4
+            the subsampling step.
+        """
+        self.ratio_threshold = ratio_threshold
+        self.sun_radius = sun_radius
+        self.step = step
+        self._grids = {}
+
+    def _grid(self, shape):
+        # the size of the subsampled image, the sector and the coordinates of its pixels, cached per image shape
+        try:
+            return self._grids[shape]
+        except KeyError:
+            pass
+        height, width = shape
+        size = (-(-width // self.step), -(-height // self.step))
+        # the coordinates of the pixels picked by the nearest neighbor resize
+        x = np.floor(np.arange(size[0], dtype=np.float32) * (width / size[0]))[np.newaxis, :]
+        y = np.floor(np.arange(size[1], dtype=np.float32) * (height / size[1]))[:, np.newaxis]
+        azimuth = np.arctan2(x - (width - 1) / 2, (height - 1) / 2 - y) % (2 * np.pi)
+        sectors = np.minimum((azimuth * (SECTORS / (2 * np.pi))).astype(np.intp), SECTORS - 1).ravel()
+        self._grids[shape] = size, sectors, x, y
+        return self._grids[shape]
+
+    def extract(self, image):
+        """
+        Compute the features of an image.
+
+        Parameters
+        ----------
+        image : numpy.array
+            the preprocessed (cropped and masked) BGR image.
+
+        Returns
+        -------
+        dict
+            'cloud_fraction', 'saturation', 'sun_saturation', 'sun_x', 'sun_y' and 'sectors' (the cloud fraction
+            of every sector), rounded to 4 decimals. A feature is None if it's undefined (e.g. no sun).
+        """
+        size, sectors, x, y = self._grid(image.shape[:2])
+        blue, green, red = cv2.split(cv2.resize(image, size, interpolation=cv2.INTER_NEAREST))
+
+        sky = cv2.max(cv2.max(blue, green), red) > 0
+        saturated = (cv2.min(cv2.min(blue, green), red) >= 250) & sky
+        clear = sky & ~saturated
+        # red / blue > threshold in integers, in percent
+        cloudy = clear & (red.astype(np.uint16) * 100 > blue.astype(np.uint16) * round(self.ratio_threshold * 100))
+
+        n_sky, n_clear = np.count_nonzero(sky), np.count_nonzero(clear)
+        cover = np.bincount(sectors, weights=cloudy.ravel(), minlength=SECTORS)
+        classified = np.bincount(sectors, weights=clear.ravel(), minlength=SECTORS)
+
+        sun_saturation = sun_x = sun_y = None
+        if saturated.any():
+            _, _, stats, centroids = cv2.connectedComponentsWithStats(saturated.view(np.uint8), connectivity=8)
+            sun = 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])
+            sun_x, sun_y = (centroids[sun] * (image.shape[1] / size[0], image.shape[0] / size[1])).tolist()
+            radius = self.sun_radius * max(image.shape[:2])
+            disk = ((x - sun_x) ** 2 + (y - sun_y) ** 2 <= radius ** 2) & sky
+            sun_saturation = np.count_nonzero(saturated & disk) / max(np.count_nonzero(disk), 1)
+
+        def rounded(value):
+            return None if value is None else round(float(value), 4)
+
+        return {
+            'cloud_fraction': rounded(np.count_nonzero(cloudy) / n_clear if n_clear else None),
+            'saturation': rounded(np.count_nonzero(saturated) / n_sky if n_sky else None),
+            'sun_saturation': rounded(sun_saturation),
+            'sun_x': rounded(sun_x),
+            'sun_y': rounded(sun_y),
+            'sectors': [rounded(c / n if n else None) for c, n in zip(cover.tolist(), classified.tolist())]
+        }
+
+    @staticmethod
+    def to_row(features):
+        """
+        Flatten the features into the columns of `FEATURE_COLUMNS` (without the time), None becomes NaN.
+
+        Parameters
+        ----------
+        features : dict
+            the features returned by `extract`.
+
+        Returns
+        -------
+        dict of {str : float}
+            the column values.
+        """
+        # the time and the sector columns aren't features of their own
+        row = {name: features[name] for name, _ in FEATURE_COLUMNS if name in features}
+        row.update({f'sector_{i}': value for i, value in enumerate(features['sectors'])})
+        return {name: float('nan') if value is None else value for name, value in row.items()}
+
+
+class ChangeDetector:
+    """
+    Measure how much a camera's frames change from one to the next.
+
+    The frames are compared as small grayscale thumbnails of every 8th pixel (a jpeg is decoded at 1/8 of its
+    size for them). The difference is the mean absolute difference of the thumbnails, from 0 (the same frame) to 1.
+
+    Attributes
+    ----------
+    size : int
+        the thumbnail size in pixels.
+    """
+
+    def __init__(self, size=32):
+        """
+        Construct a change detector.
+
+        Parameters
+        ----------
+        size : int, default 32
+            the thumbnail size in pixels.
+        """
+        self.size = size
+        self._previous = {}
+        self._lock = threading.Lock()
+
+    def thumbnail(self, image):
+        """
+        Get the thumbnail of an image.
+
+        Parameters
+        ----------
+        image : numpy.array or bytes-like
+            the BGR image or its jpeg.
+
+        Returns
+        -------
+        numpy.array
+            the float32 grayscale thumbnail, scaled to [0, 1].
+        """
+        if isinstance(image, np.ndarray):
+            # every 8th pixel, like the reduced jpeg decoding
+            image = image[::8, ::8]
+        else:
+            image = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if image is None:
+                raise ValueError('The jpeg could not be decoded!')
+        # shrunk before the conversion, so only the thumbnail is converted
+        thumbnail = cv2.resize(image, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        return thumbnail.astype(np.float32) / 255
+
+    def change(self, key, image):
+        """
+        Compare an image with the previous image of the same key (camera), it becomes the previous image.
+
+        Parameters
+        ----------
+        key : hashable
+            the camera, e.g. its name.
+        image : numpy.array or bytes-like
+            the BGR image or its jpeg.
+
+        Returns
+        -------
+        float or None
+            the difference, None for the first image of the key.
+        """
+        thumbnail = self.thumbnail(image)
+        with self._lock:
+            previous, self._previous[key] = self._previous.get(key), thumbnail
+        if previous is None:
+            return None
+        return round(float(cv2.norm(thumbnail, previous, cv2.NORM_L1)) / thumbnail.size, 4)
+
+    def reset(self):
+        """
+        Forget the previous images, e.g. after the night.
+        """
+        with self._lock:
+            self._previous.clear()
+
+
+class FramePreprocessor:
+    """
+    Crop and mask frames with a mask that is cached for the crop window of each frame shape.
+
+    Attributes
+    ----------
+    mask : numpy.array or None
+        the binary mask as loaded from disk.
+    output_resolution : tuple of (int, int) or None
+        the number of pixels in x and y of the output image, if None the frames are not cropped.
+    passthrough : bool
+        whether jpeg frames are kept encoded when the preprocessing doesn't need their pixels (see `process_jpeg`).
+    cropper : LosslessCropper or None
+        the backend for cropping jpeg frames losslessly, jpeg frames that need cropping are decoded if None.
+    """
+
+    def __init__(self, mask=None, output_resolution=None, passthrough=False, cropper=None):
+        """
+        Construct a frame preprocessor.
+
+        Parameters
+        ----------
+        mask : str or numpy.array or None, default None
+            path to the mask or the binary mask array.
+        output_resolution : tuple of (int, int) or None, default None
+            the number of pixels in x and y of the output image.
+        passthrough : bool, default False
+            whether jpeg frames are kept encoded when the preprocessing doesn't need their pixels.
+        cropper : LosslessCropper or None, default None
+            the backend for cropping jpeg frames losslessly.
+        """
+        if isinstance(mask, str):
+            mask = get_binary_image(mask)
+        self.mask = mask
+        self.output_resolution = tuple(output_resolution) if output_resolution else None
+        self.passthrough = passthrough
+        self.cropper = cropper
+        self._cache = {}
+        self._needs_pixels = {}
+
+    def fit(self, frame_shape):
+        """
+        Get the crop frame and the fitted mask for a given frame shape.
+
+        Parameters
+        ----------
+        frame_shape : tuple
+            shape of the raw frames.
+
+        Returns
+        -------
+        tuple of (tuple or None, numpy.array or None)
+            corners of the crop frame and the mask fitted to it.
+        """
+        key = tuple(frame_shape[:2])
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        crop_size = calc_crop_size(key, self.output_resolution) if self.output_resolution else None
+        mask = fit_mask(self.mask, key, crop_size) if self.mask is not None else None
+        self._cache[key] = crop_size, mask
+        return self._cache[key]
+
+    def process(self, image, crop=True, mask=True):
+        """
+        Crop the image and apply the mask on the cropped view in place.
+
+        Parameters
+        ----------
+        image : numpy.array
+            the raw frame, its pixels outside the mask are zeroed.
+        crop : bool, default True
+            whether to crop the image.
+        mask : bool, default True
+            whether to mask the image.
+
+        Returns
+        -------
+        numpy.array
+            the preprocessed image (a view on the raw frame).
+        """
+        crop_size, fitted_mask = self.fit(image.shape)
+
+        if crop and crop_size:
+            image = crop_image(image, crop_size)
+        elif mask and fitted_mask is not None and fitted_mask.shape[:2] != image.shape[:2]:
+            # the mask was fitted to the crop window, but the image is not cropped
+            fitted_mask = self.mask
+
+        if mask and fitted_mask is not None:
+            mask_image(image, fitted_mask)
+
+        return image
+
+    def _mask_needs_pixels(self, frame_shape):
+        # a mask without zeros in the crop window doesn't change the image
+        key = tuple(frame_shape[:2])
+        if key not in self._needs_pixels:
+            fitted_mask = self.fit(key)[1]
+            self._needs_pixels[key] = fitted_mask is not None and not fitted_mask.all()
+        return self._needs_pixels[key]
+
+    def process_jpeg(self, jpeg):
+        """
+        Preprocess a jpeg frame, keeping it encoded if possible.
+
+        The jpeg is returned as it is if cropping and masking are no-ops, and cropped in the DCT domain if only
+        cropping is needed and there is a `cropper`. The crop window is then moved to the nearest MCU boundary
+        (by less than 16 pixels). Otherwise the jpeg is decoded and processed by `process`.
+
+        Parameters
+        ----------
+        jpeg : bytes-like
+            the jpeg frame.
+
+        Returns
+        -------
+        tuple of (bytes-like or None, numpy.array or None)
+            the preprocessed jpeg and None, or None and the decoded and preprocessed image.
+        """
+        info = read_jpeg_info(jpeg) if self.passthrough else None
+        if info is not None:
+            shape = (info.height, info.width)
+            if not self._mask_needs_pixels(shape):
+                crop_size = self.fit(shape)[0]
+                if not crop_size or crop_size == (0, info.height, 0, info.width):
+                    return jpeg, None
+                if self.cropper:
+                    try:
+                        return self.cropper.crop(jpeg, align_crop(crop_size, info)), None
+                    except Exception:
+                        pass  # e.g. an unsupported jpeg, it's decoded
+        return None, self.process(decode_jpeg(jpeg))
 
 
 class SkyImage:
@@ -56,12 +731,19 @@ class SkyImage:
         camera object.
     image : numpy.array
         the image array of the constructing picture if exists.
+    jpeg : bytes-like or None
+        the picture as the camera delivered it (or losslessly transformed), it's used instead of encoding `image`
+        until the pixels are modified.
     mask : numpy.array
         mask array of the image.
     crop_size : tuple of (int, int, int, int)
         corners of the crop frame.
     jpeg_quality : int
         the desired jpeg quality for the captured/loaded image.
+    jpeg_subsampling : str or None
+        the chroma subsampling of the jpeg ('444', '422' or '420'), the encoder default if None.
+    jpeg_progressive : bool
+        whether to make progressive jpegs.
     timestamp: str or datetime.datetime
         the timestamp of the image.
     path: str
@@ -79,11 +761,12 @@ class SkyImage:
         image : numpy.array or str, default None
             the image array or path of the constructing picture if exists.
         """
+        self.jpeg = None
         if isinstance(camera, Cam):
             self.cam = camera
             self.image = self.cam.cap_pic()
-        elif image:
-            self.cam = Cam()
+        elif image is not None:
+            self.cam = None
             self.set_picture(image)
         else:
             self.cam = None
@@ -92,6 +775,8 @@ class SkyImage:
         self.mask = None
         self.crop_size = None
         self.jpeg_quality = None
+        self.jpeg_subsampling = None
+        self.jpeg_progressive = False
         self.timestamp = None
         self.path = None
 
@@ -106,8 +791,8 @@ class SkyImage:
             the image array or path of the constructing picture if exists.
         mask_path : str
             path to the mask.
-        output_resolution : tuple of (int, int)
-            the number of pixels in x and y of the output image.
+        output_resolution : tuple of (int, int) or None
+            the number of pixels in x and y of the output image, None if the image isn't cropped.
         jpeg_quality : int
             the jpeg compression quality.
 
@@ -118,7 +803,7 @@ class SkyImage:
         """
         obj = cls(camera=None, image=image)
         obj.set_mask(mask_path)
-        obj.get_crop_size(output_resolution)
+        obj.set_crop_size(output_resolution)
         obj.jpeg_quality = jpeg_quality
         return obj
 
@@ -135,8 +820,8 @@ class SkyImage:
             camera object.
         mask_path : str
             path to the mask.
-        output_resolution : tuple of (int, int)
-            the number of pixels in x and y of the output image.
+        output_resolution : tuple of (int, int) or None
+            the number of pixels in x and y of the output image, None if the image isn't cropped.
         jpeg_quality : int
             the jpeg compression quality.
 
@@ -147,7 +832,7 @@ class SkyImage:
         """
         obj = cls(camera=camera)
         obj.set_mask(mask_path)
-        obj.get_crop_size(output_resolution)
+        obj.set_crop_size(output_resolution)
         obj.jpeg_quality = jpeg_quality
         return obj
 
@@ -182,6 +867,22 @@ class SkyImage:
         """
         self.set_timestamp()
         self.image = self.cam.cap_pic()
+        self.jpeg = None
+
+    def snap_jpeg(self):
+        """
+        Snap a picture and keep it jpeg encoded in the jpeg attribute, it's decoded when its pixels are needed.
+        """
+        self.set_timestamp()
+        self.jpeg = self.cam.cap_jpeg()
+        self.image = None
+
+    def decode(self):
+        """
+        Decode the jpeg attribute into the image attribute if the picture is only held encoded.
+        """
+        if self.image is None and self.jpeg is not None:
+            self.image = decode_jpeg(self.jpeg)
 
     def set_picture(self, image):
         """
@@ -196,32 +897,46 @@ class SkyImage:
             self.image = load_image(image, grayscale_mode=False)
         else:
             self.image = image
+        self.jpeg = None
 
     def set_crop_size(self, output_resolution):
         """
         Set the crop frame corners based on the given output resolution.
 
-        output_resolution : tuple of (int, int)
-            the number of pixels in x and y of the output image.
+        The mask is only cropped to the crop frame if there is one.
+
+        output_resolution : tuple of (int, int) or None
+            the number of pixels in x and y of the output image, None disables cropping.
         """
-        self.crop_size = self.get_crop_size(output_resolution)
+        self.crop_size = self.get_crop_size(output_resolution) if output_resolution else None
+        self._fit_mask()
 
     def set_mask(self, mask_path):
         """
         Set the mask as a binary array and assign it to mask attribute.
 
+        If the crop frame is already set, the mask is cropped to it.
+
         Parameters
         ----------
         mask_path : str
             path to the mask.
         """
         self.mask = get_binary_image(mask_path)
+        self._fit_mask()
+
+    def _fit_mask(self):
+        # cache the mask for the crop window so it's not cropped on every frame
+        if self.mask is not None and self.crop_size and self.image is not None:
+            self.mask = fit_mask(self.mask, self.image.shape, self.crop_size)
 
     def apply_mask(self):
         """
-        Apply the stored mask the to containing image.
+        Apply the stored mask the to containing image in place.
         """
-        self.image = np.multiply(self.mask, self.image)
+        self.decode()
+        self.image = mask_image(self.image, self.mask)
+        self.jpeg = None
 
     def set_timestamp(self, timestamp=None):
         """
@@ -264,38 +979,29 @@ class SkyImage:
         tuple of (int, int, int, int)
             Return corners of the crop frame.
         """
-        w = self.image.shape[1]
-        w_delta = int((w - output_resolution[1]) / 2)
-        h = self.image.shape[0]
-        h_delta = int((h - output_resolution[0]) / 2)
-
-        if h_delta < 0 or w_delta < 0:
-            raise ValueError('Crop dimensions cannot be larger that the input image!')
-
-        return h_delta, h_delta + output_resolution[0], w_delta, w_delta + output_resolution[1]
+        return calc_crop_size(self.image.shape, output_resolution)
 
     def crop(self):
         """
         Crop the containing image and assign it to image attribute.
         """
-        self.image = self.image[
-                     self.crop_size[0]:self.crop_size[1],
-                     self.crop_size[2]:self.crop_size[3]
-                     ]
+        self.decode()
+        self.image = crop_image(self.image, self.crop_size)
+        self.jpeg = None
 
     def encode_to_jpeg(self):
         """
-        Return the containing image in jpeg format.
+        Return the containing image in jpeg format, the jpeg attribute if it's set.
 
         Returns
         -------
-        numpy.array
-            the jpeg compressed numpy array of the specified image.
+        bytes-like
+            the jpeg compressed image.
         """
-        try:
-            return cv2.imencode('.jpg', self.image, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])[1]
-        except SystemError:
-            raise TypeError('It seems jpeg_quality attr is set to None!')
+        if self.jpeg is not None:
+            return self.jpeg
+        with metrics.span('encode'):
+            return encode_jpeg(self.image, self.jpeg_quality, self.jpeg_subsampling, self.jpeg_progressive)
 
     def make_thumbnail(self, size=(100, 100)):
         """
@@ -311,6 +1017,7 @@ class SkyImage:
         numpy.array
             the numpy array of the specified thumbnail.
         """
+        self.decode()
         return cv2.resize(
             self.image,
             dsize=(size[0], size[1]),
@@ -330,4 +1037,5 @@ class SkyImage:
         """
         if not output_path:
             output_path = self.path
-        cv2.imwrite(f'{output_path}.jpg', self.image, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        with open(f'{output_path}.jpg', 'wb') as f:
+            f.write(self.encode_to_jpeg())
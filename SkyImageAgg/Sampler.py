@@ -0,0 +1,268 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+from SkyImageAgg.DataStore import DataStore
+
+CHANNELS = ('irradiance', 'ext_temp', 'cell_temp')
+STATISTICS = ('mean', 'min', 'max', 'std')
+
+SAMPLE_COLUMNS = [('time', '<f8')] + [(channel, '<f4') for channel in CHANNELS]
+AGGREGATE_COLUMNS = [('time', '<f8'), ('count', '<u4')] + [
+    (f'{channel}_{stat}', '<f4') for channel in CHANNELS for stat in STATISTICS
+]
+
+
+class IrradianceSampler:
+    """
+    Sample the irradiance sensor at a fixed rate in a dedicated thread.
+
+    The samples go to a NumPy ring buffer; the capture job asks for the aggregates (mean, min, max and std) of the
+    interval ending at the image timestamp. The samples and aggregates are written in bulk to the columnar daily
+    tables ``irr-YYYYMMDD`` and ``irr-agg-YYYYMMDD`` in the data directory.
+
+    Attributes
+    ----------
+    read : callable
+        returns the (irradiance, ext_temp, cell_temp) of a sample.
+    period : float
+        sampling period in seconds, the samples are aligned to its multiples.
+    capacity : int
+        size of the ring buffer in samples.
+    data_dir : str or None
+        the directory of the daily tables, nothing is written if None.
+    sample_store : DataStore or None
+        the daily tables of the samples.
+    aggregate_store : DataStore or None
+        the daily tables of the aggregates.
+    flush_interval : float
+        the buffered samples are written every `flush_interval` seconds.
+    paused : bool
+        if True, the sampler doesn't read the sensor.
+    samples : int
+        number of samples taken.
+    errors : int
+        number of failed reads.
+    missed : int
+        number of sampling instants skipped because the previous read was too slow.
+    lost : int
+        number of samples overwritten in the ring buffer before they were written.
+    """
+
+    def __init__(self, read, rate=1.0, capacity=3600, data_dir=None, flush_interval=60.0):
+        """
+        Construct a sampler.
+
+        Parameters
+        ----------
+        read : callable
+            returns the (irradiance, ext_temp, cell_temp) of a sample, e.g. `IrrSensor.get_data`.
+        rate : float, default 1.0
+            sampling rate in Hz.
+        capacity : int, default 3600
+            size of the ring buffer in samples, it should cover `flush_interval` and the aggregation interval.
+        data_dir : str or None, default None
+            the directory of the daily tables, nothing is written if None.
+        flush_interval : float, default 60.0
+            the buffered samples are written every `flush_interval` seconds.
+        """
+        if rate <= 0:
+            raise ValueError('The sampling rate must be positive!')
+
+        self.read = read
+        self.period = 1 / rate
+        self.capacity = capacity
+        self.data_dir = data_dir
+        self.sample_store = DataStore(data_dir, 'irr', SAMPLE_COLUMNS) if data_dir else None
+        self.aggregate_store = DataStore(data_dir, 'irr-agg', AGGREGATE_COLUMNS) if data_dir else None
+        self.flush_interval = flush_interval
+        self.paused = False
+        self.samples = 0
+        self.errors = 0
+        self.missed = 0
+        self.lost = 0
+
+        self._times = np.full(capacity, np.nan)
+        self._values = np.full((capacity, len(CHANNELS)), np.nan, dtype=np.float32)
+        self._flushed = 0  # index of the first sample that isn't written yet
+        self._aggregates = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, timestamp, values):
+        """
+        Put a sample into the ring buffer.
+
+        Parameters
+        ----------
+        timestamp : float
+            the sample time in seconds since the epoch.
+        values : tuple of float
+            irradiance, external temperature and cell temperature.
+        """
+        with self._lock:
+            i = self.samples % self.capacity
+            self._times[i] = timestamp
+            self._values[i] = values
+            self.samples += 1
+
+    def sample(self):
+        """
+        Read the sensor once and buffer the sample.
+        """
+        timestamp = time.time()
+        try:
+            values = self.read()
+        except Exception:
+            self.errors += 1
+            return
+        self.add(timestamp, values)
+
+    def window(self, start, end):
+        """
+        Get the buffered samples of an interval.
+
+        Parameters
+        ----------
+        start : float
+            start of the interval (inclusive) in seconds since the epoch.
+        end : float
+            end of the interval (exclusive) in seconds since the epoch.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            the sample times and the (n, 3) sample values.
+        """
+        with self._lock:
+            valid = min(self.samples, self.capacity)
+            times = self._times[:valid]
+            selected = (times >= start) & (times < end)
+            return times[selected], self._values[:valid][selected]
+
+    def aggregate(self, start, end, store=True):
+        """
+        Aggregate the samples of an interval, e.g. the capture interval ending at the image timestamp.
+
+        Parameters
+        ----------
+        start : float
+            start of the interval (inclusive) in seconds since the epoch.
+        end : float
+            end of the interval (exclusive) in seconds since the epoch.
+        store : bool, default True
+            write the aggregates into the daily table with the next flush.
+
+        Returns
+        -------
+        dict
+            'time' (the interval end), 'count' and a dict of the statistics (mean, min, max and std) per channel,
+            the statistics are NaN if there is no sample in the interval.
+        """
+        _, values = self.window(start, end)
+        result = {'time': end, 'count': len(values)}
+        if len(values):
+            stats = {
+                'mean': values.mean(axis=0),
+                'min': values.min(axis=0),
+                'max': values.max(axis=0),
+                'std': values.std(axis=0)
+            }
+        else:
+            stats = {stat: np.full(len(CHANNELS), np.nan) for stat in STATISTICS}
+        for i, channel in enumerate(CHANNELS):
+            result[channel] = {stat: float(stats[stat][i]) for stat in STATISTICS}
+
+        if store and self.data_dir:
+            with self._lock:
+                self._aggregates.append(result)
+        return result
+
+    def flush(self):
+        """
+        Write the new samples and aggregates into the daily tables.
+
+        If the write fails, they are kept for the next flush (until the ring buffer wraps).
+        """
+        if not self.data_dir:
+            return
+
+        with self._write_lock:
+            with self._lock:
+                end = self.samples
+                new = end - self._flushed
+                if new > self.capacity:
+                    self.lost += new - self.capacity
+                    new = self.capacity
+                    self._flushed = end - new
+                indices = np.arange(end - new, end) % self.capacity
+                times = self._times[indices]
+                values = self._values[indices]
+                aggregates = self._aggregates[:]
+
+            if len(times):
+                samples = np.empty(len(times), dtype=np.dtype(SAMPLE_COLUMNS))
+                samples['time'] = times
+                for i, channel in enumerate(CHANNELS):
+                    samples[channel] = values[:, i]
+                self.sample_store.append(samples)
+            with self._lock:
+                self._flushed = end
+
+            if aggregates:
+                rows = np.empty(len(aggregates), dtype=np.dtype(AGGREGATE_COLUMNS))
+                rows['time'] = [a['time'] for a in aggregates]
+                rows['count'] = [a['count'] for a in aggregates]
+                for channel in CHANNELS:
+                    for stat in STATISTICS:
+                        rows[f'{channel}_{stat}'] = [a[channel][stat] for a in aggregates]
+                self.aggregate_store.append(rows)
+            with self._lock:
+                del self._aggregates[:len(aggregates)]
+
+    def run(self):
+        """
+        Sample at the multiples of the sampling period until `stop` is called.
+        """
+        next_flush = time.monotonic() + self.flush_interval
+        deadline = math.ceil(time.time() / self.period) * self.period
+        while not self._stop.wait(max(deadline - time.time(), 0)):
+            if not self.paused:
+                self.sample()
+
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self.flush_interval
+                try:
+                    self.flush()
+                except Exception:
+                    pass  # retried with the next flush
+
+            # skip the instants that already passed
+            now = time.time()
+            deadline += self.period
+            if deadline <= now:
+                skipped = math.floor((now - deadline) / self.period) + 1
+                self.missed += skipped
+                deadline += skipped * self.period
+
+    def start(self):
+        """
+        Start sampling in a daemon thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='IrrSampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and write the buffered samples.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
@@ -0,0 +1,451 @@
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+from SkyImageAgg.Solar import solar_elevation
+
+# number of ticks whose solar elevation is evaluated at once when looking for sunrise/sunset
+_SEARCH_CHUNK = 4096
+# tolerance of the comparisons of the tick times
+_EPSILON = 1e-6
+
+
+class AdaptiveCadence:
+    """
+    Adapt the capture rate and the image uploads to how fast the sky changes.
+
+    The capture ticks are kept on the epoch-aligned grid of `interval` (the ceiling rate), the cadence only tells
+    which of them are captured. Every capture without an observed change doubles the interval between the
+    captures up to `max_interval` (the floor rate), a frame that changed by `change_threshold` or more or an
+    irradiance ramp of `ramp_threshold` or more brings it back to `interval` at once.
+
+    The near-duplicate frames (the change below `duplicate_threshold` and no ramp) aren't uploaded, but at least one
+    image per camera is uploaded every `max_interval` seconds, so the floor cadence is kept in the uploads too.
+
+    Attributes
+    ----------
+    interval : float
+        the shortest capture interval in seconds (the tick interval of the scheduler).
+    max_interval : float
+        the longest capture and upload interval in seconds.
+    change_threshold : float
+        the frame difference (see `ChangeDetector`) from which the sky is changing fast.
+    ramp_threshold : float
+        the irradiance ramp (in W/m2/s) from which the sky is changing fast.
+    duplicate_threshold : float
+        the frame difference below which a frame is a near-duplicate of the previous one.
+    current : float
+        the current capture interval in seconds.
+    captured : int
+        number of captured ticks.
+    skipped : int
+        number of ticks skipped by the cadence.
+    """
+
+    def __init__(self, interval, max_interval, change_threshold=0.03, ramp_threshold=5.0, duplicate_threshold=0.01):
+        """
+        Construct an adaptive cadence.
+
+        Parameters
+        ----------
+        interval : float
+            the shortest capture interval in seconds.
+        max_interval : float
+            the longest capture and upload interval in seconds, at least `interval`.
+        change_threshold : float, default 0.03
+            the frame difference from which the sky is changing fast.
+        ramp_threshold : float, default 5.0
+            the irradiance ramp (in W/m2/s) from which the sky is changing fast.
+        duplicate_threshold : float, default 0.01
+            the frame difference below which a frame is a near-duplicate of the previous one.
+        """
+        if max_interval < interval:
+            raise ValueError('The maximum interval must not be shorter than the capture interval!')
+        self.interval = interval
+        self.max_interval = max_interval
+        self.change_threshold = change_threshold
+        self.ramp_threshold = ramp_threshold
+        self.duplicate_threshold = duplicate_threshold
+        self.current = interval
+        self.captured = 0
+        self.skipped = 0
+
+        self._last = None  # the last captured tick
+        self._changing = False  # whether a change was observed since the last captured tick
+        self._uploaded = {}  # the time of the last uploaded image per camera
+        self._lock = threading.Lock()
+
+    def due(self, tick):
+        """
+        Check whether a tick is captured, a captured tick is counted as the last capture.
+
+        Parameters
+        ----------
+        tick : float
+            the tick in seconds since the unix epoch.
+
+        Returns
+        -------
+        bool
+            True if the tick is captured.
+        """
+        with self._lock:
+            if self._last is not None and tick - self._last < self.current - _EPSILON:
+                self.skipped += 1
+                return False
+            if self._last is not None and not self._changing:
+                # nothing changed since the last capture
+                self.current = min(2 * self.current, self.max_interval)
+            self._last = tick
+            self._changing = False
+            self.captured += 1
+            return True
+
+    def is_changing(self, change, ramp):
+        """
+        Check whether a frame difference or an irradiance ramp is a fast change of the sky.
+
+        Parameters
+        ----------
+        change : float or None
+            the frame difference, None if unknown (e.g. the first frame).
+        ramp : float or None
+            the irradiance ramp in W/m2/s, None if unknown (e.g. no irradiance sensor).
+
+        Returns
+        -------
+        bool
+        """
+        return (change is not None and change >= self.change_threshold) or \
+               (ramp is not None and ramp >= self.ramp_threshold)
+
+    def observe(self, change, ramp):
+        """
+        Take into account the change of a captured frame, a fast change sets the shortest interval.
+
+        Parameters
+        ----------
+        change : float or None
+            the frame difference, None if unknown.
+        ramp : float or None
+            the irradiance ramp in W/m2/s, None if unknown.
+        """
+        if self.is_changing(change, ramp):
+            with self._lock:
+                self._changing = True
+                self.current = self.interval
+
+    def keep(self, camera, t, change, ramp):
+        """
+        Decide whether to upload an image, the kept image is counted as the last upload of the camera.
+
+        Parameters
+        ----------
+        camera : str or None
+            the camera name.
+        t : float
+            the image time in seconds since the unix epoch.
+        change : float or None
+            the frame difference, None if unknown.
+        ramp : float or None
+            the irradiance ramp in W/m2/s, None if unknown.
+
+        Returns
+        -------
+        bool
+            False if the image is a near-duplicate and an image was uploaded less than `max_interval` ago.
+        """
+        duplicate = change is not None and change < self.duplicate_threshold and \
+            not (ramp is not None and ramp >= self.ramp_threshold)
+        with self._lock:
+            last = self._uploaded.get(camera)
+            if duplicate and last is not None and t - last < self.max_interval - _EPSILON:
+                return False
+            self._uploaded[camera] = t
+            return True
+
+    def stats(self):
+        """
+        Get the state of the cadence.
+
+        Returns
+        -------
+        dict of {str : int or float}
+            the current interval in seconds, number of captured and skipped ticks.
+        """
+        with self._lock:
+            return {'interval': self.current, 'captured': self.captured, 'skipped': self.skipped}
+
+
+class CaptureScheduler:
+    """
+    Run a capture job at exact, epoch-aligned instants while the sun is above a given elevation.
+
+    The capture instants are multiples of `interval` seconds since the unix epoch, so all the devices with the
+    same interval capture at the same moments. The instants of the sunrise and the sunset (on the tick grid)
+    are precomputed, so the scheduler sleeps through the night in one go.
+
+    Attributes
+    ----------
+    job : callable
+        the capture job.
+    interval : float
+        the capture interval in seconds.
+    latitude : float
+        location latitude.
+    longitude : float
+        location longitude.
+    min_elevation : float
+        the solar elevation (in degrees) above which the job is run.
+    gated : bool
+        if False the job runs also during the night.
+    on_day_start : callable or None
+        called before the first tick of a day.
+    on_day_end : callable or None
+        called when the sun goes below `min_elevation`, and on the first tick if it's at night.
+    cadence : AdaptiveCadence or None
+        picks the captured ticks, every tick is captured if None.
+    logger : logging.Logger
+        logs the errors of the job and the callbacks, they don't stop the scheduler.
+    """
+
+    def __init__(
+            self,
+            job,
+            interval,
+            latitude,
+            longitude,
+            min_elevation=-1.0,
+            gated=True,
+            on_day_start=None,
+            on_day_end=None,
+            lookahead=2 * 86400,
+            cadence=None,
+            logger=None
+    ):
+        """
+        Construct a capture scheduler.
+
+        Parameters
+        ----------
+        job : callable
+            the capture job.
+        interval : float
+            the capture interval in seconds.
+        latitude : float
+            location latitude.
+        longitude : float
+            location longitude.
+        min_elevation : float, default -1
+            the solar elevation (in degrees) above which the job is run.
+        gated : bool, default True
+            if False the job runs also during the night.
+        on_day_start : callable or None, default None
+            called before the first tick of a day.
+        on_day_end : callable or None, default None
+            called when the sun goes below `min_elevation`, and on the first tick if it's at night.
+        lookahead : float, default 2 days
+            how far ahead (in seconds) the sunrise is searched for, e.g. during a polar night.
+        cadence : AdaptiveCadence or None, default None
+            picks the captured ticks, every tick is captured if None.
+        logger : logging.Logger or None, default None
+            logs the errors of the job and the callbacks, the module logger if None.
+        """
+        self.job = job
+        self.interval = interval
+        self.latitude = latitude
+        self.longitude = longitude
+        self.min_elevation = min_elevation
+        self.gated = gated
+        self.on_day_start = on_day_start
+        self.on_day_end = on_day_end
+        self.lookahead = lookahead
+        self.cadence = cadence
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._day_end = None  # first tick after the sunset of the current day
+        self._is_day = None
+        self._ticks = 0
+        self._missed = 0
+        self._jitter_sum = 0.0
+        self._jitter_max = 0.0
+        self._jitter_last = 0.0
+
+    def align(self, t):
+        """
+        Get the first tick at or after a given time.
+
+        Parameters
+        ----------
+        t : float
+            seconds since the unix epoch.
+
+        Returns
+        -------
+        float
+            the tick.
+        """
+        return math.ceil(round(t / self.interval, 9)) * self.interval
+
+    def _find_first(self, start, daylight):
+        # the first tick from `start` on whose daylight state equals `daylight`
+        end = start + self.lookahead
+        while start < end:
+            ticks = start + self.interval * np.arange(_SEARCH_CHUNK)
+            found = np.flatnonzero((solar_elevation(ticks, self.latitude, self.longitude) >= self.min_elevation)
+                                   == daylight)
+            if found.size:
+                return float(ticks[found[0]])
+            start = float(ticks[-1]) + self.interval
+        return None
+
+    def is_day(self, t):
+        """
+        Check if the sun is above `min_elevation` at a given time.
+
+        Parameters
+        ----------
+        t : float
+            seconds since the unix epoch.
+
+        Returns
+        -------
+        bool
+            True if it's daytime, False otherwise.
+        """
+        return bool(solar_elevation(t, self.latitude, self.longitude) >= self.min_elevation)
+
+    def next_tick(self, now):
+        """
+        Get the next capture instant and whether it's during the day.
+
+        Parameters
+        ----------
+        now : float
+            seconds since the unix epoch.
+
+        Returns
+        -------
+        tuple of (float, bool)
+            the tick and the daylight state. If no daytime tick is found within the lookahead window of a gated
+            scheduler, the end of the window is returned as a non-daylight tick.
+        """
+        tick = self.align(now)
+
+        if self._day_end is not None and tick < self._day_end:
+            return tick, True
+
+        if self.is_day(tick):
+            self._day_end = self._find_first(tick, daylight=False) or tick + self.lookahead
+            return tick, True
+
+        self._day_end = None
+        if not self.gated:
+            return tick, False
+
+        sunrise = self._find_first(tick, daylight=True)
+        if sunrise is None:
+            return tick + self.lookahead, False
+        self._day_end = self._find_first(sunrise, daylight=False) or sunrise + self.lookahead
+        return sunrise, True
+
+    def _wait_until(self, t):
+        while not self._stop.is_set():
+            remaining = t - time.time()
+            if remaining <= 0:
+                return True
+            self._stop.wait(remaining)
+        return False
+
+    def _set_daylight(self, is_day):
+        if is_day == self._is_day:
+            return
+        self._is_day = is_day
+        if is_day and self.on_day_start:
+            self._call(self.on_day_start)
+        elif not is_day and self.on_day_end:
+            # also when started at night, so the night settings apply from the start
+            self._call(self.on_day_end)
+
+    def _call(self, func):
+        # an error must not stop the loop, the next tick is run anyway
+        try:
+            func()
+        except Exception:
+            self.logger.exception(f'{getattr(func, "__name__", func)} failed!')
+
+    def run(self):
+        """
+        Run the scheduler loop until `stop` is called.
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            now = time.time()
+            tick, is_day = self.next_tick(now)
+
+            if self.gated and (not is_day or tick > self.align(now)):
+                # the sun is down until the tick
+                self._set_daylight(False)
+                if not is_day:
+                    # no sunrise within the lookahead window (e.g. polar night)
+                    self._wait_until(tick)
+                    continue
+
+            if not self._wait_until(tick):
+                break
+
+            jitter = time.time() - tick
+            self._set_daylight(is_day)
+            if self.cadence is not None and not self.cadence.due(tick):
+                continue
+            self._call(self.job)
+
+            missed = int((time.time() - tick) // self.interval)
+            with self._lock:
+                self._ticks += 1
+                self._missed += missed
+                self._jitter_sum += jitter
+                self._jitter_max = max(self._jitter_max, jitter)
+                self._jitter_last = jitter
+
+    def start(self):
+        """
+        Run the scheduler loop in a daemon thread.
+
+        Returns
+        -------
+        threading.Thread
+            the scheduler thread.
+        """
+        thread = threading.Thread(target=self.run, name='CaptureScheduler', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """
+        Stop the scheduler loop.
+        """
+        self._stop.set()
+
+    def stats(self):
+        """
+        Get the timing statistics of the ticks run so far.
+
+        Returns
+        -------
+        dict of {str : int or float}
+            number of run and missed ticks, mean, max and last start delay (jitter) in seconds.
+        """
+        with self._lock:
+            return {
+                'ticks': self._ticks,
+                'missed': self._missed,
+                'jitter_mean': self._jitter_sum / self._ticks if self._ticks else 0.0,
+                'jitter_max': self._jitter_max,
+                'jitter_last': self._jitter_last
+            }
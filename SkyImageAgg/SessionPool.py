@@ -0,0 +1,194 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.connectionpool import HTTPSConnectionPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    """
+    An HTTP adapter whose connections report every new TCP connection to a callback.
+    """
+
+    def __init__(self, on_connect, **kwargs):
+        self._on_connect = on_connect
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pool_classes = {}
+
+        for scheme, pool_cls in (('http', HTTPConnectionPool), ('https', HTTPSConnectionPool)):
+            on_connect = self._on_connect
+
+            class CountingConnection(pool_cls.ConnectionCls):
+                def connect(self, _scheme=scheme):
+                    super().connect()
+                    on_connect(_scheme, self.host, self.port)
+
+            pool_classes[scheme] = type(pool_cls.__name__, (pool_cls,), {'ConnectionCls': CountingConnection})
+
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+
+class SessionPool:
+    """
+    A thread-safe pool of keep-alive HTTP connections shared by the uploader and the IP camera.
+
+    All requests go through one `requests.Session`, so the TCP (and TLS) connections are reused between
+    captures and uploads instead of being opened for every request.
+
+    Attributes
+    ----------
+    session : requests.Session
+        the underlying session.
+    max_per_host : int
+        the maximum number of concurrent requests to a single host.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=4, max_per_host=2, keep_alive=True):
+        """
+        Construct a session pool.
+
+        Parameters
+        ----------
+        pool_connections : int, default 4
+            the number of hosts whose connection pools are cached.
+        pool_maxsize : int, default 4
+            the maximum number of connections kept open to a single host.
+        max_per_host : int, default 2
+            the maximum number of concurrent requests to a single host, the rest wait for a free slot.
+        keep_alive : bool, default True
+            if False, every connection is closed after its request.
+        """
+        self.max_per_host = max_per_host
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self._requests = {}
+        self._connections = {}
+
+        self._adapter = _CountingAdapter(
+            self._count_connection,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=True
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    @staticmethod
+    def _origin(url):
+        parts = urlsplit(url)
+        port = parts.port or {'http': 80, 'https': 443}.get(parts.scheme)
+        return f'{parts.scheme}://{parts.hostname}:{port}'
+
+    def _count_connection(self, scheme, host, port):
+        origin = f'{scheme}://{host}:{port}' if port else f'{scheme}://{host}'
+        with self._lock:
+            self._connections[origin] = self._connections.get(origin, 0) + 1
+
+    def _get_host_slots(self, origin):
+        with self._lock:
+            if origin not in self._host_slots:
+                self._host_slots[origin] = threading.BoundedSemaphore(self.max_per_host)
+            self._requests[origin] = self._requests.get(origin, 0) + 1
+            return self._host_slots[origin]
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request through the pool.
+
+        Parameters
+        ----------
+        method : str
+            the http method.
+        url : str
+            the url.
+        kwargs
+            keyword arguments passed to `requests.Session.request`.
+
+        Returns
+        -------
+        requests.Response
+            http response.
+        """
+        with self._get_host_slots(self._origin(url)):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """
+        Send a get request through the pool.
+        """
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        """
+        Send a post request through the pool.
+        """
+        return self.request('POST', url, data=data, **kwargs)
+
+    def stats(self):
+        """
+        Get the connection reuse counters of the hosts in the pool.
+
+        Returns
+        -------
+        dict of {str : dict of {str : int}}
+            number of requests, opened TCP connections and reused connections per host
+            (``scheme://host:port``).
+        """
+        with self._lock:
+            return {
+                origin: {
+                    'requests': requests_count,
+                    'connections': self._connections.get(origin, 0),
+                    'reused': max(requests_count - self._connections.get(origin, 0), 0)
+                }
+                for origin, requests_count in self._requests.items()
+            }
+
+    def close(self):
+        """
+        Close all the pooled connections.
+        """
+        self.session.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """
+    Get the process-wide session pool, it's created with default settings on the first call.
+
+    Returns
+    -------
+    SessionPool
+        the shared session pool.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SessionPool()
+        return _default_pool
+
+
+def set_default_pool(pool):
+    """
+    Replace the process-wide session pool.
+
+    Parameters
+    ----------
+    pool : SessionPool
+        the session pool to be shared.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        _default_pool = pool
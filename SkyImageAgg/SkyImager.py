@@ -1,93 +1,246 @@
 #!/usr/bin/python3
 import datetime as dt
-import glob
 import logging
 import os
 import shutil
+import threading
 import time
 from os.path import dirname
 from os.path import join
-from queue import LifoQueue
-import csv
 
-from apscheduler.executors.pool import ThreadPoolExecutor
-from apscheduler.schedulers.blocking import BlockingScheduler
+import numpy as np
 
-from SkyImageAgg.Collectors.IrradianceSensor import IrrSensor
+from SkyImageAgg.Archive import INDEX_COLUMNS
+from SkyImageAgg.Backends import CAMERAS
+from SkyImageAgg.Backends import MODEMS
+from SkyImageAgg.Backends import SENSORS
+from SkyImageAgg.Backends import STREAMS
 from SkyImageAgg.Configuration import Config
 from SkyImageAgg.Controller import Controller
 from SkyImageAgg.Controller import TwilightCalc
-from SkyImageAgg.GSM import GPRS
-from SkyImageAgg.GSM import has_internet
-from SkyImageAgg.GSM import Messenger
+from SkyImageAgg.DataStore import CAPTURE_COLUMNS
+from SkyImageAgg.DataStore import DataStore
+from SkyImageAgg.DataStore import DECIMATED
+from SkyImageAgg.DataStore import DROPPED
+from SkyImageAgg.DataStore import QUEUED
+from SkyImageAgg.DataStore import STATUS_NAMES
+from SkyImageAgg.DataStore import STORED
+from SkyImageAgg.DataStore import UPLOADED
+from SkyImageAgg.Encoders import select_encoder
+from SkyImageAgg.Encoders import set_default_encoder
+from SkyImageAgg.JpegTransform import get_cropper
 from SkyImageAgg.Logger import Logger
+from SkyImageAgg.Metrics import MetricsServer
+from SkyImageAgg.Metrics import metrics
+from SkyImageAgg.MultiCamera import CameraUnit
+from SkyImageAgg.MultiCamera import MaskCache
+from SkyImageAgg.MultiCamera import SyncCapture
+from SkyImageAgg.MultiCamera import join_name
+from SkyImageAgg.MultiCamera import split_name
+from SkyImageAgg.Pipeline import Pipeline
+from SkyImageAgg.Preprocessor import ChangeDetector
+from SkyImageAgg.Preprocessor import ExposureFusion
+from SkyImageAgg.Preprocessor import FEATURE_COLUMNS
+from SkyImageAgg.Preprocessor import FeatureExtractor
+from SkyImageAgg.Preprocessor import FramePreprocessor
+from SkyImageAgg.Preprocessor import decode_jpeg
+from SkyImageAgg.Preprocessor import encode_jpeg
+from SkyImageAgg.Sampler import IrradianceSampler
+from SkyImageAgg.Scheduler import AdaptiveCadence
+from SkyImageAgg.Scheduler import CaptureScheduler
+from SkyImageAgg.SessionPool import SessionPool
+from SkyImageAgg.SessionPool import set_default_pool
+from SkyImageAgg.Spool import UploadSpool
+from SkyImageAgg.Uploader import BacklogUploader
+from SkyImageAgg.Utils import has_internet
 
 _base_dir = dirname(dirname(__file__))
 _tmp_dir = join(_base_dir, 'temp')
 _log_dir = join(_base_dir, 'log')
 _data_dir = join(_base_dir, 'data')
+_influx_overflow_dir = join(_tmp_dir, 'influx')
+
+# keep-alive connections shared by the camera and the uploaders
+session_pool = SessionPool(
+    pool_connections=Config.pool_connections,
+    pool_maxsize=Config.pool_maxsize,
+    max_per_host=Config.max_per_host,
+    keep_alive=Config.keep_alive
+)
+set_default_pool(session_pool)
+
+# Application logger, its handlers are attached by `setup`
+logger = Logger(name='SkyScanner')
 
-if not os.path.exists(_tmp_dir):
-    os.mkdir(_tmp_dir)
+# Logger object to collect irradiance sensor data and send them to an influxDB server
+sensor_logger = Logger(name='IrrSensor')
+sensor_logger.addHandler(logging.NullHandler())
 
-if not os.path.exists(_log_dir):
-    os.mkdir(_log_dir)
+# Logger object to push the metrics to an influxDB server
+metrics_logger = Logger(name='Metrics')
+metrics_logger.addHandler(logging.NullHandler())
 
-if not os.path.exists(_data_dir):
-    os.mkdir(_data_dir)
+_is_set_up = False
+_scheduler = None
 
-# a LIFO stack for storing failed uploads to be accessible by uploader job.
-upload_stack = LifoQueue(maxsize=5)
 
-# executors for job schedulers (max threads: 30)
-sched = BlockingScheduler(executors={'default': ThreadPoolExecutor(30)})
+def setup():
+    """
+    Create the working directories and attach the configured log handlers, once per process.
 
-# Application logger
-logger = Logger(name='SkyScanner')
+    It's called by `SkyScanner`, so importing this module has no side effects (e.g. no InfluxDB client).
+    """
+    global _is_set_up
+    if _is_set_up:
+        return
+    _is_set_up = True
+
+    for directory in (_tmp_dir, _log_dir, _data_dir):
+        if not os.path.exists(directory):
+            os.mkdir(directory)
+
+    metrics.enabled = Config.metrics_enabled
+
+    if Config.log_to_console:
+        logger.add_stream_handler()
+
+    if Config.log_path:
+        logger.add_timed_rotating_file_handler(log_file=join(Config.log_path, logger.name))
+
+    if Config.dashboard_enabled:
+        logger.add_influx_handler(
+            username=Config.influxdb_user,
+            pwd=Config.influxdb_pwd,
+            host=Config.influxdb_host,
+            port=Config.influxdb_port,
+            database=Config.influxdb_database,
+            measurement='app_log',
+            batch_size=Config.influxdb_batch_size,
+            flush_interval=Config.influxdb_flush_interval,
+            buffer_size=Config.influxdb_buffer_size,
+            overflow_dir=_influx_overflow_dir,
+            tags={
+                'latitude': Config.camera_latitude,
+                'longitude': Config.camera_longitude,
+                'host': os.uname()[1]
+            }
+        )
 
-if Config.log_to_console:
-    logger.add_stream_handler()
-
-if Config.log_path:
-    log_file_path = join(Config.log_path, logger.name)
-    logger.add_timed_rotating_file_handler(log_file=log_file_path)
-
-if Config.dashboard_enabled:
-    logger.add_influx_handler(
-        username=Config.influxdb_user,
-        pwd=Config.influxdb_pwd,
-        host=Config.influxdb_host,
-        port=Config.influxdb_port,
-        database=Config.influxdb_database,
-        measurement='app_log',
-        tags={
-            'latitude': Config.camera_latitude,
-            'longitude': Config.camera_longitude,
-            'host': os.uname()[1]
-        }
-    )
+    if Config.irr_sensor_enabled and Config.dashboard_enabled:
+        sensor_logger.add_timed_rotating_file_handler(log_file=join(Config.log_path, sensor_logger.name))
+        sensor_logger.add_sensor_handler(
+            username=Config.influxdb_user,
+            pwd=Config.influxdb_pwd,
+            host=Config.influxdb_host,
+            port=Config.influxdb_port,
+            database=Config.influxdb_database,
+            measurement='sensor_log',
+            batch_size=Config.influxdb_batch_size,
+            flush_interval=Config.influxdb_flush_interval,
+            buffer_size=Config.influxdb_buffer_size,
+            overflow_dir=_influx_overflow_dir,
+            tags={
+                'latitude': Config.camera_latitude,
+                'longitude': Config.camera_longitude,
+                'host': os.uname()[1]
+            }
+        )
+
+    if Config.metrics_enabled and Config.metrics_push_interval and Config.dashboard_enabled:
+        metrics_logger.add_metrics_handler(
+            username=Config.influxdb_user,
+            pwd=Config.influxdb_pwd,
+            host=Config.influxdb_host,
+            port=Config.influxdb_port,
+            database=Config.influxdb_database,
+            measurement=Config.metrics_measurement,
+            batch_size=Config.influxdb_batch_size,
+            flush_interval=Config.influxdb_flush_interval,
+            buffer_size=Config.influxdb_buffer_size,
+            overflow_dir=_influx_overflow_dir,
+            tags={
+                'latitude': Config.camera_latitude,
+                'longitude': Config.camera_longitude,
+                'host': os.uname()[1]
+            }
+        )
+
+
+def get_scheduler():
+    """
+    Get the job scheduler (max threads: 30), it's made on the first call.
+
+    Returns
+    -------
+    BlockingScheduler
+        the scheduler.
+    """
+    global _scheduler
+    if _scheduler is None:
+        from apscheduler.executors.pool import ThreadPoolExecutor
+        from apscheduler.schedulers.blocking import BlockingScheduler
+
+        _scheduler = BlockingScheduler(executors={'default': ThreadPoolExecutor(30)})
+    return _scheduler
 
-# Logger object to collect irradiance sensor data and send the to an influxDB server
-if Config.irr_sensor_enabled and Config.dashboard_enabled:
-    sensor_logger = Logger(name='IrrSensor')
-    log_file_path = join(Config.log_path, sensor_logger.name)
-    sensor_logger.add_timed_rotating_file_handler(log_file=log_file_path)
-    sensor_logger.add_sensor_handler(
-        username=Config.influxdb_user,
-        pwd=Config.influxdb_pwd,
-        host=Config.influxdb_host,
-        port=Config.influxdb_port,
-        database=Config.influxdb_database,
-        measurement='sensor_log',
-        tags={
-            'latitude': Config.camera_latitude,
-            'longitude': Config.camera_longitude,
-            'host': os.uname()[1]
-        }
+
+def make_camera(settings=None):
+    """
+    Make a camera configured in `Config`.
+
+    Parameters
+    ----------
+    settings : CameraConfig or None, default None
+        the settings of a camera of a multi-camera site, if None the camera of the [Camera] section is made.
+
+    Returns
+    -------
+    Cam or None
+        the RPi camera or the (streaming) IP camera, None if `Controller` should connect to the IP camera.
+    """
+    if settings is None:
+        address, username, pwd = Config.cam_address, Config.cam_username, Config.cam_pwd
+        stream, stream_url = Config.cam_stream, Config.cam_stream_url
+    else:
+        address, username, pwd = settings.address, settings.username, settings.pwd
+        stream, stream_url = settings.stream, settings.stream_url
+
+    if address != 'rpi':
+        if stream == 'rtsp' and Config.jpeg_passthrough:
+            logger.warning(f'The RTSP stream of {address} has no jpegs for the jpeg passthrough, so it\'s off and '
+                           'still pictures are requested instead. Use the MJPEG stream to keep the camera jpegs.')
+            stream = 'off'
+        if stream == 'off':
+            if settings is None:
+                return None
+            grabber = None
+        elif stream == 'mjpeg':
+            # the jpegs are kept for the passthrough, otherwise the frames are decoded as they arrive
+            grabber = STREAMS.load(stream)(stream_url, decode=not Config.jpeg_passthrough)
+        else:
+            grabber = STREAMS.load(stream)(stream_url)
+        camera = CAMERAS.load('geovision')(
+            address,
+            session_pool=session_pool,
+            grabber=grabber,
+            max_age=Config.cam_stream_max_age
+        )
+        camera.login(username, pwd)
+        return camera
+    if Config.bracketing_enabled and not Config.cameras:
+        # the raw frames of a bracket are released once they are fused in the preprocess stage
+        brackets = Config.pipeline_queue_size + 2 if Config.pipeline_enabled else 1
+        buffers = brackets * len(Config.bracketing_exposures) + 1
+    elif Config.pipeline_enabled or Config.cameras:
+        # frames waiting in the preprocess and encode queues plus the ones being processed and captured
+        buffers = 2 * Config.pipeline_queue_size + Config.pipeline_encoders + 2
+    else:
+        buffers = 2
+    return CAMERAS.load('rpi')(
+        capture_format=Config.rpi_capture_format,
+        use_video_port=Config.rpi_video_port,
+        buffers=buffers
     )
-else:
-    sensor_logger = logging.getLogger(name='IrrSensor')
-    sensor_logger.addHandler(logging.NullHandler())
 
 
 class SkyScanner(Controller):
@@ -97,21 +250,16 @@ class SkyScanner(Controller):
     `SkyScanner`,  as a child of controller, is responsible for coordination  and  aggregation of the images  taken
     by the device. It  configures its necessary attributes  via the help of `Config` class and simultaneously takes
     photos   from sky  and  measures the irradiance and  temperature. For that  cron jobs are run in the given time
-    frames. It also calculates the twilight time within a year with the help of `TwilightCalc` class inherited from
-    `Controller` class.
+    frames. The day and the night are told apart by `CaptureScheduler` from the solar elevation.
 
     Attributes
     ----------
     twl_calc : TwilightCalc
-        Twilight Calculator object.
-    day_of_year : int
-        the day of year (DOY) is the sequential day number starting with day 1 on January 1st.
-    sunrise : datetime.time
-        sunrise time.
-    sunset : datetime.time
-        sunset time.
+        synchronizes the device time, it doesn't compute the twilight table.
     irr_sensor : IrrSensor
         an instance of `Collectors.IrradianceSensor.IrrSensor` to collect irradiance data.
+    irr_sampler : IrradianceSampler or None
+        samples `irr_sensor` at `Config.irr_sampling_rate` and aggregates the samples per capture interval.
     jpeg_quality : int
         the desired jpeg quality for the captured/loaded image.
     messenger : Messenger
@@ -120,12 +268,51 @@ class SkyScanner(Controller):
         an instance of `GPRS` class for connecting the device to internet through GPRS service.
     daytime : `boolean`
         True if daytime, false otherwise.
+    spool : UploadSpool
+        persistent queue of the encoded images that failed to be uploaded.
+    capture_scheduler : CaptureScheduler or None
+        the scheduler running the capture job at the capture instants.
+    pipeline : Pipeline or None
+        the staged capture/preprocess/encode/upload pipeline, if enabled.
+    captures : DataStore
+        daily tables of the capture metadata (sensor data, latency, size and upload status).
+    preprocessor : FramePreprocessor
+        crops and masks the frames, it keeps the camera jpeg if `Config.jpeg_passthrough` is set.
+    fusion : ExposureFusion or None
+        fuses the bracketed exposures, if bracketing is enabled.
+    units : dict of {str : CameraUnit}
+        the cameras of a multi-camera site (see `Config.cameras`) by name, empty for a single camera.
+    sync_capture : SyncCapture or None
+        triggers the captures of `units` at the same instants, once the pipeline is started.
+    metrics_server : MetricsServer or None
+        serves the metrics at /metrics, once it's started by `start_metrics`.
+    feature_extractor : FeatureExtractor or None
+        computes the cloud cover and sun features of the images, if enabled.
+    features : DataStore
+        daily tables of the image features.
+    cadence : AdaptiveCadence or None
+        adapts the capture rate and the image uploads to the changes of the sky, if enabled.
+    change_detector : ChangeDetector or None
+        measures the change of the frames of every camera, if the cadence is adaptive.
     """
 
-    def __init__(self):
+    def __init__(self, capture=True):
         """
         Initializes a SkyScanner instance.
+
+        Parameters
+        ----------
+        capture : bool, default True
+            whether to open the cameras, the irradiance sensor and the modem, the storage maintenance jobs (e.g.
+            `check_temp_storage`) don't need them.
         """
+        setup()
+        # the first camera of a multi-camera site is also used for the single-image jobs (e.g. thumbnails)
+        cameras = [make_camera(settings) for settings in Config.cameras] if capture else []
+        if cameras:
+            camera = cameras[0]
+        else:
+            camera = make_camera() if capture else None
         super().__init__(
             server=Config.server,
             client_id=Config.client_id,
@@ -134,102 +321,520 @@ class SkyScanner(Controller):
             time_format=Config.time_format,
             cam_username=Config.cam_username,
             cam_pwd=Config.cam_pwd,
-            cam_address=Config.cam_address
+            cam_address=Config.cam_address if capture else None,
+            session_pool=session_pool,
+            camera=camera
         )
 
+        # the capture scheduler computes the daylight from the solar elevation, so no twilight table is made
         self.twl_calc = TwilightCalc(
             latitude=Config.camera_latitude,
             longitude=Config.camera_longitude,
             altitude=Config.camera_altitude,
             ntp_server=Config.ntp_server,
-            in_memory=False,
-            file=join(_base_dir, 'twilight_times.pkl')
+            in_memory=False
         )
 
-        self.day_of_year = dt.datetime.utcnow().timetuple().tm_yday
-        self.sunrise, self.sunset = self.twl_calc.get_twilight_times_by_day(day_of_year=self.day_of_year)
-
-        if self.twl_calc.has_location_changed():
-            # if device location changed or twilight times have not been collected
-            logger.info('Collecting twilight times within a year...')
-            self.twl_calc.collect_annual_twilight_times()
-
-        if Config.irr_sensor_enabled:
-            self.irr_sensor = IrrSensor(
+        if Config.irr_sensor_enabled and capture:
+            self.irr_sensor = SENSORS.load('irradiance')(
                 port=Config.irr_sensor_port,
                 address=Config.irr_sensor_address,
                 baudrate=Config.irr_sensor_baudrate,
                 bytesize=Config.irr_sensor_bytesize,
                 parity=Config.irr_sensor_parity,
-                stopbits=Config.irr_sensor_stopbits
+                stopbits=Config.irr_sensor_stopbits,
+                bulk=Config.irr_sensor_bulk_read
+            )
+            self.irr_sampler = IrradianceSampler(
+                read=self.irr_sensor.get_data,
+                rate=Config.irr_sampling_rate,
+                # enough for two capture or flush intervals
+                capacity=int(2 * Config.irr_sampling_rate * max(Config.cap_interval, Config.irr_flush_interval)) + 1,
+                data_dir=_data_dir if Config.irr_sensor_store else None,
+                flush_interval=Config.irr_flush_interval
             )
+        else:
+            self.irr_sampler = None
 
         self.set_mask(Config.mask_path)
-        self.set_crop_size(Config.image_size)
+        if self.image is not None and Config.cropping_enabled:
+            self.set_crop_size(Config.image_size)
         self.jpeg_quality = Config.jpeg_quality
+        self.jpeg_subsampling = Config.jpeg_subsampling
+        self.jpeg_progressive = Config.jpeg_progressive
+
+        try:
+            # 'auto' benchmarks the encoders, which is a waste if there's nothing to capture
+            encoder = select_encoder(
+                Config.jpeg_encoder if capture else 'opencv',
+                shape=Config.image_size,
+                quality=Config.jpeg_quality,
+                subsampling=Config.jpeg_subsampling,
+                progressive=Config.jpeg_progressive
+            )
+            set_default_encoder(encoder)
+            logger.info(f'Jpeg encoder: {encoder.name}')
+        except Exception as e:
+            logger.error(f'Couldn\'t set the {Config.jpeg_encoder} jpeg encoder, using OpenCV!\n{e}')
+
+        cropper = None
+        if Config.jpeg_passthrough and Config.cropping_enabled and Config.lossless_crop != 'none':
+            cropper = get_cropper(Config.lossless_crop)
+            if cropper:
+                logger.info(f'Lossless jpeg crop: {cropper.name}')
+            else:
+                logger.warning(f'The {Config.lossless_crop} lossless crop is not available, the jpegs are decoded!')
+        self.preprocessor = FramePreprocessor(
+            mask=self.mask if Config.masking_enabled else None,
+            output_resolution=Config.image_size if Config.cropping_enabled else None,
+            # the fusion needs the pixels
+            passthrough=Config.jpeg_passthrough and not Config.bracketing_enabled,
+            cropper=cropper
+        )
 
-        if Config.gsm_enabled:
-            self.messenger = Messenger(logger=logger)
-            self.gprs = GPRS(ppp_config_file=Config.gsm_ppp_config_file, logger=logger)
+        self.units = {}
+        self.sync_capture = None
+        if cameras:
+            # the cameras with the same mask share its preprocessor and the mask fitted to their resolution
+            masks = MaskCache(
+                output_resolution=Config.image_size if Config.cropping_enabled else None,
+                passthrough=Config.jpeg_passthrough,
+                cropper=cropper
+            )
+            name_size = np.dtype(INDEX_COLUMNS)['name'].itemsize
+            for settings, camera in zip(Config.cameras, cameras):
+                if len(join_name(dt.datetime.utcnow().strftime(Config.time_format), settings.name)) > name_size:
+                    raise ValueError(f'The camera name {settings.name} is too long for the image archives!')
+                self.units[settings.name] = CameraUnit(
+                    name=settings.name,
+                    camera=camera,
+                    preprocessor=masks.get(settings.mask_path if Config.masking_enabled else None),
+                    client_id=settings.client_id,
+                    key=settings.key,
+                    captures=DataStore(_data_dir, f'captures_{settings.name}', CAPTURE_COLUMNS),
+                    features=DataStore(_data_dir, f'features_{settings.name}', FEATURE_COLUMNS)
+                )
+            logger.info(f'Multi-camera site: {", ".join(self.units)} ({len(masks)} masks).')
+            if Config.bracketing_enabled:
+                logger.warning('Bracketing is not supported with several cameras, it\'s disabled!')
+
+        bracketing = Config.bracketing_enabled and not cameras
+        if bracketing and self.cam is not None and not self.cam.supports_bracketing:
+            # checked once here rather than failing every capture
+            logger.warning(f'{type(self.cam).__name__} doesn\'t support bracketing, it\'s disabled!')
+            bracketing = False
+        if bracketing:
+            self.fusion = ExposureFusion(budget=Config.bracketing_fusion_budget)
+            if Config.bracketing_capture_budget + Config.bracketing_fusion_budget > Config.cap_interval:
+                logger.warning('The bracketing budgets exceed the capture interval!')
+        else:
+            self.fusion = None
+
+        if Config.gsm_enabled and capture:
+            self.messenger = MODEMS.load('sms')(logger=logger)
+            self.gprs = MODEMS.load('gprs')(ppp_config_file=Config.gsm_ppp_config_file, logger=logger)
         else:
             self.messenger = None
             self.gprs = None
 
         self.daytime = False
+        self.capture_scheduler = None
+        self.pipeline = None
+        self.metrics_server = None
+
+        # failed uploads are queued on disk (temp storage) and moved to the main storage beyond the disk budget
+        self.spool = UploadSpool(
+            directory=_tmp_dir,
+            max_disk_bytes=Config.spool_disk_budget * 2 ** 20,
+            max_ram_bytes=Config.spool_ram_budget * 2 ** 20,
+            policy=Config.spool_drain_policy,
+            on_evict=self.move_to_main_storage
+        )
+
+        self.captures = DataStore(_data_dir, 'captures', CAPTURE_COLUMNS)
+
+        if Config.features_enabled:
+            self.feature_extractor = FeatureExtractor(ratio_threshold=Config.features_ratio_threshold)
+        else:
+            self.feature_extractor = None
+        self.features = DataStore(_data_dir, 'features', FEATURE_COLUMNS)
+        # ticks per camera, for decimating the image uploads
+        self._image_ticks = {}
+        self._ticks_lock = threading.Lock()
+
+        if Config.adaptive_enabled:
+            self.cadence = AdaptiveCadence(
+                interval=Config.cap_interval,
+                max_interval=max(Config.adaptive_max_interval, Config.cap_interval),
+                change_threshold=Config.adaptive_change_threshold,
+                ramp_threshold=Config.adaptive_ramp_threshold,
+                duplicate_threshold=Config.adaptive_duplicate_threshold
+            )
+            self.change_detector = ChangeDetector()
+            if Config.adaptive_max_interval < Config.cap_interval:
+                logger.warning('The maximum adaptive interval is shorter than the capture interval!')
+        else:
+            self.cadence = None
+            self.change_detector = None
+
+    def move_to_main_storage(self, name, path):
+        """
+        Move an image file to the main storage.
+
+        Parameters
+        ----------
+        name : str
+            the name of the image (its timestamp).
+        path : str
+            path to the image file.
+        """
+        try:
+            size = os.path.getsize(path)
+            shutil.move(path, self.manifest.path_of(name))
+            self.manifest.add(name, size)
+            self.set_upload_status(name, STORED)
+            logger.debug(f'{name}.jpg was moved to main storage.')
+        except Exception as e:
+            logger.error(f'moving {name}.jpg to main storage failed!\n{e}')
+
+    def captures_of(self, name):
+        """
+        Get the capture tables of an image.
+
+        Parameters
+        ----------
+        name : str
+            the image name (its timestamp, followed by its camera on a multi-camera site).
+
+        Returns
+        -------
+        DataStore
+            the capture tables of the camera of the image.
+        """
+        camera = split_name(name)[1]
+        return self.units[camera].captures if camera in self.units else self.captures
+
+    def features_of(self, name):
+        """
+        Get the feature tables of an image.
+
+        Parameters
+        ----------
+        name : str
+            the image name (its timestamp, followed by its camera on a multi-camera site).
+
+        Returns
+        -------
+        DataStore
+            the feature tables of the camera of the image.
+        """
+        camera = split_name(name)[1]
+        return self.units[camera].features if camera in self.units else self.features
+
+    def builder_for(self, time_stamp):
+        """
+        Get the upload body builder of an image, the images of a multi-camera site are uploaded as their camera.
+
+        Parameters
+        ----------
+        time_stamp : str or datetime.datetime
+            the timestamp (name) of the image.
+
+        Returns
+        -------
+        UploadBodyBuilder
+            the body builder of the calling thread.
+        """
+        camera = split_name(time_stamp)[1] if isinstance(time_stamp, str) else None
+        if camera is None:
+            return self.body_builder
+        if camera not in self.units:
+            raise ValueError(f'Unknown camera {camera} of {time_stamp}.jpg!')
+        return self.units[camera].body_builder
+
+    def record_capture(self, timestamp, jpeg, latency, status):
+        """
+        Add the metadata of a capture to the capture tables.
+
+        Parameters
+        ----------
+        timestamp : str
+            the image timestamp (name).
+        jpeg : bytes-like or None
+            the encoded image.
+        latency : float
+            seconds from the capture to the upload/storage.
+        status : int
+            the upload status (see `DataStore`).
+        """
+        metrics.inc(f'frames_{STATUS_NAMES[status]}')
+        try:
+            camera = split_name(timestamp)[1]
+            if camera in self.units:
+                self.units[camera].count_output(status, latency)
+            end = self.to_epoch(timestamp)
+            self.captures_of(timestamp).record(
+                time=end,
+                capture_latency=latency,
+                size=len(jpeg) if jpeg is not None else 0,
+                offset=-1,
+                status=status,
+                **self.sensor_means(end)
+            )
+        except Exception as e:
+            logger.error(f'Couldn\'t record the metadata of {timestamp}.jpg!\n{e}')
+
+    def sensor_means(self, end):
+        """
+        Get the mean irradiance and temperatures of the capture interval ending at `end`.
+
+        Parameters
+        ----------
+        end : float
+            the end of the interval (seconds since the epoch).
+
+        Returns
+        -------
+        dict of {str : float}
+            'irradiance', 'ext_temp' and 'cell_temp', NaN without the irradiance sensor.
+        """
+        if self.irr_sampler:
+            stats = self.irr_sampler.aggregate(end - Config.cap_interval, end, store=False)
+            return {channel: stats[channel]['mean'] for channel in ('irradiance', 'ext_temp', 'cell_temp')}
+        return {channel: float('nan') for channel in ('irradiance', 'ext_temp', 'cell_temp')}
+
+    def irradiance_ramp(self, end):
+        """
+        Get the irradiance ramp of the capture interval ending at `end`.
+
+        Parameters
+        ----------
+        end : float
+            the end of the interval (seconds since the epoch).
+
+        Returns
+        -------
+        float or None
+            the absolute slope of the irradiance in W/m2/s, None without the sensor or with less than 2 samples.
+        """
+        if not self.irr_sampler:
+            return None
+        times, values = self.irr_sampler.window(end - Config.cap_interval, end)
+        irradiance = values[:, 0]
+        valid = ~np.isnan(irradiance)
+        if np.count_nonzero(valid) < 2 or np.ptp(times[valid]) == 0:
+            return None
+        # least squares, so the sensor noise doesn't look like a ramp
+        slope = np.polyfit(times[valid] - times[valid][0], irradiance[valid], 1)[0]
+        return round(abs(float(slope)), 2)
+
+    def analyze(self, image, timestamp):
+        """
+        Compute the features of a preprocessed image and how much the sky changed since the previous image.
+
+        The change is taken into account by the adaptive cadence, if enabled.
+
+        Parameters
+        ----------
+        image : numpy.array or bytes-like
+            the preprocessed image, or its jpeg if it's kept encoded (it's decoded for the analysis only).
+        timestamp : str
+            the image timestamp (name).
+
+        Returns
+        -------
+        dict
+            'features' (see `FeatureExtractor.extract`), 'change' (see `ChangeDetector.change`) and 'ramp' (see
+            `irradiance_ramp`), None if they aren't enabled or couldn't be computed.
+        """
+        analysis = dict.fromkeys(('features', 'change', 'ramp'))
+        if self.feature_extractor:
+            try:
+                if not isinstance(image, np.ndarray):
+                    image = decode_jpeg(image)
+                with metrics.span('features'):
+                    analysis['features'] = self.feature_extractor.extract(image)
+            except Exception as e:
+                logger.error(f'Couldn\'t compute the image features!\n{e}')
+        if self.cadence:
+            try:
+                with metrics.span('change'):
+                    analysis['change'] = self.change_detector.change(split_name(timestamp)[1], image)
+                analysis['ramp'] = self.irradiance_ramp(self.to_epoch(timestamp))
+            except Exception as e:
+                logger.error(f'Couldn\'t compare {timestamp}.jpg with the previous image!\n{e}')
+            self.cadence.observe(analysis['change'], analysis['ramp'])
+        return analysis
+
+    def output_features(self, timestamp, features, upload=True):
+        """
+        Store the features of an image and upload them with the sensor data, if a feature server is configured.
+
+        Parameters
+        ----------
+        timestamp : str
+            the image timestamp (name).
+        features : dict or None
+            the features, nothing is done if None.
+        upload : bool, default True
+            whether to upload the features, they're only stored in the offline mode.
+
+        Returns
+        -------
+        bool
+            True if the features were uploaded.
+        """
+        if features is None:
+            return False
+        try:
+            end = self.to_epoch(timestamp)
+            sensor = self.sensor_means(end)
+            self.features_of(timestamp).record(time=end, **FeatureExtractor.to_row(features))
+        except Exception as e:
+            logger.error(f'Couldn\'t record the features of {timestamp}.jpg!\n{e}')
+            return False
+
+        if not (upload and Config.features_server):
+            return False
+        record = dict(features, **{
+            channel: None if np.isnan(value) else round(float(value), 2) for channel, value in sensor.items()
+        })
+        try:
+            self.upload_features(record, timestamp, Config.features_server, timeout=15)
+            return True
+        except Exception as e:
+            logger.warning(f'Couldn\'t upload the features of {timestamp}.jpg! The image is uploaded instead.\n{e}')
+            return False
+
+    def should_upload_image(self, timestamp, analysis=None, features_uploaded=False):
+        """
+        Decide whether to upload the full image of a tick.
+
+        If the features are uploaded, only every `Config.features_image_interval`-th image of a camera is. With the
+        adaptive cadence, the near-duplicate images aren't uploaded either (see `AdaptiveCadence.keep`). If the
+        features should have been uploaded but weren't, the image is, so the tick isn't lost.
+
+        Parameters
+        ----------
+        timestamp : str
+            the image timestamp (name).
+        analysis : dict or None, default None
+            the analysis of the image (see `analyze`).
+        features_uploaded : bool, default False
+            whether the features of the image were uploaded (see `output_features`).
+
+        Returns
+        -------
+        bool
+            False if the image is decimated.
+        """
+        camera = split_name(timestamp)[1]
+        if self.feature_extractor and Config.features_server and not features_uploaded:
+            return True
+        if self.feature_extractor and Config.features_server and Config.features_image_interval > 1:
+            with self._ticks_lock:
+                tick = self._image_ticks.get(camera, 0)
+                self._image_ticks[camera] = tick + 1
+            if tick % Config.features_image_interval:
+                return False
+        if self.cadence and analysis:
+            return self.cadence.keep(camera, self.to_epoch(timestamp), analysis['change'], analysis['ramp'])
+        return True
+
+    def set_upload_status(self, timestamp, status):
+        """
+        Update the upload status of a capture.
+
+        Parameters
+        ----------
+        timestamp : str
+            the image timestamp.
+        status : int
+            the upload status (see `DataStore`).
+        """
+        try:
+            self.captures_of(timestamp).update(self.to_epoch(timestamp), status=status)
+        except Exception as e:
+            logger.debug(f'Couldn\'t update the upload status of {timestamp}.jpg!\n{e}')
+
+    def flush_data_store(self):
+        """
+        Write the buffered capture metadata into the daily tables.
+        """
+        try:
+            self.captures.flush()
+            self.features.flush()
+            for unit in self.units.values():
+                unit.captures.flush()
+                unit.features.flush()
+        except Exception as e:
+            logger.error(f'Couldn\'t write the capture metadata!\n{e}')
 
     def measure_irradiance(self, timestamp='now'):
         """
-        Measure the irradiance and temperature.
+        Aggregate the irradiance and temperature samples of the capture interval ending at `timestamp`.
+
+        The aggregates are logged and stored in the daily table by `irr_sampler`.
 
         Parameters
         ----------
-        timestamp : datetime.datetime or str
-            timestamp of the data
+        timestamp : str, default 'now'
+            timestamp of the data (in `Config.time_format`).
 
         Returns
         -------
         dict of {str: str}
         """
         try:
-            sensor_data = self.irr_sensor.get_data()
             if timestamp.lower() == 'now':
-                timestamp = dt.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+                end = time.time()
+                timestamp = dt.datetime.utcfromtimestamp(end).strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                end = self.to_epoch(timestamp)
+
+            stats = self.irr_sampler.aggregate(end - Config.cap_interval, end, store=Config.irr_sensor_store)
+            if not stats['count']:
+                raise IOError(f'No sample in the last {Config.cap_interval} seconds '
+                              f'({self.irr_sampler.errors} failed reads so far)!')
 
             ms = {
                 'timestamp': timestamp,
-                'irradiance': sensor_data[0],  # irradiance (W/m^2)
-                'ext_temp': sensor_data[1],  # external temperature (°C)
-                'cell_temp': sensor_data[2]  # cell temperature (°C)
+                'irradiance': stats['irradiance']['mean'],  # irradiance (W/m^2)
+                'ext_temp': stats['ext_temp']['mean'],  # external temperature (°C)
+                'cell_temp': stats['cell_temp']['mean']  # cell temperature (°C)
             }
             # get sensor data (irr, ext_temp, cell_temp)
             sensor_logger.info(ms)
 
             # send to dashboard
             logger.info(
-                f"irr: {ms['irradiance']}, "
-                f"ext_t: {ms['ext_temp']}, "
-                f"cel_t:  {ms['cell_temp']}"
+                f"irr: {ms['irradiance']:.1f} "
+                f"({stats['irradiance']['min']:.1f}-{stats['irradiance']['max']:.1f}, "
+                f"std {stats['irradiance']['std']:.1f}, n={stats['count']}), "
+                f"ext_t: {ms['ext_temp']:.1f}, "
+                f"cel_t:  {ms['cell_temp']:.1f}"
             )
-
-            # store in data directory
-            file_name = join(_data_dir, time.strftime('irr-%Y%m%d.csv'))
-            file_exists = os.path.isfile(file_name)
-            if Config.irr_sensor_store:
-                with open(file_name, 'a+') as f:
-                    writer = csv.DictWriter(f, fieldnames=list(ms.keys()))
-                    if not file_exists:
-                        writer.writeheader()
-                    writer.writerow(ms)
+            return ms
 
         except Exception as e:
             logger.error(f'Couldn\'t collect data from irradiance sensor!\n{e}')
 
+    @metrics.timed('scan')
     def scan(self):
         """
         Take picture and measure the solar irradiance.
         """
-        # snap a pic
-        self.snap_picture()
+        # snap a pic, it's kept jpeg encoded until the pixels are needed
+        with metrics.span('capture'):
+            if self.fusion:
+                self.set_timestamp()
+                # the fused image is already cropped and masked
+                self.image = self.fuse_bracket(self.capture_bracket())
+                self.jpeg = None
+            elif self.preprocessor.passthrough:
+                self.snap_jpeg()
+            else:
+                self.snap_picture()
         # store the current time according to the time format
         self.timestamp = self.timestamp.strftime(Config.time_format)
         # set the path to save the image
@@ -239,40 +844,266 @@ class SkyScanner(Controller):
             # get sensor data (irr, ext_temp, cell_temp)
             self.measure_irradiance(timestamp=self.timestamp)
 
+    @metrics.timed('preprocess')
     def preprocess_image(self):
         """
         Preprocess the image before upload or save.
         """
+        if self.fusion:
+            return  # preprocessed before the fusion
+        if self.image is None and self.jpeg is not None:
+            # cropped losslessly if possible, otherwise decoded and preprocessed
+            self.jpeg, image = self.preprocessor.process_jpeg(self.jpeg)
+            if image is not None:
+                self.image = image
+            return
         # Crop
         if Config.cropping_enabled:
-            self.crop()
+            with metrics.span('crop'):
+                self.crop()
         # Apply mask
         if Config.masking_enabled:
-            self.apply_mask()
+            with metrics.span('mask'):
+                self.apply_mask()
 
     def execute_and_upload(self):
         """
         Take a picture from sky, pre-process and upload.
 
-        if failed, it puts the image object in `upload_stack`.
+        if failed, it puts the encoded image in the upload spool.
         """
         if self.daytime or Config.night_mode:
+            start = time.monotonic()
             # capture the image and set the proper name and path for it
             self.scan()
             # preprocess_image the image
             self.preprocess_image()
-            # try to upload the image to the server, if failed, save it to storage
+            analysis = self.analyze(self.jpeg if self.image is None else self.image, self.timestamp)
+            features_uploaded = self.output_features(self.timestamp, analysis['features'])
+            if not self.should_upload_image(self.timestamp, analysis, features_uploaded):
+                self.record_capture(self.timestamp, None, time.monotonic() - start, DECIMATED)
+                logger.debug(f'{self.timestamp}.jpg was decimated!')
+                return
+            # encode once, the same bytes are queued if the upload fails
+            jpeg = self.encode_to_jpeg()
+            # try to upload the image to the server, if failed, queue it in the spool
+            status = UPLOADED
             try:
-                self.upload_with_timeout(time_stamp=self.timestamp)
+                self.upload_with_timeout(time_stamp=self.timestamp, jpeg=jpeg)
                 logger.info(f'{self.timestamp}.jpg uploaded!')
             except Exception as e:
-                if not upload_stack.full():
-                    logger.warning(f'Couldn\'t upload {self.timestamp}.jpg! Queueing for another try!\n{e}')
-                    upload_stack.put(self)
+                logger.warning(f'Couldn\'t upload {self.timestamp}.jpg! Queueing for another try!\n{e}')
+                status = QUEUED
+                try:
+                    self.spool.put(self.timestamp, jpeg)
+                except Exception as e:
+                    status = DROPPED
+                    logger.critical(f'Couldn\'t queue {self.timestamp}.jpg!\n{e}')
+            self.record_capture(self.timestamp, jpeg, time.monotonic() - start, status)
+        elif Config.irradiance_at_night:
+            self.measure_irradiance()
+
+    def capture_bracket(self):
+        """
+        Capture the bracketed exposures within the capture budget.
+
+        Returns
+        -------
+        list of numpy.array
+            the frames, the first one is the reference exposure.
+        """
+        return self.cam.cap_bracket(Config.bracketing_exposures, budget=Config.bracketing_capture_budget)
+
+    def fuse_bracket(self, frames):
+        """
+        Preprocess the frames of a bracket and fuse them within the fusion budget.
+
+        Parameters
+        ----------
+        frames : list of numpy.array
+            the frames, the first one is the reference exposure.
+
+        Returns
+        -------
+        numpy.array
+            the fused image.
+        """
+        return self.fusion.fuse([self.preprocessor.process(frame) for frame in frames])
+
+    def make_pipeline(self, output):
+        """
+        Make a staged pipeline for the captured frames.
+
+        On a multi-camera site every camera is a source of the pipeline, so they share the encoder and output workers.
+
+        Parameters
+        ----------
+        output : callable
+            called with every encoded `Frame` by the output workers.
+
+        Returns
+        -------
+        Pipeline
+            the pipeline.
+        """
+        passthrough = self.preprocessor.passthrough
+        if self.units:
+            capture = preprocess = None
+        elif self.fusion:
+            capture, preprocess = self.capture_bracket, self.fuse_bracket
+        elif passthrough:
+            capture, preprocess = self.cam.cap_jpeg, self.preprocessor.process
+        else:
+            capture, preprocess = self.cam.cap_pic, self.preprocessor.process
+        pipeline = Pipeline(
+            capture=capture,
+            preprocess=preprocess,
+            encode=lambda image: encode_jpeg(
+                image, Config.jpeg_quality, Config.jpeg_subsampling, Config.jpeg_progressive
+            ),
+            output=output,
+            encoders=Config.pipeline_encoders,
+            outputs=Config.pipeline_uploaders,
+            queue_size=Config.pipeline_queue_size,
+            drop_policy=Config.pipeline_drop_policy,
+            on_drop=self.on_frame_dropped,
+            preprocess_jpeg=self.preprocessor.process_jpeg if passthrough else None,
+            # the frames of all the cameras arrive at the same instants
+            preprocessors=max(len(self.units), 1),
+            analyze=(lambda image, frame: self.analyze(image, frame.timestamp))
+            if self.feature_extractor or self.cadence else None,
+            logger=logger
+        )
+        for unit in self.units.values():
+            pipeline.add_source(
+                unit.name,
+                capture=unit.capture,
+                preprocess=unit.preprocessor.process,
+                preprocess_jpeg=unit.preprocessor.process_jpeg if unit.preprocessor.passthrough else None
+            )
+        return pipeline
+
+    def capture_unit(self, unit, timestamp):
+        """
+        Capture a frame of a camera of a multi-camera site and feed it to the pipeline.
+
+        Parameters
+        ----------
+        unit : CameraUnit
+            the camera.
+        timestamp : str
+            the timestamp of the capture instant.
+        """
+        name = join_name(timestamp, unit.name)
+        try:
+            self.pipeline.capture(name, source=unit.name)
+        except Exception as e:
+            logger.error(f'Couldn\'t capture {name}.jpg!\n{e}')
+            raise
+
+    def start_pipeline(self, output):
+        """
+        Make and start the pipeline, and the synchronized capture of a multi-camera site.
+
+        Parameters
+        ----------
+        output : callable
+            called with every encoded `Frame` by the output workers.
+        """
+        self.pipeline = self.make_pipeline(output=output)
+        self.pipeline.start()
+        # the pipeline and the cameras already measure their latencies
+        metrics.add_histogram('pipeline_capture', self.pipeline.capture_latency)
+        for stage in self.pipeline.stages:
+            metrics.add_histogram(f'pipeline_{stage.name}', stage.latency)
+        metrics.add_histogram('pipeline_total', self.pipeline.total_latency)
+        if self.units:
+            self.sync_capture = SyncCapture(self.units.values(), feed=self.capture_unit, logger=logger)
+            self.sync_capture.start()
+            metrics.add_histogram('camera_skew', self.sync_capture.skew)
+            for unit in self.units.values():
+                metrics.add_histogram(f'camera_{unit.name}_capture', unit.capture_latency)
+
+    def on_frame_dropped(self, stage, frame):
+        """
+        Handle a frame dropped by the pipeline, encoded frames are queued in the upload spool.
+
+        Parameters
+        ----------
+        stage : str
+            the name of the stage that dropped the frame.
+        frame : Frame
+            the dropped frame.
+        """
+        if frame.jpeg is not None and stage != 'preprocess':  # not the raw camera jpeg
+            logger.warning(f'{frame.timestamp}.jpg was dropped by the {stage} stage! Queueing it in the spool...')
+            self.spool.put(frame.timestamp, frame.jpeg)
+            self.record_capture(frame.timestamp, frame.jpeg, time.monotonic() - frame.captured_at, QUEUED)
+        else:
+            logger.warning(f'{frame.timestamp}.jpg was dropped by the {stage} stage!')
+            self.record_capture(frame.timestamp, None, time.monotonic() - frame.captured_at, DROPPED)
+
+    def upload_frame(self, frame):
+        """
+        Upload an encoded frame, if failed, queue it in the upload spool.
+
+        Parameters
+        ----------
+        frame : Frame
+            the encoded frame.
+        """
+        analysis = frame.analysis or {}
+        features_uploaded = self.output_features(frame.timestamp, analysis.get('features'))
+        if not self.should_upload_image(frame.timestamp, frame.analysis, features_uploaded):
+            self.record_capture(frame.timestamp, None, time.monotonic() - frame.captured_at, DECIMATED)
+            logger.debug(f'{frame.timestamp}.jpg was decimated!')
+            return
+        try:
+            self.upload_with_timeout(time_stamp=frame.timestamp, jpeg=frame.jpeg)
+            logger.info(f'{frame.timestamp}.jpg uploaded!')
+            status = UPLOADED
+        except Exception as e:
+            logger.warning(f'Couldn\'t upload {frame.timestamp}.jpg! Queueing for another try!\n{e}')
+            self.spool.put(frame.timestamp, frame.jpeg)
+            status = QUEUED
+        self.record_capture(frame.timestamp, frame.jpeg, time.monotonic() - frame.captured_at, status)
+
+    def store_frame(self, frame):
+        """
+        Write an encoded frame in the temp storage (through the spool).
+
+        Parameters
+        ----------
+        frame : Frame
+            the encoded frame.
+        """
+        self.output_features(frame.timestamp, (frame.analysis or {}).get('features'), upload=False)
+        try:
+            self.spool.put(frame.timestamp, frame.jpeg)
+            logger.info(f'{frame.timestamp}.jpg was stored!')
+            self.record_capture(frame.timestamp, frame.jpeg, time.monotonic() - frame.captured_at, STORED)
+        except Exception as e:
+            logger.critical(f'Couldn\'t write {frame.timestamp}.jpg on disk!\n{e}')
+
+    def execute_in_pipeline(self):
+        """
+        Take a picture from sky and feed it to the pipeline.
+
+        The preprocessing, encoding and uploading/storing are done by the pipeline workers. The cameras of a
+        multi-camera site are triggered at the same instant and captured in their own threads.
+        """
+        if self.daytime or Config.night_mode:
+            timestamp = dt.datetime.utcnow().strftime(Config.time_format)
+            try:
+                if self.sync_capture:
+                    self.sync_capture.trigger(timestamp)
                 else:
-                    logger.info('The upload stack is full! Storing the image...')
-                    self.save_as_jpeg()  # write array on the disk as jpg
-                    logger.info(f'{self.timestamp}.jpg was stored in temp storage!')
+                    self.pipeline.capture(timestamp)
+            except Exception as e:
+                logger.error(f'Couldn\'t capture {timestamp}.jpg!\n{e}')
+
+            if Config.irr_sensor_enabled:
+                self.measure_irradiance(timestamp=timestamp)
         elif Config.irradiance_at_night:
             self.measure_irradiance()
 
@@ -281,14 +1112,20 @@ class SkyScanner(Controller):
         Take a picture from sky, pre-processes it and store it.
         """
         if self.daytime or Config.night_mode:
+            start = time.monotonic()
             # capture the image and set the proper name and path for it
             self.scan()
             # preprocess_image the image
             self.preprocess_image()
+            analysis = self.analyze(self.jpeg if self.image is None else self.image, self.timestamp)
+            self.output_features(self.timestamp, analysis['features'], upload=False)
             # write it in storage
             try:
-                self.save_as_jpeg()
+                jpeg = self.encode_to_jpeg()
+                # the spool writes it in the temp storage and journals it
+                self.spool.put(self.timestamp, jpeg)
                 logger.info(f'{self.timestamp}.jpg was stored!')
+                self.record_capture(self.timestamp, jpeg, time.monotonic() - start, STORED)
             except Exception as e:
                 logger.critical(f'Couldn\'t write {self.timestamp}.jpg on disk!\n{e}')
         elif Config.irradiance_at_night:
@@ -310,91 +1147,106 @@ class SkyScanner(Controller):
             except Exception as e:
                 logger.error(f'Couldn\'t upload {self.timestamp}.jpg thumbnail!\n{e}')
 
-    @staticmethod
-    def check_upload_stack():
+    @metrics.timed('check_upload_stack')
+    def check_upload_stack(self):
         """
-        Check the `upload_stack` every 15 seconds.
+        Check the upload spool every 15 seconds.
 
-        Retry uploading the images that were not successfully uploaded to the server.
-        If failed, store them in  the temporary storage.
+        Retry uploading the images that were not successfully uploaded to the server. It stops at the first failure
+        and leaves the rest in the spool for the next run.
         """
-        while not upload_stack.empty():
-            obj = upload_stack.get()
+        while True:
+            item = self.spool.get()
+            if item is None:
+                break
+            name, jpeg = item
 
             try:
-                obj.retry_uploading_image(time_stamp=obj.timestamp)
-                logger.info(f'retrying to upload {obj.timestamp}.jpg was successful!')
+                self.upload_with_timeout(time_stamp=name, jpeg=jpeg)
+                self.spool.ack(name)
+                self.set_upload_status(name, UPLOADED)
+                logger.info(f'retrying to upload {name}.jpg was successful!')
             except Exception as e:
-                logger.warning(f'retrying to upload {obj.timestamp}.jpg failed! Storing in temp storage...\n{e}')
-                obj.save_as_jpeg()
-                logger.debug(f'{obj.timestamp}.jpg was stored in temp storage!')
+                self.spool.release(name)
+                logger.warning(f'retrying to upload {name}.jpg failed! Keeping it in the spool...\n{e}')
+                break
 
-            time.sleep(2)
-
-    def check_temp_storage(self):
+    def make_backlog_uploader(self, retry=False):
         """
-        Check the temporary storage every 10 seconds.
+        Make an uploader for draining a backlog of stored images concurrently.
 
-        Try uploading the stored images. If it failed, wait another 30 seconds.
+        Parameters
+        ----------
+        retry : bool, default False
+            whether to retry every failed image before giving up on it.
+
+        Returns
+        -------
+        BacklogUploader
+            the backlog uploader.
         """
-        # create am empty controller
-        c = Controller(
-            server=Config.server,
-            client_id=Config.client_id,
-            auth_key=Config.key,
-            storage_path=Config.storage_path,
-            time_format=Config.time_format,
-            cam_username=None,
-            cam_pwd=None,
-            cam_address=None
+        upload = self.retry_uploading_image if retry else self.upload_with_timeout
+        return BacklogUploader(
+            upload=lambda name, jpeg: upload(time_stamp=name, jpeg=jpeg),
+            max_workers=Config.backlog_max_workers,
+            max_error_rate=Config.backlog_max_error_rate,
+            logger=logger
         )
-        c.jpeg_quality = Config.jpeg_quality
-        if len(os.listdir(_tmp_dir)) != 0:
-            for img in glob.iglob(os.path.join(_tmp_dir, '*.jpg')):
-                c.set_picture(image=img)
-                c.timestamp = os.path.split(img)[-1].split('.')[0]
 
-                try:
-                    c.retry_uploading_image(time_stamp=c.timestamp)  # try to re-upload persistently
-                    logger.debug(f'{c.timestamp} was uploaded from temp storage to the server.')
-                    os.remove(img)
-                    logger.debug(f'{c.timestamp} was removed from temp storage.')
-                except Exception as e:
-                    logger.error(f'retry failed! moving {c.timestamp} to main storage\n{e}')
-                    try:
-                        shutil.move(img, self.storage_path)
-                    except Exception as e:
-                        logger.error(f'moving {c.timestamp} to main storage failed!\n{e}')
+    @metrics.timed('check_temp_storage')
+    def check_temp_storage(self):
+        """
+        Check the upload spool (temporary storage) every 5 minutes.
 
-                time.sleep(2)
+        Try uploading the queued images persistently. If it failed, move them to the main storage.
+        """
+        def queued_images(count):
+            for _ in range(count):
+                item = self.spool.get()
+                if item is None:
+                    return
+                yield item
+
+        def on_failure(name, jpeg, e):
+            logger.error(f'retry failed! moving {name} to main storage\n{e}')
+            self.spool.evict(name)
+
+        def on_success(name, jpeg):
+            self.spool.ack(name)
+            self.set_upload_status(name, UPLOADED)
+
+        stats = self.make_backlog_uploader(retry=True).run(
+            queued_images(len(self.spool)),
+            on_success=on_success,
+            on_failure=on_failure
+        )
+        logger.debug('{uploaded} images were uploaded from temp storage '
+                     '({failed} failed, {rate:.2f} images/s).'.format(**stats))
 
+    @metrics.timed('check_main_storage')
     def check_main_storage(self):
         """
         Check the main storage and send the images.
+
+        The stored jpeg files listed in the manifest are uploaded as they are by a pool of workers.
         """
-        if has_internet() and len(os.listdir(self.storage_path)) != 0:
-            c = Controller(
-                server=Config.server,
-                client_id=Config.client_id,
-                auth_key=Config.key,
-                storage_path=Config.storage_path,
-                time_format=Config.time_format,
-                cam_username=None,
-                cam_pwd=None,
-                cam_address=None
-            )
-            c.jpeg_quality = Config.jpeg_quality
-            for img in glob.iglob(os.path.join(self.storage_path, '*.jpg')):
-                c.set_picture(image=img)
-                c.timestamp = os.path.split(img)[-1].split('.')[0]
+        if has_internet():
+            images = [(name, self.manifest.path_of(name)) for name in self.manifest.names()]
 
-                try:
-                    c.retry_uploading_image(time_stamp=c.timestamp)  # try to re-upload persistently
-                    logger.debug(f'{c.timestamp} was uploaded from main storage!')
-                    os.remove(img)
-                    logger.debug(f'{c.timestamp} was removed from main storage.')
-                except Exception as e:
-                    logger.error(f'Uploading {c.timestamp} from main storage failed!\n{e}')
+            def on_success(name, img):
+                os.remove(img)
+                self.manifest.remove(name)
+                self.set_upload_status(name, UPLOADED)
+                logger.debug(f'{name} was uploaded and removed from main storage.')
+
+            def on_failure(name, img, e):
+                if isinstance(e, FileNotFoundError):
+                    self.manifest.remove(name)
+                logger.error(f'Uploading {name} from main storage failed!\n{e}')
+
+            stats = self.make_backlog_uploader().run(images, on_success=on_success, on_failure=on_failure)
+            logger.info('{uploaded} images ({bytes} B) were uploaded from main storage in {elapsed:.0f} s '
+                        '({failed} failed, {rate:.2f} images/s).'.format(**stats))
 
     def do_sunrise_operations(self):
         """
@@ -407,6 +1259,13 @@ class SkyScanner(Controller):
             self.twl_calc.sync_time()
             self.daytime = True
 
+            if self.irr_sampler:
+                self.irr_sampler.paused = False
+
+            if self.change_detector:
+                # the first images of the day aren't compared with the last ones of yesterday
+                self.change_detector.reset()
+
             if Config.gsm_enabled:
                 if not self.messenger.is_power_on():
                     self.messenger.turn_on_modem()
@@ -423,15 +1282,66 @@ class SkyScanner(Controller):
 
         Once it's sunset, sets `daytime` attribute to False and sends a sms text reporting the device status.
         If there's any image stored in `storage_path`, it would compress them and save it in `storage_path`..
+        It's also called when the service starts at night, then only the irradiance sampler is paused.
         """
+        if self.irr_sampler:
+            self.irr_sampler.paused = not Config.irradiance_at_night
+
         if self.daytime:
             logger.debug('Daytime is over!')
             self.twl_calc.sync_time()
             self.daytime = False
+
+            self.flush_data_store()
+
+            if self.irr_sampler:
+                self.irr_sampler.flush()
+                logger.info(f'Irradiance sampler: {self.irr_sampler.samples} samples, {self.irr_sampler.errors} '
+                            f'failed, {self.irr_sampler.missed} missed, {self.irr_sampler.lost} lost.')
             self.check_main_storage()
 
             if Config.store_locally:
-                self.compress_storage()
+                archived = self.compress_storage(
+                    on_archived=lambda name, day, offset: self.captures_of(name).update(
+                        self.to_epoch(name), offset=offset
+                    )
+                )
+                logger.info(f'{archived} images were archived.')
+
+            if self.pipeline:
+                for stage, stats in self.pipeline.stats().items():
+                    latency = stats['latency']
+                    logger.info(f'Pipeline {stage}: {latency["count"]} frames, '
+                                f'mean {latency["sum"] / max(latency["count"], 1):.3f} s, '
+                                f'{stats["dropped"]} dropped.')
+
+            if self.sync_capture:
+                skew = self.sync_capture.skew.snapshot()
+                logger.info(f'Camera synchronization: mean skew {skew["sum"] / max(skew["count"], 1):.3f} s.')
+                for name, stats in self.sync_capture.stats().items():
+                    latency = stats['capture_latency']
+                    logger.info(f'Camera {name}: {stats["captured"]} captured, {stats["failed"]} failed, '
+                                f'{stats["skipped"]} skipped, mean capture '
+                                f'{latency["sum"] / max(latency["count"], 1):.3f} s, {stats["uploaded"]} uploaded, '
+                                f'{stats["queued"]} queued, {stats["stored"]} stored, {stats["dropped"]} dropped, '
+                                f'{stats["decimated"]} decimated.')
+
+            if self.fusion:
+                logger.info(f'Exposure fusion: {self.fusion.fused} fused, {self.fusion.reduced} with fewer '
+                            f'exposures and {self.fusion.skipped} skipped because of the budget.')
+
+            grabber = getattr(self.cam, 'grabber', None)
+            if grabber:
+                logger.info(f'Camera stream: {grabber.frames} frames, {grabber.errors} failures, '
+                            f'{self.cam.stream_misses} stills requested instead.')
+
+            if self.capture_scheduler:
+                logger.info('Capture ticks: {ticks} run, {missed} missed, jitter mean {jitter_mean:.3f} s, '
+                            'max {jitter_max:.3f} s.'.format(**self.capture_scheduler.stats()))
+
+            if self.cadence:
+                logger.info('Adaptive cadence: {captured} ticks captured, {skipped} skipped, '
+                            'interval {interval} s.'.format(**self.cadence.stats()))
 
             if Config.gsm_enabled:
                 if not self.messenger.is_power_on():
@@ -443,60 +1353,114 @@ class SkyScanner(Controller):
 
                 self.messenger.send_sms(Config.gsm_phone_no, sms_text)
 
-    def watch_time(self):
+    def start_capture_scheduler(self, job):
+        """
+        Run a capture job at the epoch-aligned capture instants while the sun is up.
+
+        The sunrise/sunset operations are executed when the sun crosses `Config.min_sun_elevation`.
+
+        Parameters
+        ----------
+        job : callable
+            the capture job.
         """
-        Check the time to execute the sunrise/sunset operations.
+        self.capture_scheduler = CaptureScheduler(
+            job=job,
+            interval=Config.cap_interval,
+            latitude=Config.camera_latitude,
+            longitude=Config.camera_longitude,
+            min_elevation=Config.min_sun_elevation,
+            # the job also runs at night to capture images or measure irradiance
+            gated=not (Config.night_mode or Config.irradiance_at_night),
+            on_day_start=self.do_sunrise_operations,
+            on_day_end=self.do_sunset_operations,
+            cadence=self.cadence,
+            logger=logger
+        )
+        self.capture_scheduler.start()
 
-        It also assigns a new day order to `day_of_year` attribute right after the midnight.
+    def start_metrics(self, scheduler):
         """
-        curr_time = dt.datetime.utcnow()
+        Start the metrics endpoint and the job pushing the metrics to the dashboard, if the metrics are enabled.
 
-        if self.sunrise < curr_time.time() < self.sunset:
-            self.do_sunrise_operations()
-        else:
-            self.do_sunset_operations()
-            # check if the day has changed
-            if curr_time.timetuple().tm_yday != self.day_of_year:
-                self.day_of_year = curr_time.timetuple().tm_yday
-                try:
-                    self.sunrise, self.sunset = self.twl_calc.get_twilight_times_by_day(day_of_year=self.day_of_year)
-                except Exception as e:
-                    logger.error(f'New sunrise/sunset times could not be assigned!\n{e}')
+        Parameters
+        ----------
+        scheduler : BlockingScheduler
+            the scheduler of the push job.
+        """
+        if not Config.metrics_enabled:
+            return
+        if Config.metrics_port:
+            try:
+                self.metrics_server = MetricsServer(metrics, host=Config.metrics_host, port=Config.metrics_port)
+                self.metrics_server.start()
+                logger.info(f'Metrics endpoint started: http://{Config.metrics_host}:{self.metrics_server.port}'
+                            f'/metrics')
+            except OSError as e:
+                logger.error(f'Couldn\'t start the metrics endpoint!\n{e}')
+        if Config.metrics_push_interval and Config.dashboard_enabled:
+            logger.info(f'Metrics job started: Recurring every {Config.metrics_push_interval} seconds.')
+            scheduler.add_job(self.push_metrics, 'interval', seconds=Config.metrics_push_interval)
+
+    def push_metrics(self):
+        """
+        Send the current metrics to the dashboard.
+        """
+        metrics_logger.info(metrics.fields())
 
     def run_offline(self):
         """
-        Run the watching, writing and thumbnail-uploading operations recurrently in multiple jobs in offline mode.
+        Run the writing and thumbnail-uploading operations recurrently in multiple jobs in offline mode.
         """
-
-        logger.info('Time watcher job started: Recurring every 30 seconds.')
-        sched.add_job(self.watch_time, 'cron', second='*/30')
+        scheduler = get_scheduler()
+        if self.irr_sampler:
+            logger.info(f'Irradiance sampler started: {Config.irr_sampling_rate} Hz.')
+            self.irr_sampler.start()
 
         logger.info(f'Writer job started: Recurring every {Config.cap_interval} seconds')
-        sched.add_job(self.execute_and_store, 'cron', second=f'*/{Config.cap_interval}')
+        if Config.pipeline_enabled or self.units:
+            self.start_pipeline(output=self.store_frame)
+            self.start_capture_scheduler(self.execute_in_pipeline)
+        else:
+            self.start_capture_scheduler(self.execute_and_store)
 
         if Config.thumbnail_enabled:
-            logger.info(f'Thumbnail uploader job started: Recurring every {Config.thumbnail_interval} minutes.')
-            sched.add_job(self.send_thumbnail, 'cron', minute=f'*/{Config.thumbnail_interval}')
+            logger.info(f'Thumbnail uploader job started: Recurring every {Config.thumbnail_interval} seconds.')
+            scheduler.add_job(self.send_thumbnail, 'interval', seconds=Config.thumbnail_interval)
+
+        logger.info('Data store job started: Recurring every minute.')
+        scheduler.add_job(self.flush_data_store, 'interval', minutes=1)
 
-        sched.start()
+        self.start_metrics(scheduler)
+        scheduler.start()
 
     def run_online(self):
         """
-        Run the watching, writing and thumbnail-uploading operations recurrently in multiple jobs in online mode.
+        Run the uploading and retrying operations recurrently in multiple jobs in online mode.
         """
-        logger.info('Time watcher job started: Recurring every 30 seconds.')
-        sched.add_job(self.watch_time, 'cron', second='*/30')
+        scheduler = get_scheduler()
+        if self.irr_sampler:
+            logger.info(f'Irradiance sampler started: {Config.irr_sampling_rate} Hz.')
+            self.irr_sampler.start()
 
         logger.info(f'Uploader job started: Recurring every {Config.cap_interval} seconds.')
-        sched.add_job(self.execute_and_upload, 'cron', second=f'*/{Config.cap_interval}')
+        if Config.pipeline_enabled or self.units:
+            self.start_pipeline(output=self.upload_frame)
+            self.start_capture_scheduler(self.execute_in_pipeline)
+        else:
+            self.start_capture_scheduler(self.execute_and_upload)
 
         logger.info('Retriever job started: Recurring every 15 seconds.')
-        sched.add_job(self.check_upload_stack, 'cron', second='*/15')
+        scheduler.add_job(self.check_upload_stack, 'cron', second='*/15')
+
+        logger.info('Disk checker job started: Recurring every 5 minutes.')
+        scheduler.add_job(self.check_temp_storage, 'cron', minute='*/5')
 
-        logger.info('Disk checker job started: Recurring every 15 minute.')
-        sched.add_job(self.check_temp_storage, 'cron', minute='*/5')
+        logger.info('Data store job started: Recurring every minute.')
+        scheduler.add_job(self.flush_data_store, 'interval', minutes=1)
 
-        sched.start()
+        self.start_metrics(scheduler)
+        scheduler.start()
 
     def main(self):
         """
@@ -0,0 +1,316 @@
+import datetime as dt
+import os
+import struct
+
+import numpy as np
+
+# julian day of the unix epoch (1970-01-01 00:00 UTC)
+_EPOCH_JD = 2440587.5
+
+# zenith angle of the sun at sunrise/sunset (refraction and the solar disk radius included)
+_SUNRISE_ZENITH = 90.833
+
+# header of the binary twilight table: magic, latitude, longitude, altitude, number of days
+_TABLE_HEADER = struct.Struct('<4sdddI')
+_TABLE_MAGIC = b'TWL1'
+
+
+def _julian_century(epoch_seconds):
+    return (np.asarray(epoch_seconds, dtype=np.float64) / 86400.0 + _EPOCH_JD - 2451545.0) / 36525.0
+
+
+def sun_declination_and_eq_of_time(t):
+    """
+    Calculate the declination of the sun and the equation of time (NOAA algorithm).
+
+    Parameters
+    ----------
+    t : numpy.array
+        julian centuries since J2000.
+
+    Returns
+    -------
+    tuple of (numpy.array, numpy.array)
+        declination in degrees and equation of time in minutes.
+    """
+    l0 = np.mod(280.46646 + t * (36000.76983 + 0.0003032 * t), 360.0)
+    m = np.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    e = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+
+    c = (np.sin(m) * (1.914602 - t * (0.004817 + 0.000014 * t))
+         + np.sin(2 * m) * (0.019993 - 0.000101 * t)
+         + np.sin(3 * m) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * t)
+    apparent_long = np.radians(l0 + c - 0.00569 - 0.00478 * np.sin(omega))
+
+    seconds = 21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))
+    obliquity = np.radians(23.0 + (26.0 + seconds / 60.0) / 60.0 + 0.00256 * np.cos(omega))
+    declination = np.degrees(np.arcsin(np.sin(obliquity) * np.sin(apparent_long)))
+
+    y = np.tan(obliquity / 2.0) ** 2
+    l0 = np.radians(l0)
+    eq_of_time = 4.0 * np.degrees(
+        y * np.sin(2 * l0)
+        - 2.0 * e * np.sin(m)
+        + 4.0 * e * y * np.sin(m) * np.cos(2 * l0)
+        - 0.5 * y * y * np.sin(4 * l0)
+        - 1.25 * e * e * np.sin(2 * m)
+    )
+    return declination, eq_of_time
+
+
+def horizon_depression(altitude):
+    """
+    Calculate the extra degrees of depression of the horizon seen from a given altitude.
+
+    Parameters
+    ----------
+    altitude : float
+        altitude of the observer in meters.
+
+    Returns
+    -------
+    float
+        depression in degrees.
+    """
+    if altitude <= 0:
+        return 0.0
+    r = 6356900.0  # radius of the earth
+    theta = np.arccos(r / (r + altitude))
+    a = r * np.sin(theta)
+    b = r - r * np.cos(theta)
+    return float(np.degrees(np.arccos(a / np.hypot(a, b))))
+
+
+def sunrise_and_sunset(days, latitude, longitude, altitude=0.0):
+    """
+    Calculate the sunrise and sunset times of many days in one pass.
+
+    Parameters
+    ----------
+    days : numpy.array of numpy.datetime64
+        the dates.
+    latitude : float
+        location latitude.
+    longitude : float
+        location longitude.
+    altitude : float, default 0
+        location altitude in meters.
+
+    Returns
+    -------
+    tuple of (numpy.array, numpy.array)
+        sunrise and sunset as seconds since midnight (UTC), -1 on days when the sun doesn't cross the horizon.
+    """
+    latitude = float(np.clip(latitude, -89.8, 89.8))
+    midnights = np.asarray(days, dtype='datetime64[D]').astype('datetime64[s]').astype(np.int64)
+    declination, eq_of_time = sun_declination_and_eq_of_time(_julian_century(midnights))
+
+    lat = np.radians(latitude)
+    dec = np.radians(declination)
+    zenith = np.radians(_SUNRISE_ZENITH + horizon_depression(altitude))
+    cos_hour_angle = np.cos(zenith) / (np.cos(lat) * np.cos(dec)) - np.tan(lat) * np.tan(dec)
+    valid = np.abs(cos_hour_angle) <= 1.0
+    hour_angle = np.degrees(np.arccos(np.clip(cos_hour_angle, -1.0, 1.0)))
+
+    times = []
+    for sign in (1.0, -1.0):  # rising, setting
+        minutes = 720.0 + 4.0 * (-longitude - sign * hour_angle) - eq_of_time
+        seconds = np.mod(np.floor(minutes * 60.0), 86400).astype(np.int32)
+        times.append(np.where(valid, seconds, -1).astype(np.int32))
+    return times[0], times[1]
+
+
+def solar_elevation(epoch_seconds, latitude, longitude):
+    """
+    Calculate the elevation angle of the sun (refraction included).
+
+    Parameters
+    ----------
+    epoch_seconds : float or numpy.array
+        UTC times as seconds since the unix epoch.
+    latitude : float
+        location latitude.
+    longitude : float
+        location longitude.
+
+    Returns
+    -------
+    float or numpy.array
+        the elevation angle in degrees above the horizon.
+    """
+    epoch_seconds = np.asarray(epoch_seconds, dtype=np.float64)
+    latitude = float(np.clip(latitude, -89.8, 89.8))
+    declination, eq_of_time = sun_declination_and_eq_of_time(_julian_century(epoch_seconds))
+
+    true_solar_time = np.mod(np.mod(epoch_seconds, 86400.0) / 60.0 + eq_of_time + 4.0 * longitude, 1440.0)
+    hour_angle = np.radians(true_solar_time / 4.0 - 180.0)
+
+    lat = np.radians(latitude)
+    dec = np.radians(declination)
+    cos_zenith = np.clip(np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(hour_angle), -1.0, 1.0)
+    elevation = 90.0 - np.degrees(np.arccos(cos_zenith))
+
+    # atmospheric refraction
+    te = np.tan(np.radians(elevation))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        refraction = np.select(
+            [elevation > 85.0, elevation > 5.0, elevation > -0.575],
+            [
+                0.0,
+                58.1 / te - 0.07 / te ** 3 + 0.000086 / te ** 5,
+                1735.0 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))
+            ],
+            -20.774 / te
+        )
+    result = elevation + refraction / 3600.0
+    return float(result) if result.ndim == 0 else result
+
+
+class TwilightTable:
+    """
+    Annual sunrise/sunset table of a location stored as a fixed-layout binary array.
+
+    The table has a row of (sunrise, sunset) seconds since midnight (UTC) for every day of a leap year, so the
+    lookups by day of year are simple array reads.
+
+    Attributes
+    ----------
+    latitude : float
+        location latitude.
+    longitude : float
+        location longitude.
+    altitude : float
+        location altitude.
+    times : numpy.array
+        int32 array of shape (366, 2).
+    """
+
+    def __init__(self, latitude, longitude, altitude, times):
+        """
+        Construct a twilight table.
+
+        Parameters
+        ----------
+        latitude : float
+            location latitude.
+        longitude : float
+            location longitude.
+        altitude : float
+            location altitude.
+        times : numpy.array
+            int32 array of shape (366, 2) with sunrise and sunset seconds since midnight.
+        """
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+        self.times = times
+        self._time_pairs = [
+            (self.seconds_to_time(rise), self.seconds_to_time(sets)) for rise, sets in self.times.tolist()
+        ]
+
+    @staticmethod
+    def seconds_to_time(seconds):
+        """
+        Convert seconds since midnight to a time object.
+
+        Parameters
+        ----------
+        seconds : int
+            seconds since midnight, negative if undefined.
+
+        Returns
+        -------
+        datetime.time or None
+            the time.
+        """
+        seconds = int(seconds)
+        if seconds < 0:
+            return None
+        return dt.time(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+    @classmethod
+    def compute(cls, latitude, longitude, altitude):
+        """
+        Compute the table of a location.
+
+        Parameters
+        ----------
+        latitude : float
+            location latitude.
+        longitude : float
+            location longitude.
+        altitude : float
+            location altitude.
+
+        Returns
+        -------
+        TwilightTable
+            the table.
+        """
+        # 2020 is chosen as it's a leap year with 366 days
+        days = np.arange('2020-01-01', '2021-01-01', dtype='datetime64[D]')
+        sunrise, sunset = sunrise_and_sunset(days, latitude, longitude, altitude)
+        return cls(latitude, longitude, altitude, np.stack([sunrise, sunset], axis=1))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a table from the disk (memory-mapped).
+
+        Parameters
+        ----------
+        path : str
+            path to the table file.
+
+        Returns
+        -------
+        TwilightTable
+            the table.
+        """
+        with open(path, 'rb') as f:
+            magic, latitude, longitude, altitude, n_days = _TABLE_HEADER.unpack(f.read(_TABLE_HEADER.size))
+        if magic != _TABLE_MAGIC:
+            raise ValueError(f'{path} is not a twilight table!')
+        times = np.memmap(path, dtype='<i4', mode='r', offset=_TABLE_HEADER.size, shape=(n_days, 2))
+        return cls(latitude, longitude, altitude, times)
+
+    def save(self, path):
+        """
+        Save the table on the disk.
+
+        Parameters
+        ----------
+        path : str
+            path to the table file.
+        """
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_TABLE_HEADER.pack(_TABLE_MAGIC, self.latitude, self.longitude, self.altitude, len(self.times)))
+            f.write(np.ascontiguousarray(self.times, dtype='<i4').tobytes())
+        os.replace(tmp_path, path)
+
+    def is_located_at(self, latitude, longitude, altitude):
+        """
+        Check if the table belongs to a given location.
+
+        Returns
+        -------
+        bool
+            True if the location is the same, False otherwise.
+        """
+        return (self.latitude, self.longitude, self.altitude) == (latitude, longitude, altitude)
+
+    def __getitem__(self, day_of_year):
+        """
+        Get the sunrise/sunset times of a day of the year (starting with 1 on January 1st).
+
+        Returns
+        -------
+        tuple of (datetime.time or None, datetime.time or None)
+            sunrise and sunset times, None if the sun doesn't cross the horizon that day.
+        """
+        if not 1 <= day_of_year <= len(self._time_pairs):
+            raise KeyError(day_of_year)
+        return self._time_pairs[day_of_year - 1]
+
@@ -0,0 +1,312 @@
+import bisect
+import glob
+import os
+import threading
+from collections import OrderedDict
+from collections import deque
+
+_JOURNAL = 'upload.journal'
+
+
+class UploadSpool:
+    """
+    A persistent queue of jpeg encoded images waiting to be uploaded.
+
+    Every image is written as a jpeg file into `directory` and its state changes are appended to a journal, so
+    the queue survives crashes and restarts. Only the recently queued images are kept in RAM.
+
+    Attributes
+    ----------
+    directory : str
+        the directory where the images and the journal are stored.
+    max_disk_bytes : int
+        disk budget of the queued images, beyond it the oldest images are evicted.
+    max_ram_bytes : int
+        memory budget for caching the queued images.
+    policy : str
+        'lifo' to drain the newest images first, 'fifo' to drain the oldest first.
+    on_evict : callable or None
+        called with the name and the path of an image that is evicted due to the disk budget, it's supposed to
+        move the file somewhere else. If None, the file is deleted.
+    """
+
+    def __init__(self, directory, max_disk_bytes=2 ** 29, max_ram_bytes=2 ** 24, policy='lifo', on_evict=None):
+        """
+        Construct a spool and recover its state from the disk.
+
+        Parameters
+        ----------
+        directory : str
+            the directory where the images and the journal are stored.
+        max_disk_bytes : int, default 512 MB
+            disk budget of the queued images, beyond it the oldest images are evicted.
+        max_ram_bytes : int, default 16 MB
+            memory budget for caching the queued images.
+        policy : str, default 'lifo'
+            'lifo' to drain the newest images first, 'fifo' to drain the oldest first.
+        on_evict : callable or None, default None
+            called with the name and the path of an evicted image, if None the file is deleted.
+        """
+        if policy not in ('lifo', 'fifo'):
+            raise ValueError(f'Unknown drain policy: {policy}!')
+
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_ram_bytes = max_ram_bytes
+        self.policy = policy
+        self.on_evict = on_evict
+
+        self._lock = threading.RLock()
+        self._seq = 0
+        self._order = deque()  # sorted (seq, name) of the pending images
+        self._items = {}  # name -> (seq, size) of pending and taken images
+        self._taken = set()
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._disk_bytes = 0
+        self._journal = None
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        self.recover()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    @property
+    def disk_usage(self):
+        """
+        int: number of bytes occupied by the queued images.
+        """
+        return self._disk_bytes
+
+    def path_of(self, name):
+        """
+        Get the path of a queued image.
+
+        Parameters
+        ----------
+        name : str
+            the name of the image (its timestamp).
+
+        Returns
+        -------
+        str
+            path to the jpeg file.
+        """
+        return os.path.join(self.directory, f'{name}.jpg')
+
+    def _log(self, *fields):
+        self._journal.write(' '.join(str(f) for f in fields) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def recover(self):
+        """
+        Rebuild the queue from the journal and compact it.
+
+        Images in the journal whose files are missing are forgotten, jpeg files in the directory that are not in the
+        journal (e.g. left by older versions or a crash before journaling) are adopted. Images that were taken but
+        not acknowledged before a crash are pending again.
+        """
+        with self._lock:
+            if self._journal:
+                self._journal.close()
+
+            entries = {}
+            journal_path = os.path.join(self.directory, _JOURNAL)
+            if os.path.exists(journal_path):
+                with open(journal_path) as f:
+                    for line in f:
+                        fields = line.rstrip('\n').split(' ', 3)
+                        try:
+                            if fields[0] == 'put':
+                                entries[fields[3]] = int(fields[1])
+                            elif fields[0] in ('ack', 'drop'):
+                                entries.pop(fields[1], None)
+                        except (IndexError, ValueError):
+                            continue  # torn write of the last line
+
+            for tmp in glob.iglob(os.path.join(self.directory, '*.tmp')):
+                os.remove(tmp)
+
+            stray = [
+                os.path.basename(path)[:-len('.jpg')]
+                for path in sorted(glob.iglob(os.path.join(self.directory, '*.jpg')))
+            ]
+            for name in stray:
+                if name not in entries:
+                    entries[name] = -1  # adopted files go before the journaled ones
+
+            self._order = deque()
+            self._items = {}
+            self._taken = set()
+            self._cache.clear()
+            self._cache_bytes = 0
+            self._disk_bytes = 0
+
+            for seq, (name, _) in enumerate(sorted(entries.items(), key=lambda item: (item[1], item[0]))):
+                path = self.path_of(name)
+                if not os.path.exists(path):
+                    continue
+                size = os.path.getsize(path)
+                self._items[name] = (seq, size)
+                self._order.append((seq, name))
+                self._disk_bytes += size
+            self._seq = len(entries)
+
+            # compact the journal
+            tmp_path = f'{journal_path}.tmp'
+            with open(tmp_path, 'w') as f:
+                for seq, name in self._order:
+                    f.write(f'put {seq} {self._items[name][1]} {name}\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, journal_path)
+            self._journal = open(journal_path, 'a')
+
+            self._enforce_disk_budget()
+
+    def _cache_put(self, name, jpeg):
+        if len(jpeg) > self.max_ram_bytes:
+            return
+        self._cache[name] = jpeg
+        self._cache_bytes += len(jpeg)
+        while self._cache_bytes > self.max_ram_bytes:
+            _, old = self._cache.popitem(last=False)
+            self._cache_bytes -= len(old)
+
+    def _cache_pop(self, name):
+        jpeg = self._cache.pop(name, None)
+        if jpeg is not None:
+            self._cache_bytes -= len(jpeg)
+        return jpeg
+
+    def _forget(self, name):
+        seq, size = self._items.pop(name)
+        if name in self._taken:
+            self._taken.discard(name)
+        else:
+            del self._order[bisect.bisect_left(self._order, (seq, name))]
+        self._cache_pop(name)
+        self._disk_bytes -= size
+
+    def _enforce_disk_budget(self):
+        while self._disk_bytes > self.max_disk_bytes and self._order:
+            self.evict(self._order[0][1])
+
+    def put(self, name, jpeg):
+        """
+        Queue an image.
+
+        Parameters
+        ----------
+        name : str
+            the name of the image (its timestamp).
+        jpeg : bytes-like
+            the jpeg encoded image.
+        """
+        jpeg = bytes(memoryview(jpeg).cast('B'))
+        path = self.path_of(name)
+
+        with self._lock:
+            if name in self._items:
+                self._forget(name)
+
+            # write the file before journaling it, so the journal never points to a partial file
+            with open(f'{path}.tmp', 'wb') as f:
+                f.write(jpeg)
+            os.replace(f'{path}.tmp', path)
+
+            seq = self._seq
+            self._seq += 1
+            self._log('put', seq, len(jpeg), name)
+            self._items[name] = (seq, len(jpeg))
+            self._order.append((seq, name))
+            self._disk_bytes += len(jpeg)
+            self._cache_put(name, jpeg)
+            self._enforce_disk_budget()
+
+    def get(self):
+        """
+        Take the next image to be uploaded according to the drain policy.
+
+        The image stays in the spool until it's acknowledged by `ack`, released by `release` or evicted by `evict`.
+
+        Returns
+        -------
+        tuple of (str, bytes) or None
+            the name and the jpeg encoded image, None if there's nothing pending.
+        """
+        with self._lock:
+            if not self._order:
+                return None
+            _, name = self._order.popleft() if self.policy == 'fifo' else self._order.pop()
+            self._taken.add(name)
+            jpeg = self._cache_pop(name)
+
+        if jpeg is None:
+            with open(self.path_of(name), 'rb') as f:
+                jpeg = f.read()
+        return name, jpeg
+
+    def ack(self, name):
+        """
+        Remove an uploaded image from the spool.
+
+        Parameters
+        ----------
+        name : str
+            the name of the image.
+        """
+        with self._lock:
+            if name not in self._items:
+                return
+            self._forget(name)
+            self._log('ack', name)
+        os.remove(self.path_of(name))
+
+    def release(self, name):
+        """
+        Put a taken image back to its place in the queue.
+
+        Parameters
+        ----------
+        name : str
+            the name of the image.
+        """
+        with self._lock:
+            if name in self._taken:
+                self._taken.discard(name)
+                bisect.insort(self._order, (self._items[name][0], name))
+
+    def evict(self, name):
+        """
+        Remove an image from the spool and hand its file over to `on_evict`.
+
+        Parameters
+        ----------
+        name : str
+            the name of the image.
+        """
+        with self._lock:
+            if name not in self._items:
+                return
+            self._forget(name)
+            self._log('drop', name)
+
+            if self.on_evict:
+                self.on_evict(name, self.path_of(name))
+            else:
+                os.remove(self.path_of(name))
+
+    def close(self):
+        """
+        Close the journal.
+        """
+        with self._lock:
+            if self._journal:
+                self._journal.close()
+                self._journal = None
@@ -0,0 +1,394 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from urllib.parse import quote_plus
+
+# number of raw bytes encoded per chunk (multiple of 3 so the base64 chunks concatenate without padding)
+_CHUNK_SIZE = 3 * 2 ** 14
+
+# base64 characters that have to be percent-encoded in a form body
+_FORM_ESCAPES = ((b'+', b'%2B'), (b'/', b'%2F'), (b'=', b'%3D'))
+
+
+class BodyReader:
+    """
+    A minimal read-only file object over a prepared request body.
+
+    `requests` streams file objects to the socket in blocks instead of copying the whole body, and takes
+    the `Content-Length` from `__len__`.
+
+    Attributes
+    ----------
+    view : memoryview
+        the body.
+    """
+
+    def __init__(self, view):
+        """
+        Construct a body reader.
+
+        Parameters
+        ----------
+        view : memoryview
+            the body.
+        """
+        self.view = view
+        self._pos = 0
+
+    def __len__(self):
+        return len(self.view) - self._pos
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=0):
+        if whence == 0:
+            self._pos = pos
+        elif whence == 1:
+            self._pos += pos
+        else:
+            self._pos = len(self.view) + pos
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.view) - self._pos
+        chunk = self.view[self._pos:self._pos + size].tobytes()
+        self._pos += len(chunk)
+        return chunk
+
+
+class UploadBodyBuilder:
+    """
+    Build the form-encoded upload request body in a reusable buffer.
+
+    The produced body and signature are byte-identical to posting ``{'data': json.dumps(data)}`` with
+    `requests` and signing the JSON with `Controller.encrypt_data`, but the image is base64-encoded in
+    chunks that are written straight into the buffer while the HMAC is fed incrementally.
+
+    Attributes
+    ----------
+    key : bytes
+        the SHA-256 key provided by the vendor.
+    client_id : int or str
+        the camera ID assigned by the vendor.
+    """
+
+    def __init__(self, key, client_id):
+        """
+        Construct a body builder.
+
+        Parameters
+        ----------
+        key : bytes
+            the SHA-256 key provided by the vendor.
+        client_id : int or str
+            the camera ID assigned by the vendor.
+        """
+        self.key = key
+        self.client_id = client_id
+        self._buffer = bytearray()
+        self._length = 0
+        self._view = None
+
+    def _write(self, chunk):
+        # overwrite the buffer from the current position, it only grows if the body doesn't fit
+        self._buffer[self._length:self._length + len(chunk)] = chunk
+        self._length += len(chunk)
+
+    def _release(self):
+        # the buffer cannot be resized while a view on it is exported
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+
+    def build(self, jpeg, time_stamp):
+        """
+        Build the body and the signature of an upload request.
+
+        Parameters
+        ----------
+        jpeg : bytes-like
+            the jpeg encoded image (e.g. bytes or the array returned by `cv2.imencode`).
+        time_stamp : str
+            the timestamp of the image in iso format.
+
+        Returns
+        -------
+        tuple of (memoryview, str)
+            the form-encoded body and its signature.
+            The view is valid until the next call of `build`.
+        """
+        self._release()
+        self._length = 0
+        signature = hmac.new(self.key, digestmod=hashlib.sha256)
+
+        header = json.dumps({
+            'status': 'ok',
+            'id': self.client_id,
+            'time': time_stamp,
+            'coding': 'Base64'
+        })
+        prefix = header[:-1] + ', "data": "'
+        signature.update(bytes(prefix, 'ascii'))
+        self._write(b'data=')
+        self._write(bytes(quote_plus(prefix), 'ascii'))
+
+        raw = memoryview(jpeg).cast('B')
+        for start in range(0, len(raw), _CHUNK_SIZE):
+            chunk = base64.b64encode(raw[start:start + _CHUNK_SIZE])
+            signature.update(chunk)
+            for char, escaped in _FORM_ESCAPES:
+                chunk = chunk.replace(char, escaped)
+            self._write(chunk)
+
+        signature.update(b'"}')
+        self._write(b'%22%7D')
+
+        self._view = memoryview(self._buffer)[:self._length]
+        return self._view, signature.hexdigest()
+
+
+class BacklogUploader:
+    """
+    Upload a backlog of stored jpeg images through a bounded pool of workers.
+
+    The stored bytes are uploaded as they are (no decoding and re-encoding). The number of concurrent uploads is
+    adapted after every window of finished uploads: it grows by one while the throughput keeps up, it's decreased
+    when the throughput drops and halved when the error rate exceeds `max_error_rate`.
+
+    Attributes
+    ----------
+    upload : callable
+        called with the name and the jpeg bytes of an image, it should raise an exception if the upload fails.
+    min_workers : int
+        the minimum number of concurrent uploads.
+    max_workers : int
+        the maximum number of concurrent uploads.
+    window : int
+        the number of finished uploads after which the concurrency is adapted.
+    max_error_rate : float
+        the error rate of a window above which the concurrency is halved.
+    max_consecutive_failures : int
+        the number of failures in a row after which draining stops (e.g. the connection is lost).
+    clock : callable
+        returns the current time in seconds, for the rates.
+    logger : logging.Logger
+        logs the errors of the `run` callbacks, they don't stop the workers.
+    workers : int
+        the current number of concurrent uploads.
+    """
+
+    def __init__(
+            self,
+            upload,
+            min_workers=1,
+            max_workers=4,
+            window=8,
+            max_error_rate=0.2,
+            max_consecutive_failures=10,
+            clock=time.monotonic,
+            logger=None
+    ):
+        """
+        Construct a backlog uploader.
+
+        Parameters
+        ----------
+        upload : callable
+            called with the name and the jpeg bytes of an image, it should raise an exception if the upload fails.
+        min_workers : int, default 1
+            the minimum number of concurrent uploads.
+        max_workers : int, default 4
+            the maximum number of concurrent uploads.
+        window : int, default 8
+            the number of finished uploads after which the concurrency is adapted.
+        max_error_rate : float, default 0.2
+            the error rate of a window above which the concurrency is halved.
+        max_consecutive_failures : int, default 10
+            the number of failures in a row after which draining stops.
+        clock : callable, default time.monotonic
+            returns the current time in seconds, for the rates.
+        logger : logging.Logger or None, default None
+            logs the errors of the `run` callbacks, the module logger if None.
+        """
+        self.upload = upload
+        self.min_workers = min_workers
+        self.max_workers = max(max_workers, min_workers)
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.clock = clock
+        self.logger = logger or logging.getLogger(__name__)
+        self.workers = min_workers
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._stop = False
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self._started = None
+        self._uploaded = 0
+        self._failed = 0
+        self._bytes = 0
+        self._consecutive_failures = 0
+        self._window_start = None
+        self._window_done = 0
+        self._window_failed = 0
+        self._last_rate = 0.0
+
+    def metrics(self):
+        """
+        Get the progress and rate metrics of the current (or last) run.
+
+        Returns
+        -------
+        dict of {str : int or float}
+            number of uploaded and failed images, uploaded bytes, elapsed seconds, images per second,
+            bytes per second and the current number of workers.
+        """
+        with self._cond:
+            elapsed = self.clock() - self._started if self._started else 0.0
+            return {
+                'uploaded': self._uploaded,
+                'failed': self._failed,
+                'bytes': self._bytes,
+                'elapsed': elapsed,
+                'rate': self._uploaded / elapsed if elapsed else 0.0,
+                'byte_rate': self._bytes / elapsed if elapsed else 0.0,
+                'workers': self.workers
+            }
+
+    def _adapt(self):
+        # called with the condition held after every finished upload
+        if self._window_done < self.window:
+            return
+
+        now = self.clock()
+        rate = (self._window_done - self._window_failed) / max(now - self._window_start, 1e-9)
+        error_rate = self._window_failed / self._window_done
+
+        if error_rate > self.max_error_rate:
+            self.workers = max(self.min_workers, self.workers // 2)
+        elif rate >= 0.95 * self._last_rate:
+            self.workers = min(self.max_workers, self.workers + 1)
+        else:
+            self.workers = max(self.min_workers, self.workers - 1)
+
+        self._last_rate = rate
+        self._window_start = now
+        self._window_done = 0
+        self._window_failed = 0
+        self._cond.notify_all()
+
+    def _finish(self, size, failed):
+        with self._cond:
+            self._active -= 1
+            self._window_done += 1
+            if failed:
+                self._failed += 1
+                self._window_failed += 1
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.max_consecutive_failures:
+                    self._stop = True
+            else:
+                self._uploaded += 1
+                self._bytes += size
+                self._consecutive_failures = 0
+            self._adapt()
+            self._cond.notify_all()
+
+    def _call(self, callback, name, *args):
+        # a failing callback (e.g. a file removed meanwhile or a full disk) must not stop the worker
+        try:
+            callback(name, *args)
+        except Exception:
+            self.logger.exception(f'The {getattr(callback, "__name__", callback)} callback failed for {name}!')
+
+    def _work(self, items, lock, on_success, on_failure):
+        while True:
+            with self._cond:
+                while self._active >= self.workers and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                self._active += 1
+
+            with lock:
+                item = next(items, None)
+            if item is None:
+                with self._cond:
+                    self._active -= 1
+                    self._cond.notify_all()
+                return
+
+            name, source = item
+            jpeg = b''
+            try:
+                if isinstance(source, str):
+                    with open(source, 'rb') as f:
+                        jpeg = f.read()
+                else:
+                    jpeg = source
+                self.upload(name, jpeg)
+            except Exception as e:
+                self._finish(len(jpeg), failed=True)
+                if on_failure:
+                    self._call(on_failure, name, source, e)
+            else:
+                self._finish(len(jpeg), failed=False)
+                if on_success:
+                    self._call(on_success, name, source)
+
+    def run(self, items, on_success=None, on_failure=None):
+        """
+        Upload the backlog and block until it's drained or draining is stopped.
+
+        Parameters
+        ----------
+        items : iterable of (str, str or bytes)
+            the name of every image with its path or its jpeg bytes, it's consumed lazily.
+        on_success : callable or None, default None
+            called with the name and the path/bytes of every uploaded image.
+        on_failure : callable or None, default None
+            called with the name, the path/bytes and the exception of every failed image.
+
+        Returns
+        -------
+        dict of {str : int or float}
+            the final metrics, see `metrics`.
+        """
+        with self._cond:
+            self._reset_counters()
+            self._started = self._window_start = self.clock()
+            self._stop = False
+
+        items = iter(items)
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(
+                target=self._work,
+                args=(items, lock, on_success, on_failure),
+                name=f'BacklogUploader-{i}'
+            )
+            for i in range(self.max_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return self.metrics()
+
+    def stop(self):
+        """
+        Stop draining after the running uploads.
+        """
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
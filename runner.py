@@ -154,10 +154,10 @@ if __name__ == '__main__':
                 daemon.start()
                 time.sleep(15)
         elif 'check-temp-storage' == sys.argv[1]:
-            s = SkyScanner()
+            s = SkyScanner(capture=False)
             s.check_temp_storage()
         elif 'check-main-storage' == sys.argv[1]:
-            s = SkyScanner()
+            s = SkyScanner(capture=False)
             s.check_main_storage()
         else:
             print('Unknown command')
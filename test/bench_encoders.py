@@ -0,0 +1,30 @@
+"""
+Measure the jpeg encoders on a synthetic sky frame with the settings of config.ini.
+
+Run from the repository root:
+    python test/bench_encoders.py
+"""
+import sys
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from SkyImageAgg.Configuration import Config  # noqa: E402
+from SkyImageAgg.Encoders import benchmark  # noqa: E402
+from synthetic_sky import make_sky_frame  # noqa: E402
+
+
+def main():
+    frame = make_sky_frame(Config.image_size)
+    print(f'{frame.shape[1]}x{frame.shape[0]} frame, quality {Config.jpeg_quality}, '
+          f'subsampling {Config.jpeg_subsampling or "default"}, progressive {Config.jpeg_progressive}')
+    print(f'{"encoder":<12}{"time (ms)":>12}{"size (kB)":>12}')
+    for result in benchmark(frame, Config.jpeg_quality, Config.jpeg_subsampling, Config.jpeg_progressive, repeat=5):
+        if 'error' in result:
+            print(f'{result["name"]:<12}  failed: {result["error"]}')
+        else:
+            print(f'{result["name"]:<12}{result["seconds"] * 1000:>12.1f}{result["size"] / 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Compare the time of `fuse_exposures` with OpenCV's Mertens fusion on synthetic bracketed sky frames and show how
+`ExposureFusion` keeps within its budget.
+
+Run from the repository root:
+    python test/bench_exposure_fusion.py
+"""
+import sys
+import time
+from os import path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from SkyImageAgg.Preprocessor import ExposureFusion  # noqa: E402
+from SkyImageAgg.Preprocessor import fuse_exposures  # noqa: E402
+from synthetic_sky import make_sky_frame  # noqa: E402
+
+
+def make_bracket(shape, exposures):
+    # the sun saturates the reference exposure
+    return [make_sky_frame(shape, sun=5.0, exposure=ev) for ev in exposures]
+
+
+def measure(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(shape=(1926, 1926), exposures=(0, -2, 2), repeat=3):
+    frames = make_bracket(shape, exposures)
+    mertens = cv2.createMergeMertens()
+
+    print(f'{shape[1]}x{shape[0]} frames, exposures {exposures}')
+    print(f'saturated pixels in the reference: {(frames[0] == 255).all(axis=2).mean() * 100:.2f} %')
+    print(f'{"fusion":<22}{"time (ms)":>12}{"saturated (%)":>15}')
+    results = {
+        'fuse_exposures': lambda: fuse_exposures(frames),
+        'fuse_exposures (2)': lambda: fuse_exposures(frames[:2]),
+        'cv2 Mertens': lambda: np.clip(mertens.process(frames) * 255, 0, 255).astype(np.uint8),
+    }
+    for name, func in results.items():
+        elapsed = measure(func, repeat)
+        fused = func()
+        print(f'{name:<22}{elapsed * 1e3:>12.1f}{(fused == 255).all(axis=2).mean() * 100:>15.2f}')
+
+    # a budget that fits about two frames
+    fusion = ExposureFusion()
+    fusion.fuse(frames)
+    fusion.budget = measure(lambda: fuse_exposures(frames), 1) * 2 / len(frames)
+    for _ in range(5):
+        fusion.fuse(frames)
+    print(f'budget {fusion.budget * 1e3:.0f} ms: {fusion.fused} fused, {fusion.reduced} with fewer exposures, '
+          f'{fusion.skipped} skipped')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Measure the cold start of the runner with `python -X importtime` and check it doesn't regress.
+
+Every run imports the modules in a fresh interpreter. The script lists the slowest imports and fails (exit status 1)
+if a hardware backend is imported at startup or if the import takes longer than the budget.
+
+Run from the repository root:
+    python test/bench_import_time.py [budget in ms] [module]
+"""
+import subprocess
+import sys
+from os import path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+# the hardware libraries and backends that are imported only when they're configured (see SkyImageAgg.Backends)
+LAZY_MODULES = ('picamera', 'RPi', 'serial', 'minimalmodbus', 'influxdb', 'i2c_lcd', 'bs4', 'apscheduler',
+                'SkyImageAgg.GSM', 'SkyImageAgg.Collectors.RpiCam', 'SkyImageAgg.Collectors.GeoVisionCam',
+                'SkyImageAgg.Collectors.IrradianceSensor')
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter.
+
+    Returns
+    -------
+    dict of {str : tuple of (int, int)}
+        the self and cumulative import time in microseconds per imported module.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(own), int(cumulative)
+    return times
+
+
+def main(budget=1000.0, module='SkyImageAgg.SkyImager', repeat=5, top=10):
+    runs = [import_times(module) for _ in range(repeat)]
+    # the fastest run has the least noise from the rest of the system
+    best = min(runs, key=lambda times: times[module][1])
+    total = best[module][1] / 1e3
+
+    print(f'import {module}: {total:.1f} ms (best of {repeat}), {len(best)} modules')
+    print(f'{"module":<50}{"self (ms)":>12}{"cumulative (ms)":>18}')
+    for name, (own, cumulative) in sorted(best.items(), key=lambda item: -item[1][0])[:top]:
+        print(f'{name:<50}{own / 1e3:>12.1f}{cumulative / 1e3:>18.1f}')
+
+    failed = False
+    eager = sorted(name for name in best if name.split('.')[0] in LAZY_MODULES or name in LAZY_MODULES)
+    if eager:
+        print(f'FAIL: imported at startup: {", ".join(eager)}')
+        failed = True
+    if total > budget:
+        print(f'FAIL: {total:.1f} ms is over the budget of {budget:.0f} ms')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 1000.0
+    module = sys.argv[2] if len(sys.argv) > 2 else 'SkyImageAgg.SkyImager'
+    sys.exit(main(budget, module))
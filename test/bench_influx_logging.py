@@ -0,0 +1,59 @@
+"""
+Compare the logging throughput of a synchronous InfluxDB write per record with the buffered handler.
+
+A local InfluxDB stub (see `test_Logger.StubInflux`) answers every write after a simulated network latency.
+
+Run from the repository root:
+    python test/bench_influx_logging.py [records] [latency in ms]
+"""
+import logging
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+
+from SkyImageAgg.Logger import InfluxdbLogHandler  # noqa: E402
+from test_Logger import StubInflux  # noqa: E402
+
+
+class SynchronousHandler(InfluxdbLogHandler):
+    # what `InfluxdbLogHandler.emit` used to do: one HTTP request inside every logging call
+    def emit(self, record):
+        self.client.write(data=[self.make_line(record)], params={'db': self.db}, protocol='line')
+
+
+def bench(handler_class, records):
+    logger = logging.getLogger(handler_class.__name__)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = handler_class('127.0.0.1', 'user', 'pwd', 'sky', 'app_log', port=server.port)
+    handler.add_tags(host='bench', latitude=50.15, longitude=14.17)
+    logger.addHandler(handler)
+
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info('Image %d uploaded!', i)
+    logged = time.perf_counter() - start
+    handler.flush()
+    delivered = time.perf_counter() - start
+
+    logger.removeHandler(handler)
+    handler.close()
+    return logged, delivered
+
+
+if __name__ == '__main__':
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.005
+    server = StubInflux(delay=latency)
+
+    print(f'{records} records, {latency * 1000:.1f} ms per write request')
+    print(f'{"handler":<20}{"logging calls/s":>18}{"mean call (us)":>16}{"delivered in (s)":>18}{"requests":>10}')
+    for handler_class in (SynchronousHandler, InfluxdbLogHandler):
+        writes = server.writes
+        logged, delivered = bench(handler_class, records)
+        print(f'{handler_class.__name__:<20}{records / logged:>18.0f}{logged / records * 1e6:>16.1f}'
+              f'{delivered:>18.3f}{server.writes - writes:>10}')
+    server.stop()
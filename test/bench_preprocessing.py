@@ -0,0 +1,61 @@
+"""
+Compare the legacy crop/mask path of `SkyScanner.preprocess_image` with `FramePreprocessor`.
+
+Run from the repository root:
+    python test/bench_preprocessing.py
+"""
+import sys
+import time
+import tracemalloc
+from os import path
+
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from SkyImageAgg.Preprocessor import FramePreprocessor  # noqa: E402
+from SkyImageAgg.Preprocessor import calc_crop_size  # noqa: E402
+
+_mask_path = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'masks', 'mask.bmp')
+
+
+def legacy_preprocess(image, mask, crop_size):
+    # the path before the mask was cached as uint8 (int64 mask, product upcast to int64)
+    image = image[crop_size[0]:crop_size[1], crop_size[2]:crop_size[3]]
+    return np.multiply(mask, image)
+
+
+def measure(func, frames):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for frame in frames:
+        func(frame)
+    elapsed = (time.perf_counter() - start) / len(frames)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(repeat=10):
+    frames = [
+        np.random.randint(0, 256, size=(1944, 2592, 3), dtype=np.uint8)
+        for _ in range(repeat)
+    ]
+    mask = FramePreprocessor(mask=_mask_path).mask
+    legacy_mask = np.where(np.repeat(mask[..., np.newaxis], 3, axis=2) == 1, 1, 0)
+    crop_size = calc_crop_size(frames[0].shape, mask.shape)
+    proc = FramePreprocessor(mask=mask, output_resolution=mask.shape)
+    proc.fit(frames[0].shape)
+
+    results = {
+        'legacy': measure(lambda f: legacy_preprocess(f, legacy_mask, crop_size), frames),
+        'cached uint8': measure(proc.process, frames),
+    }
+
+    print(f'{"path":<15}{"time/frame (ms)":>18}{"peak alloc (MB)":>18}')
+    for name, (elapsed, peak) in results.items():
+        print(f'{name:<15}{elapsed * 1e3:>18.1f}{peak / 2 ** 20:>18.1f}')
+
+
+if __name__ == '__main__':
+    main()
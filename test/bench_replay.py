@@ -0,0 +1,365 @@
+"""
+Replay the capture/preprocess/upload/backlog cycle of `SkyScanner` offline and report its performance.
+
+The hardware and the server are replaced by stand-ins:
+- `ReplayCam` replays a directory of jpegs (synthetic sky frames if none is given), it's registered as the RPi
+  camera backend,
+- `SimulatedSensor` is registered as the irradiance sensor backend,
+- `StubUploadServer` is a local upload server with a configurable latency and failure rate.
+
+Every mode ('sequential' is `execute_and_upload`, 'pipeline' is `execute_in_pipeline`) runs in its own process
+with its own working directory. The frames are captured back to back, then the failed uploads are drained from
+the spool and the main storage. It reports frames/s, the p50/p99 cycle latency (capture to upload), the peak RSS,
+the bytes written on disk and the mean time of the instrumented spans. The exit status is 1 if a frame was lost.
+
+With an image interval above 0 the features are computed and uploaded every tick, and only every
+`image interval`-th image is uploaded (the others are decimated).
+
+Run from the repository root:
+    python test/bench_replay.py [frames] [latency in ms] [failure rate] [mode] [image interval] [jpeg directory]
+"""
+import glob
+import json
+import logging
+import math
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from os import path
+from urllib.parse import unquote_plus
+
+import cv2
+import numpy as np
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from SkyImageAgg import SkyImager  # noqa: E402
+from SkyImageAgg.Backends import CAMERAS  # noqa: E402
+from SkyImageAgg.Backends import SENSORS  # noqa: E402
+from SkyImageAgg.Collectors.Camera import Cam  # noqa: E402
+from SkyImageAgg.Configuration import Config  # noqa: E402
+from SkyImageAgg.Controller import TwilightCalc  # noqa: E402
+from SkyImageAgg.DataStore import DECIMATED  # noqa: E402
+from SkyImageAgg.Metrics import metrics  # noqa: E402
+from synthetic_sky import make_sky_frame  # noqa: E402
+
+MODES = ('sequential', 'pipeline')
+
+
+def make_sky_jpegs(directory, count=8, shape=(1944, 2592)):
+    # drifting clouds, a new cloud pattern per frame
+    for i in range(count):
+        frame = make_sky_frame(shape, seed=i, noise=0, clouds=40.0)
+        cv2.imwrite(path.join(directory, f'{i:03d}.jpg'), frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+
+class ReplayCam(Cam):
+    """
+    A camera replaying the jpegs of a directory in a loop.
+    """
+
+    def __init__(self, directory, delay=0.0):
+        super().__init__()
+        self.jpegs = []
+        for file in sorted(glob.glob(path.join(directory, '*.jpg'))):
+            with open(file, 'rb') as f:
+                self.jpegs.append(f.read())
+        if not self.jpegs:
+            raise FileNotFoundError(f'There is no jpeg in {directory}!')
+        self.delay = delay
+        self.captured = 0
+        self._lock = threading.Lock()
+
+    def login(self, username, pwd):
+        pass
+
+    def cap_jpeg(self):
+        time.sleep(self.delay)
+        with self._lock:
+            jpeg = self.jpegs[self.captured % len(self.jpegs)]
+            self.captured += 1
+        return jpeg
+
+    def cap_pic(self, output='array'):
+        return cv2.imdecode(np.frombuffer(self.cap_jpeg(), np.uint8), cv2.IMREAD_COLOR)
+
+    def cap_video(self, output):
+        raise NotImplementedError('This method is not implemented yet!')
+
+
+class SimulatedSensor:
+    """
+    An irradiance sensor answering after a modbus-like delay.
+    """
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.reads = 0
+        self._rng = random.Random(0)
+
+    def get_data(self):
+        time.sleep(self.delay)
+        self.reads += 1
+        irradiance = 600 + 300 * math.sin(time.time() / 60) + self._rng.gauss(0, 5)
+        return round(irradiance, 1), 21.5, round(25 + irradiance / 50, 1)
+
+    def close(self):
+        pass
+
+
+class StubUploadServer(ThreadingHTTPServer):
+    """
+    An upload server answering every request after a latency, a share of the requests fails.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=0):
+        super().__init__(('127.0.0.1', 0), _UploadHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self.bytes = 0
+        self.uploaded = set()
+        self.features = set()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/upload/'
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _UploadHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        with self.server._lock:
+            self.server.requests += 1
+            failed = self.server._rng.random() < self.server.failure_rate
+            if failed:
+                self.server.failures += 1
+            else:
+                time_stamp = re.search(r'"time": "([^"]+)"', unquote_plus(body[:512].decode())).group(1)
+                if self.path.startswith('/features/'):
+                    self.server.features.add(time_stamp)
+                else:
+                    self.server.bytes += len(body)
+                    self.server.uploaded.add(time_stamp)
+        reply = b'Service Unavailable' if failed else b'{"status": "ok"}'
+        self.send_response(503 if failed else 200)
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+
+def written_bytes():
+    # bytes the process caused to be written to the storage, None where /proc isn't available
+    try:
+        with open('/proc/self/io') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('write_bytes'))
+    except (OSError, StopIteration):
+        return None
+
+
+def directory_size(directory):
+    return sum(path.getsize(path.join(root, file)) for root, _, files in os.walk(directory) for file in files)
+
+
+def configure(workspace, server, mode, image_interval, jpeg_dir):
+    # the working directories, the logs and the main storage go to the workspace, nothing is written in the repo
+    SkyImager._base_dir = workspace
+    SkyImager._tmp_dir = path.join(workspace, 'temp')
+    SkyImager._log_dir = path.join(workspace, 'log')
+    SkyImager._data_dir = path.join(workspace, 'data')
+    SkyImager._influx_overflow_dir = path.join(workspace, 'temp', 'influx')
+    # the failed uploads are expected, so is the lack of the NTP daemon
+    SkyImager.logger.addHandler(logging.NullHandler())
+    TwilightCalc.sync_time = lambda self: None
+    # the stub server is the internet
+    SkyImager.has_internet = lambda: True
+
+    CAMERAS.register('rpi', lambda **settings: ReplayCam(jpeg_dir))
+    SENSORS.register('irradiance', lambda **settings: SimulatedSensor())
+
+    Config.server = server.url
+    Config.cam_address = 'rpi'
+    Config.cameras = []
+    Config.storage_path = path.join(workspace, 'storage')
+    Config.store_locally = False
+    Config.log_path = ''
+    Config.log_to_console = False
+    Config.dashboard_enabled = False
+    Config.gsm_enabled = False
+    Config.bracketing_enabled = False
+    Config.mask_path = path.join(ROOT, 'masks', 'mask.bmp')
+    # the frames are captured back to back, so their names need a finer resolution than seconds
+    Config.time_format = '%Y-%m-%d_%H-%M-%S-%f'
+    Config.irr_sensor_enabled = True
+    Config.irr_sensor_store = True
+    Config.irr_sampling_rate = 10
+    Config.pipeline_enabled = mode == 'pipeline'
+    # every frame is kept, so the throughput is the one of the slowest stage
+    Config.pipeline_drop_policy = 'block'
+    Config.metrics_enabled = True
+    Config.features_enabled = image_interval > 0
+    Config.features_server = server.url.replace('/upload/', '/features/')
+    Config.features_image_interval = max(image_interval, 1)
+
+
+def run(frames, latency, failure_rate, mode, image_interval, jpeg_dir):
+    """
+    Run a mode in this process.
+
+    Returns
+    -------
+    dict
+        the results.
+    """
+    workspace = tempfile.mkdtemp(prefix='replay-')
+    server = StubUploadServer(latency=latency, failure_rate=failure_rate)
+    try:
+        if jpeg_dir is None:
+            jpeg_dir = path.join(workspace, 'jpegs')
+            os.mkdir(jpeg_dir)
+            make_sky_jpegs(jpeg_dir)
+        configure(workspace, server, mode, image_interval, jpeg_dir)
+
+        scanner = SkyImager.SkyScanner()
+        scanner.daytime = True
+        scanner.irr_sampler.start()
+        # the decimated frames are lost unless their features were uploaded
+        decimated = []
+        record_capture = scanner.record_capture
+
+        def record(timestamp, jpeg, latency, status):
+            if status == DECIMATED:
+                decimated.append(scanner.to_iso_format(timestamp))
+            record_capture(timestamp, jpeg, latency, status)
+
+        scanner.record_capture = record
+        written = written_bytes()
+        latencies = []
+
+        start = time.monotonic()
+        if mode == 'pipeline':
+            def output(frame):
+                scanner.upload_frame(frame)
+                latencies.append(time.monotonic() - frame.captured_at)
+
+            scanner.start_pipeline(output=output)
+            for _ in range(frames):
+                scanner.execute_in_pipeline()
+            scanner.pipeline.stop()
+        else:
+            for _ in range(frames):
+                cycle = time.monotonic()
+                scanner.execute_and_upload()
+                latencies.append(time.monotonic() - cycle)
+        elapsed = time.monotonic() - start
+
+        # the failed uploads are retried from the spool, the ones failing again are drained from the main storage
+        queued = len(scanner.spool)
+        start = time.monotonic()
+        scanner.check_temp_storage()
+        evicted = len(scanner.manifest.names())
+        scanner.check_main_storage()
+        backlog = time.monotonic() - start
+
+        scanner.irr_sampler.stop()
+        scanner.flush_data_store()
+        remaining = len(scanner.spool) + len(scanner.manifest.names())
+        if written is not None:
+            written = written_bytes() - written
+
+        histograms, _ = metrics.collect()
+        undelivered = sum(time_stamp not in server.features for time_stamp in decimated)
+        return {
+            'mode': mode,
+            'frames': frames,
+            'fps': frames / elapsed,
+            'p50': float(np.percentile(latencies, 50)),
+            'p99': float(np.percentile(latencies, 99)),
+            'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'written': written,
+            'on_disk': directory_size(workspace),
+            'uploaded': len(server.uploaded),
+            'upload_bytes': server.bytes,
+            'requests': server.requests,
+            'queued': queued,
+            'evicted': evicted,
+            'backlog': backlog,
+            'remaining': remaining,
+            'decimated': len(decimated),
+            'features': len(server.features),
+            'lost': frames - len(server.uploaded) - remaining - len(decimated) + undelivered,
+            'spans': {name: snapshot['sum'] / snapshot['count'] for name, snapshot in histograms.items()
+                      if snapshot['count']}
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def main(frames=50, latency=0.05, failure_rate=0.1, mode='both', image_interval=0, jpeg_dir=None):
+    modes = MODES if mode == 'both' else (mode,)
+    results = []
+    for mode in modes:
+        # a process per mode, so the peak RSS and the written bytes are its own
+        args = [sys.executable, path.abspath(__file__), str(frames), str(latency * 1000), str(failure_rate), mode,
+                str(image_interval), '--json'] + ([jpeg_dir] if jpeg_dir else [])
+        output = subprocess.run(args, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+
+    print(f'{frames} frames, {latency * 1000:.0f} ms upload latency, {failure_rate * 100:.0f} % failed uploads'
+          + (f', images uploaded every {image_interval} ticks' if image_interval else ''))
+    print(f'{"mode":<12}{"frames/s":>10}{"p50 (ms)":>10}{"p99 (ms)":>10}{"RSS (MB)":>10}{"written (MB)":>14}'
+          f'{"on disk (MB)":>14}{"sent (MB)":>11}{"requests":>10}{"backlog (s)":>13}{"decimated":>11}{"lost":>6}')
+    for r in results:
+        written = '-' if r['written'] is None else f'{r["written"] / 2 ** 20:.1f}'
+        print(f'{r["mode"]:<12}{r["fps"]:>10.2f}{r["p50"] * 1e3:>10.0f}{r["p99"] * 1e3:>10.0f}'
+              f'{r["rss"] / 2 ** 20:>10.0f}{written:>14}{r["on_disk"] / 2 ** 20:>14.1f}'
+              f'{r["upload_bytes"] / 2 ** 20:>11.1f}{r["requests"]:>10}{r["backlog"]:>13.2f}'
+              f'{r["decimated"]:>11}{r["lost"]:>6}')
+
+    spans = sorted({name for r in results for name in r['spans']})
+    print(f'\n{"span (mean ms)":<28}' + ''.join(f'{r["mode"]:>12}' for r in results))
+    for name in spans:
+        print(f'{name:<28}' + ''.join(
+            f'{r["spans"][name] * 1e3:>12.1f}' if name in r['spans'] else f'{"-":>12}' for r in results
+        ))
+    return 1 if any(r['lost'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    argv = [arg for arg in sys.argv[1:] if arg != '--json']
+    frames = int(argv[0]) if len(argv) > 0 else 50
+    latency = float(argv[1]) / 1000 if len(argv) > 1 else 0.05
+    failure_rate = float(argv[2]) if len(argv) > 2 else 0.1
+    mode = argv[3] if len(argv) > 3 else 'both'
+    image_interval = int(argv[4]) if len(argv) > 4 else 0
+    jpeg_dir = argv[5] if len(argv) > 5 else None
+    if '--json' in sys.argv:
+        print(json.dumps(run(frames, latency, failure_rate, mode, image_interval, jpeg_dir)))
+    else:
+        sys.exit(main(frames, latency, failure_rate, mode, image_interval, jpeg_dir))
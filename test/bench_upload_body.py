@@ -0,0 +1,68 @@
+"""
+Compare memory and latency of the legacy upload body preparation with `UploadBodyBuilder`.
+
+Run from the repository root:
+    python test/bench_upload_body.py
+"""
+import hashlib
+import hmac
+import json
+import sys
+import time
+import tracemalloc
+from base64 import b64encode
+from os import path
+from urllib.parse import urlencode
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from SkyImageAgg.Uploader import UploadBodyBuilder  # noqa: E402
+
+_key = b'secret'
+_time_stamp = '2020-06-01T12:00:10'
+
+
+def legacy_body(jpeg):
+    # what `prepare_as_post_req`, `encrypt_data` and `requests.post(data={...})` used to do
+    data = json.dumps({
+        'status': 'ok',
+        'id': '200',
+        'time': _time_stamp,
+        'coding': 'Base64',
+        'data': b64encode(jpeg).decode('ascii')
+    })
+    signature = hmac.new(_key, bytes(data, 'ascii'), digestmod=hashlib.sha256).hexdigest()
+    return urlencode({'data': data}).encode('utf-8'), signature
+
+
+def measure(func, jpeg, repeat):
+    func(jpeg)  # warm up (the builder allocates its buffer once)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(jpeg)
+    elapsed = (time.perf_counter() - start) / repeat
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(repeat=20):
+    # blurred noise so the jpeg has a realistic size for a sky image
+    noise = np.random.randint(0, 256, size=(1926, 1926, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(noise, (0, 0), 1.5)
+    jpeg = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), 70])[1]
+    builder = UploadBodyBuilder(_key, '200')
+
+    print(f'jpeg size: {jpeg.size / 2 ** 20:.2f} MB')
+    print(f'{"path":<10}{"time/body (ms)":>17}{"peak alloc (MB)":>18}')
+    for name, func in (('legacy', legacy_body), ('builder', lambda j: builder.build(j, _time_stamp))):
+        elapsed, peak = measure(func, jpeg, repeat)
+        print(f'{name:<10}{elapsed * 1e3:>17.1f}{peak / 2 ** 20:>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
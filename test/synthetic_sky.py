@@ -0,0 +1,47 @@
+"""
+Synthetic sky frames for the tests and the benchmarks.
+"""
+import cv2
+import numpy as np
+
+
+def make_sky_frame(shape, seed=0, noise=4.0, clouds=0.0, sun=0.0, exposure=0):
+    """
+    Make a synthetic sky frame: a blue sky getting brighter towards the horizon with pixel noise, optionally with
+    clouds and a sun.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        (height, width) of the frame.
+    seed : int, default 0
+        the seed of the noise and the clouds.
+    noise : float, default 4.0
+        the standard deviation of the pixel noise.
+    clouds : float, default 0.0
+        the strength of the clouds, a clear sky if 0.
+    sun : float, default 0.0
+        the peak brightness of the sun relative to a white pixel, no sun if 0.
+    exposure : float, default 0
+        the EV offset of the exposure.
+
+    Returns
+    -------
+    numpy.array
+        the BGR uint8 frame.
+    """
+    height, width = shape
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    radius = np.hypot(x - width / 2, y - height / 2) / (max(height, width) / 2)
+    sky = np.array([230, 170, 110], np.float32) * (0.6 + 0.4 * radius[..., np.newaxis])
+    if clouds:
+        cloud = rng.normal(0, clouds, size=(height // 8 + 1, width // 8 + 1)).astype(np.float32)
+        cloud = cv2.resize(cv2.GaussianBlur(cloud, (0, 0), 3), (width, height))
+        sky += np.maximum(cloud, 0)[..., np.newaxis]
+    if sun:
+        disk = np.exp(-((x - 0.6 * width) ** 2 + (y - 0.4 * height) ** 2) / (0.002 * width * height))
+        sky += 255 * sun * disk[..., np.newaxis]
+    if noise:
+        sky += noise * rng.standard_normal(sky.shape, dtype=np.float32)
+    return np.clip(sky * 2 ** exposure, 0, 255).astype(np.uint8)
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from SkyImageAgg.Archive import PackArchive
+
+# 2020-06-01 12:00:00 UTC
+_noon = 1591012800
+
+
+def make_jpeg(value):
+    image = np.full((16, 16, 3), value, dtype=np.uint8)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+class TestPackArchive(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, '20200601.pack')
+        self.images = [(f'2020-06-01_12-00-{10 * i:02d}', _noon + 10 * i, make_jpeg(10 * i)) for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def fill(self):
+        archive = PackArchive(self.path)
+        offsets = [archive.append(name, timestamp, jpeg) for name, timestamp, jpeg in self.images]
+        return archive, offsets
+
+    def test_images_are_stored_as_they_are(self):
+        archive, offsets = self.fill()
+        with open(self.path, 'rb') as f:
+            pack = f.read()
+        for (name, _, jpeg), offset in zip(self.images, offsets):
+            self.assertEqual(pack[offset:offset + len(jpeg)], jpeg)
+        # one small header per image
+        self.assertLess(len(pack) - sum(len(jpeg) for _, _, jpeg in self.images), 50 * len(self.images))
+        archive.close()
+
+    def test_random_access_reads(self):
+        archive, _ = self.fill()
+        self.assertEqual(len(archive), 5)
+        self.assertIn('2020-06-01_12-00-30', archive)
+        self.assertEqual(bytes(archive.read('2020-06-01_12-00-30')), self.images[3][2])
+        self.assertEqual(bytes(archive.read_at(_noon + 10)), self.images[1][2])
+        self.assertEqual([name for name, _ in archive.range(_noon + 15, _noon + 45)],
+                         ['2020-06-01_12-00-20', '2020-06-01_12-00-30', '2020-06-01_12-00-40'])
+        with self.assertRaises(KeyError):
+            archive.read('2020-06-01_13-00-00')
+        with self.assertRaises(KeyError):
+            archive.read_at(_noon + 5)
+
+        # reads after an append remap the pack
+        archive.append('2020-06-01_12-01-00', _noon + 60, b'new')
+        self.assertEqual(bytes(archive.read('2020-06-01_12-01-00')), b'new')
+        archive.close()
+
+    def test_reopen(self):
+        archive, _ = self.fill()
+        archive.close()
+        archive = PackArchive(self.path)
+        self.assertEqual(archive.names(), [name for name, _, _ in self.images])
+        self.assertEqual(bytes(archive.read('2020-06-01_12-00-00')), self.images[0][2])
+        archive.close()
+
+    def test_an_appended_name_replaces_the_older_image(self):
+        archive, _ = self.fill()
+        archive.append('2020-06-01_12-00-10', _noon + 10, b'again')
+        self.assertEqual(bytes(archive.read('2020-06-01_12-00-10')), b'again')
+        archive.close()
+        archive = PackArchive(self.path)
+        self.assertIn('2020-06-01_12-00-10', archive)
+        self.assertNotIn('2020-06-01_12-00-11', archive)
+        self.assertEqual(bytes(archive.read('2020-06-01_12-00-10')), b'again')
+        archive.close()
+
+    def test_lost_index_is_rebuilt_from_the_pack(self):
+        archive, _ = self.fill()
+        archive.close()
+        with open(archive.index_path, 'r+b') as f:
+            f.truncate(os.path.getsize(archive.index_path) // 2)
+
+        archive = PackArchive(self.path)
+        self.assertEqual(len(archive), 5)
+        self.assertEqual(bytes(archive.read('2020-06-01_12-00-40')), self.images[4][2])
+        archive.close()
+
+    def test_partial_record_is_truncated(self):
+        archive, _ = self.fill()
+        archive.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(b'SIA1' + b'\0' * 10)
+
+        archive = PackArchive(self.path)
+        self.assertEqual(len(archive), 5)
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertEqual(archive.append('2020-06-01_12-01-00', _noon + 60, b'next'), size + 18 + 19)
+        archive.close()
+
+    def test_long_names_are_rejected(self):
+        archive = PackArchive(self.path)
+        with self.assertRaises(ValueError):
+            archive.append('x' * 33, _noon, b'data')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import subprocess
+import sys
+import unittest
+from os import path
+from unittest import TestCase
+
+from SkyImageAgg.Backends import CAMERAS
+from SkyImageAgg.Backends import MODEMS
+from SkyImageAgg.Backends import Registry
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+class TestRegistry(TestCase):
+    def test_backend_is_imported_on_load(self):
+        registry = Registry('codec', {'json': 'json:dumps'})
+        self.assertIn('json', registry)
+        self.assertFalse(registry.is_loaded('json'))
+        dumps = registry.load('json')
+        self.assertEqual(dumps([1]), '[1]')
+        self.assertTrue(registry.is_loaded('json'))
+        self.assertIs(registry.load('json'), dumps)
+
+    def test_register_an_object(self):
+        registry = Registry('codec')
+        registry.register('repr', repr)
+        self.assertTrue(registry.is_loaded('repr'))
+        self.assertIs(registry.load('repr'), repr)
+        self.assertEqual(registry.names(), ['repr'])
+
+    def test_register_replaces_the_backend(self):
+        registry = Registry('codec', {'dump': 'json:dumps'})
+        registry.load('dump')
+        registry.register('dump', 'json:loads')
+        self.assertFalse(registry.is_loaded('dump'))
+        self.assertEqual(registry.load('dump')('[1]'), [1])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            CAMERAS.load('webcam')
+
+    def test_builtin_backends(self):
+        self.assertEqual(sorted(CAMERAS.names()), ['geovision', 'rpi'])
+        self.assertEqual(sorted(MODEMS.names()), ['gprs', 'sms'])
+
+
+class TestColdStart(TestCase):
+    def test_hardware_is_not_imported_at_startup(self):
+        lazy = ('picamera', 'RPi', 'serial', 'minimalmodbus', 'influxdb', 'i2c_lcd', 'bs4', 'apscheduler',
+                'SkyImageAgg.GSM', 'SkyImageAgg.Collectors.RpiCam', 'SkyImageAgg.Collectors.GeoVisionCam')
+        code = 'import sys, SkyImageAgg.SkyImager; print(" ".join(sys.modules))'
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        modules = set(result.stdout.split())
+        self.assertIn('SkyImageAgg.SkyImager', modules)
+        self.assertEqual([name for name in lazy if name in modules], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from SkyImageAgg.DataStore import CAPTURE_COLUMNS
+from SkyImageAgg.DataStore import ColumnTable
+from SkyImageAgg.DataStore import DataStore
+from SkyImageAgg.DataStore import QUEUED
+from SkyImageAgg.DataStore import UPLOADED
+
+# 2020-06-01 00:00:00 UTC
+_midnight = 1590969600
+
+
+class TestColumnTable(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.table = ColumnTable(os.path.join(self.dir, 'table'), [('time', '<f8'), ('value', '<f4')])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_append_and_read(self):
+        self.assertEqual(len(self.table), 0)
+        self.assertEqual(len(self.table.read()['time']), 0)
+        self.table.append({'time': [1, 2], 'value': [10, 20]})
+        self.table.append({'time': [3], 'value': [30]})
+        self.assertEqual(len(self.table), 3)
+        np.testing.assert_array_equal(self.table.read()['value'], [10, 20, 30])
+        np.testing.assert_array_equal(self.table.read(['time'], start=1)['time'], [2, 3])
+        self.assertEqual(list(self.table.read(start=-1)), ['time', 'value'])
+        self.assertEqual(os.path.getsize(self.table.column_path('value')), 12)
+
+    def test_interrupted_append(self):
+        self.table.append({'time': [1, 2], 'value': [10, 20]})
+        with open(self.table.column_path('time'), 'ab') as f:
+            np.array([3.0]).tofile(f)
+        self.assertEqual(len(self.table), 2)
+        np.testing.assert_array_equal(self.table.read()['time'], [1, 2])
+
+    def test_append_after_an_interrupted_append(self):
+        self.table.append({'time': [1], 'value': [10]})
+        with open(self.table.column_path('time'), 'ab') as f:
+            np.array([2.0]).tofile(f)
+        with open(self.table.column_path('value'), 'ab') as f:
+            f.write(b'\x00')  # a partial value
+        self.table.append({'time': [3], 'value': [30]})
+        self.assertEqual(len(self.table), 2)
+        rows = self.table.read()
+        np.testing.assert_array_equal(rows['time'], [1, 3])
+        np.testing.assert_array_equal(rows['value'], [10, 30])
+
+
+class TestDataStore(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = DataStore(self.dir, 'captures', CAPTURE_COLUMNS)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def record_every_10_seconds(self, start, count):
+        for i in range(count):
+            self.store.record(time=start + 10 * i, irradiance=i, size=1000 + i, offset=-1, status=QUEUED)
+
+    def test_rows_go_to_their_daily_tables(self):
+        self.record_every_10_seconds(_midnight - 50, 10)
+        self.store.flush()
+        self.assertEqual(self.store.days(), ['20200531', '20200601'])
+        self.assertEqual(len(self.store.table('20200531')), 5)
+        self.assertEqual(len(self.store.table('20200601')), 5)
+
+    def test_range_query(self):
+        self.record_every_10_seconds(_midnight - 50, 10)
+        self.store.flush()
+        # buffered rows are included
+        self.store.record(time=_midnight + 60, irradiance=99, status=QUEUED)
+
+        rows = self.store.query(_midnight - 20, _midnight + 30)
+        np.testing.assert_array_equal(rows['time'], _midnight + np.arange(-20, 30, 10))
+        np.testing.assert_array_equal(rows['irradiance'], [3, 4, 5, 6, 7])
+        self.assertEqual(rows['size'].dtype, np.dtype('<u4'))
+
+        rows = self.store.query(_midnight + 40, _midnight + 86400, columns=['irradiance'])
+        self.assertEqual(list(rows), ['irradiance'])
+        np.testing.assert_array_equal(rows['irradiance'], [9, 99])
+
+        self.assertEqual(len(self.store.query(_midnight + 1000, _midnight + 2000)['time']), 0)
+
+    def test_rows_are_sorted_by_time(self):
+        for t in (30, 10, 20):
+            self.store.record(time=_midnight + t)
+        self.store.flush()
+        np.testing.assert_array_equal(self.store.query(_midnight, _midnight + 60)['time'],
+                                      _midnight + np.array([10, 20, 30]))
+
+    def test_update_status(self):
+        self.record_every_10_seconds(_midnight, 3)
+        self.assertEqual(self.store.update(_midnight + 10, status=UPLOADED), 1)  # buffered row
+        self.store.flush()
+        self.assertEqual(self.store.update(_midnight + 20, status=UPLOADED), 1)  # written row
+        self.assertEqual(self.store.update(_midnight + 25, status=UPLOADED), 0)
+
+        rows = self.store.query(_midnight, _midnight + 30, columns=['status', 'size'])
+        np.testing.assert_array_equal(rows['status'], [QUEUED, UPLOADED, UPLOADED])
+        np.testing.assert_array_equal(rows['size'], [1000, 1001, 1002])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from SkyImageAgg.Encoders import ENCODERS
+from SkyImageAgg.Encoders import OpenCVEncoder
+from SkyImageAgg.Encoders import available_encoders
+from SkyImageAgg.Encoders import benchmark
+from SkyImageAgg.Encoders import get_default_encoder
+from SkyImageAgg.Encoders import select_encoder
+from SkyImageAgg.Encoders import set_default_encoder
+from SkyImageAgg.Preprocessor import encode_jpeg
+from synthetic_sky import make_sky_frame
+
+
+def to_bytes(jpeg):
+    return memoryview(jpeg).cast('B').tobytes()
+
+
+def sampling_factors(jpeg):
+    """
+    Read the sampling factors of the components from the SOF marker.
+    """
+    i = 2
+    while i < len(jpeg):
+        marker, length = jpeg[i + 1], int.from_bytes(jpeg[i + 2:i + 4], 'big')
+        if marker in (0xC0, 0xC1, 0xC2):
+            components = jpeg[i + 9]
+            return marker, [jpeg[i + 11 + 3 * c] for c in range(components)]
+        i += 2 + length
+    raise ValueError('No SOF marker')
+
+
+class TestEncoders(TestCase):
+    def setUp(self):
+        self.frame = make_sky_frame((64, 96))
+
+    def test_all_available_encoders_decode(self):
+        for name in available_encoders():
+            with self.subTest(name):
+                jpeg = to_bytes(ENCODERS[name]().encode(self.frame, 90))
+                decoded = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                self.assertEqual(decoded.shape, self.frame.shape)
+                # the channels must not be swapped
+                self.assertLess(np.abs(decoded.astype(int) - self.frame).mean(), 6)
+
+    def test_grayscale(self):
+        gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        for name in available_encoders():
+            with self.subTest(name):
+                jpeg = to_bytes(ENCODERS[name]().encode(gray, 90))
+                decoded = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_UNCHANGED)
+                self.assertEqual(decoded.shape, gray.shape)
+
+    def test_subsampling_and_progressive(self):
+        for name in available_encoders():
+            with self.subTest(name):
+                encoder = ENCODERS[name]()
+                marker, factors = sampling_factors(to_bytes(encoder.encode(self.frame, 80, '444')))
+                self.assertEqual(marker, 0xC0)
+                self.assertEqual(factors[0], 0x11)
+                _, factors = sampling_factors(to_bytes(encoder.encode(self.frame, 80, '420')))
+                self.assertEqual(factors[0], 0x22)
+                marker, _ = sampling_factors(to_bytes(encoder.encode(self.frame, 80, progressive=True)))
+                self.assertEqual(marker, 0xC2)
+
+    def test_missing_quality(self):
+        with self.assertRaises(TypeError):
+            OpenCVEncoder().encode(self.frame, None)
+
+    def test_benchmark(self):
+        results = benchmark(self.frame, 70, repeat=1)
+        self.assertEqual({result['name'] for result in results}, set(available_encoders()))
+        self.assertEqual([result['seconds'] for result in results],
+                         sorted(result['seconds'] for result in results))
+        for result in results:
+            self.assertGreater(result['size'], 0)
+
+    def test_select_encoder(self):
+        self.assertIsInstance(select_encoder('opencv'), OpenCVEncoder)
+        self.assertIn(select_encoder('auto', shape=(64, 64)).name, available_encoders())
+        with self.assertRaises(ValueError):
+            select_encoder('gif')
+
+    def test_default_encoder(self):
+        class Recorder(OpenCVEncoder):
+            calls = 0
+
+            def encode(self, *args, **kwargs):
+                Recorder.calls += 1
+                return super().encode(*args, **kwargs)
+
+        previous = get_default_encoder()
+        set_default_encoder(Recorder())
+        try:
+            encode_jpeg(self.frame, 70)
+            self.assertEqual(Recorder.calls, 1)
+        finally:
+            set_default_encoder(previous)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import struct
+import threading
+import time
+import tty
+import unittest
+from unittest import TestCase
+
+from SkyImageAgg.Collectors.IrradianceSensor import IrrSensor
+
+
+def crc16(data):
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return struct.pack('<H', crc)
+
+
+class ModbusSlave:
+    """
+    A simulated Modbus RTU slave serving input registers on the master side of a pty.
+    """
+
+    def __init__(self, address, registers):
+        self.address = address
+        self.registers = registers
+        self.transactions = []
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _read(self, n):
+        data = b''
+        while len(data) < n:
+            data += os.read(self.master, n - len(data))
+        return data
+
+    def _serve(self):
+        while self._running:
+            try:
+                request = self._read(8)
+            except OSError:
+                return
+            address, function, start, count = struct.unpack('>BBHH', request[:6])
+            if crc16(request[:6]) != request[6:] or address != self.address:
+                continue
+            self.transactions.append((function, start, count))
+            if function != 4 or start + count > len(self.registers):
+                response = struct.pack('>BBB', address, function | 0x80, 2)  # illegal data address
+            else:
+                values = self.registers[start:start + count]
+                response = struct.pack(f'>BBB{count}H', address, function, 2 * count, *values)
+            os.write(self.master, response + crc16(response))
+
+    def close(self):
+        self._running = False
+        os.close(self.master)
+        os.close(self._slave)
+
+
+class TestIrrSensor(TestCase):
+    def setUp(self):
+        registers = [0] * 9
+        registers[0] = 8125  # 812.5 W/m^2
+        registers[7] = 352  # 35.2 °C
+        registers[8] = 0x10000 - 57  # -5.7 °C
+        self.slave = ModbusSlave(address=1, registers=registers)
+
+    def tearDown(self):
+        self.sensor.close()
+        self.slave.close()
+
+    def make_sensor(self, bulk):
+        self.sensor = IrrSensor(self.slave.port, 1, 9600, 8, 'N', 1, bulk=bulk)
+        return self.sensor
+
+    def test_bulk_read_is_one_transaction(self):
+        sensor = self.make_sensor(bulk=True)
+        for _ in range(3):
+            self.assertEqual(sensor.get_data(), (812.5, -5.7, 35.2))
+        self.assertEqual(self.slave.transactions, [(4, 0, 9)] * 3)
+        # the port stays open between the samples
+        self.assertTrue(sensor.serial.is_open)
+
+    def test_bulk_read_matches_single_register_reads(self):
+        bulk = self.make_sensor(bulk=True).get_data()
+        self.sensor.bulk = False
+        self.assertEqual(self.sensor.get_data(), bulk)
+        self.assertEqual(self.slave.transactions[1:], [(4, 0, 1), (4, 8, 1), (4, 7, 1)])
+        self.assertFalse(self.sensor.serial.is_open)
+
+    def test_failed_read_closes_the_port(self):
+        sensor = self.make_sensor(bulk=True)
+        self.slave.registers = self.slave.registers[:4]
+        with self.assertRaises(Exception):
+            sensor.get_data()
+        self.assertFalse(sensor.serial.is_open)
+
+        self.slave.registers = [10] * 9
+        self.assertEqual(sensor.get_data(), (1.0, 1.0, 1.0))
+
+    def test_bulk_read_is_faster(self):
+        sensor = self.make_sensor(bulk=False)
+        start = time.perf_counter()
+        sensor.get_data()
+        single = time.perf_counter() - start
+
+        sensor.bulk = True
+        sensor.get_data()  # open the port
+        start = time.perf_counter()
+        sensor.get_data()
+        self.assertLess(time.perf_counter() - start, single)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from SkyImageAgg.Encoders import OpenCVEncoder
+from SkyImageAgg.JpegTransform import CROPPERS
+from SkyImageAgg.JpegTransform import align_crop
+from SkyImageAgg.JpegTransform import get_cropper
+from SkyImageAgg.JpegTransform import read_jpeg_info
+from synthetic_sky import make_sky_frame
+
+
+def make_jpeg(image, subsampling=None, progressive=False):
+    return OpenCVEncoder().encode(image, 90, subsampling, progressive).tobytes()
+
+
+class TestJpegInfo(TestCase):
+    def setUp(self):
+        self.frame = make_sky_frame((120, 200))
+
+    def test_size_and_mcu(self):
+        info = read_jpeg_info(make_jpeg(self.frame, '420'))
+        self.assertEqual((info.width, info.height, info.components), (200, 120, 3))
+        self.assertEqual((info.mcu_width, info.mcu_height), (16, 16))
+        self.assertFalse(info.progressive)
+
+        info = read_jpeg_info(make_jpeg(self.frame, '422'))
+        self.assertEqual((info.mcu_width, info.mcu_height), (16, 8))
+        info = read_jpeg_info(make_jpeg(self.frame, '444'))
+        self.assertEqual((info.mcu_width, info.mcu_height), (8, 8))
+
+    def test_grayscale_and_progressive(self):
+        gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        info = read_jpeg_info(make_jpeg(gray))
+        self.assertEqual((info.components, info.mcu_width, info.mcu_height), (1, 8, 8))
+        self.assertTrue(read_jpeg_info(make_jpeg(self.frame, progressive=True)).progressive)
+
+    def test_not_a_jpeg(self):
+        self.assertIsNone(read_jpeg_info(b''))
+        self.assertIsNone(read_jpeg_info(cv2.imencode('.png', self.frame)[1].tobytes()))
+        self.assertIsNone(read_jpeg_info(make_jpeg(self.frame)[:20]))
+
+    def test_align_crop(self):
+        info = read_jpeg_info(make_jpeg(self.frame, '420'))
+        self.assertEqual(align_crop((9, 109, 37, 137), info), (0, 100, 32, 132))
+        self.assertEqual(align_crop((16, 116, 32, 132), info), (16, 116, 32, 132))
+
+    def test_unknown_cropper(self):
+        with self.assertRaises(ValueError):
+            get_cropper('gimp')
+
+
+class TestLosslessCrop(TestCase):
+    def test_crop_keeps_the_coefficients(self):
+        frame = make_sky_frame((120, 200))
+        jpeg = make_jpeg(frame, '420')
+        decoded = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        for name, cropper in CROPPERS.items():
+            with self.subTest(name):
+                if not cropper.available():
+                    self.skipTest(f'{name} is not installed')
+                cropped = cropper().crop(jpeg, (16, 96, 32, 160))
+                info = read_jpeg_info(cropped)
+                self.assertEqual((info.width, info.height), (128, 80))
+                # the blocks are not recompressed, so the pixels are the same as in the decoded original
+                result = cv2.imdecode(np.frombuffer(cropped, np.uint8), cv2.IMREAD_COLOR)
+                np.testing.assert_array_equal(result, decoded[16:96, 32:160])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from unittest import TestCase
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from influxdb import InfluxDBClient
+
+from SkyImageAgg.Logger import BufferedLineWriter
+from SkyImageAgg.Logger import InfluxdbLogHandler
+from SkyImageAgg.Logger import MetricsLogHandler
+from SkyImageAgg.Logger import SensorLogHandler
+from SkyImageAgg.Logger import make_line
+
+
+class StubInflux(ThreadingHTTPServer):
+    """
+    A local InfluxDB 1.x stub recording the written lines.
+    """
+    daemon_threads = True
+
+    def __init__(self, delay=0.0):
+        super().__init__(('127.0.0.1', 0), _StubInfluxHandler)
+        self.delay = delay
+        self.lines = []
+        self.writes = 0
+        self.databases = set()
+        self.failing = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _StubInfluxHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body=b''):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _query(self, params):
+        query = params.get('q', [''])[0]
+        if query.upper().startswith('CREATE DATABASE'):
+            self.server.databases.add(query.split()[-1].strip('"'))
+            result = {'statement_id': 0}
+        else:
+            result = {
+                'statement_id': 0,
+                'series': [{
+                    'name': 'databases',
+                    'columns': ['name'],
+                    'values': [[name] for name in sorted(self.server.databases)]
+                }]
+            }
+        self._reply(200, json.dumps({'results': [result]}).encode())
+
+    def do_GET(self):
+        self._query(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if url.path == '/query':
+            params = parse_qs(url.query)
+            params.update(parse_qs(body.decode()))
+            return self._query(params)
+
+        if self.server.failing:
+            return self._reply(500, b'{"error": "down"}')
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.lines.extend(body.decode('utf-8').splitlines())
+            self.server.writes += 1
+        self._reply(204)
+
+
+class TestLineProtocol(TestCase):
+    def test_escaping(self):
+        line = make_line(
+            'app log',
+            ',host=sky\\ imager',
+            {'message': 'say "hi"\\ok\nbye', 'field,key': 'a=b', 'irradiance': 12, 'ok': True},
+            time_ns=1590969600000000000
+        )
+        self.assertEqual(
+            line,
+            r'app\ log,host=sky\ imager message="say \"hi\"\\ok\nbye",field\,key="a=b",irradiance=12.0,ok=true '
+            '1590969600000000000'
+        )
+
+    def test_tags_are_escaped(self):
+        handler = InfluxdbLogHandler.__new__(InfluxdbLogHandler)
+        handler.add_tags(longitude=14.1, host='sky imager,1')
+        self.assertEqual(handler.tags, r',host=sky\ imager\,1,longitude=14.1')
+
+
+class TestBufferedLineWriter(TestCase):
+    def setUp(self):
+        self.server = StubInflux()
+        self.client = InfluxDBClient(host='127.0.0.1', port=self.server.port)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def test_points_are_written_in_batches(self):
+        writer = BufferedLineWriter(self.client, 'sky', batch_size=100, flush_interval=60)
+        for i in range(250):
+            writer.put(f'm v={i}')
+        self.assertTrue(writer.flush(timeout=5))
+        writer.close()
+        self.assertEqual(self.server.lines, [f'm v={i}' for i in range(250)])
+        self.assertEqual(self.server.writes, 3)
+        self.assertEqual(writer.written, 250)
+        self.assertIn('sky', self.server.databases)
+
+    def test_put_does_not_wait_for_the_server(self):
+        self.server.delay = 0.2
+        writer = BufferedLineWriter(self.client, 'sky', batch_size=10, flush_interval=60)
+        start = time.monotonic()
+        for i in range(20):
+            writer.put(f'm v={i}')
+        self.assertLess(time.monotonic() - start, 0.2)
+        writer.close()
+
+    def test_ring_buffer_drops_the_oldest_points(self):
+        self.server.failing = True
+        writer = BufferedLineWriter(self.client, 'sky', batch_size=1000, flush_interval=60, capacity=10)
+        for i in range(15):
+            writer.put(f'm v={i}')
+        self.assertEqual(len(writer), 10)
+        self.assertEqual(writer.dropped, 5)
+        writer.close(timeout=0)
+
+    def test_outage_goes_to_the_overflow_file(self):
+        self.server.failing = True
+        writer = BufferedLineWriter(
+            self.client, 'sky', batch_size=10, flush_interval=60, overflow_dir=self.dir, retry_interval=0
+        )
+        for i in range(25):
+            writer.put(f'm v={i}')
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(writer.spilled, 25)
+        self.assertEqual(self.server.lines, [])
+        self.assertTrue(os.path.exists(writer.overflow_file))
+
+        # the overflow file is replayed after the next successful write
+        self.server.failing = False
+        writer.put('m v=25')
+        self.assertTrue(writer.flush(timeout=5))
+        writer.close()
+        self.assertEqual(sorted(self.server.lines), sorted(f'm v={i}' for i in range(26)))
+        self.assertFalse(os.path.exists(writer.overflow_file))
+
+    def test_outage_without_overflow_keeps_the_points(self):
+        self.server.failing = True
+        writer = BufferedLineWriter(self.client, 'sky', batch_size=10, flush_interval=0.05, retry_interval=0)
+        for i in range(5):
+            writer.put(f'm v={i}')
+        self.assertFalse(writer.flush(timeout=0.3))
+        self.assertEqual(writer.dropped, 0)
+        self.server.failing = False
+        self.assertTrue(writer.flush(timeout=5))
+        writer.close()
+        self.assertEqual(self.server.lines, [f'm v={i}' for i in range(5)])
+
+    def test_overflow_file_is_bounded(self):
+        self.server.failing = True
+        writer = BufferedLineWriter(
+            self.client, 'sky', batch_size=10, flush_interval=60, overflow_dir=self.dir, max_overflow_bytes=100
+        )
+        for i in range(30):
+            writer.put(f'm v={i}')
+        writer.close()
+        self.assertLessEqual(os.path.getsize(writer.overflow_file), 100)
+        self.assertEqual(writer.spilled + writer.dropped, 30)
+
+
+class TestHandlers(TestCase):
+    def setUp(self):
+        self.server = StubInflux()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_log_records_become_points(self):
+        logger = logging.getLogger('test-influx')
+        logger.propagate = False
+        handler = InfluxdbLogHandler('127.0.0.1', 'user', 'pwd', 'sky', 'app_log', port=self.server.port)
+        handler.add_tags(host='pi')
+        logger.addHandler(handler)
+        try:
+            logger.warning('disk "full"')
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+        line, = self.server.lines
+        self.assertTrue(line.startswith('app_log,host=pi name="test-influx",levelname="WARNING",asctime="'))
+        self.assertIn(r'message="disk \"full\""', line)
+        self.assertTrue(line.rsplit(' ', 1)[1].isdigit())
+
+    def test_sensor_records_become_points(self):
+        handler = SensorLogHandler('127.0.0.1', 'user', 'pwd', 'sky', 'sensor_log', port=self.server.port)
+        record = logging.LogRecord('IrrSensor', logging.INFO, __file__, 0, {
+            'timestamp': '2020-06-01 12:00:00', 'irradiance': 812, 'ext_temp': 21.5, 'cell_temp': 35.25
+        }, None, None)
+        handler.handle(record)
+        handler.close()
+
+        line, = self.server.lines
+        self.assertIn('timestamp="2020-06-01 12:00:00",irradiance=812.0,ext_temperature=21.5,cell_temperature=35.25',
+                      line)
+
+    def test_metrics_records_become_points(self):
+        handler = MetricsLogHandler('127.0.0.1', 'user', 'pwd', 'sky', 'metrics', port=self.server.port)
+        handler.add_tags(host='pi')
+        record = logging.LogRecord('Metrics', logging.INFO, __file__, 0, {
+            'upload_count': 3, 'upload_sum': 1.5, 'frames_uploaded': 3
+        }, None, None)
+        handler.handle(record)
+        handler.close()
+
+        line, = self.server.lines
+        self.assertTrue(line.startswith('metrics,host=pi upload_count=3.0,upload_sum=1.5,frames_uploaded=3.0 '))
+
+
+if __name__ == '__main__':
+    unittest.main()
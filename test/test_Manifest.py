@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+from unittest import mock
+
+from SkyImageAgg.Manifest import Manifest
+
+
+class TestManifest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data=b'jpeg'):
+        with open(os.path.join(self.dir, f'{name}.jpg'), 'wb') as f:
+            f.write(data)
+
+    def test_first_run_adopts_the_existing_files(self):
+        for name in ('b', 'a'):
+            self.write(name)
+        manifest = Manifest(self.dir)
+        self.assertEqual(manifest.names(), ['a', 'b'])
+        self.assertEqual(manifest.total_size, 8)
+        manifest.close()
+
+    def test_index_survives_a_restart_without_scanning(self):
+        manifest = Manifest(self.dir)
+        for name in ('1', '2', '3'):
+            self.write(name)
+            manifest.add(name)
+        manifest.remove('2')
+        manifest.remove('missing')
+        manifest.close()
+
+        # a file written without going through the manifest isn't listed
+        self.write('4')
+        with mock.patch('glob.iglob') as iglob, mock.patch('os.listdir') as listdir:
+            manifest = Manifest(self.dir)
+            self.assertEqual(manifest.names(), ['1', '3'])
+            iglob.assert_not_called()
+            listdir.assert_not_called()
+        self.assertIn('3', manifest)
+        self.assertNotIn('2', manifest)
+        self.assertEqual(len(manifest), 2)
+        manifest.close()
+
+    def test_torn_last_line_is_ignored(self):
+        manifest = Manifest(self.dir)
+        self.write('1')
+        manifest.add('1')
+        manifest.close()
+        with open(manifest.log_path, 'a') as f:
+            f.write('add 12')
+        manifest = Manifest(self.dir)
+        self.assertEqual(manifest.names(), ['1'])
+        manifest.close()
+
+    def test_log_is_compacted(self):
+        manifest = Manifest(self.dir, compact_threshold=10)
+        for i in range(50):
+            manifest.add(str(i), size=1)
+            manifest.remove(str(i))
+        manifest.add('last', size=1)
+        with open(manifest.log_path) as f:
+            self.assertLess(len(f.readlines()), 25)
+        manifest.close()
+        self.assertEqual(Manifest(self.dir).names(), ['last'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from unittest import TestCase
+
+from SkyImageAgg.Metrics import Counter
+from SkyImageAgg.Metrics import MetricsRegistry
+from SkyImageAgg.Metrics import MetricsServer
+
+
+class TestCounter(TestCase):
+    def test_concurrent_increments(self):
+        counter = Counter()
+
+        def work():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.value, 4000)
+
+
+class TestMetricsRegistry(TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry(enabled=True, buckets=(0.1, 1.0))
+
+    def test_span_observes_the_duration(self):
+        with self.metrics.span('capture'):
+            pass
+        snapshot = self.metrics.histogram('capture').snapshot()
+        self.assertEqual(snapshot['count'], 1)
+        self.assertEqual(snapshot['buckets'][0], (0.1, 1))
+
+    def test_failed_span_is_counted(self):
+        with self.assertRaises(ConnectionError):
+            with self.metrics.span('send'):
+                raise ConnectionError('The server is unreachable!')
+        self.assertEqual(self.metrics.histogram('send').snapshot()['count'], 1)
+        self.assertEqual(self.metrics.counter('send_errors').value, 1)
+
+    def test_timed(self):
+        @self.metrics.timed('upload')
+        def upload(jpeg):
+            return len(jpeg)
+
+        self.assertEqual(upload(b'jpeg'), 4)
+        self.assertEqual(upload.__name__, 'upload')
+        self.assertEqual(self.metrics.histogram('upload').snapshot()['count'], 1)
+
+    def test_disabled_records_nothing(self):
+        metrics = MetricsRegistry()
+
+        @metrics.timed('upload')
+        def upload():
+            with metrics.span('send'):
+                metrics.inc('frames_uploaded')
+
+        upload()
+        self.assertIs(metrics.span('send'), metrics.span('capture'))  # the shared no-op span
+        self.assertEqual(metrics.collect(), ({}, {}))
+
+    def test_render(self):
+        with self.metrics.span('encode'):
+            pass
+        self.metrics.inc('frames_uploaded', 2)
+        text = self.metrics.render()
+        self.assertIn('# TYPE skyimager_span_seconds histogram\n', text)
+        self.assertIn('skyimager_span_seconds_bucket{span="encode",le="0.1"} 1\n', text)
+        self.assertIn('skyimager_span_seconds_bucket{span="encode",le="+Inf"} 1\n', text)
+        self.assertIn('skyimager_span_seconds_count{span="encode"} 1\n', text)
+        self.assertIn('skyimager_frames_uploaded_total 2\n', text)
+
+    def test_fields(self):
+        for value in (0.05, 0.05, 0.5):
+            self.metrics.histogram('upload').observe(value)
+        self.metrics.histogram('scan').observe(5.0)
+        self.metrics.inc('frames_queued')
+        fields = self.metrics.fields()
+        self.assertEqual((fields['upload_count'], fields['upload_p95']), (3, 1.0))
+        self.assertAlmostEqual(fields['upload_sum'], 0.6)
+        self.assertNotIn('scan_p95', fields)  # beyond the last bucket
+        self.assertEqual(fields['frames_queued'], 1)
+
+
+class TestMetricsServer(TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry(enabled=True)
+        self.server = MetricsServer(self.metrics, port=0)
+        self.server.start()
+        self.url = f'http://127.0.0.1:{self.server.port}'
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_metrics_endpoint(self):
+        self.metrics.inc('frames_stored')
+        with urllib.request.urlopen(f'{self.url}/metrics', timeout=5) as response:
+            self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+            self.assertIn('skyimager_frames_stored_total 1', response.read().decode())
+
+    def test_unknown_path(self):
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(f'{self.url}/', timeout=5)
+        self.assertEqual(cm.exception.code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
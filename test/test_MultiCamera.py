@@ -0,0 +1,222 @@
+import configparser
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from SkyImageAgg.Configuration import read_camera_sections
+from SkyImageAgg.DataStore import QUEUED
+from SkyImageAgg.DataStore import UPLOADED
+from SkyImageAgg.MultiCamera import CameraUnit
+from SkyImageAgg.MultiCamera import MaskCache
+from SkyImageAgg.MultiCamera import SyncCapture
+from SkyImageAgg.MultiCamera import join_name
+from SkyImageAgg.MultiCamera import split_name
+from SkyImageAgg.Preprocessor import FramePreprocessor
+
+
+class FakeCamera:
+    """
+    A camera recording when its captures start.
+    """
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.starts = []
+
+    def cap_pic(self):
+        self.starts.append(time.monotonic())
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError('The camera is unreachable!')
+        return np.zeros((8, 8, 3), dtype=np.uint8)
+
+    def cap_jpeg(self):
+        return cv2.imencode('.jpg', self.cap_pic())[1].tobytes()
+
+
+def make_unit(name, camera=None, preprocessor=None, client_id=1):
+    return CameraUnit(name, camera or FakeCamera(), preprocessor or FramePreprocessor(), client_id, 'key')
+
+
+class TestNames(TestCase):
+    def test_join_and_split(self):
+        self.assertEqual(join_name('2019-06-01_12-00-00', 'east'), '2019-06-01_12-00-00@east')
+        self.assertEqual(split_name('2019-06-01_12-00-00@east'), ('2019-06-01_12-00-00', 'east'))
+        self.assertEqual(join_name('2019-06-01_12-00-00', None), '2019-06-01_12-00-00')
+        self.assertEqual(split_name('2019-06-01_12-00-00'), ('2019-06-01_12-00-00', None))
+
+    def test_invalid_camera_names(self):
+        for name in ('', 'a@b', 'a/b', 'a b'):
+            with self.subTest(name):
+                with self.assertRaises(ValueError):
+                    make_unit(name)
+
+
+class TestCameraSections(TestCase):
+    def setUp(self):
+        self.conf = configparser.ConfigParser()
+        self.conf.read_dict({
+            'Auth': {'client_id': '200', 'sha256_key': 'secret'},
+            'Image': {'mask_image': 'mask.bmp'},
+            'Camera': {'cam_address': 'http://192.168.0.11', 'cam_username': 'user', 'cam_password': 'pass',
+                       'stream': 'off', 'stream_url': ''},
+            'Camera.east': {'cam_address': 'http://192.168.0.12', 'client_id': '201'},
+            'Camera.west': {'cam_address': 'rpi', 'mask_image': 'west.bmp', 'stream': 'mjpeg'}
+        })
+
+    def test_missing_keys_are_inherited(self):
+        east, west = read_camera_sections(self.conf, ['Camera.east', 'Camera.west'])
+        self.assertEqual((east.name, east.address, east.client_id, east.key), ('east', 'http://192.168.0.12', '201',
+                                                                               'secret'))
+        self.assertEqual((east.username, east.mask_path, east.stream), ('user', 'mask.bmp', 'off'))
+        self.assertEqual((west.name, west.address, west.client_id), ('west', 'rpi', '200'))
+        self.assertEqual((west.mask_path, west.stream), ('west.bmp', 'mjpeg'))
+
+    def test_missing_section(self):
+        with self.assertRaises(ValueError):
+            read_camera_sections(self.conf, ['Camera.north'])
+
+
+class TestMaskCache(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.masks = []
+        for i in range(2):
+            path = os.path.join(self.dir.name, f'mask{i}.bmp')
+            cv2.imwrite(path, np.full((40, 40), 255, dtype=np.uint8))
+            self.masks.append(path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_cameras_with_the_same_mask_share_the_preprocessor(self):
+        cache = MaskCache(output_resolution=(20, 20))
+        east, west, north = cache.get(self.masks[0]), cache.get(self.masks[0]), cache.get(self.masks[1])
+        self.assertIs(east, west)
+        self.assertIsNot(east, north)
+        self.assertEqual(len(cache), 2)
+        # the mask is fitted once for the frame resolution of both cameras
+        east.process(np.zeros((40, 40, 3), dtype=np.uint8))
+        self.assertEqual(west.process(np.zeros((40, 40, 3), dtype=np.uint8)).shape, (20, 20, 3))
+        self.assertEqual(len(east._cache), 1)
+
+    def test_without_mask(self):
+        self.assertIsNone(MaskCache().get(None).mask)
+
+
+class TestCameraUnit(TestCase):
+    def test_uploads_with_its_own_identity(self):
+        unit = make_unit('east', client_id=201)
+        body, signature = unit.body_builder.build(b'\xff\xd8\xff\xd9', '2019-06-01T12:00:00')
+        self.assertIn(b'201', bytes(body))
+        self.assertEqual(unit.body_builder.client_id, 201)
+
+    def test_capture_keeps_the_jpeg_for_the_passthrough(self):
+        self.assertEqual(make_unit('east').capture().shape, (8, 8, 3))
+        jpeg = make_unit('east', preprocessor=FramePreprocessor(passthrough=True)).capture()
+        self.assertTrue(jpeg.startswith(b'\xff\xd8'))
+
+    def test_stats(self):
+        unit = make_unit('east')
+        unit.count_capture(0.1)
+        unit.count_capture(0.2, failed=True)
+        unit.count_output(UPLOADED, 1.0)
+        unit.count_output(QUEUED, 2.0)
+        stats = unit.stats()
+        self.assertEqual((stats['captured'], stats['failed'], stats['skipped']), (1, 1, 0))
+        self.assertEqual((stats['uploaded'], stats['queued'], stats['stored'], stats['dropped']), (1, 1, 0, 0))
+        self.assertEqual(stats['capture_latency']['count'], 2)
+        self.assertAlmostEqual(stats['output_latency']['sum'], 3.0)
+
+
+class TestSyncCapture(TestCase):
+    def setUp(self):
+        self.fed = []
+        self.lock = threading.Lock()
+
+    def feed(self, unit, timestamp):
+        unit.capture()
+        with self.lock:
+            self.fed.append(join_name(timestamp, unit.name))
+
+    def test_cameras_start_together(self):
+        # every camera takes a while, so sequential captures would start 50 ms apart
+        units = [make_unit(name, FakeCamera(delay=0.05)) for name in ('east', 'west', 'north')]
+        capture = SyncCapture(units, self.feed)
+        capture.start()
+        try:
+            for i in range(3):
+                self.assertEqual(capture.trigger(str(i)), ['east', 'west', 'north'])
+                self.assertTrue(capture.wait(timeout=5))
+        finally:
+            capture.stop(timeout=5)
+
+        names = ('east', 'west', 'north')
+        self.assertEqual(sorted(self.fed), sorted(f'{i}@{name}' for i in range(3) for name in names))
+        for i in range(3):
+            starts = [unit.camera.starts[i] for unit in units]
+            self.assertLess(max(starts) - min(starts), 0.04)
+        self.assertEqual(capture.skew.snapshot()['count'], 3)
+        self.assertEqual({name: stats['captured'] for name, stats in capture.stats().items()},
+                         {'east': 3, 'west': 3, 'north': 3})
+
+    def test_busy_camera_skips_the_tick(self):
+        slow, fast = make_unit('slow', FakeCamera(delay=0.3)), make_unit('fast')
+        capture = SyncCapture([slow, fast], self.feed)
+        capture.start()
+        try:
+            capture.trigger('0')
+            time.sleep(0.1)
+            self.assertEqual(capture.trigger('1'), ['fast'])
+            self.assertTrue(capture.wait(timeout=5))
+        finally:
+            capture.stop(timeout=5)
+        self.assertEqual(sorted(self.fed), ['0@fast', '0@slow', '1@fast'])
+        self.assertEqual((slow.captured, slow.skipped), (1, 1))
+        self.assertEqual((fast.captured, fast.skipped), (2, 0))
+
+    def test_failed_capture_is_counted(self):
+        broken, working = make_unit('broken', FakeCamera(fail=True)), make_unit('working')
+        capture = SyncCapture([broken, working], self.feed)
+        capture.start()
+        try:
+            capture.trigger('0')
+            self.assertTrue(capture.wait(timeout=5))
+        finally:
+            capture.stop(timeout=5)
+        self.assertEqual(self.fed, ['0@working'])
+        self.assertEqual((broken.captured, broken.failed), (0, 1))
+        self.assertEqual((working.captured, working.failed), (1, 0))
+
+    def test_failures_in_a_row_are_logged_sparsely(self):
+        camera = FakeCamera(fail=True)
+        broken = make_unit('broken', camera)
+        capture = SyncCapture([broken], self.feed, log_every=3)
+        capture.start()
+        try:
+            with self.assertLogs(capture.logger, 'INFO') as logs:
+                for i in range(7):
+                    if i == 6:
+                        camera.fail = False
+                    capture.trigger(str(i))
+                    self.assertTrue(capture.wait(timeout=5))
+        finally:
+            capture.stop(timeout=5)
+        self.assertEqual((broken.captured, broken.failed), (1, 6))
+        # the first failure with its traceback, the 3rd and the 6th in a row and the recovery
+        self.assertEqual([record.levelname for record in logs.records], ['ERROR', 'ERROR', 'ERROR', 'INFO'])
+        self.assertIn('broken camera failed!', logs.output[0])
+        self.assertIn('ConnectionError', logs.output[0])
+        self.assertIn('failed 3 times in a row', logs.output[1])
+        self.assertIn('captures again after 6 failures', logs.output[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
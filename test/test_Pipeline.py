@@ -0,0 +1,230 @@
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from SkyImageAgg.Metrics import Histogram
+from SkyImageAgg.Pipeline import Pipeline
+from SkyImageAgg.Pipeline import Stage
+from SkyImageAgg.Preprocessor import encode_jpeg
+
+
+class TestHistogram(TestCase):
+    def test_buckets_are_cumulative(self):
+        hist = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            hist.observe(value)
+        snapshot = hist.snapshot()
+        self.assertEqual(snapshot['count'], 4)
+        self.assertAlmostEqual(snapshot['sum'], 2.65)
+        self.assertEqual(snapshot['buckets'], [(0.1, 2), (1.0, 3), (float('inf'), 4)])
+
+    def test_quantile(self):
+        hist = Histogram(buckets=(0.1, 1.0))
+        self.assertIsNone(hist.quantile(0.5))
+        for value in (0.05,) * 9 + (0.5,):
+            hist.observe(value)
+        self.assertEqual(hist.quantile(0.5), 0.1)
+        self.assertEqual(hist.quantile(0.99), 1.0)
+
+
+class TestStage(TestCase):
+    def test_drop_oldest_keeps_the_latest_frames(self):
+        dropped = []
+        stage = Stage('test', func=None, maxsize=2, drop_policy='drop_oldest',
+                      on_drop=lambda name, frame: dropped.append(frame))
+        for i in range(5):
+            stage.put(i)
+        self.assertEqual(dropped, [0, 1, 2])
+        self.assertEqual(stage.dropped, 3)
+        self.assertEqual([stage.queue.get_nowait() for _ in range(2)], [3, 4])
+
+    def test_drop_newest_keeps_the_first_frames(self):
+        stage = Stage('test', func=None, maxsize=2, drop_policy='drop_newest')
+        for i in range(5):
+            stage.put(i)
+        self.assertEqual(stage.dropped, 3)
+        self.assertEqual([stage.queue.get_nowait() for _ in range(2)], [0, 1])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            Stage('test', func=None, drop_policy='random')
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        self.outputs = []
+        self.lock = threading.Lock()
+
+    def output(self, frame):
+        with self.lock:
+            self.outputs.append(frame)
+
+    def make_pipeline(self, **kwargs):
+        kwargs.setdefault('capture', lambda: np.full((32, 32, 3), 128, dtype=np.uint8))
+        kwargs.setdefault('preprocess', lambda image: image[8:24, 8:24])
+        kwargs.setdefault('encode', lambda image: encode_jpeg(image, 90))
+        kwargs.setdefault('output', self.output)
+        return Pipeline(**kwargs)
+
+    def test_frames_are_encoded_and_output(self):
+        pipeline = self.make_pipeline(drop_policy='block')
+        pipeline.start()
+        for i in range(10):
+            pipeline.capture(str(i))
+        pipeline.stop()
+
+        self.assertEqual(sorted(frame.timestamp for frame in self.outputs), [str(i) for i in range(10)])
+        for frame in self.outputs:
+            self.assertIsNone(frame.image)
+            self.assertTrue(frame.jpeg.startswith(b'\xff\xd8'))
+
+        stats = pipeline.stats()
+        self.assertEqual(list(stats), ['capture', 'preprocess', 'encode', 'output', 'total'])
+        self.assertEqual(stats['capture']['latency']['count'], 10)
+        self.assertEqual(stats['total']['latency']['count'], 10)
+
+    def test_preprocessed_image_is_read_only(self):
+        images = []
+
+        def encode(image):
+            images.append(image)
+            return encode_jpeg(image, 90)
+
+        pipeline = self.make_pipeline(encode=encode)
+        pipeline.start()
+        pipeline.capture('0')
+        pipeline.stop()
+        self.assertFalse(images[0].flags.writeable)
+        with self.assertRaises(ValueError):
+            images[0][0, 0] = 0
+
+    def test_jpeg_frames_skip_the_encoder(self):
+        raw = encode_jpeg(np.full((32, 32, 3), 128, dtype=np.uint8), 90).tobytes()
+        encoded = []
+
+        def encode(image):
+            encoded.append(image)
+            return encode_jpeg(image, 90)
+
+        def preprocess_jpeg(jpeg):
+            if len(encoded) or self.outputs:  # the first frame stays encoded, the others are decoded
+                return None, np.zeros((16, 16, 3), dtype=np.uint8)
+            return jpeg, None
+
+        pipeline = self.make_pipeline(capture=lambda: raw, encode=encode, preprocess_jpeg=preprocess_jpeg,
+                                      drop_policy='block', encoders=1, outputs=1)
+        pipeline.start()
+        pipeline.capture('0')
+        pipeline.stop()
+        self.assertEqual(self.outputs[0].jpeg, raw)
+        self.assertEqual(encoded, [])
+
+        pipeline.start()
+        pipeline.capture('1')
+        pipeline.stop()
+        self.assertEqual(len(encoded), 1)
+        self.assertNotEqual(self.outputs[1].jpeg, raw)
+
+    def test_sources_share_the_workers(self):
+        pipeline = self.make_pipeline(capture=None, preprocess=None, drop_policy='block', preprocessors=2)
+        pipeline.add_source('east', lambda: np.full((32, 32, 3), 50, dtype=np.uint8), lambda image: image[:8, :8])
+        raw = encode_jpeg(np.full((32, 32, 3), 200, dtype=np.uint8), 90).tobytes()
+        pipeline.add_source('west', lambda: raw, None, preprocess_jpeg=lambda jpeg: (jpeg, None))
+        pipeline.start()
+        for i in range(3):
+            pipeline.capture(f'{i}@east', source='east')
+            pipeline.capture(f'{i}@west', source='west')
+        pipeline.stop()
+
+        self.assertEqual(len(self.outputs), 6)
+        for frame in self.outputs:
+            self.assertEqual(frame.timestamp.split('@')[1], frame.source)
+            if frame.source == 'west':
+                self.assertEqual(frame.jpeg, raw)
+            else:
+                self.assertTrue(frame.jpeg.startswith(b'\xff\xd8'))
+        self.assertEqual(pipeline.stats()['capture']['latency']['count'], 6)
+        with self.assertRaises(KeyError):
+            pipeline.capture('0')
+
+    def test_frames_are_analyzed(self):
+        raw = encode_jpeg(np.full((32, 32, 3), 200, dtype=np.uint8), 90).tobytes()
+        pipeline = self.make_pipeline(drop_policy='block', analyze=lambda image, frame: {'mean': image.mean()}
+                                      if isinstance(image, np.ndarray) else {'size': len(image)})
+        pipeline.add_source('west', lambda: raw, None, preprocess_jpeg=lambda jpeg: (jpeg, None))
+        pipeline.start()
+        pipeline.capture('0')
+        pipeline.capture('0@west', source='west')
+        pipeline.stop()
+
+        analyses = {frame.source: frame.analysis for frame in self.outputs}
+        self.assertEqual(analyses, {None: {'mean': 128.0}, 'west': {'size': len(raw)}})
+
+    def test_slow_output_does_not_block_the_capture(self):
+        release = threading.Event()
+        dropped = []
+
+        def output(frame):
+            release.wait()
+            self.output(frame)
+
+        pipeline = self.make_pipeline(output=output, outputs=1, queue_size=1,
+                                      on_drop=lambda stage, frame: dropped.append(frame))
+        pipeline.start()
+        start = time.monotonic()
+        for i in range(20):
+            pipeline.capture(str(i))
+        self.assertLess(time.monotonic() - start, 1)
+        release.set()
+        pipeline.stop()
+
+        self.assertEqual(len(self.outputs) + len(dropped), 20)
+        self.assertTrue(dropped)
+        # the newest frame always makes it through
+        self.assertIn('19', [frame.timestamp for frame in self.outputs])
+
+    def test_failing_stage_drops_the_frame(self):
+        dropped = []
+
+        def output(frame):
+            raise ConnectionError
+
+        pipeline = self.make_pipeline(output=output, on_drop=lambda stage, frame: dropped.append((stage, frame)))
+        pipeline.start()
+        with self.assertLogs(pipeline.stages[-1].logger, 'ERROR') as logs:
+            pipeline.capture('0')
+            pipeline.stop()
+        self.assertEqual(len(dropped), 1)
+        stage, frame = dropped[0]
+        self.assertEqual(stage, 'output')
+        self.assertIsNotNone(frame.jpeg)
+        self.assertIn('The output stage failed on the frame 0', logs.output[0])
+        self.assertIn('ConnectionError', logs.output[0])
+
+    def test_failing_drop_handler_keeps_the_workers(self):
+        outputs = []
+
+        def output(frame):
+            outputs.append(frame.timestamp)
+            raise ConnectionError
+
+        def on_drop(stage, frame):
+            raise OSError('No space left on device')
+
+        pipeline = self.make_pipeline(output=output, outputs=1, on_drop=on_drop)
+        pipeline.start()
+        with self.assertLogs(pipeline.stages[-1].logger, 'ERROR') as logs:
+            for i in range(3):
+                pipeline.capture(str(i))
+                time.sleep(0.05)
+            pipeline.stop()
+        self.assertEqual(outputs, ['0', '1', '2'])
+        self.assertEqual(pipeline.stages[-1].dropped, 3)
+        self.assertEqual(sum('could not hand over the dropped frame' in line for line in logs.output), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,267 @@
+from os import path
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from SkyImageAgg.JpegTransform import LosslessCropper
+from SkyImageAgg.Preprocessor import ChangeDetector
+from SkyImageAgg.Preprocessor import ExposureFusion
+from SkyImageAgg.Preprocessor import FEATURE_COLUMNS
+from SkyImageAgg.Preprocessor import FeatureExtractor
+from SkyImageAgg.Preprocessor import FramePreprocessor
+from SkyImageAgg.Preprocessor import decode_jpeg
+from SkyImageAgg.Preprocessor import encode_jpeg
+from SkyImageAgg.Preprocessor import fuse_exposures
+from SkyImageAgg.Preprocessor import SkyImage
+from SkyImageAgg.Preprocessor import get_binary_image
+
+_mask_path = path.join(path.dirname(path.dirname(__file__)), 'masks', 'mask.bmp')
+
+
+def legacy_preprocess(image, mask, crop_size):
+    image = image[crop_size[0]:crop_size[1], crop_size[2]:crop_size[3]]
+    return np.multiply(mask, image)
+
+
+class TestFramePreprocessor(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.frame = rng.randint(0, 256, size=(1944, 2592, 3), dtype=np.uint8)
+        self.mask = get_binary_image(_mask_path)
+        self.resolution = self.mask.shape[:2]
+
+    def test_binary_mask_is_uint8(self):
+        self.assertEqual(self.mask.dtype, np.uint8)
+        self.assertEqual(self.mask.ndim, 2)
+        self.assertTrue(set(np.unique(self.mask)) <= {0, 1})
+
+    def test_matches_legacy_path(self):
+        proc = FramePreprocessor(mask=_mask_path, output_resolution=self.resolution)
+        crop_size, _ = proc.fit(self.frame.shape)
+        expected = legacy_preprocess(self.frame.copy(), self.mask[..., np.newaxis], crop_size)
+
+        result = proc.process(self.frame)
+
+        self.assertEqual(result.dtype, np.uint8)
+        np.testing.assert_array_equal(result, expected)
+        # the mask is applied in place on the cropped view of the frame
+        self.assertTrue(np.shares_memory(result, self.frame))
+
+    def test_mask_is_cached_per_frame_shape(self):
+        proc = FramePreprocessor(mask=self.mask, output_resolution=(1000, 1000))
+        first = proc.fit(self.frame.shape)
+        self.assertIs(proc.fit(self.frame.shape), first)
+        # a mask of the output size is kept as it is
+        self.assertEqual(first[1].shape, self.mask.shape)
+
+    def test_full_frame_mask_is_cropped(self):
+        full_mask = np.zeros(self.frame.shape[:2], dtype=np.uint8)
+        full_mask[100:200, 100:200] = 1
+        proc = FramePreprocessor(mask=full_mask, output_resolution=self.resolution)
+        crop_size, mask = proc.fit(self.frame.shape)
+        self.assertEqual(mask.shape, tuple(self.resolution))
+        np.testing.assert_array_equal(mask, full_mask[crop_size[0]:crop_size[1], crop_size[2]:crop_size[3]])
+
+    def test_sky_image_preprocessing(self):
+        img = SkyImage.setup_by_image(self.frame.copy(), _mask_path, self.resolution, 70)
+        expected = legacy_preprocess(self.frame.copy(), self.mask[..., np.newaxis], img.crop_size)
+        img.crop()
+        img.apply_mask()
+        self.assertEqual(img.image.dtype, np.uint8)
+        np.testing.assert_array_equal(img.image, expected)
+
+    def test_sky_image_without_cropping_keeps_the_full_mask(self):
+        frame = self.frame[:self.resolution[0], :self.resolution[1]].copy()
+        img = SkyImage.setup_by_image(frame.copy(), _mask_path, None, 70)
+        self.assertIsNone(img.crop_size)
+        self.assertEqual(img.mask.shape, self.resolution)
+        img.apply_mask()
+        np.testing.assert_array_equal(img.image, frame * self.mask[..., np.newaxis])
+
+        img = SkyImage.setup_by_image(frame.copy(), _mask_path, (1000, 1000), 70)
+        self.assertEqual(img.mask.shape, (1000, 1000))
+
+
+class RecordingCropper(LosslessCropper):
+    name = 'recording'
+
+    def __init__(self):
+        self.crops = []
+
+    def crop(self, jpeg, crop_size):
+        self.crops.append(crop_size)
+        return b'cropped'
+
+
+class TestJpegPassthrough(TestCase):
+    def setUp(self):
+        self.frame = np.full((120, 200, 3), 100, dtype=np.uint8)
+        self.jpeg = encode_jpeg(self.frame, 90, '420').tobytes()
+
+    def test_no_op_preprocessing_keeps_the_jpeg(self):
+        proc = FramePreprocessor(passthrough=True)
+        jpeg, image = proc.process_jpeg(self.jpeg)
+        self.assertIs(jpeg, self.jpeg)
+        self.assertIsNone(image)
+
+        # a mask without zeros doesn't need the pixels either
+        proc = FramePreprocessor(mask=np.ones((120, 200), dtype=np.uint8), passthrough=True)
+        self.assertIs(proc.process_jpeg(self.jpeg)[0], self.jpeg)
+
+    def test_crop_is_aligned_to_the_mcu(self):
+        cropper = RecordingCropper()
+        proc = FramePreprocessor(output_resolution=(100, 100), passthrough=True, cropper=cropper)
+        jpeg, image = proc.process_jpeg(self.jpeg)
+        self.assertEqual(jpeg, b'cropped')
+        self.assertIsNone(image)
+        # the centered window (10, 110, 50, 150) is moved to the 16x16 MCU grid
+        self.assertEqual(cropper.crops, [(0, 100, 48, 148)])
+
+    def test_mask_needs_the_pixels(self):
+        mask = np.ones((100, 100), dtype=np.uint8)
+        mask[:10] = 0
+        cropper = RecordingCropper()
+        proc = FramePreprocessor(mask=mask, output_resolution=(100, 100), passthrough=True, cropper=cropper)
+        jpeg, image = proc.process_jpeg(self.jpeg)
+        self.assertIsNone(jpeg)
+        self.assertEqual(cropper.crops, [])
+        self.assertEqual(image.shape, (100, 100, 3))
+        self.assertFalse(image[:10].any())
+
+    def test_crop_without_cropper_decodes(self):
+        proc = FramePreprocessor(output_resolution=(100, 100), passthrough=True)
+        jpeg, image = proc.process_jpeg(self.jpeg)
+        self.assertIsNone(jpeg)
+        np.testing.assert_array_equal(image, decode_jpeg(self.jpeg)[10:110, 50:150])
+
+    def test_disabled_passthrough_decodes(self):
+        jpeg, image = FramePreprocessor().process_jpeg(self.jpeg)
+        self.assertIsNone(jpeg)
+        self.assertEqual(image.shape, self.frame.shape)
+
+    def test_sky_image_keeps_the_jpeg_until_modified(self):
+        img = SkyImage.setup_empty()
+        img.jpeg = self.jpeg
+        self.assertIs(img.encode_to_jpeg(), self.jpeg)
+        img.crop_size = (10, 110, 50, 150)
+        img.crop()
+        self.assertIsNone(img.jpeg)
+        self.assertEqual(img.image.shape, (100, 100, 3))
+
+
+def make_bracket(shape=(128, 160), exposures=(0, -2, 2)):
+    """
+    A sky with a bright sun, exposed with the given EV offsets.
+    """
+    height, width = shape
+    y, x = np.mgrid[0:height, 0:width]
+    radiance = 0.3 + 0.1 * x / width + 4.0 * np.exp(-((x - width / 2) ** 2 + (y - height / 3) ** 2) / 200)
+    return [
+        np.repeat(np.clip(radiance * 2 ** ev * 200, 0, 255).astype(np.uint8)[..., np.newaxis], 3, axis=2)
+        for ev in exposures
+    ]
+
+
+class TestExposureFusion(TestCase):
+    def test_fusion_recovers_the_saturated_sun(self):
+        frames = make_bracket()
+        fused = fuse_exposures(frames)
+        self.assertEqual((fused.shape, fused.dtype), (frames[0].shape, np.uint8))
+        self.assertLess((fused == 255).sum(), (frames[0] == 255).sum() / 2)
+        # the dark part of the sky is taken mostly from the reference and the brighter exposure
+        self.assertGreater(fused[-1, 0].mean(), frames[1][-1, 0].mean())
+
+    def test_single_frame(self):
+        frame = make_bracket(exposures=(0,))[0]
+        self.assertIs(fuse_exposures([frame]), frame)
+
+    def test_budget(self):
+        frames = make_bracket()
+        fusion = ExposureFusion(budget=None)
+        fusion.fuse(frames)
+        self.assertIsNone(fusion.max_frames(frames[0].shape))
+
+        fusion.budget = 1e-9
+        self.assertEqual(fusion.max_frames(frames[0].shape), 0)
+        self.assertIs(fusion.fuse(frames), frames[0])
+        self.assertEqual(fusion.skipped, 1)
+
+        fusion = ExposureFusion(budget=1.0)
+        fusion.fuse(frames)
+        fusion._cost = fusion.budget / (2.5 * frames[0].shape[0] * frames[0].shape[1] / 1e6)
+        fusion.fuse(frames)
+        self.assertEqual((fusion.fused, fusion.reduced, fusion.skipped), (2, 1, 0))
+
+
+def make_sky(size=400):
+    # a clear blue sky in a circular mask, with a grey cloud on the right half and a saturated sun at the top
+    image = np.zeros((size, size, 3), dtype=np.uint8)
+    y, x = np.mgrid[0:size, 0:size]
+    sky = (x - size / 2) ** 2 + (y - size / 2) ** 2 < (size / 2) ** 2
+    image[sky] = (200, 140, 80)
+    image[sky & (x >= size / 2)] = (180, 180, 175)
+    image[(x - size / 2) ** 2 + (y - 60) ** 2 < 12 ** 2] = 255
+    return image
+
+
+class TestFeatureExtractor(TestCase):
+    def setUp(self):
+        # the sun of `make_sky` has a radius of 12 pixels
+        self.extractor = FeatureExtractor(sun_radius=0.03, step=2)
+
+    def test_cloud_cover(self):
+        features = self.extractor.extract(make_sky())
+        self.assertAlmostEqual(features['cloud_fraction'], 0.5, delta=0.02)
+        # sector 0 starts at the top, the cloud covers the sectors 0-3 on the right
+        for i, cover in enumerate(features['sectors']):
+            self.assertAlmostEqual(cover, 1.0 if i < 4 else 0.0, delta=0.05)
+
+    def test_sun(self):
+        features = self.extractor.extract(make_sky())
+        self.assertAlmostEqual(features['sun_x'], 200, delta=3)
+        self.assertAlmostEqual(features['sun_y'], 60, delta=3)
+        self.assertGreater(features['sun_saturation'], 0.9)
+        self.assertGreater(features['saturation'], 0)
+
+        # a cloud in front of the upper half of the sun
+        image = make_sky()
+        image[40:60, 180:220] = (180, 180, 175)
+        self.assertLess(self.extractor.extract(image)['sun_saturation'], features['sun_saturation'])
+
+    def test_without_sun_and_sky(self):
+        features = self.extractor.extract(np.zeros((40, 40, 3), dtype=np.uint8))
+        self.assertEqual(features['cloud_fraction'], None)
+        self.assertEqual((features['sun_x'], features['sun_saturation']), (None, None))
+        self.assertEqual(features['sectors'], [None] * 8)
+
+    def test_row(self):
+        row = FeatureExtractor.to_row(self.extractor.extract(np.zeros((40, 40, 3), dtype=np.uint8)))
+        self.assertEqual(set(row), {name for name, _ in FEATURE_COLUMNS[1:]})
+        self.assertTrue(np.isnan(row['sun_x']))
+
+
+class TestChangeDetector(TestCase):
+    def test_moving_cloud(self):
+        detector = ChangeDetector()
+        sky = make_sky()
+        self.assertIsNone(detector.change('east', sky))
+        self.assertEqual(detector.change('east', sky), 0.0)
+        # the cloud drifts over a quarter of the clear sky
+        moved = sky.copy()
+        moved[:, 100:200][sky[:, 100:200, 0] == 200] = (180, 180, 175)
+        self.assertGreater(detector.change('east', moved), 0.03)
+        # every camera is compared with its own previous frame
+        self.assertIsNone(detector.change('west', sky))
+
+    def test_jpeg_matches_the_image(self):
+        detector = ChangeDetector()
+        sky = make_sky()
+        detector.change('east', sky)
+        self.assertLess(detector.change('east', encode_jpeg(sky, 90).tobytes()), 0.03)
+        detector.reset()
+        self.assertIsNone(detector.change('east', sky))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import gc
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from SkyImageAgg.Collectors.Camera import Cam
+from SkyImageAgg.Collectors.FramePool import FramePool
+from SkyImageAgg.Collectors.RpiCam import RpiCam
+from SkyImageAgg.Collectors.RpiCam import raw_resolution
+from synthetic_sky import make_sky_frame
+
+
+class FakePiCamera:
+    """
+    Simulate the PiCamera captures: jpegs are written to file-like outputs and raw frames, padded to 32x16 pixels, are
+    written directly into buffer outputs. The scene brightness follows the shutter speed.
+    """
+
+    def __init__(self, resolution=(200, 120), delay=0.0, clock=None):
+        self.resolution = resolution
+        self.delay = delay
+        # a capture advances the fake clock by the delay instead of sleeping
+        self.clock = clock
+        self.captures = []
+        self.lock = threading.Lock()
+        self.exposure_speed = 8000
+        self.shutter_speed = 0
+        self.exposure_mode = 'auto'
+        self.awb_mode = 'auto'
+        self.awb_gains = (1.5, 1.2)
+
+    def scene(self):
+        width, height = self.resolution
+        frame = make_sky_frame((height, width))
+        if self.shutter_speed:
+            frame = np.clip(frame * (self.shutter_speed / self.exposure_speed), 0, 255).astype(np.uint8)
+        return frame
+
+    def capture(self, output, format='jpeg', use_video_port=False):
+        with self.lock:
+            self.captures.append((format, use_video_port))
+            if self.clock:
+                self.clock.now += self.delay
+        if not self.clock:
+            time.sleep(self.delay)
+        frame = self.scene()
+        width, height = raw_resolution(self.resolution)
+        padded = np.zeros((height, width, 3), dtype=np.uint8)
+        padded[:frame.shape[0], :frame.shape[1]] = frame
+
+        if format == 'jpeg':
+            output.write(cv2.imencode('.jpg', frame)[1].tobytes())
+            return
+        if format == 'bgr':
+            data = padded
+        elif format == 'yuv':
+            data = cv2.cvtColor(padded, cv2.COLOR_BGR2YUV_I420)
+        else:
+            raise ValueError(format)
+        buffer = memoryview(output).cast('B')
+        if buffer.nbytes < data.nbytes:
+            raise ValueError('The buffer is too small!')
+        buffer[:data.nbytes] = data.tobytes()
+
+
+class FakeClock:
+    """
+    A clock that only moves when it's advanced.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFramePool(TestCase):
+    def test_buffers_are_reused_after_collection(self):
+        pool = FramePool((4, 4, 3), size=1)
+        frame = pool.acquire()
+        address = frame.__array_interface__['data'][0]
+        self.assertEqual(pool.free, 0)
+        del frame
+        gc.collect()
+        self.assertEqual(pool.free, 1)
+        self.assertEqual(pool.acquire().__array_interface__['data'][0], address)
+        self.assertEqual(pool.allocated, 1)
+
+    def test_views_keep_the_buffer(self):
+        pool = FramePool((4, 4, 3), size=1)
+        frame = pool.acquire()
+        frame[:] = 7
+        view = frame[1:3, 1:3]
+        del frame
+        gc.collect()
+        self.assertEqual(pool.free, 0)
+        # the pool grows instead of handing out a buffer in use
+        other = pool.acquire()
+        other[:] = 0
+        self.assertEqual(pool.allocated, 2)
+        self.assertTrue((view == 7).all())
+        del view
+        gc.collect()
+        self.assertEqual(pool.free, 1)
+
+
+class TestRpiCam(TestCase):
+    def setUp(self):
+        self.camera = FakePiCamera()
+        self.expected = self.camera.scene()
+
+    def test_raw_resolution(self):
+        self.assertEqual(raw_resolution((2592, 1944)), (2592, 1952))
+        self.assertEqual(raw_resolution((200, 120)), (224, 128))
+
+    def test_bgr_capture(self):
+        cam = RpiCam(resolution=(200, 120), capture_format='bgr', use_video_port=True, camera=self.camera)
+        image = cam.cap_pic()
+        self.assertEqual(image.shape, (120, 200, 3))
+        np.testing.assert_array_equal(image, self.expected)
+        self.assertEqual(self.camera.captures, [('bgr', True)])
+
+    def test_yuv_capture(self):
+        cam = RpiCam(resolution=(200, 120), capture_format='yuv', camera=self.camera)
+        image = cam.cap_pic()
+        self.assertEqual(image.shape, (120, 200, 3))
+        # the chroma is subsampled
+        self.assertLess(np.abs(image.astype(int) - self.expected).mean(), 4)
+
+    def test_raw_captures_reuse_the_buffers(self):
+        cam = RpiCam(resolution=(200, 120), capture_format='bgr', buffers=2, camera=self.camera)
+        addresses = set()
+        for _ in range(10):
+            image = cam.cap_pic()
+            addresses.add(image.__array_interface__['data'][0])
+            del image
+            gc.collect()
+        self.assertEqual(cam.pool.allocated, 2)
+        self.assertLessEqual(len(addresses), 2)
+
+    def test_raw_frame_can_be_masked_in_place(self):
+        cam = RpiCam(resolution=(200, 120), capture_format='bgr', camera=self.camera)
+        image = cam.cap_pic()
+        image[:10] = 0
+        self.assertFalse(image[:10].any())
+
+    def test_jpeg_capture(self):
+        cam = RpiCam(resolution=(200, 120), camera=self.camera)
+        self.assertIsNone(cam.pool)
+        self.assertEqual(cam.cap_pic().shape, (120, 200, 3))
+        self.assertTrue(cam.cap_jpeg().startswith(b'\xff\xd8'))
+        self.assertEqual(self.camera.captures, [('jpeg', False), ('jpeg', False)])
+
+    def test_bracket(self):
+        cam = RpiCam(resolution=(200, 120), capture_format='bgr', camera=self.camera)
+        frames = cam.cap_bracket([0, -1, 1])
+        self.assertEqual(len(frames), 3)
+        means = [frame.mean() for frame in frames]
+        self.assertLess(means[1], means[0])
+        self.assertLess(means[0], means[2])
+        # the automatic settings are restored
+        self.assertEqual((self.camera.shutter_speed, self.camera.exposure_mode, self.camera.awb_mode),
+                         (0, 'auto', 'auto'))
+        # every frame has its own buffer
+        self.assertEqual(len({frame.__array_interface__['data'][0] for frame in frames}), 3)
+
+    def test_bracket_budget(self):
+        clock = FakeClock()
+        self.camera.delay, self.camera.clock = 0.05, clock
+        cam = RpiCam(resolution=(200, 120), capture_format='bgr', camera=self.camera)
+        # a third exposure would end at 0.15 s
+        frames = cam.cap_bracket([0, -2, 2, -4, 4], budget=0.12, clock=clock)
+        self.assertEqual(len(frames), 2)
+        self.assertAlmostEqual(clock.now, 0.1)
+        # the reference exposure is always captured
+        self.assertEqual(len(cam.cap_bracket([0, -2], budget=0, clock=clock)), 1)
+
+    def test_supports_bracketing(self):
+        class StillCam(Cam):
+            def login(self, username, pwd):
+                pass
+
+            def cap_pic(self, output='array'):
+                pass
+
+            def cap_video(self, output):
+                pass
+
+        self.assertTrue(RpiCam(camera=self.camera).supports_bracketing)
+        self.assertFalse(StillCam().supports_bracketing)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            RpiCam(capture_format='png', camera=self.camera)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from SkyImageAgg.DataStore import ColumnTable
+from SkyImageAgg.Sampler import AGGREGATE_COLUMNS
+from SkyImageAgg.Sampler import IrradianceSampler
+from SkyImageAgg.Sampler import SAMPLE_COLUMNS
+
+# 2020-06-01 00:00:00 UTC
+_midnight = 1590969600
+
+
+class TestIrradianceSampler(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sampler = IrradianceSampler(read=None, rate=1, capacity=100, data_dir=self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_aggregates_of_an_interval(self):
+        for i in range(20):
+            self.sampler.add(_midnight + i, (100 + i, -1.0, 30.0))
+        stats = self.sampler.aggregate(_midnight + 10, _midnight + 20)
+        self.assertEqual(stats['count'], 10)
+        self.assertEqual(stats['time'], _midnight + 20)
+        self.assertAlmostEqual(stats['irradiance']['mean'], 114.5)
+        self.assertEqual(stats['irradiance']['min'], 110)
+        self.assertEqual(stats['irradiance']['max'], 119)
+        self.assertAlmostEqual(stats['irradiance']['std'], np.std(np.arange(110, 120)), places=5)
+        self.assertEqual(stats['ext_temp']['mean'], -1.0)
+        self.assertEqual(stats['cell_temp']['std'], 0.0)
+
+    def test_empty_interval(self):
+        stats = self.sampler.aggregate(_midnight, _midnight + 10)
+        self.assertEqual(stats['count'], 0)
+        self.assertTrue(np.isnan(stats['irradiance']['mean']))
+
+    def test_ring_buffer_keeps_the_latest_samples(self):
+        for i in range(250):
+            self.sampler.add(_midnight + i, (i, 0, 0))
+        times, values = self.sampler.window(0, _midnight + 1000)
+        self.assertEqual(len(times), 100)
+        self.assertEqual(sorted(values[:, 0]), list(range(150, 250)))
+
+        self.sampler.flush()
+        self.assertEqual(self.sampler.lost, 150)
+        table = ColumnTable(os.path.join(self.dir, 'irr-20200601'), SAMPLE_COLUMNS)
+        np.testing.assert_array_equal(table.read(['time'])['time'], _midnight + np.arange(150, 250))
+
+    def test_flush_writes_only_the_new_samples_split_by_day(self):
+        for i in range(10):
+            self.sampler.add(_midnight - 5 + i, (i, 0, 0))
+        self.sampler.aggregate(_midnight - 5, _midnight + 5)
+        self.sampler.flush()
+        self.sampler.add(_midnight + 5, (10, 0, 0))
+        self.sampler.flush()
+
+        before = ColumnTable(os.path.join(self.dir, 'irr-20200531'), SAMPLE_COLUMNS).read()
+        after = ColumnTable(os.path.join(self.dir, 'irr-20200601'), SAMPLE_COLUMNS).read()
+        np.testing.assert_array_equal(before['irradiance'], np.arange(5))
+        np.testing.assert_array_equal(after['irradiance'], np.arange(5, 11))
+
+        aggregates = ColumnTable(os.path.join(self.dir, 'irr-agg-20200601'), AGGREGATE_COLUMNS).read()
+        self.assertEqual(list(aggregates['count']), [10])
+        self.assertEqual(list(aggregates['irradiance_mean']), [4.5])
+
+    def test_failed_flush_is_retried(self):
+        self.sampler.add(_midnight, (1, 0, 0))
+        open(os.path.join(self.dir, 'irr-20200601'), 'w').close()  # a file in place of the table
+        with self.assertRaises(OSError):
+            self.sampler.flush()
+        os.remove(os.path.join(self.dir, 'irr-20200601'))
+        self.sampler.flush()
+        self.assertEqual(len(ColumnTable(os.path.join(self.dir, 'irr-20200601'), SAMPLE_COLUMNS)), 1)
+
+    def test_sampling_thread(self):
+        reads = []
+
+        def read():
+            reads.append(time.time())
+            return 1.0, 2.0, 3.0
+
+        sampler = IrradianceSampler(read=read, rate=50, capacity=1000, data_dir=self.dir, flush_interval=0.1)
+        sampler.start()
+        time.sleep(0.5)
+        sampler.stop()
+
+        self.assertGreater(len(reads), 15)
+        # aligned to the sampling period
+        offsets = [(t * 50) % 1 for t in reads]
+        self.assertLess(np.median(offsets), 0.5)
+        day = time.strftime('%Y%m%d', time.gmtime(reads[0]))
+        self.assertEqual(len(ColumnTable(os.path.join(self.dir, f'irr-{day}'), SAMPLE_COLUMNS)),
+                         sampler.samples)
+
+    def test_failed_reads_are_counted(self):
+        def read():
+            raise IOError
+
+        sampler = IrradianceSampler(read=read)
+        sampler.sample()
+        self.assertEqual((sampler.samples, sampler.errors), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from SkyImageAgg.Scheduler import AdaptiveCadence
+from SkyImageAgg.Scheduler import CaptureScheduler
+from SkyImageAgg.Solar import TwilightTable
+
+_lat, _lon = 50.1567017, 14.1694847
+# 2020-06-01 00:00:00 UTC
+_midnight = 1590969600
+
+
+class TestCaptureInstants(TestCase):
+    def setUp(self):
+        self.sched = CaptureScheduler(job=None, interval=7, latitude=_lat, longitude=_lon, min_elevation=-0.833)
+
+    def test_ticks_are_epoch_aligned(self):
+        for interval in (7, 10, 45, 90):
+            self.sched.interval = interval
+            for now in (_midnight + 43200.5, _midnight + 43200 + 3 * interval):
+                tick = self.sched.align(now)
+                self.assertEqual(tick % interval, 0)
+                self.assertTrue(now <= tick < now + interval)
+
+    def test_night_is_skipped_until_sunrise(self):
+        sunrise = TwilightTable.compute(_lat, _lon, 0).times[152][0]  # day of year 153
+        tick, is_day = self.sched.next_tick(_midnight + 60)
+        self.assertTrue(is_day)
+        self.assertEqual(tick % 7, 0)
+        # the threshold is on the apparent elevation, so the refraction makes it a bit earlier
+        self.assertLess(abs(tick - (_midnight + sunrise)), 300)
+
+        # during the day the ticks follow each other
+        noon = _midnight + 12 * 3600
+        self.assertEqual(self.sched.next_tick(noon), (self.sched.align(noon), True))
+
+    def test_ungated_scheduler_runs_at_night(self):
+        self.sched.gated = False
+        tick, is_day = self.sched.next_tick(_midnight + 60)
+        self.assertEqual(tick, self.sched.align(_midnight + 60))
+        self.assertFalse(is_day)
+
+
+class TestSchedulerLoop(TestCase):
+    def test_jitter_and_missed_ticks(self):
+        durations = iter([0.0, 0.0, 0.25, 0.0, 0.0])
+        runs = []
+
+        def job():
+            runs.append(time.time())
+            time.sleep(next(durations, 0.0))
+            if len(runs) == 5:
+                sched.stop()
+
+        # a short lookahead keeps the search for the sunset from delaying the first tick
+        sched = CaptureScheduler(job=job, interval=0.1, latitude=_lat, longitude=_lon, gated=False, lookahead=1)
+        thread = threading.Thread(target=sched.run)
+        thread.start()
+        thread.join(timeout=5)
+
+        stats = sched.stats()
+        self.assertEqual(stats['ticks'], 5)
+        self.assertEqual(stats['missed'], 2)
+        self.assertLess(stats['jitter_max'], 0.05)
+        # the runs start on the tick grid
+        phases = np.mod(np.array(runs) + 1e-9, 0.1)
+        self.assertTrue(np.all(phases < 0.05))
+
+    def test_day_callbacks(self):
+        events = []
+        sched = CaptureScheduler(
+            job=lambda: None,
+            interval=1,
+            latitude=_lat,
+            longitude=_lon,
+            on_day_start=lambda: events.append('start'),
+            on_day_end=lambda: events.append('end')
+        )
+        sched._set_daylight(True)
+        sched._set_daylight(True)
+        sched._set_daylight(False)
+        sched._set_daylight(False)
+        self.assertEqual(events, ['start', 'end'])
+
+    def test_night_time_start(self):
+        events = []
+        # the sun never gets that high, so it's night until the end of the lookahead window
+        sched = CaptureScheduler(
+            job=lambda: events.append('job'),
+            interval=1,
+            latitude=_lat,
+            longitude=_lon,
+            min_elevation=90,
+            on_day_start=lambda: events.append('start'),
+            on_day_end=lambda: (events.append('end'), sched.stop()),
+            lookahead=60
+        )
+        thread = threading.Thread(target=sched.run)
+        thread.start()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(events, ['end'])
+
+    def test_errors_dont_stop_the_loop(self):
+        runs = []
+
+        def job():
+            runs.append(time.time())
+            if len(runs) == 3:
+                sched.stop()
+            raise OSError('The camera is not responding!')
+
+        def on_day_end():
+            raise OSError('The SMS could not be sent!')
+
+        sched = CaptureScheduler(
+            job=job, interval=0.05, latitude=_lat, longitude=_lon, gated=False, lookahead=1, on_day_end=on_day_end
+        )
+        with self.assertLogs(sched.logger, 'ERROR') as logs:
+            sched._set_daylight(False)
+            thread = threading.Thread(target=sched.run)
+            thread.start()
+            thread.join(timeout=5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(runs), 3)
+        self.assertEqual(sched.stats()['ticks'], 3)
+        self.assertEqual(len(logs.records), 4)
+        self.assertIn('on_day_end failed', logs.output[0])
+        self.assertIn('job failed', logs.output[1])
+
+    def test_cadence_skips_ticks(self):
+        runs = []
+
+        def job():
+            runs.append(time.time())
+            if len(runs) == 3:
+                sched.stop()
+
+        cadence = AdaptiveCadence(interval=0.05, max_interval=0.1)
+        sched = CaptureScheduler(
+            job=job, interval=0.05, latitude=_lat, longitude=_lon, gated=False, lookahead=1, cadence=cadence
+        )
+        thread = threading.Thread(target=sched.run)
+        thread.start()
+        thread.join(timeout=5)
+
+        # nothing changes, so the interval doubles after the second capture
+        self.assertEqual(len(runs), 3)
+        self.assertGreater(runs[2] - runs[1], 0.09)
+        self.assertEqual(sched.stats()['ticks'], 3)
+        self.assertGreaterEqual(cadence.stats()['skipped'], 1)
+
+
+class TestAdaptiveCadence(TestCase):
+    def setUp(self):
+        self.cadence = AdaptiveCadence(interval=10, max_interval=60, change_threshold=0.03, ramp_threshold=5,
+                                       duplicate_threshold=0.01)
+
+    def captured(self, start, end):
+        return [tick for tick in range(start, end, 10) if self.cadence.due(tick)]
+
+    def test_interval_backs_off_while_nothing_changes(self):
+        self.assertEqual(self.captured(0, 200), [0, 10, 30, 70, 130, 190])
+        self.assertEqual(self.cadence.stats(), {'interval': 60, 'captured': 6, 'skipped': 14})
+
+    def test_fast_change_sets_the_shortest_interval(self):
+        self.captured(0, 200)
+        self.cadence.observe(change=0.1, ramp=None)
+        self.assertEqual(self.captured(200, 240), [200, 210, 230])
+        # an irradiance ramp too, the small changes let the interval back off again
+        self.cadence.observe(change=0.0, ramp=12.0)
+        self.cadence.observe(change=0.02, ramp=1.0)
+        self.assertEqual(self.captured(240, 320), [240, 250, 270, 310])
+
+    def test_near_duplicates_are_uploaded_every_max_interval(self):
+        kept = [t for t in range(0, 130, 10) if self.cadence.keep('east', t, 0.001, None)]
+        self.assertEqual(kept, [0, 60, 120])
+        # the changed frames and the irradiance ramps are uploaded, the first frame of a camera too
+        self.assertTrue(self.cadence.keep('east', 130, 0.02, None))
+        self.assertTrue(self.cadence.keep('east', 140, 0.001, 8.0))
+        self.assertTrue(self.cadence.keep('west', 140, None, None))
+        self.assertFalse(self.cadence.keep('west', 150, 0.0, 0.5))
+
+    def test_invalid_intervals(self):
+        with self.assertRaises(ValueError):
+            AdaptiveCadence(interval=10, max_interval=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from unittest import TestCase
+
+from SkyImageAgg.SessionPool import SessionPool
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            self.rfile.read(length)
+
+        with self.server.lock:
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.active -= 1
+
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSessionPool(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _KeepAliveHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.delay = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        pool = SessionPool()
+        for _ in range(5):
+            self.assertEqual(pool.post(f'{self.url}/upload', data={'data': 'x'}).status_code, 200)
+        pool.get(f'{self.url}/PictureCatch.cgi')
+
+        stats = pool.stats()[self.url]
+        self.assertEqual(stats['requests'], 6)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['reused'], 5)
+        pool.close()
+
+    def test_keep_alive_disabled(self):
+        pool = SessionPool(keep_alive=False)
+        for _ in range(3):
+            pool.get(self.url)
+        self.assertEqual(pool.stats()[self.url]['connections'], 3)
+        pool.close()
+
+    def test_per_host_limit(self):
+        self.server.delay = 0.05
+        pool = SessionPool(pool_maxsize=4, max_per_host=2)
+        threads = [threading.Thread(target=pool.get, args=(self.url,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(self.server.max_active, 2)
+        stats = pool.stats()[self.url]
+        self.assertEqual(stats['requests'], 8)
+        self.assertLessEqual(stats['connections'], 2)
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
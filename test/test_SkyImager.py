@@ -0,0 +1,48 @@
+import json
+import subprocess
+import sys
+import unittest
+from os import path
+from unittest import TestCase
+
+_bench = path.join(path.dirname(path.abspath(__file__)), 'bench_replay.py')
+
+
+def replay(frames, failure_rate, mode, image_interval=0):
+    # in a process of its own, the replay reconfigures `Config` and the backends
+    args = [sys.executable, _bench, str(frames), '0', str(failure_rate), mode, str(image_interval), '--json']
+    output = subprocess.run(args, capture_output=True, text=True, check=True, timeout=300).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+class TestReplay(TestCase):
+    def test_every_frame_is_uploaded(self):
+        for mode in ('sequential', 'pipeline'):
+            with self.subTest(mode):
+                result = replay(frames=4, failure_rate=0, mode=mode)
+                self.assertEqual((result['uploaded'], result['remaining'], result['lost']), (4, 0, 0))
+                self.assertIn('send', result['spans'])
+
+    def test_failed_uploads_go_through_the_backlog(self):
+        result = replay(frames=6, failure_rate=0.5, mode='sequential')
+        self.assertGreater(result['queued'], 0)
+        self.assertEqual(result['uploaded'] + result['remaining'], 6)
+        self.assertEqual(result['lost'], 0)
+
+    def test_features_are_uploaded_every_tick(self):
+        for mode in ('sequential', 'pipeline'):
+            with self.subTest(mode):
+                result = replay(frames=6, failure_rate=0, mode=mode, image_interval=3)
+                self.assertEqual((result['features'], result['uploaded'], result['decimated']), (6, 2, 4))
+                self.assertEqual(result['lost'], 0)
+                self.assertIn('features', result['spans'])
+
+    def test_ticks_with_failed_feature_uploads_are_not_decimated(self):
+        result = replay(frames=9, failure_rate=0.5, mode='sequential', image_interval=3)
+        self.assertLess(result['decimated'], 9 - 3)
+        self.assertEqual(result['uploaded'] + result['remaining'] + result['decimated'], 9)
+        self.assertEqual(result['lost'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import datetime as dt
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from SkyImageAgg.Solar import TwilightTable
+from SkyImageAgg.Solar import solar_elevation
+
+try:
+    from astral import Astral
+    from astral import Location
+except ImportError:
+    Astral = None
+
+_locations = [
+    (50.1567017, 14.1694847, 360),
+    (-33.86, 151.21, 0),
+    (37.77, -122.42, 50)
+]
+
+
+def seconds(time):
+    return time.hour * 3600 + time.minute * 60 + time.second
+
+
+def circular_diff(a, b):
+    diff = abs(a - b) % 86400
+    return min(diff, 86400 - diff)
+
+
+@unittest.skipIf(Astral is None, 'astral is not installed')
+class TestAgainstAstral(TestCase):
+    def test_annual_table(self):
+        for lat, lon, alt in _locations:
+            table = TwilightTable.compute(lat, lon, alt)
+            location = Location(('custom', 'region', lat, lon, 'UTC', alt))
+            for day in range(1, 367, 7):
+                date = dt.date(2020, 1, 1) + dt.timedelta(days=day - 1)
+                sun = location.sun(date=date)
+                sunrise, sunset = table[day]
+                self.assertLessEqual(circular_diff(seconds(sunrise), seconds(sun['sunrise'].time())), 2)
+                self.assertLessEqual(circular_diff(seconds(sunset), seconds(sun['sunset'].time())), 2)
+
+    def test_solar_elevation_at_midnight(self):
+        # astral adds the time of day twice to the julian day, so only midnights are comparable
+        astral = Astral()
+        times = [dt.datetime(2020, 1, 1) + dt.timedelta(days=9 * i) for i in range(40)]
+        epoch = np.array([(t - dt.datetime(1970, 1, 1)).total_seconds() for t in times])
+        for lat, lon, _ in _locations:
+            elevation = solar_elevation(epoch, lat, lon)
+            expected = [astral.solar_elevation(t, lat, lon) for t in times]
+            np.testing.assert_allclose(elevation, expected, atol=1e-6)
+
+
+class TestSolarElevation(TestCase):
+    def test_sun_crosses_horizon_at_sunrise_and_sunset(self):
+        for lat, lon, _ in _locations:
+            table = TwilightTable.compute(lat, lon, 0)
+            for day in range(1, 367, 30):
+                midnight = (np.datetime64('2020-01-01') + np.timedelta64(day - 1, 'D')).astype('datetime64[s]')
+                midnight = midnight.astype(np.int64)
+                sunrise, sunset = table.times[day - 1]
+                before, after = solar_elevation(midnight + np.array([sunrise - 600, sunrise + 600]), lat, lon)
+                self.assertLess(before, 0)
+                self.assertGreater(after, 0)
+                before, after = solar_elevation(midnight + np.array([sunset - 600, sunset + 600]), lat, lon)
+                self.assertGreater(before, 0)
+                self.assertLess(after, 0)
+
+    def test_scalar_input(self):
+        self.assertIsInstance(solar_elevation(1592222400, 50.0, 14.0), float)
+
+
+class TestTwilightTable(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_save_and_load(self):
+        path = os.path.join(self.dir, 'twilight_times.bin')
+        table = TwilightTable.compute(*_locations[0])
+        table.save(path)
+
+        loaded = TwilightTable.load(path)
+        self.assertTrue(loaded.is_located_at(*_locations[0]))
+        self.assertFalse(loaded.is_located_at(50.0, 14.0, 360))
+        self.assertEqual(loaded.times.shape, (366, 2))
+        self.assertEqual([loaded[d] for d in (1, 60, 366)], [table[d] for d in (1, 60, 366)])
+        # header + 366 rows of two int32
+        self.assertEqual(os.path.getsize(path), 32 + 366 * 8)
+
+    def test_polar_night(self):
+        table = TwilightTable.compute(78.22, 15.65, 0)  # Svalbard
+        self.assertEqual(table[1], (None, None))
+        self.assertIsNotNone(table[80][0])
+        with self.assertRaises(KeyError):
+            table[0]
+
+
+if __name__ == '__main__':
+    unittest.main()
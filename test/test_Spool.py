@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+from SkyImageAgg.Spool import UploadSpool
+
+
+class TestUploadSpool(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.evicted = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_spool(self, **kwargs):
+        return UploadSpool(self.dir, on_evict=lambda name, path: self.evicted.append(name), **kwargs)
+
+    def fill(self, spool, n=3):
+        for i in range(n):
+            spool.put(f'2020-06-01_12-00-{i:02d}', bytes([i]) * 100)
+
+    def test_drain_policies(self):
+        spool = self.make_spool(policy='lifo')
+        self.fill(spool)
+        self.assertEqual(spool.get()[0], '2020-06-01_12-00-02')
+        spool.close()
+
+        spool = self.make_spool(policy='fifo')
+        name, jpeg = spool.get()
+        self.assertEqual(name, '2020-06-01_12-00-00')
+        self.assertEqual(jpeg, bytes([0]) * 100)
+
+    def test_ack_and_release(self):
+        spool = self.make_spool(policy='fifo')
+        self.fill(spool)
+        name, _ = spool.get()
+        spool.release(name)
+        self.assertEqual(spool.get()[0], name)
+        spool.ack(name)
+        self.assertFalse(os.path.exists(spool.path_of(name)))
+        self.assertEqual(len(spool), 2)
+        self.assertEqual(spool.disk_usage, 200)
+
+    def test_crash_recovery(self):
+        spool = self.make_spool(policy='fifo')
+        self.fill(spool)
+        spool.ack(spool.get()[0])
+        spool.get()  # taken, but the process dies before acknowledging it
+        spool.close()
+        with open(os.path.join(self.dir, 'upload.journal'), 'a') as f:
+            f.write('put 9 10')  # torn write
+
+        spool = self.make_spool(policy='fifo')
+        self.assertEqual(len(spool), 2)
+        self.assertEqual(spool.get()[0], '2020-06-01_12-00-01')
+        self.assertEqual(spool.get()[0], '2020-06-01_12-00-02')
+        self.assertIsNone(spool.get())
+
+    def test_adopts_stray_files(self):
+        with open(os.path.join(self.dir, '2020-05-31_10-00-00.jpg'), 'wb') as f:
+            f.write(b'legacy')
+        with open(os.path.join(self.dir, '2020-05-31_10-00-01.jpg.tmp'), 'wb') as f:
+            f.write(b'partial')
+
+        spool = self.make_spool(policy='fifo')
+        spool.put('2020-06-01_12-00-00', b'new')
+
+        self.assertEqual(spool.get(), ('2020-05-31_10-00-00', b'legacy'))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, '2020-05-31_10-00-01.jpg.tmp')))
+
+    def test_disk_budget(self):
+        spool = self.make_spool(max_disk_bytes=250)
+        self.fill(spool)
+        self.assertEqual(self.evicted, ['2020-06-01_12-00-00'])
+        self.assertEqual(len(spool), 2)
+        self.assertLessEqual(spool.disk_usage, 250)
+
+    def test_ram_budget(self):
+        spool = self.make_spool(max_ram_bytes=150)
+        self.fill(spool)
+        self.assertLessEqual(spool._cache_bytes, 150)
+        # images that are not cached are read from the disk
+        self.assertEqual(spool.get()[1], bytes([2]) * 100)
+        spool.policy = 'fifo'
+        self.assertEqual(spool.get()[1], bytes([0]) * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
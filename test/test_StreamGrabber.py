@@ -0,0 +1,203 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from SkyImageAgg.Collectors.GeoVisionCam import GeoVisionCam
+from SkyImageAgg.Collectors.StreamGrabber import MjpegGrabber
+from SkyImageAgg.Collectors.StreamGrabber import StreamFrame
+from SkyImageAgg.Collectors.StreamGrabber import parse_boundary
+from SkyImageAgg.Collectors.StreamGrabber import read_mjpeg
+
+
+def make_jpeg(value):
+    return cv2.imencode('.jpg', np.full((24, 32, 3), value, dtype=np.uint8))[1].tobytes()
+
+
+def make_multipart(frames, content_length=True):
+    body = b''
+    for jpeg in frames:
+        body += b'--frame\r\nContent-Type: image/jpeg\r\n'
+        if content_length:
+            body += b'Content-Length: %d\r\n' % len(jpeg)
+        body += b'\r\n' + jpeg + b'\r\n'
+    return body + b'--frame--\r\n'
+
+
+def chunked_reader(data, size):
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    return lambda: chunks.pop(0) if chunks else b''
+
+
+class StubMjpegCamera(ThreadingHTTPServer):
+    """
+    A local camera streaming numbered gray frames as multipart/x-mixed-replace.
+    """
+    daemon_threads = True
+
+    def __init__(self, fps=50.0, frames=None, content_length=True):
+        super().__init__(('127.0.0.1', 0), _StubMjpegHandler)
+        self.fps = fps
+        self.frames = frames
+        self.content_length = content_length
+        self.sent = 0
+        self.connections = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/video.mjpg'
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _StubMjpegHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.connections += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+        self.end_headers()
+        i = 0
+        try:
+            while self.server.frames is None or i < self.server.frames:
+                self.server.sent += 1
+                jpeg = make_jpeg(self.server.sent % 256)
+                headers = b'--frame\r\nContent-Type: image/jpeg\r\n'
+                if self.server.content_length:
+                    headers += b'Content-Length: %d\r\n' % len(jpeg)
+                self.wfile.write(headers + b'\r\n' + jpeg + b'\r\n')
+                self.wfile.flush()
+                i += 1
+                time.sleep(1 / self.server.fps)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class TestReadMjpeg(TestCase):
+    def setUp(self):
+        self.frames = [make_jpeg(value) for value in (10, 20, 30)]
+
+    def test_parse_boundary(self):
+        self.assertEqual(parse_boundary('multipart/x-mixed-replace; boundary=frame'), b'frame')
+        self.assertEqual(parse_boundary('multipart/x-mixed-replace;boundary="--myboundary"'), b'myboundary')
+        with self.assertRaises(ValueError):
+            parse_boundary('image/jpeg')
+
+    def test_parts_with_content_length(self):
+        data = make_multipart(self.frames)
+        for size in (1, 7, 4096):
+            with self.subTest(size):
+                self.assertEqual(list(read_mjpeg(chunked_reader(data, size), b'frame')), self.frames)
+
+    def test_parts_without_content_length(self):
+        data = make_multipart(self.frames, content_length=False)
+        for size in (1, 7, 4096):
+            with self.subTest(size):
+                self.assertEqual(list(read_mjpeg(chunked_reader(data, size), b'frame')), self.frames)
+
+    def test_truncated_part_is_not_yielded(self):
+        data = make_multipart(self.frames)
+        self.assertEqual(list(read_mjpeg(chunked_reader(data[:-100], 64), b'frame')), self.frames[:2])
+
+
+class TestMjpegGrabber(TestCase):
+    def setUp(self):
+        self.camera = StubMjpegCamera()
+
+    def tearDown(self):
+        self.camera.stop()
+
+    def test_keeps_the_latest_frame(self):
+        grabber = MjpegGrabber(self.camera.url)
+        grabber.start()
+        try:
+            first = grabber.wait(timeout=5)
+            self.assertIsNotNone(first)
+            later = grabber.wait(after=first.seq + 5, timeout=5)
+            self.assertIsNotNone(later)
+            frame = grabber.latest(max_age=1)
+            self.assertGreaterEqual(frame.seq, later.seq)
+            self.assertTrue(frame.jpeg.startswith(b'\xff\xd8'))
+            self.assertEqual(frame.image.shape, (24, 32, 3))
+            # one long-lived request
+            self.assertEqual(self.camera.connections, 1)
+        finally:
+            grabber.stop()
+
+    def test_without_decoding(self):
+        self.camera.content_length = False
+        grabber = MjpegGrabber(self.camera.url, decode=False)
+        grabber.start()
+        try:
+            frame = grabber.wait(after=2, timeout=5)
+            self.assertIsNone(frame.image)
+            self.assertEqual(cv2.imdecode(np.frombuffer(frame.jpeg, np.uint8), cv2.IMREAD_COLOR).shape, (24, 32, 3))
+        finally:
+            grabber.stop()
+
+    def test_reconnects_and_reports_stale_frames(self):
+        self.camera.frames = 3
+        grabber = MjpegGrabber(self.camera.url, reconnect_delay=0.05)
+        grabber.start()
+        try:
+            self.assertIsNotNone(grabber.wait(after=4, timeout=5))
+            self.assertGreaterEqual(self.camera.connections, 2)
+            self.assertGreaterEqual(grabber.errors, 1)
+        finally:
+            grabber.stop()
+
+        with self.assertRaises(LookupError):
+            grabber.latest(max_age=0)
+        with self.assertRaises(LookupError):
+            MjpegGrabber(self.camera.url).latest()
+
+    def test_camera_reads_the_stream(self):
+        grabber = MjpegGrabber(self.camera.url)
+        camera = GeoVisionCam('http://127.0.0.1:1', grabber=grabber, max_age=1)
+        try:
+            frame = grabber.wait(timeout=5)
+            image = camera.cap_pic()
+            self.assertEqual(image.shape, (24, 32, 3))
+            # the slot frame is not shared with the caller
+            image[:] = 0
+            self.assertTrue(grabber.latest().image.any())
+            self.assertTrue(camera.cap_jpeg().startswith(b'\xff\xd8'))
+            self.assertGreaterEqual(grabber.latest().seq, frame.seq)
+            self.assertEqual(camera.stream_misses, 0)
+        finally:
+            camera.close()
+
+    def test_jpeg_capture_from_a_decoded_stream_is_a_miss(self):
+        class DecodedGrabber:
+            # like the RTSP grabber, its frames have no jpeg
+            def start(self):
+                pass
+
+            def stop(self):
+                pass
+
+            def latest(self, max_age=None):
+                return StreamFrame(1, time.monotonic(), None, np.zeros((24, 32, 3), dtype=np.uint8))
+
+        camera = GeoVisionCam('http://127.0.0.1:1', grabber=DecodedGrabber())
+        camera._request_picture = lambda stream=False: SimpleNamespace(content=b'still')
+        self.assertEqual(camera.cap_pic().shape, (24, 32, 3))
+        self.assertEqual(camera.stream_misses, 0)
+        self.assertEqual(camera.cap_jpeg(), b'still')
+        self.assertEqual(camera.stream_misses, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
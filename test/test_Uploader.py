@@ -0,0 +1,191 @@
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from base64 import b64encode
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from unittest import TestCase
+
+import numpy as np
+import requests
+
+from SkyImageAgg.Uploader import BacklogUploader
+from SkyImageAgg.Uploader import BodyReader
+from SkyImageAgg.Uploader import UploadBodyBuilder
+
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        self.server.records.append((dict(self.headers), self.rfile.read(length)))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+def legacy_request(key, client_id, jpeg, time_stamp):
+    data = json.dumps({
+        'status': 'ok',
+        'id': client_id,
+        'time': time_stamp,
+        'coding': 'Base64',
+        'data': b64encode(jpeg).decode('ascii')
+    })
+    signature = hmac.new(key, bytes(data, 'ascii'), digestmod=hashlib.sha256).hexdigest()
+    return data, signature
+
+
+class TestUploadBodyBuilder(TestCase):
+    def setUp(self):
+        self.key = b'secret'
+        self.time_stamp = '2020-06-01T12:00:10'
+        self.builder = UploadBodyBuilder(self.key, '200')
+        rng = np.random.RandomState(0)
+        # odd sizes make sure the base64 padding is placed only at the end
+        self.jpegs = [rng.randint(0, 256, size=n, dtype=np.uint8).tobytes() for n in (0, 1, 2, 49153, 300001, 10)]
+
+    def test_byte_identical_to_legacy_format(self):
+        for jpeg in self.jpegs:
+            data, signature = legacy_request(self.key, '200', jpeg, self.time_stamp)
+            expected = requests.Request('POST', 'http://localhost/', data={'data': data}).prepare().body
+
+            body, sig = self.builder.build(jpeg, self.time_stamp)
+
+            self.assertEqual(sig, signature)
+            self.assertEqual(body.tobytes(), bytes(expected, 'ascii'))
+
+    def test_accepts_encoded_arrays(self):
+        jpeg = np.arange(1000, dtype=np.uint8).reshape(-1, 1)
+        body, sig = self.builder.build(jpeg, self.time_stamp)
+        self.assertEqual(sig, legacy_request(self.key, '200', jpeg.tobytes(), self.time_stamp)[1])
+
+    def test_posted_request_is_identical(self):
+        server = HTTPServer(('127.0.0.1', 0), _RecordingHandler)
+        server.records = []
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = 'http://127.0.0.1:{}/'.format(server.server_port)
+        try:
+            jpeg = self.jpegs[4]
+            data, _ = legacy_request(self.key, '200', jpeg, self.time_stamp)
+            requests.post(url, data={'data': data})
+
+            body, _ = self.builder.build(jpeg, self.time_stamp)
+            requests.post(
+                url,
+                data=BodyReader(body),
+                headers={'Content-Type': 'application/x-www-form-urlencoded'}
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        (legacy_headers, legacy_body), (headers, body) = server.records
+        self.assertEqual(body, legacy_body)
+        for header in ('Content-Type', 'Content-Length'):
+            self.assertEqual(headers[header], legacy_headers[header])
+
+
+class TestBacklogUploader(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.received = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def slow_upload(self, name, jpeg):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+            self.received[name] = jpeg
+
+    def test_uploads_stored_bytes(self):
+        items = []
+        for i in range(20):
+            path = os.path.join(self.dir, f'{i}.jpg')
+            with open(path, 'wb') as f:
+                f.write(bytes([i]) * 10)
+            items.append((str(i), path))
+
+        uploaded = []
+        uploader = BacklogUploader(self.slow_upload, max_workers=3, window=4)
+        metrics = uploader.run(iter(items), on_success=lambda name, path: uploaded.append(name))
+
+        self.assertEqual(metrics['uploaded'], 20)
+        self.assertEqual(metrics['bytes'], 200)
+        self.assertEqual(sorted(uploaded, key=int), [str(i) for i in range(20)])
+        self.assertEqual(self.received['7'], bytes([7]) * 10)
+
+    def test_failing_callbacks_dont_stop_the_workers(self):
+        def upload(name, jpeg):
+            if int(name) % 2:
+                raise ConnectionError
+
+        def on_success(name, jpeg):
+            raise FileNotFoundError(name)
+
+        def on_failure(name, jpeg, error):
+            raise OSError('No space left on device')
+
+        uploader = BacklogUploader(upload, min_workers=2, max_workers=2)
+        with self.assertLogs(uploader.logger, 'ERROR') as logs:
+            metrics = uploader.run(((str(i), b'jpeg') for i in range(10)), on_success=on_success, on_failure=on_failure)
+
+        self.assertEqual((metrics['uploaded'], metrics['failed']), (5, 5))
+        self.assertEqual(sum('on_success callback failed' in line for line in logs.output), 5)
+        self.assertEqual(sum('on_failure callback failed' in line for line in logs.output), 5)
+
+    def test_concurrency_grows_with_throughput(self):
+        # the fake clock advances by the same step at every reading, so every window takes the same time and the
+        # throughput keeps up whatever the load of the machine
+        clock = itertools.count(step=0.01)
+        lock = threading.Lock()
+
+        def tick():
+            with lock:
+                return next(clock)
+
+        uploader = BacklogUploader(self.slow_upload, min_workers=1, max_workers=4, window=4, clock=tick)
+        uploader.run((str(i), b'x') for i in range(60))
+        self.assertEqual(uploader.workers, 4)
+        self.assertGreater(self.max_active, 1)
+        self.assertLessEqual(self.max_active, 4)
+
+    def test_concurrency_shrinks_on_errors(self):
+        def failing_upload(name, jpeg):
+            if int(name) >= 20:
+                raise ConnectionError('server is down')
+
+        failed = []
+        uploader = BacklogUploader(failing_upload, max_workers=4, window=4, max_consecutive_failures=12)
+        metrics = uploader.run(
+            ((str(i), b'x') for i in range(100)),
+            on_failure=lambda name, jpeg, e: failed.append(name)
+        )
+
+        self.assertEqual(uploader.workers, 1)
+        # draining stops after the failures in a row instead of going through the whole backlog
+        self.assertLess(metrics['uploaded'] + metrics['failed'], 100)
+        self.assertEqual(len(failed), metrics['failed'])
+
+
+if __name__ == '__main__':
+    unittest.main()